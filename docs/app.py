@@ -1,16 +1,23 @@
 import os
 import re
+import time
 import pandas as pd
 import pdfplumber # Add pdfplumber import
-from flask import Flask, request, render_template, send_from_directory, url_for, flash, redirect
+from flask import Flask, Response, request, render_template, send_from_directory, url_for, flash, redirect, jsonify
 from werkzeug.utils import secure_filename # Needed for secure file handling
-# Import necessary openpyxl components for table formatting
-from openpyxl.worksheet.table import Table, TableStyleInfo
-# Import utility to convert column index to letter
-from openpyxl.utils import get_column_letter
-# Import openpyxl styles for conditional formatting
-from openpyxl.styles import PatternFill, Border, Side
-from openpyxl.formatting.rule import FormulaRule
+# Sheet specs and the shared Excel rendering engine (tables, autofit, conditional formats)
+from sheet_spec import render_workbook, awb_key_mask
+# Bounded background process pool for /upload jobs
+from job_queue import (QueueFullError, new_job, write_status, read_status, job_path, remove_job, has_capacity, submit,
+                       in_flight)
+# Job progress: events.jsonl in the job directory, streamed by /jobs/<job_id>/events
+from progress import new_progress, progress_event, finish_progress, file_sink
+from job_events import EVENTS_FILE, SSE_HEADERS, event_stream, last_event_offset
+from telemetry import new_timer, span, timings
+from memory_budget import new_memory_stats, memory_hook, memory_summary
+# Prometheus metrics served at /metrics
+import metrics
+from worker_limits import rss_mb, tree_rss_mb
 # The functions below are defined in this file, so the import is removed.
 # from extract_tables import extract_awb_data, extract_cca_data
 
@@ -21,15 +28,34 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 app.config['SECRET_KEY'] = 'supersecretkey' # Needed for flash messages
 
+# Background jobs: one directory per job under uploads/jobs
+JOBS_FOLDER = os.path.join(UPLOAD_FOLDER, "jobs")
+os.makedirs(JOBS_FOLDER, exist_ok=True)
+app.config["JOBS_FOLDER"] = JOBS_FOLDER
+app.config["JOB_WORKERS"] = int(os.environ.get("APP_JOB_WORKERS", "2"))        # processes running jobs
+app.config["JOB_QUEUE_SIZE"] = int(os.environ.get("APP_JOB_QUEUE_SIZE", "8"))  # jobs waiting; more -> 429
+# Per-job limits and worker recycling (see worker_limits.py); 0 disables a limit
+app.config["JOB_LIMITS"] = {
+    "timeout": int(os.environ.get("APP_JOB_TIMEOUT", "300")),              # seconds
+    "max_memory_mb": int(os.environ.get("APP_JOB_MAX_MEMORY_MB", "2048")),   # address space (RLIMIT_AS), not RSS
+    "max_jobs": int(os.environ.get("APP_JOB_MAX_JOBS_PER_WORKER", "50")),
+}
+# Profile every upload job (all|cpu|memory, see profiling.py): reports are written next to the workbook
+app.config["PROFILE"] = os.environ.get("APP_PROFILE") or None
+
+# Job metrics of this web process, recorded as jobs finish (see metrics.py)
+METRICS = metrics.new_registry()
+
 ALLOWED_EXTENSIONS = {'pdf', 'docx'} # Keep original allowed types
-ALLOWED_REPORT_EXTENSIONS = {'xls'} # For the report file
+ALLOWED_REPORT_EXTENSIONS = {'xls', 'xlsx'} # For the report file (.xlsx: re-saved or generated reports)
 
-def extract_awb_data(pdf): # Changed signature to accept pdf object
+def extract_awb_data(pdf, progress=None): # Changed signature to accept pdf object
     """
     Extracts AWB data from specific pages of a FlyDubai PDF invoice 
     by processing the extracted text lines with layout preservation.
     Handles the multi-line format (AWB line + Date/Rate line).
     Dynamically determines the end page based on CCA header.
+    Reports "pdf_scan" and per-page "pages" events to progress (progress.py), if given.
     """
     # print(f"--- Starting PDF Text Extraction Process for: {pdf_path} ---") # pdf_path not available
     print(f"--- Starting AWB PDF Text Extraction Process ---")
@@ -73,6 +99,8 @@ def extract_awb_data(pdf): # Changed signature to accept pdf object
                 cca_start_page_index = page_num
                 print(f"  -> Found 'Section B: CCA Details' header on page {page_num + 1}. AWB data ends before this.")
                 break
+        except MemoryError:
+            raise
         except Exception as e:
             print(f"Warning: Error checking page {page_num + 1} for CCA header: {e}")
 
@@ -85,13 +113,14 @@ def extract_awb_data(pdf): # Changed signature to accept pdf object
 
     target_pages = range(1, end_page_index) # Page range is 1 to end_page_index (exclusive)
     print(f"AWB Target Page Indices (0-based): {list(target_pages)}")
+    progress_event(progress, "pdf_scan", pages=num_pages, awb_pages=len(target_pages))
     # --- End Determine Target Page Range ---
 
     # --- Extract Text from Target Pages ---
     # try: # Remove outer try/except as PDF opening is handled outside
     # with pdfplumber.open(pdf_path) as pdf: # REMOVED - pdf object is passed in
     # print(f"PDF has {len(pdf.pages)} pages.")
-    for page_num in target_pages:
+    for pages_done, page_num in enumerate(target_pages, 1):
         # Check if page_num is valid (should always be within num_pages now)
         # if page_num < len(pdf.pages):
         try:
@@ -105,9 +134,12 @@ def extract_awb_data(pdf): # Changed signature to accept pdf object
                 all_lines.extend(page_lines)
             else:
                 print(f"  -> No text extracted from page {page_num + 1}.")
+        except MemoryError:
+            raise
         except Exception as e:
             print(f"Error extracting text from page {page_num + 1}: {e}")
             # Continue to next page if one fails
+        progress_event(progress, "pages", done=pages_done, total=len(target_pages))
         # else:
         #     print(f"Warning: Page {page_num + 1} requested, but PDF only has {len(pdf.pages)} pages.") # Should not happen now
 
@@ -311,6 +343,8 @@ def extract_cca_data(pdf): # Changed signature to accept pdf object
                     print(f"  -> Found first CCA header on page {page_num + 1}!")
                 cca_pages.append(page_num)
                 print(f"  -> Added page {page_num + 1} to CCA pages list.")
+        except MemoryError:
+            raise
         except Exception as e:
             print(f"Warning: Error checking page {page_num + 1} for CCA header: {e}")
     
@@ -332,6 +366,8 @@ def extract_cca_data(pdf): # Changed signature to accept pdf object
                     else:
                         # Stop if we hit a page that doesn't seem to have CCA content
                         break
+            except MemoryError:
+                raise
             except Exception as e:
                 print(f"Warning: Error checking page {page_num + 1} for CCA continuation: {e}")
                 break
@@ -355,6 +391,8 @@ def extract_cca_data(pdf): # Changed signature to accept pdf object
                     print(f"    -> Extracted {len(page_text)} characters from page {page_num + 1}.")
                 else:
                     print(f"    -> No text extracted from page {page_num + 1}.")
+            except MemoryError:
+                raise
             except Exception as e:
                 print(f"Error extracting text from CCA page {page_num + 1}: {e}")
         
@@ -509,6 +547,10 @@ def test():
                  return redirect(url_for('index')) # Redirect back
 
         results = process_file(sample_file_path) # process_file uses the new extract_awb_data
+        if results["excel_file"]:
+            results["download_url"] = url_for('download_file', filename=results["excel_file"])
+        for warning in results.get("warnings", []):
+            flash(warning, 'warning')
         
         if results["invoices_rows"] == 0: # Only check invoice rows now
              flash(f"Processing Complete: No AWB data found in '{sample_file_name}'. Excel file not generated.")
@@ -538,8 +580,16 @@ def allowed_file(filename, allowed_set):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in allowed_set
 
-def process_file(file_path, report_data_df=None): # Add report_data_df parameter
-    """Process a specific PDF/DOCX file, merge with report data, and return the results"""
+def process_file(file_path, report_data_df=None, output_folder=None, progress=None, timer=None): # Add report_data_df parameter
+    """
+    Process a specific PDF/DOCX file, merge with report data, and return the results.
+    Runs without a Flask request context (background jobs): warnings are returned
+    in results["warnings"] and callers build download_url from results["excel_file"].
+    The workbook is written to output_folder (default: UPLOAD_FOLDER).
+    Stage progress goes to progress (progress.py) and stage spans to timer
+    (telemetry.py), if given.
+    """
+    warnings = []
     # Ensure the file exists before processing
     if not os.path.exists(file_path):
         print(f"Error: File not found at {file_path}")
@@ -568,9 +618,13 @@ def process_file(file_path, report_data_df=None): # Add report_data_df parameter
     df_awb = pd.DataFrame()
     df_cca = pd.DataFrame()
     try:
-        with pdfplumber.open(file_path) as pdf:
-            df_awb = extract_awb_data(pdf) # Pass pdf object
+        with span(timer, "pdf_extract"), pdfplumber.open(file_path) as pdf:
+            pages = len(pdf.pages)
+            df_awb = extract_awb_data(pdf, progress) # Pass pdf object
             df_cca = extract_cca_data(pdf) # Pass pdf object
+            progress_event(progress, "cca", rows=len(df_cca))
+    except MemoryError:
+         raise
     except pdfplumber.exceptions.PDFSyntaxError as pdf_err:
          print(f"Error reading PDF structure in process_file: {pdf_err}")
          # Return empty results if PDF is unreadable
@@ -605,14 +659,16 @@ def process_file(file_path, report_data_df=None): # Add report_data_df parameter
     # Prepare Excel output filenames
     base_filename = os.path.splitext(os.path.basename(file_path))[0]
     excel_filename = f"{base_filename}_processed.xlsx"
-    excel_filepath = os.path.join(app.config["UPLOAD_FOLDER"], excel_filename)
-    download_url = url_for('download_file', filename=excel_filename)
+    excel_filepath = os.path.join(output_folder or app.config["UPLOAD_FOLDER"], excel_filename)
+    download_url = "" # Set by the caller (needs a request context)
     
     total_net_due_awb = 0.0 # Initialize total
     df_awb_final = pd.DataFrame() # Initialize df_awb_final (will include totals for its sheet)
     df_awb_for_recon = pd.DataFrame() # Initialize df_awb_for_recon (data ONLY)
     df_cca_final = pd.DataFrame() # Initialize df_cca_final
     df_reconciliation = pd.DataFrame() # Initialize df_reconciliation
+    discrepancy_awbs = set() # (prefix, serial) keys with Net Due discrepancies, for Invoices highlighting
+    discrepancies = {} # Discrepant reconciliation rows per category (for metrics)
 
     # --- Process AWB Data (on data_only first) ---
     if not df_awb_data_only.empty:
@@ -810,14 +866,15 @@ def process_file(file_path, report_data_df=None): # Add report_data_df parameter
 
             # --- Perform Left Merge (Invoice-based Reconciliation) ---
             print("  -> Performing left merge...")
-            df_reconciliation = pd.merge(
-                df_invoice_subset,
-                df_report_subset,
-                on=['AWB Prefix', 'AWB Serial'],
-                how='left', # Changed from 'outer' to 'left'
-                suffixes=None # No suffix needed on left merge if column names are distinct before merge
-            )
+            with span(timer, "join"):
+                df_reconciliation = pd.merge(
+                    df_invoice_subset,
+                    df_report_subset,
+                    on=['AWB Prefix', 'AWB Serial'],
+                    how='left' # Changed from 'outer' to 'left'; column names are distinct, so no suffixes are applied
+                )
             print(f"  -> Merge complete. Shape after merge: {df_reconciliation.shape}")
+            progress_event(progress, "join", rows=len(df_reconciliation))
             # print(f"  -> Merged columns: {df_reconciliation.columns.tolist()}") # Debug
 
             # Rename columns for final output clarity
@@ -867,6 +924,12 @@ def process_file(file_path, report_data_df=None): # Add report_data_df parameter
             discrepancy = charge_weight_discrepancy | net_yield_rate_discrepancy | net_due_discrepancy
 
             df_reconciliation['Discrepancy Found'] = discrepancy
+            discrepancies = {
+                "charge_weight": int(charge_weight_discrepancy.sum()),
+                "net_yield_rate": int(net_yield_rate_discrepancy.sum()),
+                "net_due": int(net_due_discrepancy.sum()),
+                "total": int(discrepancy.sum()),
+            }
             print("  -> Added 'Discrepancy Found' column.")
 
             # --- Reorder Reconciliation Columns ---
@@ -924,7 +987,7 @@ def process_file(file_path, report_data_df=None): # Add report_data_df parameter
 
         else:
             print("  -> Report DataFrame missing required columns for reconciliation. Skipping reconciliation.")
-            flash("Warning: Report file missing required columns (chargewt, frt_cost_rate, total_cost). Reconciliation skipped.", 'warning')
+            warnings.append("Warning: Report file missing required columns (chargewt, frt_cost_rate, total_cost). Reconciliation skipped.")
             # df_reconciliation remains empty
     elif report_data_df is None or report_data_df.empty:
          print("--- No report data provided or report data is empty. Skipping reconciliation. ---")
@@ -932,349 +995,110 @@ def process_file(file_path, report_data_df=None): # Add report_data_df parameter
          print("--- Invoice data (AWB) is empty. Skipping reconciliation. ---")
 
 
-    # 5. Write to Excel using ExcelWriter for multiple sheets
+    # 5. Write to Excel using the shared sheet spec engine
     try:
         print(f"Writing data to Excel file: {excel_filepath}")
-        with pd.ExcelWriter(excel_filepath, engine='openpyxl') as writer:
-
-            # --- Calculate Summary Data ---
-            # (Calculation remains here, but depends on correctly filtered df_awb_filtered)
-            print("--- Preparing Summary Sheet Data ---")
-            summary_data = {}
-            # Use df_awb_filtered which *should* exclude the total row
-            # Re-apply filter for safety right before summing:
-            if 'df_awb_for_recon' in locals() and not df_awb_for_recon.empty:
-                # Ensure the filter is applied to the DF we are about to sum (using df_awb_for_recon now)
-                df_summary_input = df_awb_for_recon[df_awb_for_recon['AWB Prefix'] != 'Total'].copy()
-                if not df_summary_input.empty:
-                    invoice_awb_count = len(df_summary_input)
-                    # Use original column names from df_summary_input (already numeric)
-                    total_invoice_amount = df_summary_input['Net Due for AWB'].sum()
-                    total_charge_weight = df_summary_input['Charge Weight'].sum()
-                    # Calculate Average Net Yield Rate = Total Net Due / Total Charge Weight
-                    avg_net_yield_rate = (total_invoice_amount / total_charge_weight) if total_charge_weight else 0.0
-                    
-                    summary_data['Invoice AWB Count'] = invoice_awb_count
-                    summary_data['Total AWB Amount (Net Due)'] = total_invoice_amount
-                    # Store these for later use after CCA calculation
-                    temp_charge_weight = total_charge_weight
-                    temp_avg_rate = avg_net_yield_rate
-                    print(f"  -> Calculated Invoice Stats (using filtered df_awb_for_recon): Count={invoice_awb_count}, Amount={total_invoice_amount:.2f}, Weight={total_charge_weight:.2f}, Avg Rate={avg_net_yield_rate:.5f}")
-                else:
-                    print("  -> df_awb_for_recon became empty after re-applying 'Total' row filter for summary.")
-                    summary_data['Invoice AWB Count'] = 0
-                    summary_data['Total AWB Amount (Net Due)'] = 0.0
-                    temp_charge_weight = 0.0
-                    temp_avg_rate = 0.0
-
+        # --- Calculate Summary Data ---
+        # (Calculation remains here, but depends on correctly filtered df_awb_filtered)
+        print("--- Preparing Summary Sheet Data ---")
+        summary_data = {}
+        # Use df_awb_filtered which *should* exclude the total row
+        # Re-apply filter for safety right before summing:
+        if 'df_awb_for_recon' in locals() and not df_awb_for_recon.empty:
+            # Ensure the filter is applied to the DF we are about to sum (using df_awb_for_recon now)
+            df_summary_input = df_awb_for_recon[df_awb_for_recon['AWB Prefix'] != 'Total'].copy()
+            if not df_summary_input.empty:
+                invoice_awb_count = len(df_summary_input)
+                # Use original column names from df_summary_input (already numeric)
+                total_invoice_amount = df_summary_input['Net Due for AWB'].sum()
+                total_charge_weight = df_summary_input['Charge Weight'].sum()
+                # Calculate Average Net Yield Rate = Total Net Due / Total Charge Weight
+                avg_net_yield_rate = (total_invoice_amount / total_charge_weight) if total_charge_weight else 0.0
+                
+                summary_data['Invoice AWB Count'] = invoice_awb_count
+                summary_data['Total AWB Amount (Net Due)'] = total_invoice_amount
+                # Store these for later use after CCA calculation
+                temp_charge_weight = total_charge_weight
+                temp_avg_rate = avg_net_yield_rate
+                print(f"  -> Calculated Invoice Stats (using filtered df_awb_for_recon): Count={invoice_awb_count}, Amount={total_invoice_amount:.2f}, Weight={total_charge_weight:.2f}, Avg Rate={avg_net_yield_rate:.5f}")
             else:
+                print("  -> df_awb_for_recon became empty after re-applying 'Total' row filter for summary.")
                 summary_data['Invoice AWB Count'] = 0
+                summary_data['Total AWB Amount (Net Due)'] = 0.0
                 temp_charge_weight = 0.0
                 temp_avg_rate = 0.0
 
-            # Calculate CCA total amount
-            total_cca_amount = 0.0
-            if not df_cca_final.empty:
-                # Filter out the total row and sum the Net Due column
-                df_cca_summary_input = df_cca_final[df_cca_final['CCA Ref. No'] != 'Total'].copy()
-                if not df_cca_summary_input.empty and 'Net Due for AWB (Sale Currency)' in df_cca_summary_input.columns:
-                    total_cca_amount = df_cca_summary_input['Net Due for AWB (Sale Currency)'].sum()
-                    print(f"  -> Calculated CCA Total Amount: {total_cca_amount:.2f}")
-
-            summary_data['Total CCA Amount (Net Due)'] = total_cca_amount
-            
-            # Calculate combined total (AWB + CCA)
-            total_awb_amount = summary_data.get('Total AWB Amount (Net Due)', 0.0)
-            total_combined_amount = total_awb_amount + total_cca_amount
-            summary_data['Total Invoice Amount (AWB + CCA)'] = total_combined_amount
-
-            # Add the charge weight and average rate after the totals
-            summary_data['Total Invoice Charge Weight'] = temp_charge_weight
-            summary_data['Average Net Yield Rate'] = temp_avg_rate
-
-            # Calculate report totals from the reconciliation dataframe (which is based on left merge)
-            if not df_reconciliation.empty and 'Net Due (Report)' in df_reconciliation.columns:
-                # Filter df_reconciliation to remove the *newly added* total row before summing for summary
-                df_rec_summary_input = df_reconciliation[df_reconciliation['AWB Prefix'] != 'Total'].copy()
-                if not df_rec_summary_input.empty:
-                    total_report_cost = df_rec_summary_input['Net Due (Report)'].sum()
-                    # Use the combined invoice amount (AWB + CCA) for the difference calculation
-                    difference_total_amount = summary_data.get('Total Invoice Amount (AWB + CCA)', 0.0) - total_report_cost
-                    summary_data['Total Report Amount (for Matched AWBs)'] = total_report_cost
-                    summary_data['Difference (Report - Invoice)'] = difference_total_amount
-                    print(f"  -> Calculated Report Stats (after filtering recon data): Total Cost={total_report_cost:.2f}, Difference={difference_total_amount:.2f}")
-                else:
-                    print("  -> Reconciliation data became empty after filtering 'Total' row for summary.")
-                    summary_data['Total Report Amount (for Matched AWBs)'] = 0.0
-                    summary_data['Difference (Report - Invoice)'] = summary_data.get('Total Invoice Amount (AWB + CCA)', 0.0) - 0.0
+        else:
+            summary_data['Invoice AWB Count'] = 0
+            temp_charge_weight = 0.0
+            temp_avg_rate = 0.0
+
+        # Calculate CCA total amount
+        total_cca_amount = 0.0
+        if not df_cca_final.empty:
+            # Filter out the total row and sum the Net Due column
+            df_cca_summary_input = df_cca_final[df_cca_final['CCA Ref. No'] != 'Total'].copy()
+            if not df_cca_summary_input.empty and 'Net Due for AWB (Sale Currency)' in df_cca_summary_input.columns:
+                total_cca_amount = df_cca_summary_input['Net Due for AWB (Sale Currency)'].sum()
+                print(f"  -> Calculated CCA Total Amount: {total_cca_amount:.2f}")
+
+        summary_data['Total CCA Amount (Net Due)'] = total_cca_amount
+        
+        # Calculate combined total (AWB + CCA)
+        total_awb_amount = summary_data.get('Total AWB Amount (Net Due)', 0.0)
+        total_combined_amount = total_awb_amount + total_cca_amount
+        summary_data['Total Invoice Amount (AWB + CCA)'] = total_combined_amount
+
+        # Add the charge weight and average rate after the totals
+        summary_data['Total Invoice Charge Weight'] = temp_charge_weight
+        summary_data['Average Net Yield Rate'] = temp_avg_rate
+
+        # Calculate report totals from the reconciliation dataframe (which is based on left merge)
+        if not df_reconciliation.empty and 'Net Due (Report)' in df_reconciliation.columns:
+            # Filter df_reconciliation to remove the *newly added* total row before summing for summary
+            df_rec_summary_input = df_reconciliation[df_reconciliation['AWB Prefix'] != 'Total'].copy()
+            if not df_rec_summary_input.empty:
+                total_report_cost = df_rec_summary_input['Net Due (Report)'].sum()
+                # Use the combined invoice amount (AWB + CCA) for the difference calculation
+                difference_total_amount = summary_data.get('Total Invoice Amount (AWB + CCA)', 0.0) - total_report_cost
+                summary_data['Total Report Amount (for Matched AWBs)'] = total_report_cost
+                summary_data['Difference (Report - Invoice)'] = difference_total_amount
+                print(f"  -> Calculated Report Stats (after filtering recon data): Total Cost={total_report_cost:.2f}, Difference={difference_total_amount:.2f}")
             else:
+                print("  -> Reconciliation data became empty after filtering 'Total' row for summary.")
                 summary_data['Total Report Amount (for Matched AWBs)'] = 0.0
+                summary_data['Difference (Report - Invoice)'] = summary_data.get('Total Invoice Amount (AWB + CCA)', 0.0) - 0.0
+        else:
+            summary_data['Total Report Amount (for Matched AWBs)'] = 0.0
 
-            # Create DataFrame for summary
-            df_summary = pd.DataFrame(list(summary_data.items()), columns=['Metric', 'Value'])
-            
-            # --- Write Sheets in Specified Order ---
-
-            # 1. Summary Sheet
-            sheet_name_summary = "Summary"
-            df_summary.to_excel(writer, sheet_name=sheet_name_summary, index=False)
-            print(f"  -> Written summary data to '{sheet_name_summary}' sheet.")
-            worksheet_summary = writer.sheets[sheet_name_summary]
-            # Autofit columns for summary sheet
-            for column in worksheet_summary.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                for cell in column:
-                    try:
-                        cell_len = len(str(cell.value))
-                        header_len = len(str(worksheet_summary[f"{column_letter}1"].value))
-                        max_length = max(max_length, cell_len, header_len)
-                    except: pass
-                adjusted_width = (max_length + 2) * 1.1
-                worksheet_summary.column_dimensions[column_letter].width = adjusted_width
-            print(f"  -> Autofit columns for '{sheet_name_summary}'.")
-
-            # 2. Reconciliation Sheet
-            if not df_reconciliation.empty:
-                sheet_name_rec = "Reconciliation"
-                df_reconciliation.to_excel(writer, sheet_name=sheet_name_rec, index=False)
-                print(f"  -> Written {len(df_reconciliation)} rows (incl. added total) to '{sheet_name_rec}' sheet.")
-                worksheet_rec = writer.sheets[sheet_name_rec]
-                # Formatting (Autofit, Table, Conditional)
-                start_row_rec = 1
-                end_row_rec = start_row_rec + len(df_reconciliation) # Includes newly added total row
-                start_col_rec = 1
-                end_col_rec = len(df_reconciliation.columns)
-                # Adjust table range
-                rec_table_range = f"{get_column_letter(start_col_rec)}{start_row_rec}:{get_column_letter(end_col_rec)}{end_row_rec}"
-                print(f"  -> Calculated Reconciliation Table Range (incl. added total): {rec_table_range}")
-                for column in worksheet_rec.columns:
-                     max_length = 0
-                     column_letter = column[0].column_letter
-                     for cell in column:
-                        try:
-                            cell_len = len(str(cell.value))
-                            header_len = len(str(worksheet_rec[f"{column_letter}1"].value))
-                            max_length = max(max_length, cell_len, header_len)
-                        except: pass
-                     adjusted_width = (max_length + 2) * 1.1
-                     worksheet_rec.column_dimensions[column_letter].width = adjusted_width
-                print(f"  -> Autofit columns for '{sheet_name_rec}'.")
-                tab_rec = Table(displayName="ReconciliationTable", ref=rec_table_range)
-                style_rec = TableStyleInfo(name="TableStyleMedium2", showFirstColumn=False, showLastColumn=False, showRowStripes=True, showColumnStripes=False)
-                tab_rec.tableStyleInfo = style_rec
-                # Apply table if there are any rows (including the total row)
-                if len(df_reconciliation) > 0:
-                    worksheet_rec.add_table(tab_rec)
-                    print(f"  -> Added Excel table formatting to '{sheet_name_rec}'.")
-                # Apply conditional formatting if data rows exist (check > 1 because of added total row)
-                discrepancy_col_letter = None
-                col_letters = {} # Store column letters for specific fields
-                for col_idx, value in enumerate(df_reconciliation.columns):
-                    col_letter = get_column_letter(col_idx + 1)
-                    col_letters[value] = col_letter # Store letter by column name
-                    if value == 'Discrepancy Found':
-                        discrepancy_col_letter = get_column_letter(col_idx + 1)
-                        # Don't break, continue finding other column letters
-                
-                yellow_fill = PatternFill(start_color='FFFFFF00', end_color='FFFFFF00', fill_type='solid') # Yellow for row highlight
-                orange_fill = PatternFill(start_color='FFFFC7CE', end_color='FFFFC7CE', fill_type='solid') # Light red/orange for cell mismatches
-                bright_red_fill = PatternFill(start_color='FFFF0000', end_color='FFFF0000', fill_type='solid') # Bright Red for Diff Net Due
-                black_thick_border = Border(left=Side(style='thick', color='000000'), # Changed color to black
-                                          right=Side(style='thick', color='000000'), 
-                                          top=Side(style='thick', color='000000'), 
-                                          bottom=Side(style='thick', color='000000'))
-
-                # Apply conditional formatting if data rows exist (check > 1 because of added total row)
-                if discrepancy_col_letter and len(df_reconciliation) > 1:
-                    # Apply conditional formatting only to data rows (excluding header and total row)
-                    data_range_end_row = end_row_rec - 1 # Exclude the last (total) row
-                    data_range_full_row = f"A2:{get_column_letter(end_col_rec)}{data_range_end_row}"
-                    
-                    # Check if data_range is valid (start row <= end row)
-                    if data_range_end_row >= 2:
-                        # 2. Highlight specific mismatching cells (apply before row highlight)
-                        # Use ROUND for float comparison to handle precision issues.
-                        # Check that both cells are not blank before comparing.
-                        # Charge Weight Mismatch (e.g., cols C vs D)
-                        if 'Charge Weight (Invoice)' in col_letters and 'Charge Weight (Report)' in col_letters:
-                            cw_inv_col = col_letters['Charge Weight (Invoice)']
-                            cw_rep_col = col_letters['Charge Weight (Report)']
-                            formula_cw = [f'AND(ISNUMBER(${cw_inv_col}2), ISNUMBER(${cw_rep_col}2), ROUND(${cw_inv_col}2,2)<>ROUND(${cw_rep_col}2,2))']
-                            # Apply to both columns C and D (adjust range)
-                            try:
-                                worksheet_rec.conditional_formatting.add(f'{cw_inv_col}2:{cw_inv_col}{data_range_end_row}', FormulaRule(formula=formula_cw, stopIfTrue=False, fill=orange_fill))
-                                worksheet_rec.conditional_formatting.add(f'{cw_rep_col}2:{cw_rep_col}{data_range_end_row}', FormulaRule(formula=formula_cw, stopIfTrue=False, fill=orange_fill))
-                                print(f"  -> Added CF for Charge Weight mismatch (Cols {cw_inv_col}, {cw_rep_col}).")
-                            except Exception as cf_error:
-                                print(f"  -> ERROR applying CF for Charge Weight: {cf_error}")
-                            
-                        # Net Yield Rate Mismatch (e.g., cols E vs F)
-                        if 'Net Yield Rate (Invoice)' in col_letters and 'Net Yield Rate (Report)' in col_letters:
-                            nyr_inv_col = col_letters['Net Yield Rate (Invoice)']
-                            nyr_rep_col = col_letters['Net Yield Rate (Report)']
-                            formula_nyr = [f'AND(ISNUMBER(${nyr_inv_col}2), ISNUMBER(${nyr_rep_col}2), ROUND(${nyr_inv_col}2,5)<>ROUND(${nyr_rep_col}2,5))'] # Higher precision for rate
-                            # Apply to both columns E and F (adjust range)
-                            try:
-                                worksheet_rec.conditional_formatting.add(f'{nyr_inv_col}2:{nyr_inv_col}{data_range_end_row}', FormulaRule(formula=formula_nyr, stopIfTrue=False, fill=orange_fill))
-                                worksheet_rec.conditional_formatting.add(f'{nyr_rep_col}2:{nyr_rep_col}{data_range_end_row}', FormulaRule(formula=formula_nyr, stopIfTrue=False, fill=orange_fill))
-                                print(f"  -> Added CF for Net Yield Rate mismatch (Cols {nyr_inv_col}, {nyr_rep_col}).")
-                            except Exception as cf_error:
-                                print(f"  -> ERROR applying CF for Net Yield Rate: {cf_error}")
-
-                        # Net Due Mismatch (e.g., cols G vs H, check Diff I != 0)
-                        if 'Net Due (Invoice)' in col_letters and 'Net Due (Report)' in col_letters and 'Diff Net Due' in col_letters:
-                            nd_inv_col = col_letters['Net Due (Invoice)']
-                            nd_rep_col = col_letters['Net Due (Report)']
-                            nd_diff_col = col_letters['Diff Net Due']
-                            formula_nd_highlight_g_h = [f'AND(ISNUMBER(${nd_inv_col}2), ISNUMBER(${nd_rep_col}2), ROUND(${nd_diff_col}2,2)<>0)'] # For highlighting G & H
-                            formula_nd_highlight_i = [f'ROUND(${nd_diff_col}2,2)<>0'] # For highlighting I (diff column itself)
-                            # Apply to both columns G and H (adjust range)
-                            try:
-                                # Highlight G and H in light orange
-                                worksheet_rec.conditional_formatting.add(f'{nd_inv_col}2:{nd_inv_col}{data_range_end_row}', FormulaRule(formula=formula_nd_highlight_g_h, stopIfTrue=False, fill=orange_fill))
-                                worksheet_rec.conditional_formatting.add(f'{nd_rep_col}2:{nd_rep_col}{data_range_end_row}', FormulaRule(formula=formula_nd_highlight_g_h, stopIfTrue=False, fill=orange_fill))
-                                print(f"  -> Added CF for Net Due mismatch (Cols {nd_inv_col}, {nd_rep_col}).")
-                                # Highlight I (Diff Net Due) in bright red with border
-                                worksheet_rec.conditional_formatting.add(f'{nd_diff_col}2:{nd_diff_col}{data_range_end_row}', FormulaRule(formula=formula_nd_highlight_i, stopIfTrue=False, fill=bright_red_fill, border=black_thick_border))
-                                print(f"  -> Added CF for Diff Net Due itself (Col {nd_diff_col}).")
-                            except Exception as cf_error:
-                                 print(f"  -> ERROR applying CF for Net Due: {cf_error}")
-                            
-                        # 1. Apply Row Highlight Last (if Discrepancy Found is True)
-                        formula = [f"${discrepancy_col_letter}2=TRUE"] # Formula still based on row 2
-                        try:
-                            worksheet_rec.conditional_formatting.add(data_range_full_row,
-                                 FormulaRule(formula=formula, stopIfTrue=True, fill=yellow_fill))
-                            print(f"  -> Added CF for Discrepancy Found row highlight (Range: {data_range_full_row}, Col: {discrepancy_col_letter}).")
-                        except Exception as cf_error:
-                             print(f"  -> ERROR applying CF for Discrepancy Found: {cf_error}")
-
-            else:
-                pd.DataFrame().to_excel(writer, sheet_name="Reconciliation", index=False)
-
-            # 3. Invoices Sheet
-            if not df_awb_final.empty:
-                sheet_name_awb = "Invoices"
-                df_awb_final.to_excel(writer, sheet_name=sheet_name_awb, index=False)
-                print(f"  -> Written {len(df_awb_final)} rows to '{sheet_name_awb}' sheet.")
-                worksheet_awb = writer.sheets[sheet_name_awb]
-                # Formatting (Autofit, Table)
-                start_row_awb = 1
-                end_row_awb = start_row_awb + len(df_awb_final)
-                start_col_awb = 1
-                end_col_awb = len(df_awb_final.columns)
-                ref_end_row_awb = end_row_awb 
-                if 'Total' in df_awb_final['AWB Prefix'].values:
-                   ref_end_row_awb = end_row_awb
-                awb_table_range = f"{get_column_letter(start_col_awb)}{start_row_awb}:{get_column_letter(end_col_awb)}{ref_end_row_awb}"
-                print(f"  -> Calculated AWB Table Range: {awb_table_range}")
-                for column in worksheet_awb.columns:
-                    max_length = 0
-                    column_letter = column[0].column_letter
-                    for cell in column:
-                        try:
-                            cell_len = len(str(cell.value))
-                            header_len = len(str(worksheet_awb[f"{column_letter}1"].value))
-                            max_length = max(max_length, cell_len, header_len)
-                        except: pass
-                    adjusted_width = (max_length + 2) * 1.1
-                    worksheet_awb.column_dimensions[column_letter].width = adjusted_width
-                print(f"  -> Autofit columns for '{sheet_name_awb}'.")
-                tab_awb = Table(displayName="AWBTable", ref=awb_table_range)
-                style_awb = TableStyleInfo(name="TableStyleMedium9", showFirstColumn=False, showLastColumn=False, showRowStripes=True, showColumnStripes=False)
-                tab_awb.tableStyleInfo = style_awb
-                if len(df_awb_final) > 0:
-                    worksheet_awb.add_table(tab_awb)
-                    print(f"  -> Added Excel table formatting to '{sheet_name_awb}'.")
-
-                    # --- Apply Conditional Formatting for Net Due Discrepancies ---
-                    if discrepancy_awbs:
-                        red_fill = PatternFill(start_color='FFFF0000', end_color='FFFF0000', fill_type='solid') # Bright Red
-                        # Find column indices for AWB Prefix and Serial
-                        prefix_col_idx = -1
-                        serial_col_idx = -1
-                        header_row = worksheet_awb[1] # Header is row 1
-                        for idx, cell in enumerate(header_row):
-                            if cell.value == 'AWB Prefix':
-                                prefix_col_idx = idx + 1 # 1-based index
-                            elif cell.value == 'AWB Serial':
-                                serial_col_idx = idx + 1 # 1-based index
-                        
-                        if prefix_col_idx != -1 and serial_col_idx != -1:
-                            print(f"  -> Applying red highlight to invoice rows with Net Due discrepancies (Prefix Col: {prefix_col_idx}, Serial Col: {serial_col_idx})...")
-                            # Iterate through data rows (starting from row 2, up to the row before total)
-                            # end_row_awb already includes the total row if present
-                            last_data_row = end_row_awb -1 if 'Total' in df_awb_final['AWB Prefix'].values else end_row_awb
-                            for row_idx in range(2, last_data_row + 1):
-                                try:
-                                    prefix_val = worksheet_awb.cell(row=row_idx, column=prefix_col_idx).value
-                                    serial_val = worksheet_awb.cell(row=row_idx, column=serial_col_idx).value
-                                    # Ensure values are strings for comparison with the set
-                                    awb_key = (str(prefix_val) if prefix_val is not None else '', 
-                                               str(serial_val) if serial_val is not None else '')
-                                    
-                                    if awb_key in discrepancy_awbs:
-                                        # Apply fill to all cells in this row within the table range
-                                        for col_idx in range(start_col_awb, end_col_awb + 1):
-                                            worksheet_awb.cell(row=row_idx, column=col_idx).fill = red_fill
-                                except Exception as e:
-                                    print(f"   -> Warning: Error applying highlight to row {row_idx}: {e}")
-                            print(f"  -> Finished applying red highlight.")
-                        else:
-                            print("  -> Warning: Could not find AWB Prefix/Serial columns in Invoices sheet for highlighting.")
-                    else:
-                         print("  -> No Net Due discrepancies found, skipping invoice row highlighting.")
-                    # --- End Conditional Formatting ---
-                else:
-                    print(f"  -> No data rows in '{sheet_name_awb}', skipping table creation.")
-            else:
-                pd.DataFrame().to_excel(writer, sheet_name="Invoices", index=False)
-                print("  -> AWB DataFrame is empty. Written empty 'Invoices' sheet.")
-
-            # 4. CCA Sheet
-            if not df_cca_final.empty:
-                sheet_name_cca = "CCA" 
-                df_cca_final.to_excel(writer, sheet_name=sheet_name_cca, index=False)
-                print(f"  -> Written {len(df_cca_final)} rows to '{sheet_name_cca}' sheet.")
-                worksheet_cca = writer.sheets[sheet_name_cca]
-                # Formatting (Autofit, Table)
-                start_row_cca = 1
-                end_row_cca = start_row_cca + len(df_cca_final)
-                start_col_cca = 1
-                end_col_cca = len(df_cca_final.columns)
-                ref_end_row_cca = end_row_cca
-                if 'Total' in df_cca_final['CCA Ref. No'].values:
-                     ref_end_row_cca = end_row_cca
-                cca_table_range = f"{get_column_letter(start_col_cca)}{start_row_cca}:{get_column_letter(end_col_cca)}{ref_end_row_cca}"
-                print(f"  -> Calculated CCA Table Range: {cca_table_range}")
-                for column in worksheet_cca.columns:
-                    max_length = 0
-                    column_letter = column[0].column_letter
-                    for cell in column:
-                        try:
-                            cell_len = len(str(cell.value))
-                            header_len = len(str(worksheet_cca[f"{column_letter}1"].value))
-                            max_length = max(max_length, cell_len, header_len)
-                        except: pass
-                    adjusted_width = (max_length + 2) * 1.1
-                    worksheet_cca.column_dimensions[column_letter].width = adjusted_width
-                print(f"  -> Autofit columns for '{sheet_name_cca}'.")
-                tab_cca = Table(displayName="CCATable", ref=cca_table_range)
-                style_cca = TableStyleInfo(name="TableStyleMedium10", showFirstColumn=False, showLastColumn=False, showRowStripes=True, showColumnStripes=False)
-                tab_cca.tableStyleInfo = style_cca
-                if len(df_cca_final) > 0:
-                    worksheet_cca.add_table(tab_cca)
-                    print(f"  -> Added Excel table formatting to '{sheet_name_cca}'.")
-                else:
-                    print(f"  -> No data rows in '{sheet_name_cca}', skipping table creation.")
-            else:
-                pd.DataFrame().to_excel(writer, sheet_name="CCA", index=False)
-                print("  -> CCA DataFrame is empty. Written empty 'CCA' sheet.")
-            # --- End Writing Sheets ---
+        # Create DataFrame for summary
+        df_summary = pd.DataFrame(list(summary_data.items()), columns=['Metric', 'Value'])
+        
+        # --- Write Sheets in Specified Order (Summary, Reconciliation, Invoices, CCA) ---
+        # Invoice rows with Net Due discrepancies are highlighted red
+        invoice_masks = {}
+        if discrepancy_awbs and not df_awb_final.empty:
+            invoice_masks["net_due_discrepancy"] = awb_key_mask(df_awb_final, discrepancy_awbs)
+            print(f"  -> Highlighting invoice rows with Net Due discrepancies.")
+        with span(timer, "sheets"):
+            sheet_stats = render_workbook(
+                excel_filepath,
+                {
+                    "Summary": df_summary,
+                    "Reconciliation": df_reconciliation,
+                    "Invoices": df_awb_final,
+                    "CCA": df_cca_final,
+                },
+                masks=invoice_masks,
+                highlights=True,
+                timer=timer
+            )
+        progress_event(progress, "sheets", sheets=len(sheet_stats))
         
         print("--- Excel File Written Successfully ---")
 
+    except MemoryError:
+        raise
     except Exception as e:
         print(f"Error writing Excel file: {e}")
         import traceback
@@ -1288,18 +1112,9 @@ def process_file(file_path, report_data_df=None): # Add report_data_df parameter
              "total_net_due_awb": total_net_due_awb # Return calculated total even if write fails
         }
 
-    # Adjust row counts to exclude total row before returning
-    invoices_rows_count = 0
-    if not df_awb_final.empty:
-         invoices_rows_count = len(df_awb_final)
-         if 'Total' in df_awb_final['AWB Prefix'].values:
-             invoices_rows_count -= 1
-             
-    cca_rows_count = 0
-    if not df_cca_final.empty:
-        cca_rows_count = len(df_cca_final)
-        if 'Total' in df_cca_final['CCA Ref. No'].values:
-            cca_rows_count -= 1
+    # Row counts exclude the totals rows
+    invoices_rows_count = sheet_stats["Invoices"]["data_rows"]
+    cca_rows_count = sheet_stats["CCA"]["data_rows"]
 
     # Return results including the CCA count
     return {
@@ -1307,125 +1122,241 @@ def process_file(file_path, report_data_df=None): # Add report_data_df parameter
         "cca_rows": cca_rows_count,
         "excel_file": excel_filename,
         "download_url": download_url,
-        "total_net_due_awb": total_net_due_awb 
+        "total_net_due_awb": total_net_due_awb,
+        "pages": pages,
+        "discrepancies": discrepancies,
+        "warnings": warnings
     }
 
 
-@app.route("/upload", methods=["POST"])
-def upload():
-    if 'file' not in request.files or 'report_file' not in request.files:
-        flash('Both Invoice/CCA file and Report file are required.', 'error')
-        return redirect(url_for('index'))
-
-    invoice_file = request.files['file']
-    report_file = request.files['report_file']
-
-    if invoice_file.filename == '' or report_file.filename == '':
-        flash('No selected file for one or both inputs.', 'error')
-        return redirect(url_for('index'))
-
-    # --- Process Invoice File ---
-    invoice_file_path = None # Initialize
-    if invoice_file and allowed_file(invoice_file.filename, ALLOWED_EXTENSIONS):
-        invoice_filename = secure_filename(invoice_file.filename)
-        invoice_file_path = os.path.join(app.config["UPLOAD_FOLDER"], invoice_filename)
-        try:
-            invoice_file.save(invoice_file_path)
-            print(f"Invoice file saved to: {invoice_file_path}")
-        except Exception as e:
-            flash(f"Error saving invoice file: {e}", 'error')
-            return redirect(url_for('index'))
-    else:
-        flash(f'Invalid invoice file type. Allowed: {", ".join(ALLOWED_EXTENSIONS)}', 'error')
-        return redirect(url_for('index'))
-
-    # --- Process Report File ---
-    df_report = None
-    report_file_path = None
-    if report_file and allowed_file(report_file.filename, ALLOWED_REPORT_EXTENSIONS):
-        report_filename = secure_filename(report_file.filename)
-        report_file_path = os.path.join(app.config["UPLOAD_FOLDER"], report_filename)
-        try:
-            report_file.save(report_file_path)
-            print(f"Report file saved to: {report_file_path}")
-            # Read the saved report .xls file, specifying header row and data types
-            print(f"Reading report file: {report_file_path} with header on row 8 (index 7)")
-            df_report = pd.read_excel(
-                report_file_path,
-                engine='xlrd',
-                header=7, # Assumes header is on the 8th row (0-indexed 7)
-                dtype={'awbprefix': str, 'awbsuffix': str} # Specify dtype for merge keys
-            )
-            print(f"Report file read successfully. Shape: {df_report.shape}")
-
-            # Clean column names by stripping whitespace and lowercasing
-            df_report.columns = df_report.columns.str.strip().str.lower()
-            print(f"Cleaned report columns (lower, strip): {df_report.columns.tolist()}")
+def read_report_file(report_file_path):
+    """
+    Reads the report .xls/.xlsx (header on row 8) and checks the reconciliation columns.
+    Returns (df_report, error message or None).
+    """
+    print(f"Reading report file: {report_file_path} with header on row 8 (index 7)")
+    df_report = pd.read_excel(
+        report_file_path,
+        engine='openpyxl' if report_file_path.lower().endswith('.xlsx') else 'xlrd',
+        header=7, # Assumes header is on the 8th row (0-indexed 7)
+        dtype={'awbprefix': str, 'awbsuffix': str} # Specify dtype for merge keys
+    )
+    print(f"Report file read successfully. Shape: {df_report.shape}")
 
-            # --- Updated Validation for required columns ---
-            required_report_cols = ['awbprefix', 'awbsuffix', 'chargewt', 'frt_cost_rate', 'total_cost']
-            missing_cols = [col for col in required_report_cols if col not in df_report.columns]
+    # Clean column names by stripping whitespace and lowercasing
+    df_report.columns = df_report.columns.str.strip().str.lower()
+    print(f"Cleaned report columns (lower, strip): {df_report.columns.tolist()}")
 
-            if missing_cols:
-                 flash(f"Report file is missing one or more required columns (checked names, lowercased & stripped: {', '.join(missing_cols)}). Ensure header is on row 8 and columns exist. Actual found: {df_report.columns.tolist()}", 'error')
-                 # Clean up invoice file before redirecting
-                 if invoice_file_path and os.path.exists(invoice_file_path): os.remove(invoice_file_path)
-                 if report_file_path and os.path.exists(report_file_path): os.remove(report_file_path) # Clean up report file too
-                 return redirect(url_for('index'))
+    # --- Updated Validation for required columns ---
+    required_report_cols = ['awbprefix', 'awbsuffix', 'chargewt', 'frt_cost_rate', 'total_cost']
+    missing_cols = [col for col in required_report_cols if col not in df_report.columns]
+    if missing_cols:
+        return df_report, f"Report file is missing one or more required columns (checked names, lowercased & stripped: {', '.join(missing_cols)}). Ensure header is on row 8 and columns exist. Actual found: {df_report.columns.tolist()}"
+    return df_report, None
 
-        except Exception as e:
-            flash(f"Error reading or processing report file: {e}", 'error')
-            if invoice_file_path and os.path.exists(invoice_file_path): os.remove(invoice_file_path)
-            # Clean up report file if it exists
-            if report_file_path and os.path.exists(report_file_path):
-                try: os.remove(report_file_path)
-                except Exception as rm_e: print(f"Error removing report file during error handling: {rm_e}")
-            return redirect(url_for('index'))
-    else:
-        flash(f'Invalid report file type. Allowed: {", ".join(ALLOWED_REPORT_EXTENSIONS)}', 'error')
-        if invoice_file_path and os.path.exists(invoice_file_path): os.remove(invoice_file_path) # Clean up invoice file
-        return redirect(url_for('index'))
-
-    # --- Process the invoice file, passing the report data ---
+def run_upload_job(job_id, job_dir, invoice_file_path, report_file_path):
+    """
+    Background job for /upload (runs in a job_queue pool process).
+    Reads the report, runs process_file into the job directory and records
+    the outcome in the job's status.json. Stage progress is appended to the
+    job's events.jsonl (served by /jobs/<job_id>/events) and flushed before the
+    final status is written. Uploaded inputs are removed afterwards.
+    Stage timings (telemetry.py) and per-stage memory (memory_budget.py) go
+    into the status as timings. With app.config["PROFILE"] set, the job is profiled (profiling.py) and the
+    report files are listed in the status as profile_files.
+    """
+    progress = new_progress(file_sink(os.path.join(job_dir, EVENTS_FILE)), job_id=job_id)
+    profile = None
+    hooks = []
+    if app.config["PROFILE"]:
+        from profiling import start_profile, profile_hook
+        profile = start_profile(app.config["PROFILE"])
+        hooks.append(profile_hook(profile))
+    memory = new_memory_stats()
+    timer = new_timer(hooks=hooks + [memory_hook(memory)])
+
+    def finish(**fields):
+        finish_progress(progress, status=fields["status"])
+        fields["timings"] = dict(timings(timer), memory=memory_summary(memory))
+        if profile is not None:
+            from profiling import stop_profile, write_profile, profile_base_path
+            stop_profile(profile)
+            excel_file = (fields.get("results") or {}).get("excel_file")
+            base_path = profile_base_path(os.path.join(job_dir, excel_file) if excel_file else "",
+                                          fallback_name=os.path.join(job_dir, "profile"))
+            fields["profile_files"] = [os.path.basename(path) for path in write_profile(profile, base_path)]
+        return write_status(job_dir, finished_at=time.time(), **fields)
+
+    write_status(job_dir, status="running", started_at=time.time())
     try:
-        results = process_file(invoice_file_path, report_data_df=df_report)
-
-        # Check for processing errors indicated by missing excel_file key
+        with span(timer, "report_read"):
+            df_report, report_error = read_report_file(report_file_path)
+        if report_error:
+            return finish(status="failed", error=report_error)
+        progress_event(progress, "report", rows=len(df_report))
+
+        results = process_file(invoice_file_path, report_data_df=df_report, output_folder=job_dir,
+                               progress=progress, timer=timer)
         if not results.get("excel_file"):
-             # Assuming errors are flashed within process_file or handled by empty df checks
-             flash(f"Processing completed, but encountered issues. Excel file not generated.", 'warning') # Generic message if needed
-             # Error/Warning should have been flashed already, redirect
-             return redirect(url_for('index'))
-
-
-        if results["invoices_rows"] == 0 and results["cca_rows"] == 0: # Check both
-            flash(f"Processing Complete: No AWB or CCA data found in '{invoice_filename}'. Excel file not generated.", 'warning')
-        else:
-            # Display success and results using flash messages
-            flash(f"File '{invoice_filename}' processed successfully!")
-            flash(f"AWB Rows Processed: {results['invoices_rows']}")
-            flash(f"CCA Rows Processed: {results['cca_rows']}") # Updated CCA count name
-            flash(f"Total Net Due for AWB (from Invoice): {results['total_net_due_awb']:.2f}")
-            flash(f"<a href='{results['download_url']}'>Download Processed Excel File: {results['excel_file']}</a>", 'download') # Use a specific category for styling
-
-        return redirect(url_for('index'))
+            return finish(status="failed", results=results,
+                          error="Processing completed, but encountered issues. Excel file not generated.")
+        return finish(status="done", results=results)
 
+    except MemoryError:
+        raise
     except Exception as e:
         error_message = f"Error processing file: {e}"
         print(error_message)
         import traceback
         traceback.print_exc()
-        flash(f"Error during processing: {error_message}", 'error')
-        return redirect(url_for('index'))
+        return finish(status="failed", error=error_message)
 
     finally:
         # Clean up uploaded files
-        if invoice_file_path and os.path.exists(invoice_file_path):
-            try: os.remove(invoice_file_path)
-            except Exception as e: print(f"Error removing invoice file {invoice_file_path}: {e}")
-        if report_file_path and os.path.exists(report_file_path):
-             try: os.remove(report_file_path)
-             except Exception as e: print(f"Error removing report file {report_file_path}: {e}")
+        for path in (invoice_file_path, report_file_path):
+            if path and os.path.exists(path):
+                try: os.remove(path)
+                except Exception as e: print(f"Error removing uploaded file {path}: {e}")
+
+def record_job_metrics(status):
+    """job_queue on_done callback: adds a finished job to METRICS (runs in the web process)."""
+    results = status.get("results") or {}
+    details = {"timings": status.get("timings"), "pages": results.get("pages"),
+               "discrepancies": results.get("discrepancies")}
+    if "invoices_rows" in results:
+        details["rows"] = {"invoices": results["invoices_rows"], "cca": results.get("cca_rows", 0)}
+    seconds = None
+    if status.get("started_at") and status.get("finished_at"):
+        seconds = status["finished_at"] - status["started_at"]
+    metrics.record_job(METRICS, "app", status.get("status") == "done", seconds, details)
+
+def collect_process_metrics(registry):
+    """Scrape-time gauges: queue depth and the RSS of this process and its job workers."""
+    queue = registry["metrics"]["reconciler_queue_jobs"]
+    metrics.set_gauge(queue, ("in_flight",), in_flight())
+    metrics.set_gauge(queue, ("capacity",), app.config["JOB_WORKERS"] + app.config["JOB_QUEUE_SIZE"])
+    server_mb = rss_mb()
+    metrics.set_rss(registry, "server", server_mb)
+    tree_mb = tree_rss_mb(os.getpid())
+    if tree_mb is not None:
+        metrics.set_rss(registry, "workers", max(0.0, tree_mb - server_mb))
+
+metrics.add_collector(METRICS, collect_process_metrics)
+
+def wants_json():
+    """True for API clients (Accept: application/json), False for the HTML form."""
+    return request.accept_mimetypes.best == 'application/json'
+
+def upload_error(message, status_code=400):
+    if wants_json():
+        return jsonify({"error": message}), status_code
+    flash(message, 'error')
+    return redirect(url_for('index'))
+
+def queue_full_response():
+    response = jsonify({"error": "Too many jobs in progress, please retry shortly."})
+    response.headers["Retry-After"] = "5"
+    return response, 429
+
+def job_response(status):
+    """Job status for the API, with status/download URLs."""
+    response = dict(status)
+    response["status_url"] = url_for('job_status', job_id=status["job_id"])
+    response["events_url"] = url_for('job_events', job_id=status["job_id"])
+    if status.get("status") == "done":
+        response["download_url"] = url_for('job_download', job_id=status["job_id"])
+    return response
+
+@app.route("/upload", methods=["POST"])
+def upload():
+    """
+    Saves both files into a new job directory and queues the processing.
+    Returns right away: 202 with the job id (JSON clients) or a flash with the
+    status link. Answers 429 when the job queue is full.
+    """
+    if 'file' not in request.files or 'report_file' not in request.files:
+        return upload_error('Both Invoice/CCA file and Report file are required.')
+
+    invoice_file = request.files['file']
+    report_file = request.files['report_file']
+
+    if invoice_file.filename == '' or report_file.filename == '':
+        return upload_error('No selected file for one or both inputs.')
+    if not allowed_file(invoice_file.filename, ALLOWED_EXTENSIONS):
+        return upload_error(f'Invalid invoice file type. Allowed: {", ".join(ALLOWED_EXTENSIONS)}')
+    if not allowed_file(report_file.filename, ALLOWED_REPORT_EXTENSIONS):
+        return upload_error(f'Invalid report file type. Allowed: {", ".join(ALLOWED_REPORT_EXTENSIONS)}')
+
+    # --- Backpressure: refuse before saving the uploads ---
+    max_workers, max_pending = app.config["JOB_WORKERS"], app.config["JOB_QUEUE_SIZE"]
+    if not has_capacity(max_workers, max_pending):
+        return queue_full_response()
+
+    # --- Save both files into the job directory ---
+    job_id, job_dir = new_job(app.config["JOBS_FOLDER"])
+    invoice_filename = secure_filename(invoice_file.filename)
+    invoice_file_path = os.path.join(job_dir, invoice_filename)
+    report_file_path = os.path.join(job_dir, secure_filename(report_file.filename))
+    try:
+        invoice_file.save(invoice_file_path)
+        report_file.save(report_file_path)
+        print(f"Job {job_id}: saved {invoice_file_path} and {report_file_path}")
+    except Exception as e:
+        remove_job(job_dir)
+        return upload_error(f"Error saving uploaded files: {e}", 500)
+
+    # --- Queue the processing ---
+    try:
+        submit(job_id, job_dir, run_upload_job, (invoice_file_path, report_file_path), max_workers, max_pending,
+               limits=app.config["JOB_LIMITS"], on_done=record_job_metrics)
+    except QueueFullError:
+        remove_job(job_dir)
+        return queue_full_response()
+
+    status = read_status(app.config["JOBS_FOLDER"], job_id)
+    if wants_json():
+        return jsonify(job_response(status)), 202
+    flash(f"File '{invoice_filename}' queued for processing.")
+    flash(f"<a href='{url_for('job_status', job_id=job_id)}'>Check processing status (job {job_id})</a>")
+    return redirect(url_for('index'))
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    """Job status as JSON (queued, running, done, failed), with the download URL once done."""
+    status = read_status(app.config["JOBS_FOLDER"], job_id)
+    if status is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job_response(status))
+
+@app.route("/jobs/<job_id>/download")
+def job_download(job_id):
+    """Streams the finished workbook of a job."""
+    status = read_status(app.config["JOBS_FOLDER"], job_id)
+    if status is None:
+        return jsonify({"error": "Unknown job"}), 404
+    if status.get("status") != "done":
+        return jsonify({"error": f"Job is {status.get('status')}", "status_url": url_for('job_status', job_id=job_id)}), 409
+    job_dir = job_path(app.config["JOBS_FOLDER"], job_id)
+    return send_from_directory(os.path.abspath(job_dir), status["results"]["excel_file"], as_attachment=True)
+
+@app.route("/jobs/<job_id>/events")
+def job_events(job_id):
+    """
+    Server-Sent Events: status changes, stage progress and a final summary of a job.
+    Each open stream holds a server thread here; job_events.py serves the same
+    stream from an asyncio server for many concurrent clients.
+    """
+    status = read_status(app.config["JOBS_FOLDER"], job_id)
+    if status is None:
+        return jsonify({"error": "Unknown job"}), 404
+    job_dir = job_path(app.config["JOBS_FOLDER"], job_id)
+    offset = last_event_offset(request.headers.get("Last-Event-ID"))
+    return Response(event_stream(job_dir, offset), mimetype="text/event-stream", headers=SSE_HEADERS)
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus metrics of this web process (text exposition format, see metrics.py)."""
+    return Response(metrics.render(METRICS), mimetype="text/plain; version=0.0.4")
 
 if __name__ == '__main__':
     # Set host to '0.0.0.0' to make it accessible on the network
@@ -0,0 +1,336 @@
+"""
+Batch mode of process_invoice.py: many invoice/report pairs, one command.
+
+Replaces the one-`subprocess.run`-per-invoice loops (test_reconciliation.py)
+for month-end backfills. Jobs run in a process pool; each finished job is
+written as one JSON line, in completion order, and the run ends with
+aggregate throughput stats.
+
+USAGE:
+   python process_invoice.py batch <directory|manifest> [options]
+
+   --workers N          processes (default: CPU count)
+   --output PATH        JSONL results (default: stdout)
+   --output-dir DIR     where the workbooks go (default: current directory)
+   --report PATH        report used for every invoice of a directory
+   --workflow-id ID     output name suffix: <invoice>-<ID>.xlsx (default: batch)
+   --log-dir DIR        keep each job's log lines as <invoice>.log (detail set by N8N_LOG_LEVEL)
+   --job-timeout S      wall-clock seconds per job (worker_limits.py)
+   --journal PATH       checkpoint journal (default: <output-dir>/batch-journal.jsonl)
+   --no-journal         rerun everything and record nothing
+   --retries N          retries per failed job (default 2)
+   --retry-backoff S    seconds before the first retry, doubling after (default 5)
+   --memory-budget-mb MB
+                        low-memory paths for jobs predicted to need more than MB
+                        (default: N8N_MEMORY_BUDGET_MB; see memory_budget.py)
+   --metrics-file PATH  add the run's Prometheus metrics to this textfile collector
+                        file (default: N8N_METRICS_FILE; see metrics.py). Journal
+                        skips count as hits of cache "batch_journal"
+
+INPUTS:
+- Directory: every *.pdf under it (recursively), paired with --report or
+  with the single .xls/.xlsx report in the PDF's own directory.
+- Manifest (.csv with a header, or .jsonl): one job per row/line with
+  "invoice" and "report" and optionally "workflow_id" and "output_filename".
+  Relative paths resolve against the manifest's directory.
+
+JSONL LINE (one per job):
+   {"invoice", "report", "success", "output_file", "pages", "seconds",
+    "summary", "discrepancies", "rows", "report_rows", "report_format", "timings"}
+   or {..., "success": false, "error"}
+   plus "attempts", and "skipped": true for work reported from the journal.
+Stats (jobs, failed, pages, jobs/min, pages/sec) are printed last: to stdout
+with --output, else to stderr. Exits with 1 if any job failed.
+
+CHECKPOINTS (journal.py):
+- Every attempt is appended to the journal. A rerun with the same inputs and
+  options skips jobs journaled as done whose workbook still exists, and
+  retries everything else.
+- Workbooks and the --output file are written under a temporary name and
+  renamed into place when complete, so a crash never leaves a partial file
+  under the final name.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from contextlib import redirect_stdout, redirect_stderr
+
+from result_json import dumps, atomic_path
+from worker_limits import DEFAULT_LIMITS, JobTimeout, job_limits, limit_error
+
+REPORT_EXTENSIONS = ('.xls', '.xlsx')
+NO_DATA_ERROR = "No data found in PDF files"  # not retried: the same PDF gives the same result
+
+
+# --- Job Discovery ---
+
+def _reports_in(directory):
+    return sorted(name for name in os.listdir(directory) if name.lower().endswith(REPORT_EXTENSIONS))
+
+
+def jobs_from_directory(directory, report=None):
+    """Jobs for every PDF under directory. Raises ValueError when a report can't be chosen."""
+    jobs = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        pdfs = sorted(name for name in files if name.lower().endswith('.pdf'))
+        if not pdfs:
+            continue
+        job_report = report
+        if job_report is None:
+            reports = _reports_in(root)
+            if len(reports) != 1:
+                raise ValueError(f"{root}: expected exactly one report file next to the invoices, found {len(reports)}"
+                                 " (use --report)")
+            job_report = os.path.join(root, reports[0])
+        jobs.extend({"invoice": os.path.join(root, name), "report": job_report} for name in pdfs)
+    return jobs
+
+
+def jobs_from_manifest(manifest_path):
+    """Jobs listed in a .csv or .jsonl manifest. Raises ValueError on a malformed entry."""
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path, newline='') as f:
+        if manifest_path.lower().endswith('.csv'):
+            entries = list(csv.DictReader(f))
+        else:
+            entries = [json.loads(line) for line in f if line.strip()]
+
+    jobs = []
+    for number, entry in enumerate(entries, start=1):
+        entry = {key.strip(): value for key, value in entry.items() if value not in (None, '')}
+        if 'invoice' not in entry or 'report' not in entry:
+            raise ValueError(f"{manifest_path}: entry {number} needs 'invoice' and 'report'")
+        for key in ('invoice', 'report'):
+            entry[key] = os.path.join(base_dir, entry[key])
+        jobs.append(entry)
+    return jobs
+
+
+# --- Worker ---
+
+def run_batch_job(job, output_dir, workflow_id, log_dir, limits, memory_budget_mb=None):
+    """Processes one pair (runs in a pool process). Returns the job's JSONL record."""
+    from process_invoice import process_files
+    from structured_log import configure_logging
+
+    record = {"invoice": job["invoice"], "report": job["report"]}
+    details = {}
+    log_path = os.devnull
+    if log_dir:
+        log_path = os.path.join(log_dir, os.path.splitext(os.path.basename(job["invoice"]))[0] + ".log")
+
+    start = time.perf_counter()
+    with open(log_path, 'w') as log, redirect_stdout(log), redirect_stderr(log):
+        configure_logging(job_id=os.path.basename(job["invoice"]))
+        try:
+            with job_limits(limits):
+                output_path = process_files(job["invoice"], job["report"],
+                                            workflow_id=job.get("workflow_id") or workflow_id,
+                                            custom_filename=job.get("output_filename"),
+                                            details=details, output_dir=output_dir,
+                                            memory_budget_mb=memory_budget_mb)
+            if output_path:
+                record.update(success=True, output_file=output_path)
+            else:
+                record.update(success=False, error=NO_DATA_ERROR)
+        except (JobTimeout, MemoryError) as e:
+            record.update(success=False, error=limit_error(e, limits))
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            record.update(success=False, error=str(e) or type(e).__name__)
+    record["seconds"] = round(time.perf_counter() - start, 3)
+    record.update(details)
+    return record
+
+
+# --- Runner ---
+
+def _worker_failure(job, error):
+    return {"invoice": job["invoice"], "report": job["report"], "success": False,
+            "error": f"Worker failed: {error!r}"}
+
+
+def run_jobs(jobs, workers, out, output_dir=None, workflow_id="batch", log_dir=None, limits=None,
+             journal_path=None, retries=0, backoff=5.0, metrics_path=None, memory_budget_mb=None):
+    """
+    Runs jobs in a process pool and writes one JSON line per finished job to out.
+    With journal_path, jobs already completed there are reported from the journal
+    ("skipped": true) instead of being rerun, and every attempt is journaled.
+    Failed jobs are retried up to retries times, waiting backoff * 2**n seconds.
+    With metrics_path, the finished jobs are added to that metrics textfile.
+    memory_budget_mb is passed to process_files (see memory_budget.py).
+    Returns the aggregate stats dict.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+    from concurrent.futures.process import BrokenProcessPool
+    from journal import job_key, load_journal, is_complete, append_entry
+
+    from metrics import new_registry, record_job, record_cache, update_textfile
+
+    limits = DEFAULT_LIMITS if limits is None else limits
+    registry = new_registry()
+    stats = {"jobs": len(jobs), "succeeded": 0, "failed": 0, "skipped": 0, "retried": 0, "pages": 0}
+    start = time.perf_counter()
+
+    def report(record):
+        out.write(dumps(record).decode("utf-8") + "\n")
+        out.flush()
+
+    # --- Skip work completed by an earlier run ---
+    journal = load_journal(journal_path)
+    todo = []
+    for job in jobs:
+        try:
+            key = job_key(job, {"output_dir": output_dir, "workflow_id": workflow_id}) if journal_path else None
+        except OSError as e:
+            stats["failed"] += 1
+            report({"invoice": job["invoice"], "report": job["report"], "success": False, "error": str(e)})
+            continue
+        if key and is_complete(journal.get(key)):
+            stats["skipped"] += 1
+            report(dict(journal[key]["record"], skipped=True))
+            continue
+        todo.append((job, key))
+    if journal_path:
+        record_cache(registry, "batch_journal", True, stats["skipped"])
+        record_cache(registry, "batch_journal", False, len(todo))
+
+    def new_pool():
+        # 'spawn': a fresh interpreter per worker, and max_tasks_per_child needs it
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                   max_tasks_per_child=limits.get("max_jobs") or None)
+
+    pool = [new_pool()]
+    running = {}  # future -> (job, key, attempt)
+    waiting = []  # (due time, job, key, attempt) for retries
+
+    def launch(job, key, attempt):
+        try:
+            future = pool[0].submit(run_batch_job, job, output_dir, workflow_id, log_dir, limits,
+                                    memory_budget_mb)
+        except BrokenProcessPool:
+            # A killed worker breaks the pool; the jobs it held come back as failures
+            pool[0].shutdown(wait=False)
+            pool[0] = new_pool()
+            future = pool[0].submit(run_batch_job, job, output_dir, workflow_id, log_dir, limits,
+                                    memory_budget_mb)
+        running[future] = (job, key, attempt)
+
+    try:
+        for job, key in todo:
+            launch(job, key, 1)
+        while running or waiting:
+            now = time.monotonic()
+            for item in [item for item in waiting if item[0] <= now]:
+                waiting.remove(item)
+                launch(*item[1:])
+            timeout = max(0.0, min(item[0] for item in waiting) - now) if waiting else None
+            if not running:
+                time.sleep(timeout)
+                continue
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                job, key, attempt = running.pop(future)
+                try:
+                    record = future.result()
+                except Exception as e:
+                    record = _worker_failure(job, e)  # e.g. killed by the OOM killer
+                record["attempts"] = attempt
+                if journal_path:
+                    append_entry(journal_path, key, "done" if record["success"] else "failed", attempt, record)
+
+                if not record["success"] and record.get("error") != NO_DATA_ERROR and attempt <= retries:
+                    delay = backoff * 2 ** (attempt - 1)
+                    print(f"Retrying {job['invoice']} in {delay:.1f} s (attempt {attempt + 1}): {record['error']}",
+                          file=sys.stderr)
+                    stats["retried"] += 1
+                    waiting.append((time.monotonic() + delay, job, key, attempt + 1))
+                    continue
+                stats["succeeded" if record["success"] else "failed"] += 1
+                stats["pages"] += record.get("pages", 0)
+                record_job(registry, "batch", record["success"], record.get("seconds"), record)
+                report(record)
+    finally:
+        pool[0].shutdown(wait=True)
+        if metrics_path:
+            try:
+                update_textfile(metrics_path, registry)
+            except OSError as e:
+                print(f"Could not write the metrics file {metrics_path}: {e}", file=sys.stderr)
+
+    elapsed = time.perf_counter() - start
+    processed = stats["jobs"] - stats["skipped"]
+    stats["seconds"] = round(elapsed, 3)
+    stats["jobs_per_min"] = round(processed * 60 / elapsed, 2) if elapsed else 0.0
+    stats["pages_per_sec"] = round(stats["pages"] / elapsed, 2) if elapsed else 0.0
+    return stats
+
+
+def run_batch(args):
+    """Entry point of `process_invoice.py batch ...` (args without 'batch')."""
+    parser = argparse.ArgumentParser(prog="process_invoice.py batch",
+                                     description="Process many invoice/report pairs in parallel")
+    parser.add_argument("source", help="Directory of invoices or a .csv/.jsonl manifest")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--output", help="JSONL results file (default: stdout)")
+    parser.add_argument("--output-dir", help="Directory for the workbooks (default: current directory)")
+    parser.add_argument("--report", help="Report used for every invoice of a directory")
+    parser.add_argument("--workflow-id", default="batch")
+    parser.add_argument("--log-dir", help="Keep each job's processing log here")
+    parser.add_argument("--job-timeout", type=int, default=DEFAULT_LIMITS["timeout"])
+    parser.add_argument("--journal", help="Checkpoint journal (default: batch-journal.jsonl in --output-dir)")
+    parser.add_argument("--no-journal", action="store_true", help="Rerun everything, record nothing")
+    parser.add_argument("--retries", type=int, default=2, help="Retries per failed job")
+    parser.add_argument("--retry-backoff", type=float, default=5.0, help="Seconds before the first retry (doubles)")
+    parser.add_argument("--memory-budget-mb", type=float, default=os.environ.get("N8N_MEMORY_BUDGET_MB") or None,
+                        help="Low-memory paths for jobs predicted to exceed this (default: N8N_MEMORY_BUDGET_MB)")
+    parser.add_argument("--metrics-file", default=os.environ.get("N8N_METRICS_FILE"),
+                        help="Prometheus textfile to add the run's metrics to (default: N8N_METRICS_FILE)")
+    options = parser.parse_args(args)
+
+    try:
+        if os.path.isdir(options.source):
+            jobs = jobs_from_directory(options.source, options.report)
+        else:
+            jobs = jobs_from_manifest(options.source)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    if not jobs:
+        print(f"Error: no invoices found in {options.source}", file=sys.stderr)
+        sys.exit(1)
+
+    for directory in (options.output_dir, options.log_dir):
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+    limits = dict(DEFAULT_LIMITS, timeout=options.job_timeout)
+    workers = max(1, min(options.workers, len(jobs)))
+    journal_path = None
+    if not options.no_journal:
+        journal_path = options.journal or os.path.join(options.output_dir or '.', "batch-journal.jsonl")
+    print(f"Batch: {len(jobs)} jobs on {workers} workers (journal: {journal_path})", file=sys.stderr)
+
+    settings = dict(output_dir=options.output_dir, workflow_id=options.workflow_id, log_dir=options.log_dir,
+                    limits=limits, journal_path=journal_path, retries=options.retries, backoff=options.retry_backoff,
+                    metrics_path=options.metrics_file, memory_budget_mb=options.memory_budget_mb)
+    if options.output:
+        # Published only once complete; progress is in the journal meanwhile
+        with atomic_path(options.output) as tmp_path, open(tmp_path, 'w') as out:
+            stats = run_jobs(jobs, workers, out, **settings)
+    else:
+        stats = run_jobs(jobs, workers, sys.stdout, **settings)
+
+    summary = (f"Batch done: {stats['jobs']} jobs ({stats['failed']} failed, {stats['skipped']} already done, "
+               f"{stats['retried']} retries), {stats['pages']} pages "
+               f"in {stats['seconds']:.1f} s -> {stats['jobs_per_min']:.1f} jobs/min, "
+               f"{stats['pages_per_sec']:.1f} pages/sec")
+    # stdout carries the JSONL unless --output is given
+    print(summary, file=sys.stdout if options.output else sys.stderr)
+    sys.exit(1 if stats["failed"] else 0)
@@ -0,0 +1,285 @@
+"""
+Engine benchmarks: per-stage time and throughput of process_files at several
+input sizes, with JSON baselines and a regression check.
+
+Inputs come from synthetic_inputs.py (same seed -> same files), so results
+are comparable between runs and machines carry no customer data. Stage times
+are the telemetry.py spans of a real process_files run, grouped as:
+
+   extract_awb    cca_locate + layout + parse   (extract_awb_data)
+   extract_cca    cca                           (extract_cca_data)
+   report_read    report_read                   (pd.read_excel of the AllDataReport)
+   merge          normalize + join              (key normalization and the left merge)
+   excel_write    sheets                        (render_workbook)
+   total          the whole process_files call
+
+USAGE:
+   python benchmarks.py run [--sizes 100,1000] [--repeat 3] [--output bench.json] [--compare BASELINE] [--model M]
+                            [--max-estimate-error 0.4]
+   python benchmarks.py compare BASELINE CURRENT [--threshold 0.15] [--min-ms 5]
+
+- run: per size, one warm-up and --repeat timed runs; the median of each stage
+  is kept. Prints a table and writes JSON (--output; default stdout).
+  Generated inputs are cached in --data-dir.
+- compare: a stage regressed when it is slower than the baseline by more
+  than --threshold (relative) and --min-ms (absolute, so 1 ms stages do not
+  flap). Exits 1 on any regression.
+
+ESTIMATE ACCURACY: per size, "estimate" holds duration_estimate.py's estimate
+of the run ("ms", with the deployed model or --model), its "error" relative to
+the median total (0.1 = 10% high) and "cost_ms", the time to read the inputs'
+page and AWB counts and report rows; "estimate_accuracy" holds the mean and
+max absolute error. run exits 1 when a size's estimate is off by more than
+--max-estimate-error (0 disables the check). The default model is fitted on
+these inputs on the benchmark machine, within 15% there from 20 to 1000 AWBs;
+on a much faster or slower machine, fit a model from its own jobs
+(duration_estimate.py fit) and pass it as --model.
+
+BASELINES: bench_baseline.json in this directory, recorded with
+`python benchmarks.py run --output bench_baseline.json`. Times depend on the
+machine; compare prints both machines and warns when they differ, so
+re-record the baseline on the machine that runs the check.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+DOCS_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(DOCS_DIR, "bench_baseline.json")
+DEFAULT_SIZES = [100, 1000]
+DEFAULT_REPEAT = 3
+DEFAULT_THRESHOLD = 0.15
+DEFAULT_MIN_MS = 5.0
+DEFAULT_MAX_ESTIMATE_ERROR = 0.4
+SEED = 45
+
+# Benchmark stage -> telemetry spans it adds up
+STAGE_GROUPS = {
+    "extract_awb": ["cca_locate", "layout", "parse"],
+    "extract_cca": ["cca"],
+    "report_read": ["report_read"],
+    "merge": ["normalize", "join"],
+    "excel_write": ["sheets"],
+}
+
+
+def machine_info():
+    return {"python": platform.python_version(), "platform": platform.platform(),
+            "processor": platform.processor() or platform.machine(), "cpus": os.cpu_count()}
+
+
+def group_stages(stage_ms, total_ms):
+    """Benchmark stages (ms) from a timings()["stages"] dict."""
+    groups = {name: round(sum(stage_ms.get(span, 0.0) for span in spans), 3)
+              for name, spans in STAGE_GROUPS.items()}
+    groups["total"] = round(total_ms, 3)
+    return groups
+
+
+def inputs_for(size, data_dir):
+    """Invoice/report paths of the synthetic inputs for size (generated once per data_dir)."""
+    from synthetic_inputs import generate
+
+    name = f"bench-{size}-{SEED}"
+    paths = {
+        "invoice": os.path.join(data_dir, f"{name}.pdf"),
+        "report": os.path.join(data_dir, f"AllDataReport_{name}.xlsx"),
+    }
+    if not all(os.path.exists(path) for path in paths.values()):
+        generate(data_dir, name=name, awbs=size, cca=min(25, max(1, size // 100)), seed=SEED)
+    return paths
+
+
+def run_once(paths, output_dir):
+    """Benchmark stages (ms) of one process_files run."""
+    from process_invoice import process_files
+    from telemetry import new_timer, timings
+
+    timer = new_timer()
+    details = {}
+    output_path = process_files(paths["invoice"], paths["report"], workflow_id="bench", details=details,
+                                output_dir=output_dir, timer=timer)
+    if not output_path:
+        raise RuntimeError(f"process_files failed for {paths['invoice']}")
+    result = timings(timer)
+    return group_stages(result["stages"], result["total_ms"])
+
+
+def run_size(size, repeat, data_dir):
+    """Median stage times and throughput (AWBs/s) of repeat runs at size, after one warm-up."""
+    paths = inputs_for(size, data_dir)
+    with tempfile.TemporaryDirectory() as output_dir:
+        run_once(paths, output_dir)
+        runs = [run_once(paths, output_dir) for _ in range(repeat)]
+    median_ms = {stage: round(statistics.median(run[stage] for run in runs), 3) for stage in runs[0]}
+    return {
+        "awbs": size,
+        "runs": repeat,
+        "median_ms": median_ms,
+        "min_ms": {stage: min(run[stage] for run in runs) for stage in runs[0]},
+        "awbs_per_sec": {stage: round(size / (ms / 1000.0), 1) if ms else None for stage, ms in median_ms.items()},
+    }
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, repeat=DEFAULT_REPEAT, data_dir=None, model=None):
+    """The benchmark JSON: machine info plus run_size() per size, and the estimate accuracy."""
+    data_dir = data_dir or os.path.join(tempfile.gettempdir(), "reconciler-bench")
+    os.makedirs(data_dir, exist_ok=True)
+    results = {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "machine": machine_info(),
+        "sizes": {str(size): run_size(size, repeat, data_dir) for size in sizes},
+    }
+    add_estimates(results, data_dir, model)
+    return results
+
+
+def add_estimates(results, data_dir, model=None):
+    """Adds duration_estimate.py's estimate and its error per size (see module docstring)."""
+    from duration_estimate import input_features, load_model, predict
+
+    model = model or load_model()
+    errors = []
+    for size, entry in results["sizes"].items():
+        paths = inputs_for(int(size), data_dir)
+        start = time.perf_counter()
+        features = input_features(paths["invoice"], paths["report"])
+        cost_ms = (time.perf_counter() - start) * 1000.0
+        estimate_ms = predict(model, features)["estimate_ms"]
+        total_ms = entry["median_ms"]["total"]
+        error = round((estimate_ms - total_ms) / total_ms, 4) if total_ms else 0.0
+        entry["estimate"] = {"ms": estimate_ms, "error": error, "cost_ms": round(cost_ms, 3)}
+        errors.append(abs(error))
+    results["estimate_accuracy"] = {
+        "mean_abs_error": round(statistics.fmean(errors), 4) if errors else None,
+        "max_abs_error": max(errors) if errors else None,
+    }
+
+
+def inaccurate_estimates(results, max_error=DEFAULT_MAX_ESTIMATE_ERROR):
+    """Sizes whose estimate is off by more than max_error (relative; 0 disables the check)."""
+    if not max_error:
+        return []
+    return [size for size, entry in results["sizes"].items()
+            if entry.get("estimate") and abs(entry["estimate"]["error"]) > max_error]
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD, min_ms=DEFAULT_MIN_MS):
+    """
+    Rows for every size/stage present in both: {"size", "stage", "baseline_ms",
+    "current_ms", "change", "regression"}. change is relative (0.2 = 20% slower).
+    """
+    rows = []
+    for size, entry in current["sizes"].items():
+        base = baseline["sizes"].get(size)
+        if base is None:
+            continue
+        for stage, current_ms in entry["median_ms"].items():
+            baseline_ms = base["median_ms"].get(stage)
+            if baseline_ms is None:
+                continue
+            change = (current_ms - baseline_ms) / baseline_ms if baseline_ms else 0.0
+            rows.append({
+                "size": int(size), "stage": stage, "baseline_ms": baseline_ms, "current_ms": current_ms,
+                "change": round(change, 4),
+                "regression": change > threshold and current_ms - baseline_ms > min_ms,
+            })
+    return rows
+
+
+def print_results(results, out=sys.stdout):
+    stages = list(STAGE_GROUPS) + ["total"]
+    print(f"{'awbs':>7}  " + "  ".join(f"{stage:>12}" for stage in stages) + "   (median ms; AWBs/s below)", file=out)
+    for size, entry in results["sizes"].items():
+        print(f"{size:>7}  " + "  ".join(f"{entry['median_ms'][stage]:12.1f}" for stage in stages), file=out)
+        print(f"{'':>7}  " + "  ".join(f"{entry['awbs_per_sec'][stage] or 0:12.0f}" for stage in stages), file=out)
+        estimate = entry.get("estimate")
+        if estimate:
+            print(f"{'':>7}  estimate {estimate['ms']:.0f} ms ({estimate['error'] * 100:+.1f}%), "
+                  f"inputs read in {estimate['cost_ms']:.1f} ms", file=out)
+    accuracy = results.get("estimate_accuracy")
+    if accuracy and accuracy["mean_abs_error"] is not None:
+        print(f"Estimate error: mean {accuracy['mean_abs_error'] * 100:.1f}%, "
+              f"max {accuracy['max_abs_error'] * 100:.1f}%", file=out)
+
+
+def print_comparison(rows, baseline, current, threshold, out=sys.stdout):
+    if baseline.get("machine") != current.get("machine"):
+        print(f"WARNING: different machines (baseline {baseline.get('machine')}, "
+              f"current {current.get('machine')}); times are not comparable", file=out)
+    for row in rows:
+        mark = "REGRESSION" if row["regression"] else ""
+        print(f"{row['size']:>7}  {row['stage']:<12} {row['baseline_ms']:10.1f} -> {row['current_ms']:10.1f} ms "
+              f"{row['change'] * 100:+7.1f}%  {mark}", file=out)
+    regressions = [row for row in rows if row["regression"]]
+    print(f"{len(regressions)} regression(s) beyond {threshold * 100:.0f}%", file=out)
+    return regressions
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="process_invoice.py engine benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="Run the benchmarks")
+    run_parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="AWB counts, comma separated")
+    run_parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    run_parser.add_argument("--data-dir", default=None, help="Cache of generated inputs")
+    run_parser.add_argument("--output", default=None, help="Write the JSON here (default: stdout)")
+    run_parser.add_argument("--compare", default=None, metavar="BASELINE", help="Then compare with BASELINE")
+    run_parser.add_argument("--model", default=None, help="duration_estimate.py model JSON (default: the deployed one)")
+    run_parser.add_argument("--max-estimate-error", type=float, default=DEFAULT_MAX_ESTIMATE_ERROR,
+                            help="Fail when an estimate is off by more than this (relative, 0: no check)")
+    for sub in (run_parser, commands.add_parser("compare", help="Compare two benchmark JSON files")):
+        sub.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+        sub.add_argument("--min-ms", type=float, default=DEFAULT_MIN_MS)
+    commands.choices["compare"].add_argument("baseline")
+    commands.choices["compare"].add_argument("current")
+    args = parser.parse_args()
+
+    inaccurate = []
+    if args.command == "compare":
+        baseline, current = load(args.baseline), load(args.current)
+    else:
+        from structured_log import configure_logging
+        from result_json import atomic_path
+        from duration_estimate import load_model
+
+        configure_logging()
+        sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+        current = run_benchmarks(sizes, args.repeat, args.data_dir, load_model(args.model))
+        print_results(current, out=sys.stderr if args.output is None else sys.stdout)
+        if args.output:
+            with atomic_path(args.output) as tmp_path, open(tmp_path, "w") as f:
+                json.dump(current, f, indent=2)
+        else:
+            json.dump(current, sys.stdout, indent=2)
+            print()
+        inaccurate = inaccurate_estimates(current, args.max_estimate_error)
+        if inaccurate:
+            print(f"Estimate off by more than {args.max_estimate_error * 100:.0f}% at {', '.join(inaccurate)} AWBs",
+                  file=sys.stderr)
+        if not args.compare:
+            if inaccurate:
+                sys.exit(1)
+            return
+        baseline = load(args.compare)
+
+    rows = compare(baseline, current, args.threshold, args.min_ms)
+    out = sys.stderr if args.command == "run" and args.output is None else sys.stdout
+    if print_comparison(rows, baseline, current, args.threshold, out=out) or inaccurate:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Typed per-column buffers for the PDF extractors.
+
+extract_awb_data/extract_cca_data used to append one dict of strings per row
+(19 keys per AWB, 16 per CCA), build the DataFrame from that list of dicts and
+then convert every amount column again with safe_to_numeric. Each row cost a
+dict plus a str object per field, all alive until the DataFrame was built.
+
+The extractors now fill one buffer per column while parsing:
+- 'float':    array('d') of amounts/weights, parsed once (no str kept)
+- 'category': array('i') of codes + a small value->code dict (Origin/Destination)
+- 'string':   serials/references; Arrow-backed strings when pyarrow is installed
+- 'str':      plain list (dates, free text)
+
+buffers_to_frame() builds the DataFrame straight from the buffers: float
+columns are wrapped without copying (np.frombuffer) and category columns
+become pandas Categoricals.
+
+A float column can keep a raw value that did not parse (CCA amounts keep the
+original text, as before); such a column is materialized as object dtype.
+
+DTYPE POLICY:
+The same kinds are applied to frames built elsewhere (split AWB keys, the
+report subset) with apply_dtypes(), so the lean dtypes hold through the merge
+and up to rendering. Amounts, weights and rates stay float64: they are written
+to Excel as-is and compared at 2/5 decimals, where float32 would change both.
+memory_report() logs (DEBUG) the deep memory use per DataFrame.
+"""
+
+from array import array
+
+import numpy as np
+import pandas as pd
+
+from structured_log import get_logger
+
+log = get_logger("column_buffers")
+
+try:
+    import pyarrow  # noqa: F401 (only needed for the Arrow string dtype)
+    STRING_DTYPE = pd.StringDtype("pyarrow")
+except ImportError:
+    STRING_DTYPE = None  # keep pandas' default string/object dtype
+
+NAN = float('nan')
+
+
+def new_buffers(columns):
+    """
+    Creates empty buffers in column order.
+    columns: list of (column name, kind) with kind 'float', 'category', 'string' or 'str'
+    """
+    buffers = {}
+    for name, kind in columns:
+        if kind == 'float':
+            buffers[name] = {"kind": kind, "values": array('d'), "raw": {}}
+        elif kind == 'category':
+            buffers[name] = {"kind": kind, "codes": array('i'), "categories": {}}
+        else:
+            buffers[name] = {"kind": 'string' if kind == 'string' else 'str', "values": []}
+    return buffers
+
+
+def to_float(text):
+    """Parses text as float, NaN when it is not a number (same as safe_to_numeric)."""
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return NAN
+
+
+def append_float(buffer, value):
+    """Appends a parsed float. Any other value is stored as NaN and kept as raw value."""
+    if isinstance(value, float):
+        buffer["values"].append(value)
+    else:
+        buffer["raw"][len(buffer["values"])] = value
+        buffer["values"].append(NAN)
+
+
+def append_category(buffer, value):
+    categories = buffer["categories"]
+    code = categories.get(value)
+    if code is None:
+        code = categories[value] = len(categories)
+    buffer["codes"].append(code)
+
+
+def append_text(buffer, value):
+    buffer["values"].append(value)
+
+
+def buffer_rows(buffers):
+    """Number of rows appended (taken from the first column)."""
+    for buffer in buffers.values():
+        return len(buffer["codes"] if buffer["kind"] == 'category' else buffer["values"])
+    return 0
+
+
+def _column(buffer):
+    kind = buffer["kind"]
+    if kind == 'float':
+        values = np.frombuffer(buffer["values"], dtype=np.float64)
+        if not buffer["raw"]:
+            return values
+        values = values.astype(object)
+        for idx, raw in buffer["raw"].items():
+            values[idx] = raw
+        return values
+    if kind == 'category':
+        codes = np.frombuffer(buffer["codes"], dtype=np.int32)
+        return pd.Categorical.from_codes(codes, categories=list(buffer["categories"]))
+    if kind == 'string' and STRING_DTYPE is not None:
+        return pd.array(buffer["values"], dtype=STRING_DTYPE)
+    return buffer["values"]
+
+
+def buffers_to_frame(buffers):
+    """Builds the DataFrame from the buffers. No rows gives an empty DataFrame (no columns)."""
+    if not buffer_rows(buffers):
+        return pd.DataFrame()
+    return pd.DataFrame({name: _column(buffer) for name, buffer in buffers.items()})
+
+
+def apply_dtypes(df, dtypes):
+    """
+    Applies the dtype policy to an existing frame (in place, columns not present are skipped).
+    dtypes: {column name: kind} with kind 'category', 'string' or 'float'
+    """
+    for name, kind in dtypes.items():
+        if name not in df.columns:
+            continue
+        if kind == 'category':
+            df[name] = df[name].astype('category')
+        elif kind == 'string' and STRING_DTYPE is not None:
+            df[name] = df[name].astype(STRING_DTYPE)
+        elif kind == 'float':
+            df[name] = pd.to_numeric(df[name], errors='coerce').astype(np.float64)
+    return df
+
+
+def align_categories(frames, name):
+    """
+    Gives column name the same categories in every frame (in place), so a merge
+    on it joins on category codes instead of casting both sides to object.
+    """
+    from pandas.api.types import union_categoricals
+
+    columns = [df[name] for df in frames if name in df.columns and isinstance(df[name].dtype, pd.CategoricalDtype)]
+    if len(columns) < 2:
+        return
+    categories = union_categoricals(columns, ignore_order=True).categories
+    for df in frames:
+        if name in df.columns and isinstance(df[name].dtype, pd.CategoricalDtype):
+            df[name] = df[name].cat.set_categories(categories)
+
+
+def memory_report(frames):
+    """
+    Logs rows and deep memory use per DataFrame, with the largest dtype groups.
+    frames: {name: DataFrame}. Returns {name: bytes}.
+    """
+    report = {}
+    log.debug("DataFrame Memory Report")
+    for name, df in frames.items():
+        if df is None or df.empty:
+            report[name] = 0
+            log.debug("%s: empty", name)
+            continue
+        usage = df.memory_usage(deep=True, index=False)
+        report[name] = int(usage.sum())
+        by_dtype = {}
+        for col, nbytes in usage.items():
+            dtype = str(df[col].dtype)
+            by_dtype[dtype] = by_dtype.get(dtype, 0) + int(nbytes)
+        breakdown = ", ".join(f"{dtype} {nbytes / 1024:.1f} KB"
+                              for dtype, nbytes in sorted(by_dtype.items(), key=lambda item: -item[1]))
+        log.debug("%s: %s rows x %s cols, %.1f KB (%s)", name, len(df), len(df.columns), report[name] / 1024, breakdown)
+    return report
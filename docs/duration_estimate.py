@@ -0,0 +1,450 @@
+"""
+Processing-time estimate for process_invoice.py jobs (PRD FR4.18), trained
+from recorded job telemetry.
+
+estimate(invoice_path, report_path) predicts a job's duration in ms from what
+is cheap to read before the job runs: the PDF's page count and AWB count and
+the report's row count (from the .xls DIMENSIONS record or the .xlsx sheet's
+row tags, no cell is parsed). AWBs are counted as the AWB dates (01JAN25) in
+the pages' content streams, which are decompressed but not laid out: about
+0.1 ms per AWB where the job costs 10 to 20 ms per AWB.
+
+MODEL (one linear fit per stage, ms = intercept_ms + sum of ms_per[driver] * driver):
+   extract_awb   cca_locate + layout + parse   AWBs, pages
+   extract_cca   cca                           pages
+   report_read   report_read                   report rows, fitted per report format
+                                               (.xls is ~10x slower per row than .xlsx)
+   merge         normalize + join              AWBs + report rows
+   excel_write   sheets                        AWBs
+   other         the rest of total_ms          AWBs, pages
+Layout cost follows the text on a page, so AWB density (AWBs per page, the
+way airlines' invoice layouts differ) decides the cost of a page: with both
+drivers one fit holds for sparse and dense invoices, so records of several
+airlines can be fitted together. A driver that gets a
+negative or undeterminable coefficient (e.g. all records at one density) is
+left out of that stage. When no AWB date is found (text the engine can't read
+either), AWBs are predicted as awbs_per_page (fitted over the records) times
+the page count.
+
+TRAINING (fit): from records of finished jobs, which carry pages, rows,
+report_rows, report_format and timings (telemetry.py):
+- result JSON files of process_invoice.py (one object per file);
+- batch.py JSONL output and its checkpoint journal (journal entries' "record").
+Failed jobs, journal replays ("skipped") and records without these fields
+are ignored. The model is JSON: MODEL_PATH next to this script, or
+N8N_DURATION_MODEL; without either, DEFAULT_MODEL, which is fitted on the
+synthetic_inputs.py size sweep at benchmark density, the same sizes at the
+sample invoice's density (about 5.5 AWBs per page), and the sample invoice.
+Fitting from the deployment's own jobs also captures its machine.
+
+ACCURACY: accuracy() compares predictions with recorded totals; fit stores
+it in the model, and benchmarks.py reports it per benchmark size and fails a
+run whose estimates are off by more than --max-estimate-error.
+
+USAGE:
+   python duration_estimate.py estimate INVOICE.pdf REPORT.xls [--model M]   # JSON on stdout
+   python duration_estimate.py fit RECORDS.jsonl [result.json ...] [--output duration_model.json]
+"""
+
+import argparse
+import datetime
+import json
+import os
+import re
+import statistics
+import struct
+import sys
+
+DOCS_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.path.join(DOCS_DIR, "duration_model.json")
+REPORT_HEADER_ROWS = 8  # process_files reads the report with header=7
+# An AWB line's second row starts with its date; CCA rows use DDMMM
+AWB_DATE_REGEX = re.compile(
+    rb"(?<![0-9A-Za-z])\d{2}(?:JAN|FEB|MAR|APR|MAY|JUN|JUL|AUG|SEP|OCT|NOV|DEC)\d{2}(?![0-9A-Za-z])")
+
+# Stage -> (telemetry spans it adds up, drivers in order of preference); "other" is total_ms minus the rest
+STAGES = {
+    "extract_awb": (["cca_locate", "layout", "parse"], ("awbs", "pages")),
+    "extract_cca": (["cca"], ("pages",)),
+    "report_read": (["report_read"], ("report_rows",)),
+    "merge": (["normalize", "join"], ("rows",)),
+    "excel_write": (["sheets"], ("awbs",)),
+    "other": (None, ("awbs", "pages")),
+}
+PER_FORMAT_STAGES = ("report_read",)
+
+# Fitted from 22 batch.py records on the benchmark machine (warm workers):
+# synthetic_inputs.py invoices of 20 to 1000 AWBs at its default density
+# (benchmarks.py inputs, about 27 AWBs per page) and of 20 to 800 AWBs at the
+# sample invoice's density (5.5 AWBs per page), and the sample invoice
+# (10 pages, .xls report); mean error 13.7%, max 33%.
+DEFAULT_MODEL = {
+    "records": 22,
+    "awbs_per_page": 10.1872,
+    "stages": {
+        "extract_awb": {"intercept_ms": -178.663, "ms_per": {"awbs": 8.830868, "pages": 61.018453}},
+        "extract_cca": {"intercept_ms": 4.319, "ms_per": {"pages": 0.008498}},
+        "report_read": {"intercept_ms": 18.924, "ms_per": {"report_rows": 0.459072}},
+        "report_read.xlsx": {"intercept_ms": 20.191, "ms_per": {"report_rows": 0.411788}},
+        "report_read.xls": {"intercept_ms": 0.0, "ms_per": {"report_rows": 0.620001}},
+        "merge": {"intercept_ms": 19.908, "ms_per": {"rows": 0.050303}},
+        "excel_write": {"intercept_ms": 42.629, "ms_per": {"awbs": 0.320841}},
+        "other": {"intercept_ms": 44.979, "ms_per": {"pages": 0.225622}},
+    },
+}
+
+
+# --- Input dimensions ---
+
+def pdf_dimensions(path):
+    """
+    {"pages", "awbs"} of an invoice PDF: the AWB dates in the pages' content
+    streams (no layout analysis). awbs is None when they can't be read.
+    """
+    from pdfminer.pdfdocument import PDFDocument
+    from pdfminer.pdfpage import PDFPage
+    from pdfminer.pdfparser import PDFParser
+
+    try:
+        pages = awbs = 0
+        with open(path, 'rb') as f:
+            for page in PDFPage.create_pages(PDFDocument(PDFParser(f))):
+                pages += 1
+                for stream in page.contents:
+                    awbs += len(AWB_DATE_REGEX.findall(stream.get_data()))
+        return {"pages": pages, "awbs": awbs or None}
+    except Exception:
+        import pdfplumber
+        with pdfplumber.open(path) as pdf:
+            return {"pages": len(pdf.pages), "awbs": None}
+
+
+def _xls_rows(path):
+    # BIFF8: the first BOUNDSHEET record (0x0085) in the workbook globals gives
+    # the first sheet's offset; its DIMENSIONS record (0x0200) holds the last row + 1
+    from xlrd.compdoc import CompDoc
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    mem, base, size = CompDoc(data).locate_named_stream("Workbook")
+    end = base + size
+    sheet_offset = None
+    pos = base
+    while pos + 4 <= end:
+        record, length = struct.unpack('<HH', mem[pos:pos + 4])
+        if record == 0x0085 and sheet_offset is None:
+            sheet_offset = struct.unpack('<I', mem[pos + 4:pos + 8])[0]
+        elif record == 0x000A:  # EOF of the globals
+            break
+        pos += 4 + length
+    pos = base + sheet_offset
+    while pos + 4 <= end:
+        record, length = struct.unpack('<HH', mem[pos:pos + 4])
+        if record == 0x0200:
+            return struct.unpack('<I', mem[pos + 8:pos + 12])[0]
+        if record == 0x000A:
+            break
+        pos += 4 + length
+    raise ValueError("No DIMENSIONS record")
+
+
+def _xlsx_rows(path):
+    # Counts the first sheet's <row> tags (the <dimension> element is optional)
+    import re
+    import zipfile
+
+    row_tag = re.compile(rb"<(?:\w+:)?row[ >]")
+    with zipfile.ZipFile(path) as archive:
+        workbook = archive.read("xl/workbook.xml").decode("utf-8", "replace")
+        rels = archive.read("xl/_rels/workbook.xml.rels").decode("utf-8", "replace")
+        sheet_id = re.search(r'<(?:\w+:)?sheet\b[^>]*\br:id="([^"]+)"', workbook).group(1)
+        rel = re.search(r'<Relationship\b[^>]*\bId="%s"[^>]*>' % re.escape(sheet_id), rels).group(0)
+        target = re.search(r'\bTarget="([^"]+)"', rel).group(1)
+        name = target.lstrip("/") if target.startswith("/") else "xl/" + target
+        rows = 0
+        tail = b""
+        with archive.open(name) as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                block = tail + chunk
+                rows += len(row_tag.findall(block))
+                # Keep an unfinished tag for the next block, without counting it twice
+                cut = block.rfind(b"<")
+                tail = block[cut:] if cut >= 0 and b">" not in block[cut:] else b""
+                if tail:
+                    rows -= len(row_tag.findall(tail))
+    return rows
+
+
+def report_dimensions(path):
+    """{"rows": data rows below the header, "format": "xls" | "xlsx"} of an AllDataReport."""
+    from process_invoice import XLSX_MAGIC
+
+    with open(path, 'rb') as f:
+        is_xlsx = f.read(4) == XLSX_MAGIC
+    try:
+        rows = _xlsx_rows(path) if is_xlsx else _xls_rows(path)
+    except Exception:
+        import pandas as pd
+        rows = len(pd.read_excel(path, header=None, usecols=[0])) if is_xlsx else _xlrd_rows(path)
+    return {"rows": max(rows - REPORT_HEADER_ROWS, 0), "format": "xlsx" if is_xlsx else "xls"}
+
+
+def _xlrd_rows(path):
+    import xlrd
+    return xlrd.open_workbook(path, on_demand=True).sheet_by_index(0).nrows
+
+
+def input_features(invoice_path, report_path):
+    """{"pages", "awbs", "report_rows", "report_format"} read without processing the files."""
+    features = dict(pdf_dimensions(invoice_path), report_rows=0, report_format=None)
+    if report_path and os.path.exists(report_path):
+        dimensions = report_dimensions(report_path)
+        features.update(report_rows=dimensions["rows"], report_format=dimensions["format"])
+    return features
+
+
+# --- Model ---
+
+def default_model_path():
+    return os.environ.get("N8N_DURATION_MODEL") or MODEL_PATH
+
+
+def load_model(path=None):
+    """The model at path (default: default_model_path()), DEFAULT_MODEL if there is none."""
+    path = path or default_model_path()
+    if not os.path.exists(path):
+        return DEFAULT_MODEL
+    with open(path) as f:
+        return json.load(f)
+
+
+def _driver(name, features, awbs):
+    if name == "pages":
+        return features["pages"]
+    if name == "report_rows":
+        return features["report_rows"]
+    if name == "awbs":
+        return awbs
+    return awbs + features["report_rows"]  # rows
+
+
+def _awbs(model, features):
+    # Counted by input_features(); from the page count when the PDF's text couldn't be read
+    return features.get("awbs") or model["awbs_per_page"] * features["pages"]
+
+
+def _stage_fit(model, stage, report_format):
+    fits = model["stages"]
+    if stage in PER_FORMAT_STAGES and report_format:
+        return fits.get(f"{stage}.{report_format}", fits[stage])
+    return fits[stage]
+
+
+def predict(model, features):
+    """{"estimate_ms", "awbs", "stages": {stage: ms}} for input_features()."""
+    awbs = _awbs(model, features)
+    stages = {}
+    for stage in STAGES:
+        if stage == "report_read" and not features["report_rows"]:
+            stages[stage] = 0.0  # no report: not read
+            continue
+        fit = _stage_fit(model, stage, features.get("report_format"))
+        ms = fit["intercept_ms"] + sum(ms_per * _driver(driver, features, awbs)
+                                       for driver, ms_per in fit["ms_per"].items())
+        stages[stage] = round(max(ms, 0.0), 3)
+    return {"estimate_ms": round(sum(stages.values()), 3), "awbs": round(awbs, 1), "stages": stages}
+
+
+def estimate(invoice_path, report_path, model=None):
+    """Predicted duration (ms) of processing invoice_path against report_path."""
+    model = model or load_model()
+    return predict(model, input_features(invoice_path, report_path))["estimate_ms"]
+
+
+# --- Training ---
+
+def sample_from_record(record):
+    """Features and stage times (ms) of a finished job's record, None if it can't train."""
+    timings = record.get("timings") or {}
+    if (not record.get("success") or record.get("skipped") or not timings.get("stages")
+            or record.get("pages") is None or record.get("report_rows") is None):
+        return None
+    spans = timings["stages"]
+    stages = {}
+    for stage, (names, _) in STAGES.items():
+        if names is not None:
+            stages[stage] = sum(spans.get(name, 0.0) for name in names)
+    stages["other"] = max(timings["total_ms"] - sum(stages.values()), 0.0)
+    return {
+        "pages": record["pages"],
+        "awbs": (record.get("rows") or {}).get("invoices", 0),
+        "report_rows": record["report_rows"],
+        "report_format": record.get("report_format"),
+        "stages": stages,
+        "total_ms": timings["total_ms"],
+    }
+
+
+def load_samples(paths):
+    """Training samples from result JSON files, batch JSONL output and batch journals."""
+    samples = []
+    for path in paths:
+        with open(path) as f:
+            text = f.read()
+        try:
+            records = [json.loads(text)]
+        except ValueError:
+            records = [json.loads(line) for line in text.splitlines() if line.strip()]
+        for record in records:
+            if isinstance(record, dict) and "record" in record and "key" in record:
+                record = record["record"]  # journal entry
+            sample = sample_from_record(record) if isinstance(record, dict) else None
+            if sample is not None:
+                samples.append(sample)
+    return samples
+
+
+def _solve(matrix, vector):
+    """x with matrix @ x = vector (Gaussian elimination), None if a variable is not determined."""
+    size = len(vector)
+    rows = [list(row) + [value] for row, value in zip(matrix, vector)]
+    for col in range(size):
+        pivot = max(range(col, size), key=lambda row: abs(rows[row][col]))
+        # Relative to the variable's own spread: collinear drivers leave only rounding noise
+        if abs(rows[pivot][col]) <= 1e-9 * abs(matrix[col][col]) or not rows[pivot][col]:
+            return None
+        rows[col], rows[pivot] = rows[pivot], rows[col]
+        for row in range(col + 1, size):
+            factor = rows[row][col] / rows[col][col]
+            rows[row] = [a - factor * b for a, b in zip(rows[row], rows[col])]
+    x = [0.0] * size
+    for col in reversed(range(size)):
+        x[col] = (rows[col][size] - sum(rows[col][k] * x[k] for k in range(col + 1, size))) / rows[col][col]
+    return x
+
+
+def _least_squares(points, drivers):
+    """(intercept, {driver: slope}) of [({driver: x}, y)], None if the drivers are collinear or constant."""
+    xs = [[x[driver] for driver in drivers] for x, _ in points]
+    ys = [y for _, y in points]
+    means = [statistics.fmean(column) for column in zip(*xs)]
+    mean_y = statistics.fmean(ys)
+    spread = [[sum((row[i] - means[i]) * (row[j] - means[j]) for row in xs) for j in range(len(drivers))]
+              for i in range(len(drivers))]
+    cross = [sum((row[i] - means[i]) * (y - mean_y) for row, y in zip(xs, ys)) for i in range(len(drivers))]
+    slopes = _solve(spread, cross)
+    if slopes is None:
+        return None
+    return mean_y - sum(slope * mean for slope, mean in zip(slopes, means)), dict(zip(drivers, slopes))
+
+
+def _fit_stage(points, drivers):
+    """
+    Least-squares (intercept, {driver: slope}) of [({driver: x}, y)] with every
+    slope >= 0 (predict() clamps at 0 ms). A driver with a negative slope, or
+    the least preferred one of collinear drivers, is dropped and the rest refitted.
+    """
+    if not points:
+        return 0.0, {}
+    drivers = list(drivers)
+    while drivers:
+        result = _least_squares(points, drivers)
+        if result is None and len(drivers) > 1:
+            drivers.pop()
+            continue
+        if result is None:
+            break  # one input size: a line through the origin, below
+        intercept, slopes = result
+        negative = [driver for driver in drivers if slopes[driver] < 0]
+        if not negative:
+            return intercept, slopes
+        drivers.remove(min(negative, key=slopes.get))
+    squares = sum(x[drivers[0]] ** 2 for x, _ in points) if drivers else 0
+    if not squares:
+        return statistics.fmean(y for _, y in points), {}
+    return 0.0, {drivers[0]: sum(x[drivers[0]] * y for x, y in points) / squares}
+
+
+def fit(samples):
+    """A model from load_samples() samples, with its accuracy() on them."""
+    if not samples:
+        raise ValueError("No usable job records to fit")
+    total_pages = sum(sample["pages"] for sample in samples)
+    awbs_per_page = sum(sample["awbs"] for sample in samples) / total_pages if total_pages else 0.0
+    fits = {}
+    for stage, (_, drivers) in STAGES.items():
+        groups = {stage: samples}
+        if stage in PER_FORMAT_STAGES:
+            for sample in samples:
+                if sample["report_format"]:
+                    groups.setdefault(f"{stage}.{sample['report_format']}", []).append(sample)
+        for name, group in groups.items():
+            if stage == "report_read":
+                group = [sample for sample in group if sample["report_rows"]]
+            intercept, slopes = _fit_stage([({driver: _driver(driver, sample, sample["awbs"]) for driver in drivers},
+                                             sample["stages"][stage]) for sample in group], drivers)
+            fits[name] = {"intercept_ms": round(intercept, 3),
+                          "ms_per": {driver: round(slope, 6) for driver, slope in slopes.items() if round(slope, 6)}}
+    model = {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "records": len(samples),
+        "awbs_per_page": round(awbs_per_page, 4),
+        "stages": fits,
+    }
+    model["accuracy"] = accuracy(model, samples)
+    return model
+
+
+def accuracy(model, samples):
+    """
+    {"samples", "mean_abs_error", "max_abs_error", "bias"}: relative errors of
+    the predicted total (0.1 = 10%; bias > 0 means the estimates run high).
+    """
+    errors = [(predict(model, sample)["estimate_ms"] - sample["total_ms"]) / sample["total_ms"]
+              for sample in samples if sample["total_ms"]]
+    if not errors:
+        return {"samples": 0, "mean_abs_error": None, "max_abs_error": None, "bias": None}
+    return {
+        "samples": len(errors),
+        "mean_abs_error": round(statistics.fmean(abs(error) for error in errors), 4),
+        "max_abs_error": round(max(abs(error) for error in errors), 4),
+        "bias": round(statistics.fmean(errors), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="process_invoice.py processing-time estimate")
+    commands = parser.add_subparsers(dest="command", required=True)
+    estimate_parser = commands.add_parser("estimate", help="Estimate a job's duration")
+    estimate_parser.add_argument("invoice")
+    estimate_parser.add_argument("report")
+    estimate_parser.add_argument("--model", default=None, help="Model JSON (default: N8N_DURATION_MODEL or "
+                                                                "duration_model.json next to this script)")
+    fit_parser = commands.add_parser("fit", help="Fit a model from recorded jobs")
+    fit_parser.add_argument("records", nargs="+", help="Result JSON, batch JSONL or batch journal files")
+    fit_parser.add_argument("--output", default=None, help="Write the model here (default: stdout)")
+    args = parser.parse_args()
+
+    if args.command == "estimate":
+        features = input_features(args.invoice, args.report)
+        json.dump(dict(predict(load_model(args.model), features), **features), sys.stdout)
+        print()
+        return
+
+    model = fit(load_samples(args.records))
+    if model["accuracy"]["mean_abs_error"] is None:
+        print(f"Fitted on {model['records']} jobs, none with a recorded duration to check it on", file=sys.stderr)
+    else:
+        print(f"Fitted on {model['records']} jobs: mean error {model['accuracy']['mean_abs_error'] * 100:.1f}%, "
+              f"max {model['accuracy']['max_abs_error'] * 100:.1f}%", file=sys.stderr)
+    if args.output:
+        from result_json import atomic_path
+        with atomic_path(args.output) as tmp_path, open(tmp_path, "w") as f:
+            json.dump(model, f, indent=2)
+    else:
+        json.dump(model, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""
+Golden-output equivalence harness for the reconciliation engines.
+
+docs/app.py (Flask process_file) and process_invoice.py (n8n process_files)
+are two copies of the same extraction and reconciliation logic that have
+drifted apart. This harness runs every engine in-process on the same inputs,
+reads each workbook back sheet by sheet and compares the values against a
+reference engine (or a stored golden workbook), with a tolerance for numbers.
+No subprocesses, unlike test_reconciliation.py.
+
+   python golden_harness.py INVOICE REPORT [--engines cli,app] [--reference cli]
+                            [--golden WORKBOOK] [--engine name=module:function]
+                            [--atol 0.005] [--rtol 1e-9] [--output report.json]
+
+ENGINES (name -> function(invoice, report, output_dir, timer) returning the workbook path):
+   cli    process_invoice.process_files
+   app    app.read_report_file + app.process_file (its stdout is captured)
+   --engine name=module:function adds another, e.g. an optimized engine;
+   --golden WORKBOOK adds a stored workbook as engine "golden".
+
+COMPARISON (per sheet of the reference):
+- Sheets and columns missing or extra on either side are reported.
+- Rows are matched by position; the Summary sheet is matched by Metric, so a
+  metric one engine adds or drops shows as a missing/extra row.
+- Cells: both numbers -> equal within atol + rtol * |reference| (the default
+  atol is half a cent); both empty -> equal; a number never equals text
+  ("141" vs 141); otherwise the text must match (surrounding spaces ignored).
+
+The report holds, per engine, the wall time and its telemetry stages (where
+the engine takes a timer) and the per-sheet differences (the first
+MAX_CELLS mismatching cells). Exits with 1 when any engine differs.
+
+Formatting (the Flask app's highlights) is not compared: only values.
+"""
+
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+
+DEFAULT_ATOL = 0.005
+DEFAULT_RTOL = 1e-9
+MAX_CELLS = 20
+# Sheets whose rows are matched by a key column instead of by position
+SHEET_KEYS = {"Summary": "Metric"}
+
+
+# --- Engines ---
+
+def run_cli_engine(invoice, report, output_dir, timer=None):
+    from process_invoice import process_files
+    return process_files(invoice, report, workflow_id="golden", output_dir=output_dir, timer=timer)
+
+
+def run_app_engine(invoice, report, output_dir, timer=None):
+    import app
+    from telemetry import span
+    with contextlib.redirect_stdout(io.StringIO()):
+        with span(timer, "report_read"):
+            df_report, report_error = app.read_report_file(report)
+        if report_error:
+            raise ValueError(report_error)
+        results = app.process_file(invoice, report_data_df=df_report, output_folder=output_dir, timer=timer)
+    if not results.get("excel_file"):
+        return None
+    return os.path.join(output_dir, results["excel_file"])
+
+
+ENGINES = {"cli": run_cli_engine, "app": run_app_engine}
+
+
+def load_engine(spec):
+    """ "module:function" -> the function."""
+    module_name, _, function_name = spec.partition(":")
+    if not function_name:
+        raise ValueError(f"Engine must be module:function, got {spec!r}")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def run_engine(name, engine, invoice, report, output_dir):
+    """{"engine", "workbook", "seconds", "stages"} of one engine run into its own directory."""
+    from telemetry import new_timer, timings
+
+    engine_dir = os.path.join(output_dir, name)
+    os.makedirs(engine_dir, exist_ok=True)
+    timer = new_timer()
+    start = time.perf_counter()
+    workbook = engine(invoice, report, engine_dir, timer)
+    seconds = round(time.perf_counter() - start, 3)
+    return {"engine": name, "workbook": workbook, "seconds": seconds, "stages": timings(timer)["stages"]}
+
+
+# --- Comparison ---
+
+def read_workbook(path):
+    """{sheet name: DataFrame} of a workbook."""
+    import pandas as pd
+    return pd.read_excel(path, sheet_name=None)
+
+
+def _is_empty(value):
+    return value is None or (isinstance(value, float) and math.isnan(value)) or value == ""
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def values_equal(reference, candidate, atol=DEFAULT_ATOL, rtol=DEFAULT_RTOL):
+    """Typed cell comparison: numbers within tolerance, empties alike, anything else as text."""
+    if hasattr(reference, "item"):
+        reference = reference.item()
+    if hasattr(candidate, "item"):
+        candidate = candidate.item()
+    if _is_empty(reference) or _is_empty(candidate):
+        return _is_empty(reference) and _is_empty(candidate)
+    if _is_number(reference) or _is_number(candidate):
+        return (_is_number(reference) and _is_number(candidate)
+                and abs(reference - candidate) <= atol + rtol * abs(reference))
+    return str(reference).strip() == str(candidate).strip()
+
+
+def _plain(value):
+    value = value.item() if hasattr(value, "item") else value
+    return None if _is_empty(value) else value
+
+
+def compare_frames(sheet, reference, candidate, atol=DEFAULT_ATOL, rtol=DEFAULT_RTOL):
+    """Differences of one sheet: {"sheet", "equal", "shape", ...} (see module docstring)."""
+    key = SHEET_KEYS.get(sheet)
+    if key and key in reference.columns and key in candidate.columns:
+        reference = reference.set_index(key, drop=False)
+        candidate = candidate.set_index(key, drop=False)
+    result = {
+        "sheet": sheet, "shape": [list(reference.shape), list(candidate.shape)],
+        "columns_missing": [col for col in reference.columns if col not in candidate.columns],
+        "columns_extra": [col for col in candidate.columns if col not in reference.columns],
+    }
+    if key:
+        labels = list(reference.index)
+        result["rows_missing"] = [label for label in labels if label not in candidate.index]
+        result["rows_extra"] = [label for label in candidate.index if label not in reference.index]
+        pairs = [(label, label) for label in labels if label in candidate.index]
+    else:
+        result["rows_missing"] = list(range(len(candidate), len(reference)))
+        result["rows_extra"] = list(range(len(reference), len(candidate)))
+        pairs = list(zip(reference.index[:len(candidate)], candidate.index[:len(reference)]))
+
+    columns = [col for col in reference.columns if col in candidate.columns]
+    mismatches = 0
+    cells = []
+    for col in columns:
+        ref_values = reference[col]
+        cand_values = candidate[col]
+        for ref_label, cand_label in pairs:
+            ref_value, cand_value = ref_values.at[ref_label], cand_values.at[cand_label]
+            if not values_equal(ref_value, cand_value, atol, rtol):
+                mismatches += 1
+                if len(cells) < MAX_CELLS:
+                    cells.append({"row": _plain(ref_label), "column": col,
+                                  "reference": _plain(ref_value), "candidate": _plain(cand_value)})
+    result["cell_mismatches"] = mismatches
+    result["cells"] = cells
+    result["equal"] = not (mismatches or result["columns_missing"] or result["columns_extra"]
+                           or result["rows_missing"] or result["rows_extra"])
+    return result
+
+
+def compare_workbooks(reference, candidate, atol=DEFAULT_ATOL, rtol=DEFAULT_RTOL):
+    """{"equal", "sheets_missing", "sheets_extra", "sheets": [compare_frames() per common sheet]}."""
+    sheets = [compare_frames(sheet, frame, candidate[sheet], atol, rtol)
+              for sheet, frame in reference.items() if sheet in candidate]
+    result = {
+        "sheets_missing": [sheet for sheet in reference if sheet not in candidate],
+        "sheets_extra": [sheet for sheet in candidate if sheet not in reference],
+        "sheets": sheets,
+    }
+    result["equal"] = not (result["sheets_missing"] or result["sheets_extra"]) and all(s["equal"] for s in sheets)
+    return result
+
+
+def run_harness(invoice, report, engines=("cli", "app"), reference="cli", golden=None, extra_engines=None,
+                atol=DEFAULT_ATOL, rtol=DEFAULT_RTOL, output_dir=None):
+    """
+    Runs the engines (names from ENGINES or extra_engines {name: function}) and
+    compares each workbook with the reference engine's ("golden" when golden is
+    a workbook path). Returns the report dict.
+    """
+    available = dict(ENGINES, **(extra_engines or {}))
+    names = list(engines) + [name for name in (extra_engines or {}) if name not in engines]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise ValueError(f"Unknown engine(s): {', '.join(unknown)} (known: {', '.join(available)})")
+
+    with contextlib.ExitStack() as stack:
+        if output_dir is None:
+            output_dir = stack.enter_context(tempfile.TemporaryDirectory())
+        runs = [run_engine(name, available[name], invoice, report, output_dir) for name in names]
+        if golden:
+            runs.append({"engine": "golden", "workbook": golden, "seconds": None, "stages": {}})
+        workbooks = {run["engine"]: read_workbook(run["workbook"]) for run in runs if run["workbook"]}
+
+    if reference not in workbooks:
+        raise ValueError(f"Reference engine {reference!r} produced no workbook")
+    comparisons = {}
+    for run in runs:
+        name = run["engine"]
+        if name == reference:
+            continue
+        if name not in workbooks:
+            comparisons[name] = {"equal": False, "error": "no workbook written"}
+        else:
+            comparisons[name] = compare_workbooks(workbooks[reference], workbooks[name], atol, rtol)
+    return {
+        "invoice": invoice, "report": report, "reference": reference, "atol": atol, "rtol": rtol,
+        "engines": [{key: run[key] for key in ("engine", "seconds", "stages")} for run in runs],
+        "comparisons": comparisons,
+        "equal": all(comparison["equal"] for comparison in comparisons.values()),
+    }
+
+
+def print_report(result, out=sys.stdout):
+    for run in result["engines"]:
+        seconds = f"{run['seconds']:.2f} s" if run["seconds"] is not None else "(stored)"
+        print(f"{run['engine']:<10} {seconds}", file=out)
+    for name, comparison in result["comparisons"].items():
+        print(f"--- {name} vs {result['reference']}: {'EQUAL' if comparison['equal'] else 'DIFFERENT'}", file=out)
+        if "error" in comparison:
+            print(f"  {comparison['error']}", file=out)
+            continue
+        for field in ("sheets_missing", "sheets_extra"):
+            if comparison[field]:
+                print(f"  {field}: {comparison[field]}", file=out)
+        for sheet in comparison["sheets"]:
+            if sheet["equal"]:
+                continue
+            print(f"  {sheet['sheet']}: shape {sheet['shape'][0]} vs {sheet['shape'][1]}, "
+                  f"{sheet['cell_mismatches']} cell(s) differ", file=out)
+            for field in ("columns_missing", "columns_extra", "rows_missing", "rows_extra"):
+                if sheet[field]:
+                    print(f"    {field}: {sheet[field]}", file=out)
+            for cell in sheet["cells"]:
+                print(f"    [{cell['row']}, {cell['column']}] {cell['reference']!r} != {cell['candidate']!r}", file=out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare reconciliation engines on the same inputs")
+    parser.add_argument("invoice")
+    parser.add_argument("report")
+    parser.add_argument("--engines", default="cli,app", help=f"Comma separated (known: {', '.join(ENGINES)})")
+    parser.add_argument("--engine", action="append", default=[], metavar="NAME=MODULE:FUNCTION",
+                        help="Add an engine function(invoice, report, output_dir, timer) -> workbook path")
+    parser.add_argument("--reference", default="cli")
+    parser.add_argument("--golden", default=None, help="Stored workbook compared as engine 'golden'")
+    parser.add_argument("--atol", type=float, default=DEFAULT_ATOL)
+    parser.add_argument("--rtol", type=float, default=DEFAULT_RTOL)
+    parser.add_argument("--keep", default=None, metavar="DIR", help="Keep the engines' workbooks in DIR")
+    parser.add_argument("--output", default=None, help="Write the JSON report here")
+    args = parser.parse_args()
+
+    from structured_log import configure_logging
+    configure_logging()
+    try:
+        extra = {}
+        for spec in args.engine:
+            name, _, target = spec.partition("=")
+            extra[name] = load_engine(target)
+        result = run_harness(args.invoice, args.report, [name for name in args.engines.split(",") if name],
+                             args.reference, args.golden, extra, args.atol, args.rtol, args.keep)
+    except (ValueError, ImportError, AttributeError) as e:
+        parser.error(str(e))
+    print_report(result)
+    if args.output:
+        from result_json import atomic_path, dumps
+        with atomic_path(args.output) as tmp_path, open(tmp_path, "wb") as f:
+            f.write(dumps(result))
+    sys.exit(0 if result["equal"] else 1)
+
+
+if __name__ == "__main__":
+    main()
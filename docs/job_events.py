@@ -0,0 +1,285 @@
+#!/opt/venv/bin/python3
+"""
+Server-Sent Events for /upload jobs: GET /jobs/<job_id>/events
+
+The job's pool process appends progress events (progress.py) to
+<jobs_dir>/<job_id>/events.jsonl; this module turns that file and the job's
+status.json (job_queue.py) into an SSE stream:
+
+   event: status     {"job_id", "status": "queued" | "running" | ...}   on every change
+   event: progress   {"stage": "pages", "done": 3, "total": 6, ...}     id = byte offset in events.jsonl
+   event: summary    final status.json (results or error, download_url) then the stream ends
+
+A client that reconnects sends Last-Event-ID and continues after the last
+progress event it received.
+
+SERVERS:
+- app.py serves the endpoint too, but the Flask development server holds a
+  thread per open stream. For many clients run the asyncio server below:
+  every connection is a coroutine polling two files, so thousands of idle
+  streams cost a socket and a few KB each.
+- All state is in the job directory, so any number of web and event server
+  processes can run side by side (gunicorn workers, --reuse-port event
+  servers). Route /jobs/*/events to the event server in the reverse proxy,
+  with buffering off (the X-Accel-Buffering header does this for nginx).
+
+USAGE:
+   python job_events.py --jobs-dir uploads/jobs --port 5001 [--reuse-port]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from job_queue import STATUS_FILE, job_path, read_status_file
+
+EVENTS_FILE = "events.jsonl"
+POLL_INTERVAL = 0.5        # seconds between checks of a job's files
+HEARTBEAT_INTERVAL = 15.0  # seconds of silence before a keep-alive comment
+RETRY_MS = 2000            # client reconnect delay
+MAX_CONNECTIONS = 10000
+REQUEST_TIMEOUT = 10       # seconds to receive the request headers
+FINAL_STATUSES = ("done", "failed")
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+# --- SSE Formatting ---
+
+def format_sse(data, event=None, event_id=None):
+    """One SSE message as bytes. data is JSON-encoded."""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.append("data: " + json.dumps(data, default=str))
+    return ("\n".join(lines) + "\n\n").encode('utf-8')
+
+
+def last_event_offset(header):
+    """Resume offset from a Last-Event-ID header (0 if missing or invalid)."""
+    try:
+        return max(int(header), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+# --- Job Files ---
+
+def read_new_events(path, offset):
+    """
+    Complete lines appended to an events file after offset.
+    Returns [(event, offset after its line)]; a line still being written is left for the next call.
+    """
+    try:
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+    except FileNotFoundError:
+        return []
+    events = []
+    for line in data.splitlines(keepends=True):
+        if not line.endswith(b"\n"):
+            break
+        offset += len(line)
+        try:
+            events.append((json.loads(line), offset))
+        except ValueError:
+            continue
+    return events
+
+
+def summary_data(status):
+    """Final summary event: the job status plus its URLs."""
+    summary = dict(status)
+    summary["status_url"] = f"/jobs/{status.get('job_id')}"
+    if status.get("status") == "done":
+        summary["download_url"] = f"/jobs/{status.get('job_id')}/download"
+    return summary
+
+
+def new_stream(job_dir, offset=0):
+    return {"job_dir": job_dir, "offset": offset, "status_version": None, "status": None, "sent_status": None}
+
+
+def poll_stream(stream):
+    """
+    Checks the job's files once. Returns (bytes to send, finished).
+    status.json is read only when it was replaced and events.jsonl only when it grew.
+    """
+    try:
+        info = os.stat(os.path.join(stream["job_dir"], STATUS_FILE))
+        version = (info.st_ino, info.st_mtime_ns)  # status.json is replaced, not rewritten
+    except FileNotFoundError:
+        version = None
+    if version != stream["status_version"]:
+        stream["status_version"] = version
+        stream["status"] = read_status_file(stream["job_dir"]) or stream["status"]
+    # Read the status before the events: the job flushes its last events before
+    # it writes the final status, so a final status means the events are complete
+    status = stream["status"] or {}
+    finished = status.get("status") in FINAL_STATUSES
+    chunks = []
+    if status.get("status") and status["status"] != stream["sent_status"] and not finished:
+        stream["sent_status"] = status["status"]
+        chunks.append(format_sse({"job_id": status.get("job_id"), "status": status["status"]}, event="status"))
+
+    events_file = os.path.join(stream["job_dir"], EVENTS_FILE)
+    try:
+        size = os.stat(events_file).st_size
+    except FileNotFoundError:
+        size = 0
+    if size > stream["offset"]:
+        for event, offset in read_new_events(events_file, stream["offset"]):
+            chunks.append(format_sse(event, event="progress", event_id=offset))
+            stream["offset"] = offset
+
+    if finished:
+        chunks.append(format_sse({"job_id": status.get("job_id"), "status": status["status"]}, event="status"))
+        chunks.append(format_sse(summary_data(status), event="summary"))
+    return b"".join(chunks), finished
+
+
+# --- Streams ---
+
+def event_stream(job_dir, offset=0, poll_interval=POLL_INTERVAL, heartbeat_interval=HEARTBEAT_INTERVAL):
+    """Blocking generator of SSE bytes for one job (Flask Response body)."""
+    stream = new_stream(job_dir, offset)
+    yield f"retry: {RETRY_MS}\n\n".encode('utf-8')
+    last_sent = time.monotonic()
+    while True:
+        data, finished = poll_stream(stream)
+        if data:
+            yield data
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent >= heartbeat_interval:
+            yield b": keep-alive\n\n"
+            last_sent = time.monotonic()
+        if finished:
+            return
+        time.sleep(poll_interval)
+
+
+async def write_event_stream(writer, job_dir, offset=0, poll_interval=POLL_INTERVAL,
+                             heartbeat_interval=HEARTBEAT_INTERVAL):
+    """Writes one job's SSE stream to an asyncio writer until the job finishes or the client leaves."""
+    stream = new_stream(job_dir, offset)
+    writer.write(f"retry: {RETRY_MS}\n\n".encode('utf-8'))
+    last_sent = time.monotonic()
+    while True:
+        data, finished = poll_stream(stream)
+        if data:
+            writer.write(data)
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent >= heartbeat_interval:
+            writer.write(b": keep-alive\n\n")  # also detects clients that went away
+            last_sent = time.monotonic()
+        await writer.drain()
+        if finished:
+            return
+        await asyncio.sleep(poll_interval)
+
+
+# --- Asyncio Server ---
+
+async def read_request(reader):
+    """(method, path, headers) of an HTTP request; the headers are lowercased."""
+    request_line = await reader.readline()
+    method, path = (request_line.decode('latin-1').split() + ["", ""])[:2]
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode('latin-1').partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return method, path, headers
+
+
+def _http_response(status_line, body=b"", headers=None):
+    head = [f"HTTP/1.1 {status_line}", "Connection: close"]
+    head += [f"{name}: {value}" for name, value in (headers or {}).items()]
+    if body:
+        head += ["Content-Type: application/json", f"Content-Length: {len(body)}"]
+    return ("\r\n".join(head) + "\r\n\r\n").encode('latin-1') + body
+
+
+def _job_dir_for(jobs_dir, path):
+    # /jobs/<job_id>/events -> job directory, or None
+    parts = path.split('?')[0].strip('/').split('/')
+    if len(parts) != 3 or parts[0] != "jobs" or parts[2] != "events":
+        return None
+    return job_path(jobs_dir, parts[1])
+
+
+def make_handler(jobs_dir, poll_interval=POLL_INTERVAL, heartbeat_interval=HEARTBEAT_INTERVAL,
+                 max_connections=MAX_CONNECTIONS, stats=None):
+    """Connection handler for asyncio.start_server. stats (dict) tracks open and total streams."""
+    stats = stats if stats is not None else {}
+    stats.setdefault("open", 0)
+    stats.setdefault("streams", 0)
+
+    async def handle(reader, writer):
+        try:
+            try:
+                method, path, headers = await asyncio.wait_for(read_request(reader), REQUEST_TIMEOUT)
+            except (asyncio.TimeoutError, ConnectionError):
+                return
+            job_dir = _job_dir_for(jobs_dir, path)
+            if method != "GET" or job_dir is None:
+                writer.write(_http_response("404 Not Found", b'{"error": "Not found"}'))
+            elif read_status_file(job_dir) is None:
+                writer.write(_http_response("404 Not Found", b'{"error": "Unknown job"}'))
+            elif stats["open"] >= max_connections:
+                writer.write(_http_response("503 Service Unavailable", b'{"error": "Too many open streams"}',
+                                            {"Retry-After": "5"}))
+            else:
+                stats["open"] += 1
+                stats["streams"] += 1
+                try:
+                    writer.write(_http_response("200 OK", headers=dict(SSE_HEADERS, **{
+                        "Content-Type": "text/event-stream"})))
+                    await write_event_stream(writer, job_dir, last_event_offset(headers.get("last-event-id")),
+                                             poll_interval, heartbeat_interval)
+                finally:
+                    stats["open"] -= 1
+            await writer.drain()
+        except ConnectionError:
+            pass  # client went away
+        finally:
+            writer.close()
+
+    return handle
+
+
+async def start_event_server(jobs_dir, host="127.0.0.1", port=0, reuse_port=False, **handler_options):
+    """Starts the SSE server on the running loop. Returns the asyncio Server."""
+    return await asyncio.start_server(make_handler(jobs_dir, **handler_options), host, port,
+                                      reuse_port=reuse_port or None)
+
+
+async def serve(jobs_dir, host, port, reuse_port=False):
+    server = await start_event_server(jobs_dir, host, port, reuse_port)
+    print(f"Job event server (pid {os.getpid()}) serving {jobs_dir} on http://{host}:{port}/jobs/<job_id>/events")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server-Sent Events for /upload job progress")
+    parser.add_argument("--jobs-dir", default=os.path.join("uploads", "jobs"), help="The app's JOBS_FOLDER")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--reuse-port", action="store_true",
+                        help="Share the port with other event server processes (SO_REUSEPORT)")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.jobs_dir, args.host, args.port, args.reuse_port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Bounded background job queue for the Flask app (app.py).
+
+/upload used to run the whole process_file pipeline inside the request, so a
+large invoice held a worker thread for tens of seconds and concurrent users
+queued behind it. Jobs now run in a process pool and the request returns a
+job id right away.
+
+JOB STATE:
+- Each job has a directory <jobs_dir>/<job_id>/ holding its inputs, the
+  generated workbook and status.json.
+- status.json is replaced atomically (write + os.replace), so any web process
+  can read a job's status, not only the one that submitted it.
+- status: queued -> running -> done | failed
+
+BACKPRESSURE:
+- At most max_workers jobs run and max_pending wait per web process; submit()
+  raises QueueFullError beyond that (the route answers 429).
+- The pool uses the 'spawn' start method: forking a threaded web server can
+  copy held locks into the children.
+
+WORKER LIMITS (worker_limits.py):
+- Pool processes are replaced after limits["max_jobs"] jobs.
+- Each job runs under limits["timeout"] and limits["max_memory_mb"], an
+  address-space ceiling (RLIMIT_AS) rather than an RSS one; a job stopped by
+  a limit is marked failed with limit_error() and the worker keeps serving.
+  Job code must let MemoryError propagate for the limit to be reported.
+- A worker killed outright (OOM killer) breaks the pool: the jobs it held are
+  marked failed and the next submit() starts a fresh pool.
+"""
+
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from worker_limits import DEFAULT_LIMITS, JobTimeout, job_limits, limit_error
+
+JOB_ID_REGEX = re.compile(r"^[0-9a-f]{32}$")
+STATUS_FILE = "status.json"
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue has no free slot."""
+
+
+# Pool and in-flight count of this web process
+_pool = {"executor": None, "in_flight": 0}
+_lock = threading.Lock()
+
+
+# --- Job Status Files ---
+
+def job_path(jobs_dir, job_id):
+    """Directory of a job, or None if job_id is not a valid job id."""
+    if not job_id or not JOB_ID_REGEX.match(job_id):
+        return None
+    return os.path.join(jobs_dir, job_id)
+
+
+def new_job(jobs_dir):
+    """Creates a job directory. Returns (job_id, job_dir)."""
+    job_id = uuid.uuid4().hex
+    job_dir = os.path.join(jobs_dir, job_id)
+    os.makedirs(job_dir)
+    return job_id, job_dir
+
+
+def write_status(job_dir, **fields):
+    """Merges fields into the job's status.json (atomic replace)."""
+    status = read_status_file(job_dir) or {}
+    status.update(fields)
+    status["updated_at"] = time.time()
+    tmp_path = os.path.join(job_dir, f".{STATUS_FILE}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(status, f)
+    os.replace(tmp_path, os.path.join(job_dir, STATUS_FILE))
+    return status
+
+
+def read_status_file(job_dir):
+    try:
+        with open(os.path.join(job_dir, STATUS_FILE)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def read_status(jobs_dir, job_id):
+    """Status dict of a job, or None if the job is unknown."""
+    job_dir = job_path(jobs_dir, job_id)
+    if job_dir is None:
+        return None
+    return read_status_file(job_dir)
+
+
+def remove_job(job_dir):
+    shutil.rmtree(job_dir, ignore_errors=True)
+
+
+# --- Pool ---
+
+def _executor(max_workers, limits):
+    if _pool["executor"] is None:
+        _pool["executor"] = ProcessPoolExecutor(max_workers=max_workers,
+                                                mp_context=multiprocessing.get_context('spawn'),
+                                                max_tasks_per_child=limits.get("max_jobs") or None)
+    return _pool["executor"]
+
+
+def _run_limited(fn, limits, job_id, job_dir, *args):
+    # Runs in the pool process
+    try:
+        with job_limits(limits):
+            return fn(job_id, job_dir, *args)
+    except (JobTimeout, MemoryError) as e:
+        error = limit_error(e, limits)
+        print(f"Job {job_id}: {error}")
+        return write_status(job_dir, status="failed", error=error, finished_at=time.time())
+
+
+def has_capacity(max_workers, max_pending):
+    """True if a new job would be accepted right now (checked before saving uploads)."""
+    with _lock:
+        return _pool["in_flight"] < max_workers + max_pending
+
+
+def in_flight():
+    """Jobs of this web process that are running or waiting for a worker."""
+    return _pool["in_flight"]
+
+
+def _job_finished(job_dir, future, on_done):
+    with _lock:
+        _pool["in_flight"] -= 1
+    error = future.exception()
+    if error is not None:
+        # The job function writes its own failures; this covers a worker that died
+        if isinstance(error, BrokenProcessPool):
+            error = "worker process was killed while processing the job"
+        status = write_status(job_dir, status="failed", error=f"Worker failed: {error}", finished_at=time.time())
+    else:
+        status = future.result()
+    if on_done is not None:
+        on_done(status)
+
+
+def submit(job_id, job_dir, fn, args, max_workers, max_pending, limits=None, on_done=None):
+    """
+    Queues fn(job_id, job_dir, *args) in the process pool under limits
+    (default worker_limits.DEFAULT_LIMITS; "max_jobs" applies when the pool starts).
+    Raises QueueFullError when max_workers + max_pending jobs are already in flight.
+    on_done(status) runs in this process when the job has finished; status is
+    what fn returned (its final status dict) or the failure written for a dead worker.
+    """
+    limits = DEFAULT_LIMITS if limits is None else limits
+    with _lock:
+        if _pool["in_flight"] >= max_workers + max_pending:
+            raise QueueFullError(f"Job queue is full ({_pool['in_flight']} jobs in flight)")
+        write_status(job_dir, job_id=job_id, status="queued", submitted_at=time.time())
+        try:
+            future = _executor(max_workers, limits).submit(_run_limited, fn, limits, job_id, job_dir, *args)
+        except BrokenProcessPool:
+            # A crashed worker breaks the whole pool; start a fresh one
+            _pool["executor"] = None
+            future = _executor(max_workers, limits).submit(_run_limited, fn, limits, job_id, job_dir, *args)
+        _pool["in_flight"] += 1
+    future.add_done_callback(lambda done: _job_finished(job_dir, done, on_done))
+    return future
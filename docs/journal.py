@@ -0,0 +1,73 @@
+"""
+Checkpoint journal for multi-job runs (batch.py).
+
+An append-only JSONL file with one entry per finished attempt:
+   {"key": "...", "status": "done" | "failed", "attempt": 1, "record": {...}}
+
+key is a hash of the invoice and report contents plus the output options
+(including the invoice file name, which names the workbook), so a restarted
+run recognises completed work even if the inputs were moved, and redoes a
+job whose inputs changed. Each entry is flushed and fsynced before the job
+is reported; a line cut short by a crash is ignored when the journal is loaded.
+"""
+
+import hashlib
+import json
+import os
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def job_key(job, options):
+    """
+    Journal key of a job: input contents plus everything that changes its output.
+    options: dict of run-wide output options (e.g. output_dir, workflow_id).
+    """
+    digest = hashlib.sha256()
+    digest.update(file_digest(job["invoice"]).encode())
+    digest.update(file_digest(job["report"]).encode())
+    outputs = {key: job.get(key) for key in ("workflow_id", "output_filename")}
+    outputs["invoice_name"] = os.path.basename(job["invoice"])
+    outputs.update(options)
+    digest.update(json.dumps(outputs, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def load_journal(path):
+    """Last entry per key, {} if the journal does not exist yet."""
+    entries = {}
+    if not path or not os.path.exists(path):
+        return entries
+    with open(path, 'rb') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # torn write from an interrupted run
+            entries[entry["key"]] = entry
+    return entries
+
+
+def is_complete(entry):
+    """True if a journal entry is finished work whose output still exists."""
+    if not entry or entry.get("status") != "done":
+        return False
+    output_file = entry.get("record", {}).get("output_file")
+    return not output_file or os.path.exists(output_file)
+
+
+def append_entry(path, key, status, attempt, record):
+    """Appends one entry and syncs it to disk."""
+    line = json.dumps({"key": key, "status": status, "attempt": attempt, "record": record}, default=str)
+    with open(path, 'a') as f:
+        f.write(line + "\n")
+        f.flush()
+        os.fsync(f.fileno())
@@ -0,0 +1,325 @@
+"""
+Load generator for the Flask upload endpoint (docs/app.py, POST /upload).
+
+Posts synthetic invoice/report pairs (synthetic_inputs.py) at fixed
+concurrency levels and records, per level, latency percentiles, throughput,
+rejections/errors and the server's memory, so capacity can be compared
+between releases:
+
+   python load_test.py run --url http://127.0.0.1:5000 --concurrency 1,2,4,8 --requests 40 \\
+                           --sizes 100,300 --server-pid 1234 --output load-v1.json
+   python load_test.py compare load-v1.json load-v2.json [--threshold 0.2]
+
+RUN:
+- Each level runs --concurrency clients in a closed loop (send, wait for the
+  answer, send again) until --requests uploads are answered. Inputs cycle
+  through the --sizes pairs (generated once into --data-dir).
+- upload latency: POST /upload until the 202 (files saved, job queued).
+  With --wait (default) each client then polls the job until done/failed:
+  job latency is upload to finished, which is what a user waits for.
+- 429 (queue full, see job_queue.py) counts as rejected, not as an error; the
+  client backs off for Retry-After (at most MAX_BACKOFF seconds).
+  Other statuses, failed jobs and connection errors count as errors.
+- RSS: with --server-pid, the resident memory of that process and all its
+  descendants (the job pool workers) is sampled from /proc every
+  RSS_INTERVAL seconds: peak and mean MB per level (Linux only).
+
+REPORT (JSON): machine, url, inputs and per level: requests, accepted,
+rejected, errors, error_rate, seconds, uploads_per_sec, jobs_per_sec,
+upload_ms / job_ms {p50, p95, p99, max}, rss_mb {peak, mean}.
+
+COMPARE: per concurrency level, p95 latencies and throughput of NEW against
+OLD; flags levels where p95 grew or throughput fell by more than
+--threshold, or the error rate rose. Exits 1 when anything is flagged.
+
+Only the standard library is used (http.client, threads).
+"""
+
+import argparse
+import datetime
+import http.client
+import json
+import math
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import uuid
+
+from worker_limits import tree_rss_mb
+
+DEFAULT_CONCURRENCY = [1, 2, 4]
+DEFAULT_REQUESTS = 20
+DEFAULT_SIZES = [100]
+DEFAULT_THRESHOLD = 0.2
+POLL_INTERVAL = 0.25   # seconds between job status polls
+RSS_INTERVAL = 0.5     # seconds between server RSS samples
+MAX_BACKOFF = 2.0      # seconds a client waits after a 429
+JOB_TIMEOUT = 600      # seconds a client waits for one job
+
+
+# --- Inputs ---
+
+def load_inputs(sizes, data_dir):
+    """[{"name", "invoice": (filename, bytes), "report": (filename, bytes)}] of synthetic pairs."""
+    from synthetic_inputs import generate
+
+    pairs = []
+    for size in sizes:
+        name = f"load-{size}"
+        paths = {"invoice": os.path.join(data_dir, f"{name}.pdf"),
+                 "report": os.path.join(data_dir, f"AllDataReport_{name}.xlsx")}
+        if not all(os.path.exists(path) for path in paths.values()):
+            paths = generate(data_dir, name=name, awbs=size, seed=size)
+        pair = {"name": name}
+        for field in ("invoice", "report"):
+            with open(paths[field], "rb") as f:
+                pair[field] = (os.path.basename(paths[field]), f.read())
+        pairs.append(pair)
+    return pairs
+
+
+def multipart_body(pair):
+    """(body, content type) of an /upload form with the invoice ("file") and the report ("report_file")."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for field, (filename, data) in (("file", pair["invoice"]), ("report_file", pair["report"])):
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+                     f'Content-Type: application/octet-stream\r\n\r\n'.encode() + data + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+# --- Server memory ---
+
+def start_rss_sampler(pid, samples, stop):
+    def sample():
+        while not stop.wait(RSS_INTERVAL):
+            rss = tree_rss_mb(pid)
+            if rss is not None:
+                samples.append(rss)
+    thread = threading.Thread(target=sample, daemon=True, name="rss-sampler")
+    thread.start()
+    return thread
+
+
+# --- Clients ---
+
+def request_json(conn, method, path, body=None, headers=None):
+    """(status, JSON body or None, headers) of one request; reconnects if the server closed the connection."""
+    conn.request(method, path, body=body, headers=dict(headers or {}, Accept="application/json"))
+    response = conn.getresponse()
+    data = response.read()
+    try:
+        payload = json.loads(data) if data else None
+    except ValueError:
+        payload = None
+    return response.status, payload, response
+
+
+def wait_for_job(conn, status_url, deadline):
+    while time.monotonic() < deadline:
+        status, payload, _ = request_json(conn, "GET", status_url)
+        if status != 200:
+            return f"status poll answered {status}"
+        if payload.get("status") == "done":
+            return None
+        if payload.get("status") == "failed":
+            return f"job failed: {payload.get('error')}"
+        time.sleep(POLL_INTERVAL)
+    return "job timed out"
+
+
+def client_loop(url, bodies, state, wait):
+    parsed = urllib.parse.urlsplit(url)
+    conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=JOB_TIMEOUT)
+    prefix = parsed.path.rstrip("/")
+    while True:
+        with state["lock"]:
+            if state["issued"] >= state["requests"]:
+                break
+            index = state["issued"]
+            state["issued"] += 1
+        body, content_type = bodies[index % len(bodies)]
+        start = time.monotonic()
+        try:
+            status, payload, response = request_json(conn, "POST", f"{prefix}/upload", body,
+                                                     {"Content-Type": content_type})
+            upload_ms = (time.monotonic() - start) * 1000
+            if status == 429:
+                with state["lock"]:
+                    state["rejected"] += 1
+                time.sleep(min(float(response.getheader("Retry-After") or 1), MAX_BACKOFF))
+                continue
+            if status != 202:
+                raise RuntimeError(f"upload answered {status}: {(payload or {}).get('error')}")
+            with state["lock"]:
+                state["upload_ms"].append(upload_ms)
+            error = wait_for_job(conn, f"{prefix}{payload['status_url']}", start + JOB_TIMEOUT) if wait else None
+            if error:
+                raise RuntimeError(error)
+            with state["lock"]:
+                state["accepted"] += 1
+                if wait:
+                    state["job_ms"].append((time.monotonic() - start) * 1000)
+        except (OSError, http.client.HTTPException, RuntimeError, KeyError) as e:
+            conn.close()
+            with state["lock"]:
+                state["errors"] += 1
+                state["error_samples"] = (state["error_samples"] + [str(e)])[:5]
+
+
+def percentiles(values):
+    """{p50, p95, p99, max} (nearest rank) of values in ms, or None for no values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def rank(q):
+        return round(ordered[max(0, math.ceil(q * len(ordered)) - 1)], 1)
+
+    return {"p50": rank(0.50), "p95": rank(0.95), "p99": rank(0.99), "max": round(ordered[-1], 1)}
+
+
+def run_level(url, bodies, concurrency, requests, wait=True, server_pid=None):
+    """Results of one concurrency level (see module docstring)."""
+    state = {"lock": threading.Lock(), "requests": requests, "issued": 0, "accepted": 0, "rejected": 0,
+             "errors": 0, "error_samples": [], "upload_ms": [], "job_ms": []}
+    rss_samples = []
+    stop = threading.Event()
+    sampler = start_rss_sampler(server_pid, rss_samples, stop) if server_pid else None
+    start = time.monotonic()
+    clients = [threading.Thread(target=client_loop, args=(url, bodies, state, wait), name=f"load-client-{n}")
+               for n in range(concurrency)]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    seconds = time.monotonic() - start
+    stop.set()
+    if sampler is not None:
+        sampler.join()
+        final = tree_rss_mb(server_pid)
+        if final is not None:
+            rss_samples.append(final)
+
+    answered = state["accepted"] + state["rejected"] + state["errors"]
+    return {
+        "concurrency": concurrency, "requests": requests, "accepted": state["accepted"],
+        "rejected": state["rejected"], "errors": state["errors"], "error_samples": state["error_samples"],
+        "error_rate": round(state["errors"] / answered, 4) if answered else 0.0,
+        "seconds": round(seconds, 3),
+        "uploads_per_sec": round(len(state["upload_ms"]) / seconds, 3) if seconds else None,
+        "jobs_per_sec": round(state["accepted"] / seconds, 3) if wait and seconds else None,
+        "upload_ms": percentiles(state["upload_ms"]), "job_ms": percentiles(state["job_ms"]),
+        "rss_mb": {"peak": max(rss_samples), "mean": round(sum(rss_samples) / len(rss_samples), 1)}
+                  if rss_samples else None,
+    }
+
+
+def run_load_test(url, concurrency=DEFAULT_CONCURRENCY, requests=DEFAULT_REQUESTS, sizes=DEFAULT_SIZES,
+                  data_dir=None, wait=True, server_pid=None, out=None):
+    """The load test report: one run_level() per concurrency level (printed to out as it goes)."""
+    data_dir = data_dir or os.path.join(tempfile.gettempdir(), "reconciler-load")
+    os.makedirs(data_dir, exist_ok=True)
+    pairs = load_inputs(sizes, data_dir)
+    bodies = [multipart_body(pair) for pair in pairs]
+    levels = []
+    for level in concurrency:
+        levels.append(run_level(url, bodies, level, requests, wait, server_pid))
+        if out is not None:
+            print_level(levels[-1], out)
+    return {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "url": url, "inputs": [pair["name"] for pair in pairs], "wait": wait, "levels": levels,
+    }
+
+
+def print_level(level, out=sys.stdout):
+    def ms(stats, key):
+        return f"{stats[key]:9.0f}" if stats else f"{'-':>9}"
+
+    upload, job, rss = level["upload_ms"], level["job_ms"], level["rss_mb"]
+    print(f"c={level['concurrency']:<3} ok={level['accepted']:<4} 429={level['rejected']:<4} err={level['errors']:<3} "
+          f"upload p50/p95/p99 {ms(upload, 'p50')}{ms(upload, 'p95')}{ms(upload, 'p99')} ms  "
+          f"job p50/p95/p99 {ms(job, 'p50')}{ms(job, 'p95')}{ms(job, 'p99')} ms  "
+          f"{level['jobs_per_sec'] or level['uploads_per_sec'] or 0:.2f}/s"
+          + (f"  rss peak {rss['peak']:.0f} MB" if rss else ""), file=out)
+
+
+# --- Compare ---
+
+def compare_reports(old, new, threshold=DEFAULT_THRESHOLD):
+    """Per common concurrency level: [{"concurrency", "changes": {...}, "flags": [...]}]."""
+    old_levels = {level["concurrency"]: level for level in old["levels"]}
+    rows = []
+    for level in new["levels"]:
+        before = old_levels.get(level["concurrency"])
+        if before is None:
+            continue
+        changes, flags = {}, []
+        for metric in ("upload_ms", "job_ms"):
+            if before[metric] and level[metric] and before[metric]["p95"]:
+                change = level[metric]["p95"] / before[metric]["p95"] - 1
+                changes[f"{metric}.p95"] = round(change, 4)
+                if change > threshold:
+                    flags.append(f"{metric} p95 +{change * 100:.0f}%")
+        throughput = "jobs_per_sec" if before.get("jobs_per_sec") and level.get("jobs_per_sec") else "uploads_per_sec"
+        if before.get(throughput) and level.get(throughput):
+            change = level[throughput] / before[throughput] - 1
+            changes[throughput] = round(change, 4)
+            if change < -threshold:
+                flags.append(f"{throughput} {change * 100:.0f}%")
+        if level["error_rate"] > before["error_rate"]:
+            flags.append(f"error rate {before['error_rate']:.2%} -> {level['error_rate']:.2%}")
+        rows.append({"concurrency": level["concurrency"], "changes": changes, "flags": flags})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for the Flask /upload endpoint")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="Run a load test")
+    run_parser.add_argument("--url", default="http://127.0.0.1:5000")
+    run_parser.add_argument("--concurrency", default=",".join(map(str, DEFAULT_CONCURRENCY)),
+                            help="Client counts, comma separated (one level each)")
+    run_parser.add_argument("--requests", type=int, default=DEFAULT_REQUESTS, help="Uploads per level")
+    run_parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                            help="AWB counts of the synthetic invoices, comma separated")
+    run_parser.add_argument("--data-dir", default=None, help="Cache of generated inputs")
+    run_parser.add_argument("--no-wait", dest="wait", action="store_false",
+                            help="Measure the uploads only, do not wait for the jobs")
+    run_parser.add_argument("--server-pid", type=int, default=None, help="Sample this process tree's RSS")
+    run_parser.add_argument("--output", default=None, help="Write the JSON report here")
+    compare_parser = commands.add_parser("compare", help="Compare two load test reports")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.old) as f:
+            old = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        rows = compare_reports(old, new, args.threshold)
+        for row in rows:
+            changes = "  ".join(f"{name} {change * 100:+.1f}%" for name, change in row["changes"].items())
+            print(f"c={row['concurrency']:<3} {changes}  {'; '.join(row['flags'])}")
+        sys.exit(1 if any(row["flags"] for row in rows) else 0)
+
+    report = run_load_test(args.url, [int(n) for n in args.concurrency.split(",") if n],
+                           args.requests, [int(n) for n in args.sizes.split(",") if n],
+                           args.data_dir, args.wait, args.server_pid, out=sys.stdout)
+    if args.output:
+        from result_json import atomic_path
+        with atomic_path(args.output) as tmp_path, open(tmp_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
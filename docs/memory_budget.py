@@ -0,0 +1,237 @@
+"""
+Per-stage memory accounting and an optional memory budget for process_files
+(process_invoice.py).
+
+A 25 MB invoice (the upload limit) costs far more than 25 MB of memory:
+pdfplumber keeps every page's parsed layout objects until the PDF is closed,
+and the pipeline holds several DataFrame copies (the AWB frame and its
+reconciliation copy, the report subset). This module shows which stage the
+memory goes to and keeps a job under a budget.
+
+ACCOUNTING (always on; "memory" in the result JSON's timings):
+   "memory": {
+     "peak_rss_mb": 412.5,
+     "stages": {"cca_locate": {"spans": 1, "peak_rss_mb": 398.1, "rss_mb": 395.0, "growth_mb": 210.4}, ...},
+     "plan": {"budget_mb": 300, "rss_mb": 120.3, "estimate_mb": 480.2,
+              "low_memory_estimate_mb": 190.3, "low_memory": true}
+   }
+- memory_hook() is a telemetry.py timer hook measuring every top-level span.
+  peak_rss_mb is the kernel's high-water mark (VmHWM), reset at each span
+  start through /proc/self/clear_refs; where that is not allowed, a stage's
+  peak is known only when it raised the process high-water mark, otherwise
+  the larger of its start and end RSS is reported.
+- VmHWM and its reset are per process. While jobs run on more than one
+  thread of a process (from new_memory_stats() to stop_memory_stats()), one
+  job's reset would clear the others' peaks: the peak is then not reset, and
+  a span that overlapped another thread's job reports the larger of its
+  start and end RSS. The job_queue pool processes and the daemon workers run
+  one job at a time, so they keep exact peaks.
+- growth_mb: RSS change over the stage's spans (negative when it freed memory).
+- While tracemalloc runs (trace=True, N8N_MEMORY_TRACE=1, or a memory
+  profile, see profiling.py) each stage also gets py_peak_mb, the peak of
+  Python allocations above the span start. tracemalloc slows pdfminer's
+  layout down several times, so it is off by default; the RSS reads cost
+  about 25 us per span.
+
+BUDGET (N8N_MEMORY_BUDGET_MB, batch --memory-budget-mb, process_files(memory_budget_mb=)):
+- Once the PDF is open, plan_memory() predicts the job's peak RSS from the
+  current RSS, the page count and the input sizes (ESTIMATE). Over the
+  budget, the job takes the low-memory paths:
+  - PDF: one pass over the pages (CCA header check and layout text page by
+    page), closing each page when done, instead of keeping every page's
+    layout objects until the PDF is closed;
+  - DataFrames: the AWB frame is worked on in place instead of copied twice,
+    the full report frame is released once its subset is taken, and the
+    garbage collector runs once the PDF is closed (pdfminer's object graphs
+    are cyclic).
+- Both paths write the same workbook. If even the low-memory estimate is over
+  the budget the job still runs (low-memory) and a warning is logged: the
+  hard stop is worker_limits.py's max_memory_mb.
+"""
+
+import os
+import threading
+import tracemalloc
+
+TRACEMALLOC_FRAMES = 1
+
+# Peak RSS growth over the RSS at planning time (MB):
+#   fixed_mb + page_mb * pages + invoice_factor * invoice MB + report_factor * report MB
+# Measured growth per page: 2.3 MB on the 10-page sample invoice, 5.3 MB on
+# dense synthetic_inputs.py invoices of 20 to 400 pages (2.1 GB at 400 pages;
+# 26 MB on the low-memory paths, at the same speed). page_mb is the dense case,
+# so the estimate errs high. report_factor: xls/xlsx read into a DataFrame.
+ESTIMATE = {
+    "default": {"fixed_mb": 20.0, "page_mb": 5.5, "invoice_factor": 1.0, "report_factor": 20.0},
+    "low_memory": {"fixed_mb": 20.0, "page_mb": 0.05, "invoice_factor": 1.0, "report_factor": 20.0},
+}
+
+
+# Jobs accounted in this process: {thread id: open stats}; epoch counts the
+# threads that started a job, so a span can tell whether another one overlapped it
+_lock = threading.Lock()
+_jobs = {"threads": {}, "epoch": 0}
+
+
+# --- Accounting ---
+
+def new_memory_stats(trace=False):
+    """Per-stage memory of one job; trace=True starts tracemalloc (stop_memory_stats stops it)."""
+    stats = {"stages": {}, "span": None, "reset_peak": True, "own_tracing": False,
+             "thread": threading.get_ident()}
+    with _lock:
+        if stats["thread"] not in _jobs["threads"]:
+            _jobs["epoch"] += 1
+        _jobs["threads"][stats["thread"]] = _jobs["threads"].get(stats["thread"], 0) + 1
+    if trace and not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        stats["own_tracing"] = True
+    return stats
+
+
+def stop_memory_stats(stats):
+    if stats["own_tracing"]:
+        tracemalloc.stop()
+        stats["own_tracing"] = False
+    with _lock:
+        count = _jobs["threads"].get(stats["thread"], 0)
+        if count > 1:
+            _jobs["threads"][stats["thread"]] = count - 1
+        else:
+            _jobs["threads"].pop(stats["thread"], None)
+
+
+def _sole_job_epoch():
+    """The job epoch while at most one thread runs jobs in this process, else None."""
+    with _lock:
+        return _jobs["epoch"] if len(_jobs["threads"]) <= 1 else None
+
+
+def _status_kb():
+    """(VmRSS, VmHWM) of this process in kB, or (None, None) without /proc."""
+    rss = hwm = None
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    hwm = int(line.split()[1])
+                elif line.startswith("VmRSS:"):
+                    rss = int(line.split()[1])
+                    break  # VmRSS follows VmHWM
+    except (OSError, ValueError, IndexError):
+        return None, None
+    return rss, hwm
+
+
+def _reset_peak(stats):
+    # Writing 5 to clear_refs resets VmHWM to the current RSS (Linux 4.0+)
+    if not stats["reset_peak"]:
+        return
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        stats["reset_peak"] = False
+
+
+def memory_hook(stats):
+    """telemetry.py timer hook: peak/end RSS (and tracemalloc peak) of each top-level span."""
+
+    def hook(event, path, depth):
+        if depth != 1:
+            return
+        if event == "begin":
+            epoch = _sole_job_epoch()
+            if epoch is not None:
+                _reset_peak(stats)
+            rss, hwm = _status_kb()
+            py_start = None
+            if tracemalloc.is_tracing():
+                tracemalloc.reset_peak()
+                py_start = tracemalloc.get_traced_memory()[0]
+            stats["span"] = (rss, hwm, py_start, epoch) if rss is not None else None
+            return
+        if stats["span"] is None:
+            return
+        rss_begin, hwm_begin, py_start, epoch = stats["span"]
+        stats["span"] = None
+        rss, hwm = _status_kb()
+        if rss is None:
+            return
+        if epoch is None or _sole_job_epoch() != epoch:
+            peak_kb = max(rss_begin, rss)  # another job shared the process high-water mark
+        else:
+            peak_kb = hwm if stats["reset_peak"] or hwm > hwm_begin else max(rss_begin, rss)
+        stage = stats["stages"].setdefault(path, {"spans": 0, "peak_rss_mb": 0.0, "rss_mb": 0.0, "growth_mb": 0.0})
+        stage["spans"] += 1
+        stage["peak_rss_mb"] = max(stage["peak_rss_mb"], peak_kb / 1024)
+        stage["rss_mb"] = rss / 1024
+        stage["growth_mb"] += (rss - rss_begin) / 1024
+        if py_start is not None and tracemalloc.is_tracing():
+            py_peak = (tracemalloc.get_traced_memory()[1] - py_start) / (1024 * 1024)
+            stage["py_peak_mb"] = max(stage.get("py_peak_mb", 0.0), py_peak)
+
+    return hook
+
+
+def memory_summary(stats, plan=None):
+    """The "memory" object of the timings (see module docstring)."""
+    stages = {path: {key: round(value, 1) if isinstance(value, float) else value for key, value in stage.items()}
+              for path, stage in stats["stages"].items()}
+    summary = {"peak_rss_mb": max((stage["peak_rss_mb"] for stage in stages.values()), default=None),
+               "stages": stages}
+    if plan is not None:
+        summary["plan"] = plan
+    return summary
+
+
+# --- Budget ---
+
+def input_size(source):
+    """Size in bytes of a path, bytes-like or seekable file object (None if unknown)."""
+    if isinstance(source, (str, os.PathLike)):
+        try:
+            return os.path.getsize(source)
+        except OSError:
+            return None
+    if isinstance(source, memoryview):
+        return source.nbytes
+    if isinstance(source, (bytes, bytearray)):
+        return len(source)
+    try:
+        position = source.tell()
+        size = source.seek(0, os.SEEK_END)
+        source.seek(position)
+        return size
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def estimate_growth_mb(pages, invoice_bytes, report_bytes, low_memory=False):
+    """Predicted peak RSS growth of a job (MB), from ESTIMATE."""
+    model = ESTIMATE["low_memory" if low_memory else "default"]
+    return (model["fixed_mb"] + model["page_mb"] * pages
+            + model["invoice_factor"] * (invoice_bytes or 0) / (1024 * 1024)
+            + model["report_factor"] * (report_bytes or 0) / (1024 * 1024))
+
+
+def plan_memory(budget_mb, pages, invoice_bytes, report_bytes, rss_mb=None):
+    """
+    The plan for a job under budget_mb (None when there is no budget):
+    {"budget_mb", "rss_mb", "estimate_mb", "low_memory_estimate_mb", "low_memory"}.
+    rss_mb: the RSS the job starts from (default: this process, now).
+    """
+    if not budget_mb:
+        return None
+    if rss_mb is None:
+        from worker_limits import rss_mb as current_rss_mb
+        rss_mb = current_rss_mb()
+    estimate = rss_mb + estimate_growth_mb(pages, invoice_bytes, report_bytes)
+    low_estimate = rss_mb + estimate_growth_mb(pages, invoice_bytes, report_bytes, low_memory=True)
+    return {
+        "budget_mb": budget_mb,
+        "rss_mb": round(rss_mb, 1),
+        "estimate_mb": round(estimate, 1),
+        "low_memory_estimate_mb": round(low_estimate, 1),
+        "low_memory": estimate > budget_mb,
+    }
@@ -0,0 +1,260 @@
+"""
+Prometheus metrics for the reconciliation service (no prometheus_client needed).
+
+app.py serves them at GET /metrics. CLI, daemon and batch runs of
+process_invoice.py add theirs to a textfile for node_exporter's textfile
+collector: set N8N_METRICS_FILE=/var/lib/node_exporter/textfile/reconciler.prom
+(batch: --metrics-file, defaulting to the same variable).
+
+METRICS (labels in braces):
+   reconciler_jobs_total{engine,status}              counter    finished jobs, status done | failed
+   reconciler_job_duration_seconds{engine}           histogram  wall time of a job
+   reconciler_stage_duration_seconds{engine,stage}   histogram  telemetry.py stage times of a job
+   reconciler_pages_total{engine}                    counter    invoice pages read
+   reconciler_awbs_total{engine}                     counter    Invoices rows
+   reconciler_ccas_total{engine}                     counter    CCA rows
+   reconciler_discrepancies_total{engine,category}   counter    discrepant rows per result_json.py
+                                                                category ("total": rows with any)
+   reconciler_cache_requests_total{cache,result}     counter    result hit | miss; hit ratio =
+                                                                rate(hit) / rate(hit + miss)
+   reconciler_queue_jobs{state}                      gauge      app: in_flight and capacity
+   reconciler_worker_rss_bytes{process}              gauge      app: server, workers (the job pool);
+                                                                CLI: cli (the process that ran the last job)
+engine is cli (process_invoice.py, also on the daemon), batch or app.
+
+COST:
+- The engines are not instrumented inside their page/row loops: record_job()
+  takes a job's counts from the details and timings it already returns, once
+  per job.
+- inc/observe are a dict lookup and an add (histograms: plus a bisect), without
+  a lock; each registry is updated from one thread (the app's job-finished
+  callback, the batch runner, the CLI after its job).
+- Gauges are set at scrape time by collectors (add_collector).
+
+TEXTFILE (update_textfile):
+- One-shot processes merge into the file: counters and histograms add to the
+  values already there, gauges replace theirs. The merge runs under an
+  exclusive lock on <path>.lock and the file is replaced atomically, so
+  concurrent CLI runs and daemon workers don't lose updates.
+- node_exporter only reads files ending in .prom.
+"""
+
+import bisect
+import fcntl
+
+# Seconds
+JOB_BUCKETS = (0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# name -> (type, help, labels, buckets)
+SERVICE_METRICS = {
+    "reconciler_jobs_total": ("counter", "Finished reconciliation jobs.", ("engine", "status"), None),
+    "reconciler_job_duration_seconds": ("histogram", "Wall time of a reconciliation job.", ("engine",), JOB_BUCKETS),
+    "reconciler_stage_duration_seconds": ("histogram", "Time per pipeline stage of a job (telemetry.py spans).",
+                                          ("engine", "stage"), STAGE_BUCKETS),
+    "reconciler_pages_total": ("counter", "Invoice PDF pages read.", ("engine",), None),
+    "reconciler_awbs_total": ("counter", "AWB rows extracted (Invoices sheet).", ("engine",), None),
+    "reconciler_ccas_total": ("counter", "CCA rows extracted.", ("engine",), None),
+    "reconciler_discrepancies_total": ("counter", "Discrepant reconciliation rows per category.",
+                                       ("engine", "category"), None),
+    "reconciler_cache_requests_total": ("counter", "Cache lookups by result (hit or miss).", ("cache", "result"), None),
+    "reconciler_queue_jobs": ("gauge", "Jobs in flight (running or waiting) and queue capacity.", ("state",), None),
+    "reconciler_worker_rss_bytes": ("gauge", "Resident memory of the processes running jobs.", ("process",), None),
+}
+
+
+# --- Registry ---
+
+def new_registry():
+    """An empty registry with the SERVICE_METRICS defined."""
+    registry = {"metrics": {}, "collectors": []}
+    for name, (kind, help_text, labels, buckets) in SERVICE_METRICS.items():
+        define(registry, name, kind, help_text, labels, buckets)
+    return registry
+
+
+def define(registry, name, kind, help_text, labels=(), buckets=None):
+    """Adds (or returns the existing) metric {"name", "type", "help", "labels", "buckets", "series"}."""
+    metric = registry["metrics"].get(name)
+    if metric is None:
+        if kind == "histogram" and not buckets:
+            raise ValueError(f"Histogram {name} needs buckets")
+        metric = {"name": name, "type": kind, "help": help_text, "labels": tuple(labels),
+                  "buckets": tuple(buckets) if buckets else None, "series": {}}
+        registry["metrics"][name] = metric
+    return metric
+
+
+def add_collector(registry, collect):
+    """collect(registry) runs before every render, e.g. to set gauges."""
+    registry["collectors"].append(collect)
+
+
+# --- Updates (labels: a tuple of values in the metric's label order) ---
+
+def inc(metric, labels=(), amount=1):
+    series = metric["series"]
+    series[labels] = series.get(labels, 0) + amount
+
+
+def set_gauge(metric, labels, value):
+    metric["series"][labels] = value
+
+
+def observe(metric, labels, value):
+    entry = metric["series"].get(labels)
+    if entry is None:
+        # [per-bucket counts (last: +Inf), sum, count]
+        entry = metric["series"][labels] = [[0] * (len(metric["buckets"]) + 1), 0.0, 0]
+    entry[0][bisect.bisect_left(metric["buckets"], value)] += 1
+    entry[1] += value
+    entry[2] += 1
+
+
+def record_job(registry, engine, success, seconds, details):
+    """
+    Records one finished job. details: the job's result fields ("pages",
+    "rows" {"invoices", "cca"}, "discrepancies" {category: count}, "timings"
+    from telemetry.timings()); missing ones are skipped, as is seconds=None.
+    """
+    metrics = registry["metrics"]
+    inc(metrics["reconciler_jobs_total"], (engine, "done" if success else "failed"))
+    if seconds is not None:
+        observe(metrics["reconciler_job_duration_seconds"], (engine,), seconds)
+    stage_metric = metrics["reconciler_stage_duration_seconds"]
+    for stage, ms in ((details.get("timings") or {}).get("stages") or {}).items():
+        if "." not in stage:  # sub-spans (sheets.Summary) are inside their stage
+            observe(stage_metric, (engine, stage), ms / 1000.0)
+    if details.get("pages") is not None:
+        inc(metrics["reconciler_pages_total"], (engine,), details["pages"])
+    rows = details.get("rows") or {}
+    if rows:
+        inc(metrics["reconciler_awbs_total"], (engine,), rows.get("invoices", 0))
+        inc(metrics["reconciler_ccas_total"], (engine,), rows.get("cca", 0))
+    discrepancy_metric = metrics["reconciler_discrepancies_total"]
+    for category, count in (details.get("discrepancies") or {}).items():
+        inc(discrepancy_metric, (engine, category), count)
+
+
+def record_cache(registry, cache, hit, count=1):
+    inc(registry["metrics"]["reconciler_cache_requests_total"], (cache, "hit" if hit else "miss"), count)
+
+
+def set_rss(registry, process, rss_mb):
+    """Sets reconciler_worker_rss_bytes{process} from an RSS in MB (None: unknown, left as is)."""
+    if rss_mb is not None:
+        set_gauge(registry["metrics"]["reconciler_worker_rss_bytes"], (process,), int(rss_mb * 1024 * 1024))
+
+
+# --- Exposition format ---
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def families(registry):
+    """
+    {metric name: {"type", "help", "samples": {(sample name, label string): value}}}
+    after running the collectors; the form render/merge work on.
+    """
+    for collect in registry["collectors"]:
+        collect(registry)
+    result = {}
+    for name, metric in registry["metrics"].items():
+        samples = {}
+        names = metric["labels"]
+        for labels, value in sorted(metric["series"].items()):
+            if metric["type"] != "histogram":
+                samples[(name, _labels(names, labels))] = value
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip(metric["buckets"] + (float("inf"),), counts):
+                cumulative += bucket_count
+                samples[(name + "_bucket", _labels(names + ("le",), labels + (_number(float(bound)),)))] = cumulative
+            samples[(name + "_sum", _labels(names, labels))] = total
+            samples[(name + "_count", _labels(names, labels))] = count
+        result[name] = {"type": metric["type"], "help": metric["help"], "samples": samples}
+    return result
+
+
+def format_families(metric_families):
+    lines = []
+    for name, family in metric_families.items():
+        if not family["samples"]:
+            continue
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        lines.extend(f"{sample}{labels} {_number(value)}" for (sample, labels), value in family["samples"].items())
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+def render(registry):
+    """The registry in the Prometheus text exposition format (version 0.0.4)."""
+    return format_families(families(registry))
+
+
+def parse_families(text):
+    """families() of exposition text written by format_families (the textfile)."""
+    result = {}
+    family = None
+    for line in text.splitlines():
+        if line.startswith("# HELP "):
+            name, _, help_text = line[7:].partition(" ")
+            family = result.setdefault(name, {"type": "untyped", "help": help_text, "samples": {}})
+        elif line.startswith("# TYPE "):
+            name, _, kind = line[7:].partition(" ")
+            family = result.setdefault(name, {"type": kind, "help": "", "samples": {}})
+            family["type"] = kind
+        elif line.strip() and not line.startswith("#") and family is not None:
+            series, _, value = line.rpartition(" ")
+            brace = series.find("{")
+            sample, labels = (series, "") if brace < 0 else (series[:brace], series[brace:])
+            family["samples"][(sample, labels)] = float(value)
+    return result
+
+
+def merge_families(previous, current):
+    """previous with current added: counter and histogram samples sum, gauges replace."""
+    merged = {name: dict(family, samples=dict(family["samples"])) for name, family in previous.items()}
+    for name, family in current.items():
+        target = merged.setdefault(name, dict(family, samples={}))
+        samples = target["samples"]
+        for key, value in family["samples"].items():
+            if family["type"] == "gauge" or key not in samples:
+                samples[key] = value
+            else:
+                samples[key] += value
+    return merged
+
+
+# --- Textfile ---
+
+def update_textfile(path, registry):
+    """Merges the registry into the metrics textfile at path (see module docstring)."""
+    from result_json import atomic_path
+
+    with open(path + ".lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with open(path) as f:
+                previous = parse_families(f.read())
+        except FileNotFoundError:
+            previous = {}
+        text = format_families(merge_families(previous, families(registry)))
+        with atomic_path(path) as tmp_path, open(tmp_path, "w") as f:
+            f.write(text)
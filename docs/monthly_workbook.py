@@ -0,0 +1,572 @@
+#!/opt/venv/bin/python3
+"""
+Append-mode monthly reconciliation workbook.
+
+Finance keeps one workbook per month that collects every invoice's
+reconciliation. Instead of rebuilding that workbook from the separate files
+written by process_files, each invoice is appended as its own set of sheet
+parts ("Reconciliation 001", "Invoices 001", "CCA 001", ...) and the Summary
+sheet is regenerated from running totals.
+
+HOW APPENDING STAYS CHEAP:
+- The xlsx zip is laid out as [immutable invoice parts][mutable tail]. The
+  tail holds the small parts that change on every append: the Summary sheet,
+  workbook.xml, its rels, styles and [Content_Types].xml.
+- An indexed sidecar (<workbook>.index.json) records the byte offset where the
+  tail starts, the sheets/tables written so far and the running Summary totals.
+- Appending truncates the file at the tail (os.truncate), appends the new
+  invoice's sheet parts and the new tail, zipped in memory, and writes a
+  central directory for the kept and the new members (see Zip Layout).
+  Existing sheet parts are never read, decompressed or rewritten, so an
+  append costs about the same for the 2nd invoice of the month as for the 200th.
+- Sheets are rendered by sheet_spec.render_workbook, as in the per-invoice
+  workbook, and only their parts are copied in, so the two cannot drift.
+
+CRASH SAFETY (see Rollback Journal below): the old tail is journaled before
+an append touches the workbook. An append that fails is rolled back at once;
+one cut short by a crash is rolled back by the next load_index().
+
+USAGE:
+   From process_invoice.py (per-invoice output is still written as before):
+   ```
+   N8N_MONTHLY_WORKBOOK=/files/reconciliation-{month}.xlsx python process_invoice.py invoice.pdf report.xls result.json
+   ```
+
+   Append an already processed workbook by hand:
+   ```
+   python monthly_workbook.py reconciliation-2025-06.xlsx invoice-abc123.xlsx
+   ```
+"""
+
+import sys
+import os
+import io
+import re
+import json
+import math
+import struct
+import zipfile
+import datetime
+from xml.sax.saxutils import escape
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are not locked
+    fcntl = None
+
+from sheet_spec import RECONCILIATION_SHEET, INVOICES_SHEET, CCA_SHEET, count_data_rows, render_workbook
+
+
+INDEX_SUFFIX = ".index.json"
+JOURNAL_SUFFIX = ".journal"
+INDEX_VERSION = 1
+
+# Sheets accumulated per invoice, in workbook order: (name, table name, table style)
+# taken from the same sheet specs as the per-invoice workbook.
+APPENDED_SHEETS = [
+    (spec["name"], spec["table"]["name"], spec["table"]["style"])
+    for spec in (RECONCILIATION_SHEET, INVOICES_SHEET, CCA_SHEET)
+]
+APPENDED_SPECS = {spec["name"]: spec for spec in (RECONCILIATION_SHEET, INVOICES_SHEET, CCA_SHEET)}
+
+# Summary metrics that are summed across invoices. Averages and differences
+# are derived from these totals when the Summary sheet is regenerated.
+ADDITIVE_SUMMARY_METRICS = [
+    'Invoice AWB Count',
+    'Total Invoice Amount (Net Due)',
+    'Total Invoice Charge Weight',
+    'Total Report Amount (for Matched AWBs)',
+]
+
+INVOICE_LIST_COLUMNS = [
+    'Invoice', 'Appended At', 'AWB Rows', 'CCA Rows',
+    'Total Invoice Amount (Net Due)', 'Total Report Amount (for Matched AWBs)',
+    'Difference (Report - Invoice)', 'Reconciliation Sheet', 'Invoices Sheet', 'CCA Sheet',
+]
+
+# The monthly Summary sheet: month metrics under Metric/Value, then the invoice
+# list (its own header row) across all INVOICE_LIST_COLUMNS
+MONTHLY_SUMMARY_SHEET = {
+    "name": "Summary",
+    "columns": [f"column{i}" for i in range(len(INVOICE_LIST_COLUMNS))],
+    "headers": {f"column{i}": ('Metric', 'Value')[i] if i < 2 else '' for i in range(len(INVOICE_LIST_COLUMNS))},
+    "dtypes": {},
+    "number_formats": {},
+    "table": None,
+    "total_row": None,
+    "highlights": [],
+}
+
+NS_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+NS_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+NS_PKG_REL = "http://schemas.openxmlformats.org/package/2006/relationships"
+REL_WORKSHEET = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"
+REL_STYLES = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles"
+REL_TABLE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/table"
+REL_OFFICE_DOC = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"
+CT_WORKSHEET = "application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"
+CT_TABLE = "application/vnd.openxmlformats-officedocument.spreadsheetml.table+xml"
+CT_WORKBOOK = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"
+CT_STYLES = "application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"
+
+STYLES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    f'<styleSheet xmlns="{NS_MAIN}">'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+
+
+class MonthlyWorkbookError(RuntimeError):
+    """Raised when the monthly workbook and its index no longer agree."""
+
+
+def index_path_for(workbook_path):
+    """Returns the sidecar index path for a monthly workbook."""
+    return workbook_path + INDEX_SUFFIX
+
+
+def resolve_monthly_path(path_template, when=None):
+    """Expands a '{month}' placeholder (YYYY-MM) in a monthly workbook path."""
+    when = when or datetime.datetime.now()
+    return path_template.replace('{month}', when.strftime('%Y-%m'))
+
+
+# --- Sheet Rendering (sheet_spec.py) ---
+
+def render_sheet_parts(specs, frames):
+    """
+    Renders sheets with sheet_spec.render_workbook (as process_files and app.py
+    do, without highlights) and returns their parts in spec order:
+    [(sheet_xml, table_xml or None)]. Only these parts are copied into the
+    monthly workbook; its own tail parts tie them together.
+    """
+    out = io.BytesIO()
+    render_workbook(out, frames, highlights=False, specs=specs)
+    parts = []
+    with zipfile.ZipFile(out) as rendered:
+        names = set(rendered.namelist())
+        for number in range(1, len(specs) + 1):
+            sheet_xml = rendered.read(f"xl/worksheets/sheet{number}.xml")
+            table_xml = None
+            rels_name = f"xl/worksheets/_rels/sheet{number}.xml.rels"
+            if rels_name in names:
+                target = re.search(rb'Target="/?([^"]+)"', rendered.read(rels_name)).group(1).decode()
+                table_xml = rendered.read(target)
+            parts.append((sheet_xml, table_xml))
+    return parts
+
+
+def _renumber_table(table_xml, table_id):
+    # Table ids must be unique across the workbook; openpyxl numbers from 1 per render
+    return re.sub(rb'(<table\b[^>]*?\sid=")\d+"', lambda m: m.group(1) + str(table_id).encode() + b'"',
+                  table_xml, count=1)
+
+
+def render_sheet_rels_xml(table_part):
+    # rId1: the tablePart id openpyxl writes into the sheet XML
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        f'<Relationships xmlns="{NS_PKG_REL}">'
+        f'<Relationship Id="rId1" Type="{REL_TABLE}" Target="/{table_part}"/>'
+        '</Relationships>'
+    ).encode('utf-8')
+
+
+# --- Summary ---
+
+def _new_index():
+    return {
+        "version": INDEX_VERSION,
+        "tail_offset": 0,
+        "size": 0,
+        "next_sheet_id": 2,  # sheet1.xml is always the Summary sheet
+        "next_table_id": 1,
+        "invoices": [],
+        "totals": {metric: 0.0 for metric in ADDITIVE_SUMMARY_METRICS},
+    }
+
+
+def _as_number(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return 0.0 if math.isnan(number) else number
+
+
+def month_summary_rows(index):
+    """Metric/Value rows for the month, derived from the running totals."""
+    totals = index["totals"]
+    invoice_amount = totals.get('Total Invoice Amount (Net Due)', 0.0)
+    charge_weight = totals.get('Total Invoice Charge Weight', 0.0)
+    report_amount = totals.get('Total Report Amount (for Matched AWBs)', 0.0)
+    return [
+        ('Invoices Appended', len(index["invoices"])),
+        ('Invoice AWB Count', int(totals.get('Invoice AWB Count', 0))),
+        ('Total Invoice Amount (Net Due)', invoice_amount),
+        ('Total Invoice Charge Weight', charge_weight),
+        ('Average Net Yield Rate', (invoice_amount / charge_weight) if charge_weight else 0.0),
+        ('Total Report Amount (for Matched AWBs)', report_amount),
+        ('Difference (Report - Invoice)', report_amount - invoice_amount),
+    ]
+
+
+def render_summary_xml(index):
+    """Month metrics, a blank row, then one row per appended invoice."""
+    import pandas as pd
+
+    rows = [list(r) + [None] * (len(INVOICE_LIST_COLUMNS) - 2) for r in month_summary_rows(index)]
+    rows.append([None] * len(INVOICE_LIST_COLUMNS))
+    rows.append(list(INVOICE_LIST_COLUMNS))
+    for invoice in index["invoices"]:
+        summary = invoice["summary"]
+        rows.append([
+            invoice["label"], invoice["appended_at"],
+            invoice["rows"].get("Invoices", 0), invoice["rows"].get("CCA", 0),
+            summary.get('Total Invoice Amount (Net Due)', 0.0),
+            summary.get('Total Report Amount (for Matched AWBs)', 0.0),
+            summary.get('Total Report Amount (for Matched AWBs)', 0.0) - summary.get('Total Invoice Amount (Net Due)', 0.0),
+            invoice["sheets"].get("Reconciliation", {}).get("name", ""),
+            invoice["sheets"].get("Invoices", {}).get("name", ""),
+            invoice["sheets"].get("CCA", {}).get("name", ""),
+        ])
+    rows = [[None if value == '' else value for value in row] for row in rows]
+    frame = pd.DataFrame(rows, columns=MONTHLY_SUMMARY_SHEET["columns"], dtype=object)
+    [(sheet_xml, _)] = render_sheet_parts([MONTHLY_SUMMARY_SHEET], {"Summary": frame})
+    return sheet_xml
+
+
+# --- Package (tail) Parts ---
+
+def _sheet_entries(index):
+    """(name, part) for every sheet in workbook order, Summary first."""
+    entries = [("Summary", "xl/worksheets/sheet1.xml")]
+    for invoice in index["invoices"]:
+        for base_name, _, _ in APPENDED_SHEETS:
+            sheet = invoice["sheets"].get(base_name)
+            if sheet:
+                entries.append((sheet["name"], sheet["part"]))
+    return entries
+
+
+def render_tail_parts(index):
+    """All mutable parts, regenerated on every append."""
+    entries = _sheet_entries(index)
+    sheets_xml = "".join(
+        f'<sheet name="{escape(name)}" sheetId="{i}" r:id="rId{i}"/>'
+        for i, (name, _) in enumerate(entries, start=1)
+    )
+    workbook_xml = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        f'<workbook xmlns="{NS_MAIN}" xmlns:r="{NS_REL}"><sheets>{sheets_xml}</sheets></workbook>'
+    )
+    rels = "".join(
+        f'<Relationship Id="rId{i}" Type="{REL_WORKSHEET}" Target="/{part}"/>'
+        for i, (_, part) in enumerate(entries, start=1)
+    )
+    rels += f'<Relationship Id="rId{len(entries) + 1}" Type="{REL_STYLES}" Target="/xl/styles.xml"/>'
+    workbook_rels_xml = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        f'<Relationships xmlns="{NS_PKG_REL}">{rels}</Relationships>'
+    )
+    overrides = [f'<Override PartName="/{part}" ContentType="{CT_WORKSHEET}"/>' for _, part in entries]
+    for invoice in index["invoices"]:
+        for sheet in invoice["sheets"].values():
+            if sheet.get("table_part"):
+                overrides.append(f'<Override PartName="/{sheet["table_part"]}" ContentType="{CT_TABLE}"/>')
+    content_types_xml = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        f'<Override PartName="/xl/workbook.xml" ContentType="{CT_WORKBOOK}"/>'
+        f'<Override PartName="/xl/styles.xml" ContentType="{CT_STYLES}"/>'
+        f'{"".join(overrides)}</Types>'
+    )
+    root_rels_xml = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        f'<Relationships xmlns="{NS_PKG_REL}">'
+        f'<Relationship Id="rId1" Type="{REL_OFFICE_DOC}" Target="/xl/workbook.xml"/></Relationships>'
+    )
+    return [
+        ("xl/worksheets/sheet1.xml", render_summary_xml(index)),
+        ("xl/styles.xml", STYLES_XML.encode('utf-8')),
+        ("xl/workbook.xml", workbook_xml.encode('utf-8')),
+        ("xl/_rels/workbook.xml.rels", workbook_rels_xml.encode('utf-8')),
+        ("_rels/.rels", root_rels_xml.encode('utf-8')),
+        ("[Content_Types].xml", content_types_xml.encode('utf-8')),
+    ]
+
+
+# --- Index I/O ---
+
+def load_index(workbook_path):
+    """
+    Loads the sidecar index, or a fresh one if the workbook does not exist yet.
+    An append that did not finish is rolled back first (see recover_append).
+    """
+    recover_append(workbook_path)
+    idx_path = index_path_for(workbook_path)
+    if not os.path.exists(workbook_path):
+        if os.path.exists(idx_path):
+            raise MonthlyWorkbookError(f"Index {idx_path} exists but workbook {workbook_path} is missing")
+        return _new_index()
+    if not os.path.exists(idx_path):
+        raise MonthlyWorkbookError(
+            f"Monthly workbook {workbook_path} has no index ({idx_path}); it was not created in append mode")
+    with open(idx_path, 'r') as f:
+        index = json.load(f)
+    if index.get("version") != INDEX_VERSION:
+        raise MonthlyWorkbookError(f"Unsupported monthly index version: {index.get('version')}")
+    actual_size = os.path.getsize(workbook_path)
+    if actual_size != index["size"]:
+        raise MonthlyWorkbookError(
+            f"Monthly workbook {workbook_path} changed outside append mode "
+            f"(size {actual_size}, index expects {index['size']}); re-create it before appending")
+    return index
+
+
+def _write_index(workbook_path, index):
+    idx_path = index_path_for(workbook_path)
+    tmp_path = idx_path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, idx_path)
+
+
+# --- Rollback Journal ---
+# An append only writes at or after the tail offset. Before it starts, the old
+# tail bytes (tail parts + central directory, a few kB) are saved to
+# <workbook>.index.json.journal; the journal is removed once the new index is
+# written. A journal found later means the append did not finish: the old tail
+# is written back and the file cut to its old size, which matches the index.
+
+def journal_path_for(workbook_path):
+    return index_path_for(workbook_path) + JOURNAL_SUFFIX
+
+
+def _write_journal(workbook_path, index):
+    header = {"invoices": len(index["invoices"]), "tail_offset": index["tail_offset"], "size": index["size"],
+              "created": not os.path.exists(workbook_path)}
+    tail = b""
+    if not header["created"]:
+        with open(workbook_path, 'rb') as f:
+            f.seek(index["tail_offset"])
+            tail = f.read()
+    path = journal_path_for(workbook_path)
+    with open(path + ".tmp", 'wb') as f:
+        f.write(json.dumps(header).encode('utf-8') + b"\n" + tail)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+
+def recover_append(workbook_path):
+    """Rolls back an append that was interrupted (see Rollback Journal). Returns True if it did."""
+    path = journal_path_for(workbook_path)
+    if not os.path.exists(path):
+        return False
+    with open(path, 'rb') as f:
+        header, _, tail = f.read().partition(b"\n")
+    header = json.loads(header)
+    idx_path = index_path_for(workbook_path)
+    committed = False
+    if os.path.exists(idx_path):
+        with open(idx_path, 'r') as f:
+            committed = len(json.load(f)["invoices"]) > header["invoices"]
+    if not committed:
+        if header["created"]:
+            if os.path.exists(workbook_path):
+                os.remove(workbook_path)
+        else:
+            with open(workbook_path, 'r+b') as f:
+                f.seek(header["tail_offset"])
+                f.write(tail)
+                f.truncate(header["size"])
+                f.flush()
+                os.fsync(f.fileno())
+    os.remove(path)
+    return not committed
+
+
+# --- Append ---
+
+def append_invoice(workbook_path, label, summary_data, frames):
+    """
+    Appends one invoice to a monthly workbook, creating it if needed.
+
+    summary_data: the per-invoice Summary metrics dict built by process_files.
+    frames: {"Reconciliation": df, "Invoices": df, "CCA": df}; empty or missing
+            frames are skipped. Totals rows are kept, as in the per-invoice file.
+    Returns the updated index.
+    """
+    lock_file = open(index_path_for(workbook_path) + ".lock", 'w')
+    try:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return _append_locked(workbook_path, label, summary_data, frames)
+    finally:
+        lock_file.close()
+
+
+def _append_locked(workbook_path, label, summary_data, frames):
+    index = load_index(workbook_path)
+    seq = len(index["invoices"]) + 1
+    invoice = {
+        "label": label,
+        "seq": seq,
+        "appended_at": datetime.datetime.now().isoformat(timespec='seconds'),
+        "sheets": {},
+        "rows": {},
+        "summary": {k: _as_number(v) for k, v in summary_data.items()},
+    }
+
+    # Render the new immutable parts before touching the file
+    specs, sheet_frames = [], {}
+    for base_name, table_base, _ in APPENDED_SHEETS:
+        df = frames.get(base_name)
+        if df is None or df.empty:
+            continue
+        spec = APPENDED_SPECS[base_name]
+        if spec["table"]:
+            spec = dict(spec, table=dict(spec["table"], name=f"{table_base}{seq:03d}"))
+        specs.append(spec)
+        sheet_frames[base_name] = df
+    new_parts = []
+    for spec, (sheet_xml, table_xml) in zip(specs, render_sheet_parts(specs, sheet_frames)):
+        base_name = spec["name"]
+        sheet_id = index["next_sheet_id"]
+        index["next_sheet_id"] += 1
+        sheet_part = f"xl/worksheets/sheet{sheet_id}.xml"
+        sheet = {"name": f"{base_name} {seq:03d}", "part": sheet_part}
+        new_parts.append((sheet_part, sheet_xml))
+        if table_xml is not None:
+            table_id = index["next_table_id"]
+            index["next_table_id"] += 1
+            table_part = f"xl/tables/table{table_id}.xml"
+            new_parts.append((table_part, _renumber_table(table_xml, table_id)))
+            new_parts.append((f"xl/worksheets/_rels/sheet{sheet_id}.xml.rels", render_sheet_rels_xml(table_part)))
+            sheet["table_part"] = table_part
+            sheet["table"] = spec["table"]["name"]
+        sheet["rows"] = len(sheet_frames[base_name])
+        invoice["sheets"][base_name] = sheet
+        invoice["rows"][base_name] = count_data_rows(spec, sheet_frames[base_name])
+
+    _write_journal(workbook_path, index)
+    index["invoices"].append(invoice)
+    for metric in ADDITIVE_SUMMARY_METRICS:
+        index["totals"][metric] = index["totals"].get(metric, 0.0) + invoice["summary"].get(metric, 0.0)
+
+    # Truncate the mutable tail, append new parts, rewrite tail + central directory
+    try:
+        kept = []
+        if os.path.exists(workbook_path):
+            with zipfile.ZipFile(workbook_path) as zf:  # reads the central directory only
+                kept = [info for info in zf.infolist() if info.header_offset < index["tail_offset"]]
+            os.truncate(workbook_path, index["tail_offset"])
+        start = index["tail_offset"]
+        members, added, tail_start = _zip_members(new_parts, render_tail_parts, index)
+        for info in added:
+            info.header_offset += start
+        index["tail_offset"] = start + tail_start
+        with open(workbook_path, 'ab') as fp:
+            fp.write(members)
+            fp.write(_central_directory(kept + added, start + len(members)))
+            index["size"] = fp.tell()
+            fp.flush()
+            os.fsync(fp.fileno())
+        _write_index(workbook_path, index)
+    except BaseException:
+        recover_append(workbook_path)
+        raise
+    os.remove(journal_path_for(workbook_path))
+    return index
+
+
+# --- Zip Layout ---
+# The workbook is only ever cut at the tail offset and appended to. New members
+# are zipped in memory with zipfile; their local headers and data are copied
+# after the kept members and the central directory is written here, from the
+# documented ZipInfo fields (APPNOTE 4.3.12/4.3.16, no zip64: a monthly
+# workbook stays far below 4 GB and 65535 parts).
+
+CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+END_OF_CENTRAL_DIR = struct.Struct("<IHHHHIIH")
+ZIP32_LIMIT = 0xFFFFFFFF
+
+
+def _zip_members(new_parts, render_tail, index):
+    """
+    (local headers + data of new_parts and the tail parts, their ZipInfos with
+    offsets relative to the returned bytes, offset where the tail parts start).
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, data in new_parts + render_tail(index):
+            zf.writestr(name, data)
+        infos = zf.infolist()
+    data = buffer.getvalue()
+    central_dir_offset = END_OF_CENTRAL_DIR.unpack_from(data, len(data) - END_OF_CENTRAL_DIR.size)[6]
+    return data[:central_dir_offset], infos, infos[len(new_parts)].header_offset
+
+
+def _dos_date_time(date_time):
+    year, month, day, hour, minute, second = date_time
+    return hour << 11 | minute << 5 | second // 2, (year - 1980) << 9 | month << 5 | day
+
+
+def _central_directory(infos, offset):
+    """Central directory and end record for infos, the directory starting at offset."""
+    if offset > ZIP32_LIMIT or len(infos) >= 0xFFFF:
+        raise MonthlyWorkbookError("Monthly workbook is too large for append mode (zip64)")
+    records = []
+    for info in infos:
+        name = info.filename.encode('utf-8' if info.flag_bits & 0x800 else 'cp437')
+        dos_time, dos_date = _dos_date_time(info.date_time)
+        records.append(CENTRAL_HEADER.pack(
+            0x02014b50, info.create_system << 8 | info.create_version, info.extract_version, info.flag_bits,
+            info.compress_type, dos_time, dos_date, info.CRC, info.compress_size, info.file_size, len(name),
+            len(info.extra), len(info.comment), 0, info.internal_attr, info.external_attr, info.header_offset)
+            + name + info.extra + info.comment)
+    central_dir = b"".join(records)
+    return central_dir + END_OF_CENTRAL_DIR.pack(0x06054b50, 0, 0, len(infos), len(infos), len(central_dir),
+                                                 offset, 0)
+
+
+def append_processed_workbook(workbook_path, processed_path):
+    """Appends an existing process_files output workbook to a monthly workbook."""
+    import pandas as pd
+
+    sheets = pd.read_excel(processed_path, sheet_name=None, dtype={'AWB Prefix': str, 'AWB Serial': str})
+    summary = {}
+    if 'Summary' in sheets and not sheets['Summary'].empty:
+        summary = dict(zip(sheets['Summary']['Metric'], sheets['Summary']['Value']))
+    label = os.path.splitext(os.path.basename(processed_path))[0]
+    frames = {name: sheets.get(name) for name, _, _ in APPENDED_SHEETS}
+    return append_invoice(workbook_path, label, summary, frames)
+
+
+def main():
+    """Command line entry point: append processed workbooks to a monthly workbook."""
+    if len(sys.argv) < 3:
+        print("Usage: python monthly_workbook.py <monthly_workbook.xlsx> <processed.xlsx> [processed2.xlsx ...]")
+        print("  monthly_workbook may contain '{month}' (expanded to YYYY-MM)")
+        sys.exit(1)
+
+    workbook_path = resolve_monthly_path(sys.argv[1])
+    for processed_path in sys.argv[2:]:
+        index = append_processed_workbook(workbook_path, processed_path)
+        print(f"Appended '{processed_path}' to '{workbook_path}' ({len(index['invoices'])} invoices this month)")
+
+
+if __name__ == "__main__":
+    main()
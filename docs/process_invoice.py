@@ -30,121 +30,347 @@ CHANGES FOR N8N INTEGRATION & RECONCILIATION FIXES:
    python /path/to/process_invoice.py invoice.pdf report.xls /tmp/result.json workflow123 custom-reconciliation.xlsx
    ```
    
+   In memory (no temp files; '-' = stdin/stdout, progress output goes to stderr):
+   ```
+   python process_invoice.py - report.xls - workflow123 < invoice.pdf          # result JSON on stdout
+   python process_invoice.py - report.xls /tmp/result.json workflow123 - < invoice.pdf > out.xlsx
+   ```
+   From Python: process_streams(invoice_bytes, report_bytes, workbook_buffer)
+   
    Environment Variables (N8N):
    - Set N8N_WORKFLOW_ID={{ $workflow.id }}
    - Set N8N_OUTPUT_FILENAME={{ $json.custom_name }}
+   - Set N8N_MONTHLY_WORKBOOK=/files/reconciliation-{month}.xlsx to also append
+     the invoice to that month's workbook (monthly_workbook.py must sit next to
+     this script)
+   - Set N8N_DISCREPANCIES_JSONL=/files/discrepancies.jsonl to stream the
+     discrepant AWB rows there, one JSON object per line
+   - Set N8N_PROGRESS=stdout (or stderr, file:/path/progress.jsonl, or an http(s)
+     callback URL) to receive progress events while the job runs, at most one
+     batch per N8N_PROGRESS_INTERVAL seconds (default 1; see progress.py)
+   - Set N8N_METRICS_FILE=/var/lib/node_exporter/textfile/reconciler.prom to add
+     the job's Prometheus metrics (duration, stage times, pages, rows,
+     discrepancies, RSS) to that textfile collector file (see metrics.py)
+   - Set N8N_MEMORY_BUDGET_MB=1024 to process invoices predicted to need more
+     on the low-memory paths, and N8N_MEMORY_TRACE=1 to add tracemalloc peaks
+     (slow) to the per-stage memory in timings (see memory_budget.py)
+   - Set RECONCILER_DAEMON_SOCKET=/tmp/reconciler.sock to run the job on a warm
+     worker daemon (python reconciler_daemon.py serve); same arguments and
+     result JSON, falls back to processing in-process if no daemon is running
 
 4. OUTPUT:
    - Returns JSON with success status and output_filename
+   - On success also: summary (Summary sheet metrics), discrepancies
+     (per-category counts), rows (Invoices/CCA row counts), timings (per-stage
+     and per-page durations, see telemetry.py, with per-stage memory, see
+     memory_budget.py), pages, report_rows and report_format (the inputs
+     duration_estimate.py trains on) and discrepancies_file when
+     N8N_DISCREPANCIES_JSONL is set
    - File saved to /files/ directory if exists (N8N container), otherwise local directory
    - Enhanced debug output for troubleshooting reconciliation issues
 
-RECONCILIATION DEBUGGING:
-- Added before/after AWB Serial formatting debug output
-- Enhanced AWB matching analysis with detailed comparisons
+RECONCILIATION DEBUGGING (N8N_LOG_LEVEL=DEBUG, see structured_log.py):
+- Before/after AWB Serial formatting debug output
+- AWB matching analysis (log_awb_matching): key samples, match counts
 - Shows exact format mismatches between invoice and report data
+
+LOGGING:
+- Log lines go to stderr as JSON (N8N_LOG_FORMAT=text for plain messages);
+  stdout only carries usage errors and '-' data outputs
+- N8N_LOG_LEVEL: WARNING by default (a normal job logs nothing), INFO for
+  one line per stage, DEBUG for per-page detail and the analysis above
 """
 
 import sys
 import os
-import json
 import re
-import pandas as pd
-import pdfplumber
-from openpyxl.worksheet.table import Table, TableStyleInfo
-from openpyxl.utils import get_column_letter
+import datetime
+import time
+import logging
+from result_json import atomic_path, discrepancy_counts, dumps, write_discrepancy_rows, write_result
+from progress import progress_event
+from worker_limits import JobTimeout
+from telemetry import new_timer, span, begin_span, end_span, timings
+from structured_log import configure_logging, get_logger
+
+log = get_logger("process_invoice")
+
+# Heavy dependencies are imported in the stage that needs them, so the usage
+# and error-JSON paths (and the daemon client shim) start without them:
+# - pandas/numpy (column_buffers):  parsing and reconciliation
+# - pdfplumber:                     reading the invoice PDF
+# - xlrd (via pandas.read_excel):   only when a report file exists (.xlsx: openpyxl)
+# - openpyxl (sheet_spec):          only when writing the xlsx
+# Check the cold-start budget with: python startup_budget.py
 
 
 def safe_to_numeric(series):
     """Converts a pandas Series to numeric, coercing errors to NaN."""
+    import pandas as pd
     return pd.to_numeric(series, errors='coerce')
 
-def extract_awb_data(pdf):
+def log_awb_matching(df_invoice, df_report, limit=10):
+    """
+    DEBUG-level AWB matching analysis: key formats on both sides and, for
+    invoice AWBs missing from the report, the report keys with the same serial
+    (a prefix or zero-padding mismatch) if any.
+    """
+    keys = ['AWB Prefix', 'AWB Serial']
+    log.debug("Invoice key samples: %s", df_invoice[keys].head(5).values.tolist())
+    log.debug("Report key samples: %s", df_report[keys].head(5).values.tolist())
+    def key_pairs(df):
+        return zip(*(df[key].astype(object).where(df[key].notna(), '').astype(str).tolist() for key in keys))
+
+    report_keys = set(key_pairs(df_report))
+    unmatched = [key for key in key_pairs(df_invoice) if key not in report_keys]
+    log.debug("AWB matching: %s of %s invoice AWBs found in the report", len(df_invoice) - len(unmatched), len(df_invoice))
+    by_serial = {}
+    for prefix, serial in report_keys:
+        by_serial.setdefault(serial.lstrip('0'), []).append((prefix, serial))
+    for prefix, serial in unmatched[:limit]:
+        near = by_serial.get(serial.lstrip('0'), [])
+        log.debug("Unmatched AWB %s-%s (len %s); report keys with the same serial: %s",
+                  prefix, serial, len(serial), near or "none")
+
+# --- Extracted column layouts (see column_buffers.py) ---
+AWB_COLUMNS = [
+    ("AWB Number", 'string'), ("AWB Serial Part1", 'string'), ("AWB Serial Part2", 'string'),
+    ("Flight Date", 'str'), ("Origin", 'category'), ("Destination", 'category'),
+    ("Charge Weight", 'float'), ("Net Yield Rate", 'float'),
+    ("PP Freight Charge", 'float'), ("PP Due Airline", 'float'), ("CC Freight Charge", 'float'),
+    ("CC Due Agent", 'float'), ("CC Due Airline", 'float'), ("Disc.", 'float'),
+    ("Agency Comm.", 'float'), ("Taxes", 'float'), ("Others", 'float'),
+    ("Net Due for AWB", 'float'), ("Exchange Rate", 'category'),
+]
+# Amount columns in line1_regex group order (groups 5-14)
+AWB_AMOUNT_COLUMNS = [
+    "PP Freight Charge", "PP Due Airline", "CC Freight Charge", "CC Due Agent", "CC Due Airline",
+    "Disc.", "Agency Comm.", "Taxes", "Others", "Net Due for AWB",
+]
+
+CCA_COLUMNS = [
+    ("CCA Ref. No", 'string'), ("AWB Prefix", 'category'), ("AWB Serial", 'string'), ("CCA Issue Date", 'str'),
+    ("Origin", 'category'), ("Destination", 'category'),
+    ("MOP Freight Charge", 'category'), ("MOP Other Charge", 'category'),
+    ("Freight Charge", 'float'), ("Due Airline", 'float'), ("Due Agent", 'float'), ("Disc.", 'float'),
+    ("Agency Comm.", 'float'), ("Taxes", 'float'), ("Others", 'float'),
+    ("Net Due for AWB (Sale Currency)", 'float'),
+]
+# Amount columns in cca_block_regex group order (groups 7-14)
+CCA_AMOUNT_COLUMNS = [
+    "Freight Charge", "Due Airline", "Due Agent", "Disc.", "Agency Comm.", "Taxes", "Others",
+    "Net Due for AWB (Sale Currency)",
+]
+
+# Dtype policy for the AWB keys (invoice and report side of the merge)
+AWB_KEY_DTYPES = {'AWB Prefix': 'category', 'AWB Serial': 'string'}
+
+# Report columns used by the reconciliation (matched after strip + lower)
+REPORT_COLUMNS = ['awbprefix', 'awbsuffix', 'chargewt', 'frt_cost_rate', 'total_cost']
+
+# --- Regex Definitions (compiled once per process) ---
+# AWB Line (Copied from app(1).py)
+AWB_LINE_REGEX = re.compile(
+    r"^\s*141\s+(\d{7})\s+(\d)\s+TLV\s+([A-Z]{3})\s+"  
+    r"(\d+\.\d{2}\s*K)\s+"                       # Charge Weight (e.g., 560.00K or 560.00 K) - Made space optional
+    r"([\d\.\,-]+)\s+"                             # PP Freight Charge
+    r"([\d\.\,-]+)\s+"                             # PP Due Airline
+    r"([\d\.\,-]+)\s+"                             # CC Freight Charge
+    r"([\d\.\,-]+)\s+"                             # CC Due Agent
+    r"([\d\.\,-]+)\s+"                             # CC Due Airline
+    r"([\d\.\,-]+)\s+"                             # Disc.
+    r"([\d\.\,-]+)\s+"                             # Agency Comm.
+    r"([\d\.\,-]+)\s+"                             # Taxes
+    r"([\d\.\,-]+)\s+"                             # Others
+    r"([\d\.\,-]+)\s+"                             # Net Due for AWB (1)
+    r"(1\.00000000)\s+"                           # Exchange Rate
+    r"I?\s*([\d\.\,-]+)\s*$"                        # Net Due for AWB (2)
+)
+# Rate pattern (search within the second line)
+NET_YIELD_RATE_REGEX = re.compile(r"(\d+\.\d+)")    
+# Runs of 2+ whitespace characters (collapsed before matching)
+WHITESPACE_RUN_REGEX = re.compile(r"\s{2,}")
+
+# CCA Block (two lines per CCA)
+CCA_BLOCK_REGEX = re.compile(
+    r"^\s*(\d{5,})\s+"          # CCA Ref No (1)
+    r"(\d{3})\s*"             # AWB Prefix (2)
+    r"(\d{7}\s\d{1})\s*"           # AWB Serial (3) - Captures "NNNNNNN N"
+    r"([A-Z]{3})\s+"          # Origin (4)
+    r"(\S+)\s+"               # MOP Freight (5)
+    r"(\S+)\s+"               # MOP Other (6)
+    r"([\d().,-]+)\s+"         # Freight Charge (7) - Handles parentheses
+    r"([\d().,-]+)\s+"         # Due Airline (8) - Handles parentheses
+    r"([\d().,-]+)\s+"         # Due Agent (9) - Handles parentheses
+    r"([\d().,-]+)"            # Disc. (10) - Handles parentheses
+    r".*?"                     # Non-greedy match until next numeric field
+    r"([\d().,-]+)\s+"         # Agency Comm. (11) - Handles parentheses
+    r"([\d().,-]+)\s+"         # Taxes (12) - Handles parentheses
+    r"([\d().,-]+)\s+"         # Others (13) - Handles parentheses
+    r"([\d().,-]+)\s+"         # Net Due (Sale) (14) - Handles parentheses
+    r"\d\.\d{2}\s+"          # Exchange Rate (ignore)
+    r"[\d().,-]+\s*?"          # Net Due (Invoice) (ignore)
+    # --- Second Line --- 
+    r"\n\s*"                  # Match newline and start of next line
+    r"(\d{2}[A-Z]{3})?"        # CCA Issue Date (15) - Optional capture
+    r".*?"                     # Non-greedy match until destination
+    r"\b([A-Z]{3})\b"          # Destination (16)"
+    , re.MULTILINE | re.DOTALL
+)
+# --- End Regex Definitions ---
+
+def extract_awb_data(pdf, progress=None, timer=None, low_memory=False, scan=None):
     """
     Extracts AWB data from specific pages of a FlyDubai PDF invoice 
     by processing the extracted text lines with layout preservation.
     Handles the multi-line format (AWB line + Date/Rate line).
     Dynamically determines the end page based on CCA header.
+    low_memory and scan: see read_awb_lines.
     """
-    print(f"--- Starting AWB PDF Text Extraction Process ---")
-    extracted_data = []
-
-    # --- Regex Definitions ---
-    # AWB Line (Copied from app(1).py)
-    line1_regex = re.compile(
-        r"^\s*141\s+(\d{7})\s+(\d)\s+TLV\s+([A-Z]{3})\s+"  
-        r"(\d+\.\d{2}\s*K)\s+"                       # Charge Weight (e.g., 560.00K or 560.00 K) - Made space optional
-        r"([\d\.\,-]+)\s+"                             # PP Freight Charge
-        r"([\d\.\,-]+)\s+"                             # PP Due Airline
-        r"([\d\.\,-]+)\s+"                             # CC Freight Charge
-        r"([\d\.\,-]+)\s+"                             # CC Due Agent
-        r"([\d\.\,-]+)\s+"                             # CC Due Airline
-        r"([\d\.\,-]+)\s+"                             # Disc.
-        r"([\d\.\,-]+)\s+"                             # Agency Comm.
-        r"([\d\.\,-]+)\s+"                             # Taxes
-        r"([\d\.\,-]+)\s+"                             # Others
-        r"([\d\.\,-]+)\s+"                             # Net Due for AWB (1)
-        r"(1\.00000000)\s+"                           # Exchange Rate
-        r"I?\s*([\d\.\,-]+)\s*$"                        # Net Due for AWB (2)
-    )
-    # Rate pattern (search within the second line)
-    net_yield_rate_regex_search = re.compile(r"(\d+\.\d+)")    
-    # --- End Regex Definitions ---
+    log.debug("Starting AWB PDF Text Extraction Process")
+    all_lines = read_awb_lines(pdf, progress, timer, low_memory, scan)
+    with span(timer, "parse"):
+        return parse_awb_lines(all_lines)
 
+def read_awb_lines(pdf, progress=None, timer=None, low_memory=False, scan=None):
+    """
+    Text lines (layout preserved) of the AWB pages: page 2 up to the CCA header page.
+    Emits 'pdf_scan' and 'pages' progress events (see progress.py) and times
+    the header search ('cca_locate') and each page ('layout', see telemetry.py).
+    If scan is a dict, scan['cca_page'] receives the header page index (-1: none)
+    for extract_cca_data. low_memory reads the pages in one pass and closes
+    each one when done (see memory_budget.py).
+    """
+    if low_memory:
+        return _read_awb_lines_single_pass(pdf, progress, timer, scan)
     all_lines = []
-    
+
     # --- Determine Target Page Range Dynamically ---
     cca_start_page_index = -1
     num_pages = len(pdf.pages)
-    print(f"Total pages in PDF: {num_pages}")
+    log.debug("Total pages in PDF: %s", num_pages)
     # Start searching for CCA from page 2 (index 1) onwards
+    begin_span(timer, "cca_locate")
     for page_num in range(1, num_pages):
+        progress_event(progress, "pdf_scan", done=page_num, total=num_pages)
         try:
             page_to_check = pdf.pages[page_num]
             text_to_check = page_to_check.extract_text()
             if text_to_check and "Section B: CCA Details" in text_to_check:
                 cca_start_page_index = page_num
-                print(f"  -> Found 'Section B: CCA Details' header on page {page_num + 1}. AWB data ends before this.")
+                log.debug("Found 'Section B: CCA Details' header on page %s. AWB data ends before this.", page_num + 1)
                 break
+        except MemoryError:
+            raise
         except Exception as e:
-            print(f"Warning: Error checking page {page_num + 1} for CCA header: {e}")
+            log.warning("Error checking page %s for CCA header: %s", page_num + 1, e)
+    end_span(timer)
+
+    if scan is not None:
+        scan['cca_page'] = cca_start_page_index
 
     # If CCA header not found, process all pages from page 2 to the end
     if cca_start_page_index == -1:
-        print("  -> 'Section B: CCA Details' not found. Processing AWB data until the end of the document.")
+        log.info("'Section B: CCA Details' not found. Processing AWB data until the end of the document.")
         end_page_index = num_pages
     else:
         end_page_index = cca_start_page_index
 
     target_pages = range(1, end_page_index) # Page range is 1 to end_page_index (exclusive)
-    print(f"AWB Target Page Indices (0-based): {list(target_pages)}")
+    log.debug("AWB Target Page Indices (0-based): %s", list(target_pages))
     # --- End Determine Target Page Range ---
 
     # --- Extract Text from Target Pages ---
-    for page_num in target_pages:
+    for done, page_num in enumerate(target_pages):
+        progress_event(progress, "pages", done=done, total=len(target_pages))
+        begin_span(timer, "layout", page=page_num + 1)
         try:
             page = pdf.pages[page_num]
-            print(f"Extracting text with layout from Page {page_num + 1}...")
+            log.debug("Extracting text with layout from Page %s...", page_num + 1)
             # Use same extraction settings as test script
             text = page.extract_text(x_tolerance=2, layout=True) 
             if text:
                 page_lines = text.split('\n')
-                print(f"  -> Extracted {len(page_lines)} lines from page {page_num + 1}.")
+                log.debug("Extracted %s lines from page %s.", len(page_lines), page_num + 1)
                 all_lines.extend(page_lines)
             else:
-                print(f"  -> No text extracted from page {page_num + 1}.")
+                log.debug("No text extracted from page %s.", page_num + 1)
+        except MemoryError:
+            raise
         except Exception as e:
-            print(f"Error extracting text from page {page_num + 1}: {e}")
+            log.warning("Error extracting text from page %s: %s", page_num + 1, e)
+        end_span(timer)
+
+    progress_event(progress, "pages", done=len(target_pages), total=len(target_pages))
+    log.debug("Total text lines collected from AWB pages: %s", len(all_lines))
+    return all_lines
+
+def _read_awb_lines_single_pass(pdf, progress, timer, scan):
+    """
+    Low-memory read_awb_lines: each page is checked for the CCA header and its
+    layout text taken right away, then the page is closed, dropping its parsed
+    objects. Same calls per page as the two-pass version, so the same text.
+    The header page stays open for read_cca_text.
+    """
+    all_lines = []
+    cca_start_page_index = -1
+    num_pages = len(pdf.pages)
+    log.debug("Total pages in PDF: %s (low-memory single pass)", num_pages)
+    for page_num in range(1, num_pages):
+        progress_event(progress, "pdf_scan", done=page_num, total=num_pages)
+        page = pdf.pages[page_num]
+        with span(timer, "cca_locate"):
+            try:
+                text_to_check = page.extract_text()
+                found = bool(text_to_check) and "Section B: CCA Details" in text_to_check
+            except MemoryError:
+                raise
+            except Exception as e:
+                log.warning("Error checking page %s for CCA header: %s", page_num + 1, e)
+                found = False
+        if found:
+            cca_start_page_index = page_num
+            log.debug("Found 'Section B: CCA Details' header on page %s. AWB data ends before this.", page_num + 1)
+            break
+        with span(timer, "layout", page=page_num + 1):
+            try:
+                text = page.extract_text(x_tolerance=2, layout=True)
+                if text:
+                    all_lines.extend(text.split('\n'))
+                else:
+                    log.debug("No text extracted from page %s.", page_num + 1)
+            except MemoryError:
+                raise
+            except Exception as e:
+                log.warning("Error extracting text from page %s: %s", page_num + 1, e)
+        page.close()
+
+    if cca_start_page_index == -1:
+        log.info("'Section B: CCA Details' not found. Processing AWB data until the end of the document.")
+    if scan is not None:
+        scan['cca_page'] = cca_start_page_index
+    awb_pages = (cca_start_page_index if cca_start_page_index != -1 else num_pages) - 1
+    progress_event(progress, "pages", done=max(awb_pages, 0), total=max(awb_pages, 0))
+    log.debug("Total text lines collected from AWB pages: %s", len(all_lines))
+    return all_lines
+
+def parse_awb_lines(all_lines):
+    """
+    Parses AWB text lines into a DataFrame (one row per AWB).
+    Values go straight into typed column buffers; amounts are parsed once here.
+    """
+    from column_buffers import new_buffers, to_float, append_float, append_category, append_text, buffers_to_frame
 
-    print(f"--- Total text lines collected from AWB pages: {len(all_lines)} ---")
+    buffers = new_buffers(AWB_COLUMNS)
+    amount_buffers = [buffers[name] for name in AWB_AMOUNT_COLUMNS]
 
     # --- Process the collected text lines ---
     i = 0
     while i < len(all_lines):
         line1_raw = all_lines[i] 
-        line1 = re.sub(r'\s{2,}', ' ', line1_raw).strip() 
+        line1 = WHITESPACE_RUN_REGEX.sub(' ', line1_raw).strip() 
         
-        match1 = line1_regex.match(line1)
+        match1 = AWB_LINE_REGEX.match(line1)
         
         if match1:
             flight_date = ""
@@ -153,7 +379,7 @@ def extract_awb_data(pdf):
 
             if i + 1 < len(all_lines):
                 line2_raw = all_lines[i+1]
-                line2 = re.sub(r'\s{2,}', ' ', line2_raw).strip()
+                line2 = WHITESPACE_RUN_REGEX.sub(' ', line2_raw).strip()
                 
                 parts = line2.split(' ')
                 flight_date = "" 
@@ -163,11 +389,9 @@ def extract_awb_data(pdf):
                      flight_date = parts[0] 
                      lines_consumed += 1
 
-                     rate_match = net_yield_rate_regex_search.search(line2)
+                     rate_match = NET_YIELD_RATE_REGEX.search(line2)
                      if rate_match:
-                         potential_rates = net_yield_rate_regex_search.findall(line2)
-                         if len(potential_rates) > 0:
-                             net_yield_rate = potential_rates[0]
+                         net_yield_rate = rate_match.group(1)
                 else:
                      flight_date = "" 
 
@@ -175,43 +399,19 @@ def extract_awb_data(pdf):
                 groups = match1.groups()
                 # Data cleaning and assignment
                 cleaned_groups = [g.replace(',', '.').strip() if isinstance(g, str) else g for g in groups]
-                
-                awb_number = f"141 {cleaned_groups[0]} {cleaned_groups[1]}"
-                destination = cleaned_groups[2]
-                charge_weight = cleaned_groups[3] # Already includes K
-                pp_freight = cleaned_groups[4]
-                pp_due_airline = cleaned_groups[5]
-                cc_freight = cleaned_groups[6]
-                cc_due_agent = cleaned_groups[7]
-                cc_due_airline = cleaned_groups[8]
-                disc = cleaned_groups[9]
-                agency_comm = cleaned_groups[10]
-                taxes = cleaned_groups[11]
-                others = cleaned_groups[12]
-                net_due_awb1 = cleaned_groups[13]
-                exchange_rate = cleaned_groups[14]
-
-                extracted_data.append({
-                    "AWB Number": awb_number,
-                    "AWB Serial Part1": cleaned_groups[0],
-                    "AWB Serial Part2": cleaned_groups[1],
-                    "Flight Date": flight_date,
-                    "Origin": "TLV",
-                    "Destination": destination,
-                    "Charge Weight": charge_weight,
-                    "Net Yield Rate": net_yield_rate,
-                    "PP Freight Charge": pp_freight,
-                    "PP Due Airline": pp_due_airline,
-                    "CC Freight Charge": cc_freight,
-                    "CC Due Agent": cc_due_agent,
-                    "CC Due Airline": cc_due_airline,
-                    "Disc.": disc,
-                    "Agency Comm.": agency_comm,
-                    "Taxes": taxes,
-                    "Others": others,
-                    "Net Due for AWB": net_due_awb1,
-                    "Exchange Rate": exchange_rate
-                })
+
+                append_text(buffers["AWB Number"], f"141 {cleaned_groups[0]} {cleaned_groups[1]}")
+                append_text(buffers["AWB Serial Part1"], cleaned_groups[0])
+                append_text(buffers["AWB Serial Part2"], cleaned_groups[1])
+                append_text(buffers["Flight Date"], flight_date)
+                append_category(buffers["Origin"], "TLV")
+                append_category(buffers["Destination"], cleaned_groups[2])
+                # Charge Weight comes as e.g. '560.00K' / '560.00 K'
+                append_float(buffers["Charge Weight"], to_float(cleaned_groups[3].rstrip('K').strip()))
+                append_float(buffers["Net Yield Rate"], to_float(net_yield_rate))
+                for buffer, value in zip(amount_buffers, cleaned_groups[4:14]):
+                    append_float(buffer, to_float(value))
+                append_category(buffers["Exchange Rate"], cleaned_groups[14])
                 
                 i += lines_consumed
                 continue 
@@ -220,159 +420,145 @@ def extract_awb_data(pdf):
         else:
             i += 1
 
-    print("--- Finished Processing Text Lines ---")
-    df = pd.DataFrame(extracted_data)
+    log.debug("Finished Processing Text Lines")
+    df = buffers_to_frame(buffers)
 
     return df
 
-def extract_cca_data(pdf):
+def extract_cca_data(pdf, scan=None):
     """
     Extracts CCA data from FlyDubai PDF invoice
     by processing the extracted text lines with layout preservation.
     Handles the multi-line format for CCA entries.
-    Dynamically finds the CCA page.
+    Dynamically finds the CCA page (unless scan from read_awb_lines has it).
     """
-    print(f"--- Starting CCA PDF Text Extraction Process ---")
-    extracted_data = []
-    target_page = -1
-    raw_text_cca_page = ""
-
-    # --- Regex Definitions ---
-    destination_regex_search = re.compile(r"\b([A-Z]{3})\b")
-    cca_date_regex_search = re.compile(r"\b(\d{2}[A-Z]{3})\b")
-
-    # --- Block Regex --- 
-    cca_block_regex = re.compile(
-        r"^\s*(\d{5,})\s+"          # CCA Ref No (1)
-        r"(\d{3})\s*"             # AWB Prefix (2)
-        r"(\d{7}\s\d{1})\s*"           # AWB Serial (3) - Captures "NNNNNNN N"
-        r"([A-Z]{3})\s+"          # Origin (4)
-        r"(\S+)\s+"               # MOP Freight (5)
-        r"(\S+)\s+"               # MOP Other (6)
-        r"([\d().,-]+)\s+"         # Freight Charge (7) - Handles parentheses
-        r"([\d().,-]+)\s+"         # Due Airline (8) - Handles parentheses
-        r"([\d().,-]+)\s+"         # Due Agent (9) - Handles parentheses
-        r"([\d().,-]+)"            # Disc. (10) - Handles parentheses
-        r".*?"                     # Non-greedy match until next numeric field
-        r"([\d().,-]+)\s+"         # Agency Comm. (11) - Handles parentheses
-        r"([\d().,-]+)\s+"         # Taxes (12) - Handles parentheses
-        r"([\d().,-]+)\s+"         # Others (13) - Handles parentheses
-        r"([\d().,-]+)\s+"         # Net Due (Sale) (14) - Handles parentheses
-        r"\d\.\d{2}\s+"          # Exchange Rate (ignore)
-        r"[\d().,-]+\s*?"          # Net Due (Invoice) (ignore)
-        # --- Second Line --- 
-        r"\n\s*"                  # Match newline and start of next line
-        r"(\d{2}[A-Z]{3})?"        # CCA Issue Date (15) - Optional capture
-        r".*?"                     # Non-greedy match until destination
-        r"\b([A-Z]{3})\b"          # Destination (16)"
-        , re.MULTILINE | re.DOTALL
-    )
-    # --- End Regex Definitions ---
+    log.debug("Starting CCA PDF Text Extraction Process")
+    raw_text_cca_page = read_cca_text(pdf, (scan or {}).get('cca_page'))
+    if raw_text_cca_page is None:
+        log.info("'Section B: CCA Details' header not found in the document. Assuming no CCA data.")
+        import pandas as pd
+        return pd.DataFrame()
+    return parse_cca_text(raw_text_cca_page)
 
+def read_cca_text(pdf, target_page=None):
+    """
+    Text of the page holding the 'Section B: CCA Details' header (None if there is no such page).
+    target_page: the header page index when already known (-1: none), else it is searched for.
+    """
+    raw_text_cca_page = ""
     num_pages = len(pdf.pages)
-    print(f"PDF has {num_pages} pages (in CCA function).")
+    log.debug("PDF has %s pages (in CCA function).", num_pages)
     
-    # --- Find the CCA Page Dynamically --- 
-    start_search_page = 1 
-    print(f"Searching for 'Section B: CCA Details' starting from page {start_search_page + 1}...")
-    for page_num in range(start_search_page, num_pages):
-        print(f"  Checking page {page_num + 1}...")
-        try:
-            page_to_check = pdf.pages[page_num]
-            text_to_check = page_to_check.extract_text()
-            if text_to_check and "Section B: CCA Details" in text_to_check:
-                target_page = page_num
-                print(f"  -> Found CCA header on page {target_page + 1}!")
-                break
-        except Exception as e:
-            print(f"Warning: Error checking page {page_num + 1} for CCA header: {e}")
+    # --- Find the CCA Page Dynamically (unless read_awb_lines found it) ---
+    if target_page is None:
+        target_page = -1
+        start_search_page = 1
+        log.debug("Searching for 'Section B: CCA Details' starting from page %s...", start_search_page + 1)
+        for page_num in range(start_search_page, num_pages):
+            log.debug("Checking page %s...", page_num + 1)
+            try:
+                page_to_check = pdf.pages[page_num]
+                text_to_check = page_to_check.extract_text()
+                if text_to_check and "Section B: CCA Details" in text_to_check:
+                    target_page = page_num
+                    log.debug("Found CCA header on page %s!", target_page + 1)
+                    break
+            except MemoryError:
+                raise
+            except Exception as e:
+                log.warning("Error checking page %s for CCA header: %s", page_num + 1, e)
     # --- End Find Page ---
 
-    if target_page != -1:
+    if target_page == -1:
+        return None
+    try:
+        page = pdf.pages[target_page]
+        log.debug("Using standard text extraction for Page %s.", target_page + 1)
+        raw_text_cca_page = page.extract_text()
+        if raw_text_cca_page:
+            log.debug("Extracted %s characters from page %s.", len(raw_text_cca_page), target_page + 1)
+        else:
+            log.warning("No text extracted from page %s using standard extraction.", target_page + 1)
+    except MemoryError:
+        raise
+    except Exception as e:
+         log.warning("Error extracting text from CCA page %s: %s", target_page + 1, e)
+         raw_text_cca_page = ""
+    return raw_text_cca_page or ""
+
+def clean_currency(value_str):
+    """
+    Parses a CCA amount: '1,234.50' -> 1234.5, '(12.00)' -> -12.0, '()' -> 0.0.
+    Returns the input unchanged when it is not a number.
+    """
+    if isinstance(value_str, str):
+        cleaned = value_str.replace(',', '').strip()
+        is_negative = False
+        
+        if cleaned.startswith('(') and cleaned.endswith(')'):
+            is_negative = True
+            cleaned = cleaned[1:-1]
+        elif cleaned.startswith('(') and not cleaned.endswith(')'):
+            temp_cleaned = cleaned[1:]
+            try:
+                if re.match(r"^[\d.]+$", temp_cleaned):
+                    is_negative = True
+                    cleaned = temp_cleaned
+            except re.error:
+                pass
+
         try:
-            page = pdf.pages[target_page]
-            print(f"Using standard text extraction for Page {target_page + 1}.")
-            raw_text_cca_page = page.extract_text()
-            if raw_text_cca_page:
-                print(f"  -> Extracted {len(raw_text_cca_page)} characters from page {target_page + 1}.")
-            else:
-                print(f"  -> No text extracted from page {target_page + 1} using standard extraction.")
-        except Exception as e:
-             print(f"Error extracting text from CCA page {target_page + 1}: {e}")
-             raw_text_cca_page = ""
-    else:
-        print("Warning: 'Section B: CCA Details' header not found in the document. Assuming no CCA data.")
-        return pd.DataFrame()
+            value = float(cleaned)
+            if is_negative:
+                value = -value
+            return value
+        except ValueError:
+            if not cleaned and value_str == "()":
+                return 0.0
+            return value_str
+    return value_str
+
+def parse_cca_text(raw_text_cca_page):
+    """
+    Parses the CCA page text into a DataFrame (one row per CCA plus a totals row).
+    Values go straight into typed column buffers; amounts are parsed once here.
+    """
+    import pandas as pd
+    from column_buffers import new_buffers, append_float, append_category, append_text, buffers_to_frame
 
-    # --- Process using findall on the raw text block --- 
-    print("--- Starting CCA processing using findall on raw text --- ")
-    extracted_data = [] 
-    
-    # --- Define clean_currency locally ---
-    def clean_currency(value_str):
-        if isinstance(value_str, str):
-            cleaned = value_str.replace(',', '').strip()
-            is_negative = False
-            
-            if cleaned.startswith('(') and cleaned.endswith(')'):
-                is_negative = True
-                cleaned = cleaned[1:-1]
-            elif cleaned.startswith('(') and not cleaned.endswith(')'):
-                temp_cleaned = cleaned[1:]
-                try:
-                    if re.match(r"^[\d.]+$", temp_cleaned):
-                        is_negative = True
-                        cleaned = temp_cleaned
-                except re.error:
-                    pass
+    buffers = new_buffers(CCA_COLUMNS)
+    amount_buffers = [buffers[name] for name in CCA_AMOUNT_COLUMNS]
 
-            try:
-                value = float(cleaned)
-                if is_negative:
-                    value = -value
-                return value
-            except ValueError:
-                if not cleaned and value_str == "()":
-                    return 0.0
-                return value_str
-        return value_str
-    # --- End clean_currency definition ---
-    
+    # --- Process using findall on the raw text block --- 
+    log.debug("Starting CCA processing using findall on raw text")
     if raw_text_cca_page:
-        matches = cca_block_regex.findall(raw_text_cca_page)
-        print(f"  -> Found {len(matches)} potential CCA blocks using findall.")
+        matches = CCA_BLOCK_REGEX.findall(raw_text_cca_page)
+        log.debug("Found %s potential CCA blocks using findall.", len(matches))
 
         for groups in matches:            
             if len(groups) == 16:
-                 extracted_data.append({
-                    "CCA Ref. No": groups[0],
-                    "AWB Prefix": groups[1],
-                    "AWB Serial": groups[2].replace(" ", ""),
-                    "CCA Issue Date": groups[14] if groups[14] else "",
-                    "Origin": groups[3],
-                    "Destination": groups[15],
-                    "MOP Freight Charge": groups[4],
-                    "MOP Other Charge": groups[5],
-                    "Freight Charge": clean_currency(groups[6]),
-                    "Due Airline": clean_currency(groups[7]),
-                    "Due Agent": clean_currency(groups[8]),
-                    "Disc.": clean_currency(groups[9]),
-                    "Agency Comm.": clean_currency(groups[10]),
-                    "Taxes": clean_currency(groups[11]),
-                    "Others": clean_currency(groups[12]),
-                    "Net Due for AWB (Sale Currency)": clean_currency(groups[13]),
-                })
+                append_text(buffers["CCA Ref. No"], groups[0])
+                append_category(buffers["AWB Prefix"], groups[1])
+                append_text(buffers["AWB Serial"], groups[2].replace(" ", ""))
+                append_text(buffers["CCA Issue Date"], groups[14] if groups[14] else "")
+                append_category(buffers["Origin"], groups[3])
+                append_category(buffers["Destination"], groups[15])
+                append_category(buffers["MOP Freight Charge"], groups[4])
+                append_category(buffers["MOP Other Charge"], groups[5])
+                # Unparsable amounts keep their text (column becomes object dtype)
+                for buffer, value in zip(amount_buffers, groups[6:14]):
+                    append_float(buffer, clean_currency(value))
             else:
-                 print(f"    -> WARNING: Match found but had unexpected number of groups ({len(groups)}). Skipping.")
+                 log.warning("Match found but had unexpected number of groups (%s). Skipping.", len(groups))
 
     else:
-        print("  -> No raw text extracted to process.")
+        log.debug("No raw text extracted to process.")
     
-    print("--- Finished Processing CCA Text ---")
-    df_cca = pd.DataFrame(extracted_data)
+    log.debug("Finished Processing CCA Text")
+    df_cca = buffers_to_frame(buffers)
     
     # Identify numeric columns for potential totaling (excluding AWB parts)
-    numeric_cols_cca = [col for col in df_cca.columns if df_cca[col].apply(lambda x: isinstance(x, (int, float))).all()]
+    numeric_cols_cca = [col for col in df_cca.columns if pd.api.types.is_float_dtype(df_cca[col])]
     
     # Add Totals Row if data exists and numeric columns are found
     if not df_cca.empty and numeric_cols_cca:
@@ -389,32 +575,136 @@ def extract_cca_data(pdf):
         totals_row_cca['MOP Other Charge'] = ''
         
         df_cca = pd.concat([df_cca, pd.DataFrame([totals_row_cca])], ignore_index=True)
-        print("  -> Added totals row to CCA DataFrame.")
+        log.debug("Added totals row to CCA DataFrame.")
     elif not df_cca.empty:
-         print("  -> CCA DataFrame created, but no purely numeric columns found for totaling.")
+         log.debug("CCA DataFrame created, but no purely numeric columns found for totaling.")
     
     return df_cca
 
-def process_files(invoice_file_path, report_file_path, workflow_id=None, custom_filename=None):
-    """Main processing function that matches app(1).py functionality."""
-    print("Starting comprehensive file processing...")
+def is_path(source):
+    return isinstance(source, (str, os.PathLike))
+
+
+def open_input(source):
+    """
+    An input as pdfplumber/pandas accept it: paths are returned as-is, bytes-like
+    data is wrapped in BytesIO (no copy for bytes), file-like objects (stdin
+    buffer, BytesIO, mmap) are used directly.
+    """
+    if is_path(source):
+        return source
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        import io
+        return io.BytesIO(source)
+    return source
+
+
+XLSX_MAGIC = b'PK\x03\x04'  # .xlsx is a zip archive; legacy .xls is an OLE2 file
+
+
+def report_engine(source):
+    """pandas.read_excel engine for a report path or seekable file-like: openpyxl for .xlsx, else xlrd."""
+    if is_path(source):
+        with open(source, 'rb') as f:
+            head = f.read(4)
+    else:
+        position = source.tell()
+        head = source.read(4)
+        source.seek(position)
+    return 'openpyxl' if head == XLSX_MAGIC else 'xlrd'
+
+
+def process_files(invoice_file_path, report_file_path, workflow_id=None, custom_filename=None, monthly_workbook=None,
+                  details=None, discrepancies_path=None, output_dir=None, output_stream=None, invoice_name=None,
+                  progress=None, timer=None, memory_budget_mb=None, memory_trace=False):
+    """
+    Main processing function that matches app(1).py functionality.
+    If monthly_workbook is given, the invoice's sheets are also appended to
+    that month's workbook (see monthly_workbook.py).
+    If details is a dict, it is filled with the summary metrics, discrepancy
+    counts and row counts for the result JSON (see result_json.py), plus the
+    page count and the report's rows and format (see duration_estimate.py).
+    If discrepancies_path is given, discrepant AWB rows are streamed there as JSONL.
+    If output_dir is given, the workbook is written there instead of /files
+    (or the current directory).
+
+    In-memory I/O: invoice_file_path and report_file_path may also be bytes or
+    binary file-like objects (see open_input); invoice_name then stands in for
+    the file name when naming the workbook. With output_stream (a binary
+    file-like object) the workbook is written there instead of to disk and the
+    workbook's file name is returned.
+
+    progress (see progress.py) receives stage events: pdf_scan, pages, cca,
+    report, join, sheets. The caller creates it and calls finish_progress().
+
+    Stage durations are recorded with timer (see telemetry.py; a new one if not
+    given) and go into details['timings'], with the per-stage memory as
+    details['timings']['memory'] (see memory_budget.py). With memory_budget_mb,
+    inputs predicted to exceed it are processed on the low-memory paths;
+    memory_trace adds tracemalloc peaks to the memory stages.
+    """
+    from memory_budget import new_memory_stats, memory_hook, stop_memory_stats
+    if timer is None:
+        timer = new_timer()
+    memory = new_memory_stats(trace=memory_trace)
+    hook = memory_hook(memory)
+    timer["hooks"].append(hook)
+    try:
+        return _process_files(invoice_file_path, report_file_path, workflow_id, custom_filename, monthly_workbook,
+                              details, discrepancies_path, output_dir, output_stream, invoice_name, progress, timer,
+                              memory, memory_budget_mb)
+    finally:
+        timer["hooks"].remove(hook)
+        stop_memory_stats(memory)
+
+def _process_files(invoice_file_path, report_file_path, workflow_id, custom_filename, monthly_workbook, details,
+                   discrepancies_path, output_dir, output_stream, invoice_name, progress, timer, memory,
+                   memory_budget_mb):
+    log.info("Starting comprehensive file processing...")
+    import pandas as pd
+    import pdfplumber
+    from column_buffers import align_categories, apply_dtypes, memory_report
+    from memory_budget import input_size, plan_memory, memory_summary
     
     # Ensure the file exists before processing
-    if not os.path.exists(invoice_file_path):
+    if is_path(invoice_file_path) and not os.path.exists(invoice_file_path):
         raise RuntimeError(f"Invoice file not found at {invoice_file_path}")
+    if invoice_name is None:
+        invoice_name = os.path.basename(invoice_file_path) if is_path(invoice_file_path) else "invoice.pdf"
 
     # 1. Extract AWB and CCA Data
     df_awb = pd.DataFrame()
     df_cca = pd.DataFrame()
     try:
-        with pdfplumber.open(invoice_file_path) as pdf:
-            df_awb = extract_awb_data(pdf)
-            df_cca = extract_cca_data(pdf)
+        with span(timer, "pdf_open"):
+            pdf = pdfplumber.open(open_input(invoice_file_path))
+        with pdf:
+            if details is not None:
+                details['pages'] = len(pdf.pages)
+            plan = plan_memory(memory_budget_mb, len(pdf.pages), input_size(invoice_file_path),
+                               input_size(report_file_path))
+            low_memory = bool(plan and plan["low_memory"])
+            if plan:
+                log.info("Memory budget %s MB: estimated peak %s MB%s", plan["budget_mb"], plan["estimate_mb"],
+                         " -> low-memory paths" if low_memory else "")
+                if plan["low_memory_estimate_mb"] > plan["budget_mb"]:
+                    log.warning("Estimated peak %s MB exceeds the memory budget of %s MB even on the low-memory paths",
+                                plan["low_memory_estimate_mb"], plan["budget_mb"])
+            scan = {}
+            df_awb = extract_awb_data(pdf, progress, timer, low_memory, scan)
+            with span(timer, "cca"):
+                df_cca = extract_cca_data(pdf, scan)
+            progress_event(progress, "cca", rows=len(df_cca))
+    except (MemoryError, JobTimeout):
+        raise  # a job over its limits must be reported as such (worker_limits.limit_error)
     except Exception as e:
         raise RuntimeError(f"Error reading PDF structure: {e}")
+    if low_memory:
+        import gc
+        gc.collect()  # pdfminer's layout objects are cyclic: free them before the report is read
 
     if df_awb.empty and df_cca.empty:
-        print("Both extract_awb_data and extract_cca_data returned empty DataFrames.")
+        log.warning("Both extract_awb_data and extract_cca_data returned empty DataFrames.")
         return None
 
     # Initialize variables
@@ -423,11 +713,13 @@ def process_files(invoice_file_path, report_file_path, workflow_id=None, custom_
     df_awb_for_recon = pd.DataFrame()
     df_cca_final = pd.DataFrame()
     df_reconciliation = pd.DataFrame()
+    discrepancy_masks = {}
 
     # --- Process AWB Data ---
+    begin_span(timer, "normalize")
     if not df_awb.empty:
-        df_awb_data_only = df_awb.copy()
-        print(f"  -> Initial AWB data rows extracted: {len(df_awb_data_only)}")
+        df_awb_data_only = df_awb if low_memory else df_awb.copy()
+        log.debug("Initial AWB data rows extracted: %s", len(df_awb_data_only))
 
         # Process AWB data (calculations, column drops) before writing
         numeric_cols_awb = [
@@ -435,10 +727,10 @@ def process_files(invoice_file_path, report_file_path, workflow_id=None, custom_
             'CC Due Airline', 'Disc.', 'Agency Comm.', 'Taxes', 'Others', 'Net Due for AWB',
             'Net Yield Rate'
         ]
-        # Convert only potential numeric columns
-        print("  -> Converting AWB columns to numeric...")
+        # Convert only potential numeric columns (parse_awb_lines already gives floats)
+        log.debug("Converting AWB columns to numeric...")
         for col in numeric_cols_awb:
-             if col in df_awb_data_only.columns:
+             if col in df_awb_data_only.columns and not pd.api.types.is_numeric_dtype(df_awb_data_only[col]):
                 df_awb_data_only[col] = safe_to_numeric(df_awb_data_only[col])
 
         # Calculate totals based *only* on data rows
@@ -459,13 +751,13 @@ def process_files(invoice_file_path, report_file_path, workflow_id=None, custom_
             # Calculate the overall total net due from the data_only df
             if 'Net Due for AWB' in df_awb_data_only.columns and pd.api.types.is_numeric_dtype(df_awb_data_only['Net Due for AWB']):
                 total_net_due_awb = df_awb_data_only['Net Due for AWB'].sum()
-                print(f"  -> Calculated Total Net Due (data only): {total_net_due_awb}")
+                log.debug("Calculated Total Net Due (data only): %s", total_net_due_awb)
             else:
                 total_net_due_awb = 0.0
 
-            print("  -> Calculated totals row based on AWB data_only.")
+            log.debug("Calculated totals row based on AWB data_only.")
         else:
-            print("  -> AWB data_only empty or no valid numeric columns found for totaling.")
+            log.debug("AWB data_only empty or no valid numeric columns found for totaling.")
             if 'Net Due for AWB' in df_awb_data_only.columns and pd.api.types.is_numeric_dtype(df_awb_data_only['Net Due for AWB']):
                total_net_due_awb = df_awb_data_only['Net Due for AWB'].sum()
 
@@ -480,8 +772,8 @@ def process_files(invoice_file_path, report_file_path, workflow_id=None, custom_
         if 'Flight Date' in df_awb_data_only.columns:
              df_awb_data_only['Flight Date'] = df_awb_data_only['Flight Date'].astype(str).apply(format_date)
 
-        # Format Charge Weight (remove ' K' and convert to numeric)
-        if 'Charge Weight' in df_awb_data_only.columns:
+        # Format Charge Weight (remove ' K' and convert to numeric); parse_awb_lines already gives floats
+        if 'Charge Weight' in df_awb_data_only.columns and not pd.api.types.is_numeric_dtype(df_awb_data_only['Charge Weight']):
             df_awb_data_only['Charge Weight'] = df_awb_data_only['Charge Weight'].astype(str).str.replace(r'\s*K$', '', regex=True)
             df_awb_data_only['Charge Weight'] = safe_to_numeric(df_awb_data_only['Charge Weight'])
 
@@ -497,14 +789,20 @@ def process_files(invoice_file_path, report_file_path, workflow_id=None, custom_
             df_awb_data_only['AWB Serial'] = split_awb[1].fillna('').astype(str) + split_awb[2].fillna('').astype(str)
             # Remove extra spaces within serial just in case
             df_awb_data_only['AWB Serial'] = df_awb_data_only['AWB Serial'].str.replace(r'\s+', '', regex=True).str.strip()
+            apply_dtypes(df_awb_data_only, AWB_KEY_DTYPES)
+            if log.isEnabledFor(logging.DEBUG):
+                for before, prefix, serial in zip(df_awb_data_only["AWB Number"].head(5),
+                                                  df_awb_data_only['AWB Prefix'], df_awb_data_only['AWB Serial']):
+                    log.debug("AWB Serial formatting: %r -> prefix %r, serial %r", before, prefix, serial)
             # Update the separate totals_row_awb with split info if needed (optional, keeps structure consistent)
             if totals_row_awb:
                  totals_row_awb['AWB Prefix'] = 'Total'
                  totals_row_awb['AWB Serial'] = ''
 
         # --- Finalize DataFrames for Sheets ---
-        df_awb_for_recon = df_awb_data_only.copy()
-        print(f"  -> Finalized df_awb_for_recon (data only). Shape: {df_awb_for_recon.shape}")
+        # Low-memory: shared with df_awb_data_only, which is only read from here on
+        df_awb_for_recon = df_awb_data_only if low_memory else df_awb_data_only.copy()
+        log.debug("Finalized df_awb_for_recon (data only). Shape: %s", df_awb_for_recon.shape)
 
         # df_awb_final (for Invoices sheet) = processed data_only + totals_row
         df_awb_final_data = df_awb_data_only.drop(columns=["AWB Serial Part1", "AWB Serial Part2", "Exchange Rate", "AWB Number"], errors='ignore')
@@ -512,7 +810,7 @@ def process_files(invoice_file_path, report_file_path, workflow_id=None, custom_
             df_awb_final = pd.concat([df_awb_final_data, pd.DataFrame([totals_row_awb]).drop(columns=["AWB Serial Part1", "AWB Serial Part2", "Exchange Rate", "AWB Number"], errors='ignore')], ignore_index=True)
         else:
             df_awb_final = df_awb_final_data
-        print(f"  -> Finalized df_awb_final (for Invoices sheet). Shape: {df_awb_final.shape}")
+        log.debug("Finalized df_awb_final (for Invoices sheet). Shape: %s", df_awb_final.shape)
 
         # Reorder columns for AWB sheet 
         base_awb_cols = ['AWB Prefix', 'AWB Serial']
@@ -549,61 +847,77 @@ def process_files(invoice_file_path, report_file_path, workflow_id=None, custom_
         cca_cols_order = [col for col in cca_cols_order if col in df_cca_final.columns]
         df_cca_final = df_cca_final[cca_cols_order]
 
+    end_span(timer)
+
     # --- 4. Process Report Data and Reconciliation Logic ---
     report_data_df = None
-    if os.path.exists(report_file_path):
+    if not is_path(report_file_path) or os.path.exists(report_file_path):
         try:
-            print(f"Reading report file: {report_file_path} with header on row 8 (index 7)")
-            report_data_df = pd.read_excel(
-                report_file_path,
-                engine='xlrd',
-                header=7, # Header on row 8 (0-indexed 7) - same as app(1).py
-                dtype={'awbprefix': str, 'awbsuffix': str}
-            )
-            print(f"Report file read successfully. Shape: {report_data_df.shape}")
+            log.debug("Reading report file: %s with header on row 8 (index 7)", report_file_path if is_path(report_file_path) else '(in memory)')
+            with span(timer, "report_read"):
+                report_input = open_input(report_file_path)
+                engine = report_engine(report_input)
+                report_data_df = pd.read_excel(
+                    report_input,
+                    engine=engine, # .xls (xlrd) or .xlsx (openpyxl)
+                    header=7, # Header on row 8 (0-indexed 7) - same as app(1).py
+                    dtype={'awbprefix': str, 'awbsuffix': str},
+                    # Only the reconciliation columns are loaded (the report has ~30)
+                    usecols=lambda col: str(col).strip().lower() in REPORT_COLUMNS
+                )
+            log.info("Report file read successfully. Shape: %s", report_data_df.shape)
+            progress_event(progress, "report", rows=len(report_data_df))
+            if details is not None:  # duration_estimate.py trains on these
+                details['report_rows'] = len(report_data_df)
+                details['report_format'] = 'xlsx' if engine == 'openpyxl' else 'xls'
 
             # Clean column names by stripping whitespace and lowercasing - same as app(1).py
             report_data_df.columns = report_data_df.columns.str.strip().str.lower()
-            print(f"Cleaned report columns: {report_data_df.columns.tolist()}")
+            log.debug("Cleaned report columns: %s", report_data_df.columns.tolist())
 
             # Basic validation for required columns
-            required_report_cols = ['awbprefix', 'awbsuffix', 'chargewt', 'frt_cost_rate', 'total_cost']
-            missing_cols = [col for col in required_report_cols if col not in report_data_df.columns]
+            missing_cols = [col for col in REPORT_COLUMNS if col not in report_data_df.columns]
             if missing_cols:
-                print(f"Warning: Report file missing required columns: {missing_cols}")
+                log.warning("Report file missing required columns: %s", missing_cols)
                 report_data_df = None
             else:
-                print(f"All required columns found in report file")
+                log.debug("All required columns found in report file")
                 
+        except MemoryError:
+            raise
         except Exception as e:
-            print(f"Warning: Could not read Excel file: {e}")
+            log.warning("Could not read Excel file: %s", e)
             report_data_df = None
 
     # --- 4. Reconciliation Logic ---
     if report_data_df is not None and not report_data_df.empty and not df_awb_for_recon.empty:
-        print("--- Starting Reconciliation Process ---")
+        log.debug("Starting Reconciliation Process")
+        begin_span(timer, "normalize")
 
         # --- Prepare Invoice Data for Merge ---
         invoice_cols_for_merge = ['AWB Prefix', 'AWB Serial', 'Charge Weight', 'Net Yield Rate', 'Net Due for AWB']
-        # Ensure AWB Prefix/Serial are strings and handle potential NaN before conversion
-        df_awb_for_recon['AWB Prefix'] = df_awb_for_recon['AWB Prefix'].fillna('').astype(str).str.strip()
-        df_awb_for_recon['AWB Serial'] = df_awb_for_recon['AWB Serial'].fillna('').astype(str).str.strip()
+        # AWB Prefix/Serial were normalized and typed (AWB_KEY_DTYPES) when the AWB Number was split
+        apply_dtypes(df_awb_for_recon, AWB_KEY_DTYPES)
 
         # Ensure numeric types for comparison columns
         df_awb_for_recon['Charge Weight'] = safe_to_numeric(df_awb_for_recon['Charge Weight'])
         df_awb_for_recon['Net Yield Rate'] = safe_to_numeric(df_awb_for_recon['Net Yield Rate'])
         df_awb_for_recon['Net Due for AWB'] = safe_to_numeric(df_awb_for_recon['Net Due for AWB'])
 
-        df_invoice_subset = df_awb_for_recon[invoice_cols_for_merge]
-        print(f"  -> Prepared Invoice subset for merge. Shape: {df_invoice_subset.shape}")
+        log.debug("Prepared Invoice data for merge. Shape: %s", df_awb_for_recon.shape)
 
         # --- Prepare Report Data for Merge ---
-        report_cols = ['awbprefix', 'awbsuffix', 'chargewt', 'frt_cost_rate', 'total_cost']
+        report_cols = REPORT_COLUMNS
         if all(col in report_data_df.columns for col in report_cols):
-            df_report_subset = report_data_df[report_cols].copy()
+            if low_memory:
+                # The column selection is already a copy; the full report is not needed after it
+                df_report_subset = report_data_df[report_cols]
+                report_data_df = None
+            else:
+                df_report_subset = report_data_df[report_cols].copy()
 
             # Ensure merge keys are strings and normalized (remove .0)
-            print("  -> Normalizing report merge key strings...")
+            log.debug("Normalizing report merge key strings...")
             for col in ['awbprefix', 'awbsuffix']:
                  df_report_subset[col] = df_report_subset[col].astype(str).str.replace(r'\.0$', '', regex=True).str.strip()
 
@@ -620,26 +934,36 @@ def process_files(invoice_file_path, report_file_path, workflow_id=None, custom_
             df_report_subset['Charge Weight (Report)'] = safe_to_numeric(df_report_subset['Charge Weight (Report)'])
             df_report_subset['Net Yield Rate (Report)'] = safe_to_numeric(df_report_subset['Net Yield Rate (Report)'])
             df_report_subset['Net Due (Report)'] = safe_to_numeric(df_report_subset['Net Due (Report)'])
+            apply_dtypes(df_report_subset, AWB_KEY_DTYPES)
 
-            print(f"  -> Prepared Report subset for merge. Shape before dedup: {df_report_subset.shape}")
+            log.debug("Prepared Report subset for merge. Shape before dedup: %s", df_report_subset.shape)
 
             # Remove duplicates from report data
             initial_report_rows = len(df_report_subset)
             df_report_subset.drop_duplicates(subset=['AWB Prefix', 'AWB Serial'], keep='first', inplace=True)
             final_report_rows = len(df_report_subset)
             if initial_report_rows != final_report_rows:
-                print(f"  -> Removed {initial_report_rows - final_report_rows} duplicate AWB entries from the report data.")
-            print(f"  -> Shape after dedup: {df_report_subset.shape}")
+                log.info("Removed %s duplicate AWB entries from the report data.", initial_report_rows - final_report_rows)
+            log.debug("Shape after dedup: %s", df_report_subset.shape)
+
+            end_span(timer)
 
             # --- Perform Left Merge ---
-            print("  -> Performing left merge...")
+            begin_span(timer, "join")
+            # Same key dtypes on both sides: the merge joins on category codes / strings
+            align_categories([df_awb_for_recon, df_report_subset], 'AWB Prefix')
+            df_invoice_subset = df_awb_for_recon[invoice_cols_for_merge]
+            log.debug("Performing left merge...")
             df_reconciliation = pd.merge(
                 df_invoice_subset,
                 df_report_subset,
                 on=['AWB Prefix', 'AWB Serial'],
                 how='left'
             )
-            print(f"  -> Merge complete. Shape after merge: {df_reconciliation.shape}")
+            log.info("Merge complete. Shape after merge: %s", df_reconciliation.shape)
+            if log.isEnabledFor(logging.DEBUG):
+                log_awb_matching(df_invoice_subset, df_report_subset)
+            progress_event(progress, "join", rows=len(df_reconciliation))
             
             # Rename columns for final output clarity
             df_reconciliation.rename(columns={
@@ -650,7 +974,7 @@ def process_files(invoice_file_path, report_file_path, workflow_id=None, custom_
             
             # --- Calculate Differences ---
             df_reconciliation['Diff Net Due'] = df_reconciliation['Net Due (Report)'].sub(df_reconciliation['Net Due (Invoice)'])
-            print("  -> Calculated difference columns.")
+            log.debug("Calculated difference columns.")
 
             # --- Add Discrepancy Flag ---
             charge_weight_discrepancy = (
@@ -672,7 +996,14 @@ def process_files(invoice_file_path, report_file_path, workflow_id=None, custom_
             discrepancy = charge_weight_discrepancy | net_yield_rate_discrepancy | net_due_discrepancy
 
             df_reconciliation['Discrepancy Found'] = discrepancy
-            print("  -> Added 'Discrepancy Found' column.")
+            discrepancy_masks = {
+                'charge_weight': charge_weight_discrepancy,
+                'net_yield_rate': net_yield_rate_discrepancy,
+                'net_due': net_due_discrepancy,
+                'missing_in_report': df_reconciliation['Net Due (Report)'].isna(),
+                'any': discrepancy,
+            }
+            log.debug("Added 'Discrepancy Found' column.")
 
             # --- Reorder Reconciliation Columns ---
             recon_cols_order = [
@@ -698,22 +1029,31 @@ def process_files(invoice_file_path, report_file_path, workflow_id=None, custom_
                 totals_row_rec.update(totals_rec)
                 totals_row_rec['AWB Prefix'] = 'Total'
                 df_reconciliation = pd.concat([df_reconciliation, pd.DataFrame([totals_row_rec])], ignore_index=True)
-                print("  -> Added calculated totals row to Reconciliation DataFrame.")
+                log.debug("Added calculated totals row to Reconciliation DataFrame.")
             else:
-                print("  -> No numeric columns found or Reconciliation data empty. Skipping totals row addition.")
+                log.debug("No numeric columns found or Reconciliation data empty. Skipping totals row addition.")
+            end_span(timer)
 
         else:
-            print("  -> Report DataFrame missing required columns for reconciliation. Skipping reconciliation.")
-            print(f"  -> Available columns: {report_data_df.columns.tolist()}")
-            print(f"  -> Required columns: {report_cols}")
+            end_span(timer)
+            log.warning("Report DataFrame missing required columns for reconciliation, skipping reconciliation. "
+                        "Available columns: %s; required: %s", report_data_df.columns.tolist(), report_cols)
     elif report_data_df is None or report_data_df.empty:
-         print("--- No report data provided or report data is empty. Skipping reconciliation. ---")
+         log.info("No report data provided or report data is empty. Skipping reconciliation.")
     elif df_awb_for_recon.empty:
-         print("--- Invoice data (AWB) is empty. Skipping reconciliation. ---")
+         log.info("Invoice data (AWB) is empty. Skipping reconciliation.")
 
 
+    if log.isEnabledFor(logging.DEBUG):  # deep memory_usage() walks every string
+        memory_report({
+            "Invoices": df_awb_for_recon,
+            "CCA": df_cca_final,
+            "Report": report_data_df,
+            "Reconciliation": df_reconciliation,
+        })
+
     # 5. Generate Excel output with all sheets
-    print("-> Generating comprehensive Excel file...")
+    log.debug("Generating comprehensive Excel file...")
     
     # Create dynamic filename based on custom filename or N8N variables
     if custom_filename:
@@ -722,290 +1062,374 @@ def process_files(invoice_file_path, report_file_path, workflow_id=None, custom_
             output_filename += '.xlsx'
     elif workflow_id:
         # Use N8N pattern: invoicefile-workflowid.xlsx
-        base_filename = os.path.splitext(os.path.basename(invoice_file_path))[0]
+        base_filename = os.path.splitext(invoice_name)[0]
         output_filename = f"{base_filename}-{workflow_id}.xlsx"
     else:
         # Fallback to timestamp pattern
-        import datetime
-        base_filename = os.path.splitext(os.path.basename(invoice_file_path))[0]
+        base_filename = os.path.splitext(invoice_name)[0]
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
         output_filename = f"{base_filename}_processed_{timestamp}.xlsx"
     
     # Use /files/ for n8n, local directory for testing
-    if os.path.exists("/files"):
+    if output_stream is not None:
+        output_path = output_filename  # returned as the name; the bytes go to output_stream
+    elif output_dir:
+        output_path = os.path.join(output_dir, output_filename)
+    elif os.path.exists("/files"):
         output_path = f"/files/{output_filename}"
     else:
         output_path = output_filename
     
-    print(f"  -> Output file will be: {output_path}")
+    log.info("Output file will be: %s%s", '(stream) ' if output_stream is not None else '', output_path)
     
-    try:
-        with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
-
-            # --- Calculate Summary Data ---
-            print("--- Preparing Summary Sheet Data ---")
-            summary_data = {}
-            if not df_awb_for_recon.empty:
-                df_summary_input = df_awb_for_recon[df_awb_for_recon['AWB Prefix'] != 'Total'].copy()
-                if not df_summary_input.empty:
-                    invoice_awb_count = len(df_summary_input)
-                    total_invoice_amount = df_summary_input['Net Due for AWB'].sum()
-                    total_charge_weight = df_summary_input['Charge Weight'].sum()
-                    avg_net_yield_rate = (total_invoice_amount / total_charge_weight) if total_charge_weight else 0.0
-                    
-                    summary_data['Invoice AWB Count'] = invoice_awb_count
-                    summary_data['Total Invoice Amount (Net Due)'] = total_invoice_amount
-                    summary_data['Total Invoice Charge Weight'] = total_charge_weight
-                    summary_data['Average Net Yield Rate'] = avg_net_yield_rate
-                    print(f"  -> Calculated Invoice Stats: Count={invoice_awb_count}, Amount={total_invoice_amount:.2f}, Weight={total_charge_weight:.2f}, Avg Rate={avg_net_yield_rate:.5f}")
-                else:
-                     summary_data['Invoice AWB Count'] = 0
-                     summary_data['Total Invoice Amount (Net Due)'] = 0.0
-                     summary_data['Total Invoice Charge Weight'] = 0.0
-                     summary_data['Average Net Yield Rate'] = 0.0
-            else:
-                summary_data['Invoice AWB Count'] = 0
-
-            # Calculate report totals from the reconciliation dataframe
-            if not df_reconciliation.empty and 'Net Due (Report)' in df_reconciliation.columns:
-                df_rec_summary_input = df_reconciliation[df_reconciliation['AWB Prefix'] != 'Total'].copy()
-                if not df_rec_summary_input.empty:
-                    total_report_cost = df_rec_summary_input['Net Due (Report)'].sum()
-                    difference_total_amount = total_report_cost - summary_data.get('Total Invoice Amount (Net Due)', 0.0)
-                    summary_data['Total Report Amount (for Matched AWBs)'] = total_report_cost
-                    summary_data['Difference (Report - Invoice)'] = difference_total_amount
-                    print(f"  -> Calculated Report Stats: Total Cost={total_report_cost:.2f}, Difference={difference_total_amount:.2f}")
-                else:
-                    summary_data['Total Report Amount (for Matched AWBs)'] = 0.0
-                    summary_data['Difference (Report - Invoice)'] = 0.0 - summary_data.get('Total Invoice Amount (Net Due)', 0.0)
-            else:
-                summary_data['Total Report Amount (for Matched AWBs)'] = 0.0
-
-            # Create DataFrame for summary
-            df_summary = pd.DataFrame(list(summary_data.items()), columns=['Metric', 'Value'])
+    # --- Calculate Summary Data ---
+    log.debug("Preparing Summary Sheet Data")
+    begin_span(timer, "summary")
+    summary_data = {}
+    if not df_awb_for_recon.empty:
+        df_summary_input = df_awb_for_recon[df_awb_for_recon['AWB Prefix'] != 'Total'].copy()
+        if not df_summary_input.empty:
+            invoice_awb_count = len(df_summary_input)
+            total_invoice_amount = df_summary_input['Net Due for AWB'].sum()
+            total_charge_weight = df_summary_input['Charge Weight'].sum()
+            avg_net_yield_rate = (total_invoice_amount / total_charge_weight) if total_charge_weight else 0.0
             
-            # --- Write Sheets in Specified Order ---
-
-            # 1. Summary Sheet
-            sheet_name_summary = "Summary"
-            df_summary.to_excel(writer, sheet_name=sheet_name_summary, index=False)
-            print(f"  -> Written summary data to '{sheet_name_summary}' sheet.")
-            worksheet_summary = writer.sheets[sheet_name_summary]
-            # Autofit columns for summary sheet
-            for column in worksheet_summary.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                for cell in column:
-                    try:
-                        cell_len = len(str(cell.value))
-                        header_len = len(str(worksheet_summary[f"{column_letter}1"].value))
-                        max_length = max(max_length, cell_len, header_len)
-                    except: pass
-                adjusted_width = (max_length + 2) * 1.1
-                worksheet_summary.column_dimensions[column_letter].width = adjusted_width
-            print(f"  -> Autofit columns for '{sheet_name_summary}'.")
-
-            # 2. Reconciliation Sheet
-            if not df_reconciliation.empty:
-                sheet_name_rec = "Reconciliation"
-                df_reconciliation.to_excel(writer, sheet_name=sheet_name_rec, index=False)
-                print(f"  -> Written {len(df_reconciliation)} rows to '{sheet_name_rec}' sheet.")
-                worksheet_rec = writer.sheets[sheet_name_rec]
-                # Formatting (Autofit, Table, Conditional)
-                start_row_rec = 1
-                end_row_rec = start_row_rec + len(df_reconciliation)
-                start_col_rec = 1
-                end_col_rec = len(df_reconciliation.columns)
-                # Adjust table range
-                rec_table_range = f"{get_column_letter(start_col_rec)}{start_row_rec}:{get_column_letter(end_col_rec)}{end_row_rec}"
-                print(f"  -> Calculated Reconciliation Table Range: {rec_table_range}")
-                for column in worksheet_rec.columns:
-                     max_length = 0
-                     column_letter = column[0].column_letter
-                     for cell in column:
-                        try:
-                            cell_len = len(str(cell.value))
-                            header_len = len(str(worksheet_rec[f"{column_letter}1"].value))
-                            max_length = max(max_length, cell_len, header_len)
-                        except: pass
-                     adjusted_width = (max_length + 2) * 1.1
-                     worksheet_rec.column_dimensions[column_letter].width = adjusted_width
-                print(f"  -> Autofit columns for '{sheet_name_rec}'.")
-                tab_rec = Table(displayName="ReconciliationTable", ref=rec_table_range)
-                style_rec = TableStyleInfo(name="TableStyleMedium2", showFirstColumn=False, showLastColumn=False, showRowStripes=True, showColumnStripes=False)
-                tab_rec.tableStyleInfo = style_rec
-                # Apply table if there are any rows
-                if len(df_reconciliation) > 0:
-                    worksheet_rec.add_table(tab_rec)
-                    print(f"  -> Added Excel table formatting to '{sheet_name_rec}'.")
-                print(f"  -> Skipping conditional formatting to avoid Excel compatibility issues.")
+            summary_data['Invoice AWB Count'] = invoice_awb_count
+            summary_data['Total Invoice Amount (Net Due)'] = total_invoice_amount
+            summary_data['Total Invoice Charge Weight'] = total_charge_weight
+            summary_data['Average Net Yield Rate'] = avg_net_yield_rate
+            log.info("Calculated Invoice Stats: Count=%s, Amount=%.2f, Weight=%.2f, Avg Rate=%.5f", invoice_awb_count, total_invoice_amount, total_charge_weight, avg_net_yield_rate)
+        else:
+             summary_data['Invoice AWB Count'] = 0
+             summary_data['Total Invoice Amount (Net Due)'] = 0.0
+             summary_data['Total Invoice Charge Weight'] = 0.0
+             summary_data['Average Net Yield Rate'] = 0.0
+    else:
+        summary_data['Invoice AWB Count'] = 0
+
+    # Calculate report totals from the reconciliation dataframe
+    if not df_reconciliation.empty and 'Net Due (Report)' in df_reconciliation.columns:
+        df_rec_summary_input = df_reconciliation[df_reconciliation['AWB Prefix'] != 'Total'].copy()
+        if not df_rec_summary_input.empty:
+            total_report_cost = df_rec_summary_input['Net Due (Report)'].sum()
+            difference_total_amount = total_report_cost - summary_data.get('Total Invoice Amount (Net Due)', 0.0)
+            summary_data['Total Report Amount (for Matched AWBs)'] = total_report_cost
+            summary_data['Difference (Report - Invoice)'] = difference_total_amount
+            log.info("Calculated Report Stats: Total Cost=%.2f, Difference=%.2f", total_report_cost, difference_total_amount)
+        else:
+            summary_data['Total Report Amount (for Matched AWBs)'] = 0.0
+            summary_data['Difference (Report - Invoice)'] = 0.0 - summary_data.get('Total Invoice Amount (Net Due)', 0.0)
+    else:
+        summary_data['Total Report Amount (for Matched AWBs)'] = 0.0
 
+    # Create DataFrame for summary
+    df_summary = pd.DataFrame(list(summary_data.items()), columns=['Metric', 'Value'])
+    end_span(timer)
+
+    # --- Write Sheets in Specified Order (Summary, Reconciliation, Invoices, CCA) ---
+    from sheet_spec import render_workbook
+    try:
+        frames = {
+            "Summary": df_summary,
+            "Reconciliation": df_reconciliation,
+            "Invoices": df_awb_final,
+            "CCA": df_cca_final,
+        }
+        with span(timer, "sheets"):
+            if output_stream is not None:
+                sheet_stats = render_workbook(output_stream, frames, highlights=False, timer=timer)
             else:
-                pd.DataFrame().to_excel(writer, sheet_name="Reconciliation", index=False)
-
-            # 3. Invoices Sheet
-            if not df_awb_final.empty:
-                sheet_name_awb = "Invoices"
-                df_awb_final.to_excel(writer, sheet_name=sheet_name_awb, index=False)
-                print(f"  -> Written {len(df_awb_final)} rows to '{sheet_name_awb}' sheet.")
-                worksheet_awb = writer.sheets[sheet_name_awb]
-                # Formatting (Autofit, Table)
-                start_row_awb = 1
-                end_row_awb = start_row_awb + len(df_awb_final)
-                start_col_awb = 1
-                end_col_awb = len(df_awb_final.columns)
-                awb_table_range = f"{get_column_letter(start_col_awb)}{start_row_awb}:{get_column_letter(end_col_awb)}{end_row_awb}"
-                print(f"  -> Calculated AWB Table Range: {awb_table_range}")
-                for column in worksheet_awb.columns:
-                    max_length = 0
-                    column_letter = column[0].column_letter
-                    for cell in column:
-                        try:
-                            cell_len = len(str(cell.value))
-                            header_len = len(str(worksheet_awb[f"{column_letter}1"].value))
-                            max_length = max(max_length, cell_len, header_len)
-                        except: pass
-                    adjusted_width = (max_length + 2) * 1.1
-                    worksheet_awb.column_dimensions[column_letter].width = adjusted_width
-                print(f"  -> Autofit columns for '{sheet_name_awb}'.")
-                tab_awb = Table(displayName="AWBTable", ref=awb_table_range)
-                style_awb = TableStyleInfo(name="TableStyleMedium9", showFirstColumn=False, showLastColumn=False, showRowStripes=True, showColumnStripes=False)
-                tab_awb.tableStyleInfo = style_awb
-                if len(df_awb_final) > 0:
-                    worksheet_awb.add_table(tab_awb)
-                    print(f"  -> Added Excel table formatting to '{sheet_name_awb}'.")
-                else:
-                    print(f"  -> No data rows in '{sheet_name_awb}', skipping table creation.")
-            else:
-                pd.DataFrame().to_excel(writer, sheet_name="Invoices", index=False)
-                print("  -> AWB DataFrame is empty. Written empty 'Invoices' sheet.")
-
-            # 4. CCA Sheet
-            if not df_cca_final.empty:
-                sheet_name_cca = "CCA" 
-                df_cca_final.to_excel(writer, sheet_name=sheet_name_cca, index=False)
-                print(f"  -> Written {len(df_cca_final)} rows to '{sheet_name_cca}' sheet.")
-                worksheet_cca = writer.sheets[sheet_name_cca]
-                # Formatting (Autofit, Table)
-                start_row_cca = 1
-                end_row_cca = start_row_cca + len(df_cca_final)
-                start_col_cca = 1
-                end_col_cca = len(df_cca_final.columns)
-                cca_table_range = f"{get_column_letter(start_col_cca)}{start_row_cca}:{get_column_letter(end_col_cca)}{end_row_cca}"
-                print(f"  -> Calculated CCA Table Range: {cca_table_range}")
-                for column in worksheet_cca.columns:
-                    max_length = 0
-                    column_letter = column[0].column_letter
-                    for cell in column:
-                        try:
-                            cell_len = len(str(cell.value))
-                            header_len = len(str(worksheet_cca[f"{column_letter}1"].value))
-                            max_length = max(max_length, cell_len, header_len)
-                        except: pass
-                    adjusted_width = (max_length + 2) * 1.1
-                    worksheet_cca.column_dimensions[column_letter].width = adjusted_width
-                print(f"  -> Autofit columns for '{sheet_name_cca}'.")
-                tab_cca = Table(displayName="CCATable", ref=cca_table_range)
-                style_cca = TableStyleInfo(name="TableStyleMedium10", showFirstColumn=False, showLastColumn=False, showRowStripes=True, showColumnStripes=False)
-                tab_cca.tableStyleInfo = style_cca
-                if len(df_cca_final) > 0:
-                    worksheet_cca.add_table(tab_cca)
-                    print(f"  -> Added Excel table formatting to '{sheet_name_cca}'.")
-                else:
-                    print(f"  -> No data rows in '{sheet_name_cca}', skipping table creation.")
-            else:
-                pd.DataFrame().to_excel(writer, sheet_name="CCA", index=False)
-                print("  -> CCA DataFrame is empty. Written empty 'CCA' sheet.")
-        
-        print("--- Excel File Written Successfully ---")
+                with atomic_path(output_path) as tmp_output_path:
+                    sheet_stats = render_workbook(tmp_output_path, frames, highlights=False, timer=timer)
+        log.debug("Skipping conditional formatting to avoid Excel compatibility issues.")
+        log.info("Excel File Written Successfully")
+        progress_event(progress, "sheets", sheets=len(sheet_stats))
 
     except Exception as e:
-        print(f"Error writing Excel file: {e}")
-        import traceback
-        traceback.print_exc()
+        log.error("Error writing Excel file: %s", e, exc_info=True)
         raise
 
-    # Adjust row counts to exclude total row before returning
-    invoices_rows_count = 0
-    if not df_awb_final.empty:
-         invoices_rows_count = len(df_awb_final)
-         if 'Total' in df_awb_final['AWB Prefix'].values:
-             invoices_rows_count -= 1
-             
-    cca_rows_count = 0
-    if not df_cca_final.empty:
-        cca_rows_count = len(df_cca_final)
-        if 'Total' in df_cca_final['CCA Ref. No'].values:
-            cca_rows_count -= 1
-
-    print(f"Processing completed successfully:")
-    print(f"  - AWB rows: {invoices_rows_count}")
-    print(f"  - CCA rows: {cca_rows_count}")
-    print(f"  - Total Net Due: {total_net_due_awb:.2f}")
+    # 6. Append to the monthly workbook (append mode)
+    if monthly_workbook:
+        from monthly_workbook import append_invoice, resolve_monthly_path
+        monthly_path = resolve_monthly_path(monthly_workbook)
+        log.info("Appending to monthly workbook: %s", monthly_path)
+        with span(timer, "monthly_workbook"):
+            index = append_invoice(
+                monthly_path,
+                os.path.splitext(os.path.basename(output_path))[0],
+                summary_data,
+                {"Reconciliation": df_reconciliation, "Invoices": df_awb_final, "CCA": df_cca_final}
+            )
+        log.info("Monthly workbook now holds %s invoices.", len(index['invoices']))
+
+    # Row counts exclude the totals rows
+    invoices_rows_count = sheet_stats["Invoices"]["data_rows"]
+    cca_rows_count = sheet_stats["CCA"]["data_rows"]
+
+    # 7. Result details for n8n (summary, discrepancy counts, discrepant rows)
+    if details is not None:
+        details['summary'] = summary_data
+        details['discrepancies'] = discrepancy_counts(discrepancy_masks)
+        details['rows'] = {"invoices": invoices_rows_count, "cca": cca_rows_count}
+    if discrepancies_path:
+        with span(timer, "discrepancies_jsonl"):
+            written = write_discrepancy_rows(discrepancies_path, df_reconciliation, discrepancy_masks)
+        log.info("Streamed %s discrepant AWB rows to %s", written, discrepancies_path)
+    if details is not None:
+        details['timings'] = timings(timer)
+        details['timings']['memory'] = memory_summary(memory, plan)
+
+    log.info("Processing completed successfully: AWB rows %s, CCA rows %s, Total Net Due %.2f",
+             invoices_rows_count, cca_rows_count, total_net_due_awb)
 
     return output_path
 
 def main():
-    """Main entry point for command line execution."""
-    if len(sys.argv) < 4 or len(sys.argv) > 6:
+    """
+    Main entry point for command line execution.
+    With RECONCILER_DAEMON_SOCKET set, the job runs on the warm worker daemon
+    (see reconciler_daemon.py) and this process only relays its output.
+    `process_invoice.py batch ...` processes many pairs in parallel (see batch.py).
+    """
+    if sys.argv[1:2] == ['batch']:
+        from batch import run_batch
+        run_batch(sys.argv[2:])
+    configure_logging()
+    daemon_socket = os.environ.get('RECONCILER_DAEMON_SOCKET')
+    # stdin/stdout jobs ('-' arguments) can't be forwarded: they run in this process
+    if daemon_socket and '-' not in sys.argv[1:]:
+        from reconciler_daemon import submit_job
+        # A worker killed mid-job (e.g. out of memory) can't write the result JSON: submit_job does
+        response = submit_job(daemon_socket, sys.argv[1:], result_path=cli_result_path(sys.argv[1:]))
+        if response is not None:
+            sys.stdout.write(response["stdout"])
+            sys.stderr.write(response["stderr"])
+            sys.exit(response["exit_code"])
+        log.warning("Reconciler daemon not reachable at %s, processing in this process.", daemon_socket)
+    run_cli(sys.argv[1:])
+
+def build_result(result_path, details, discrepancies_path=None):
+    """Result JSON dict of a finished process_files run (result_path None: no data)."""
+    if not result_path:
+        return {
+            "success": False,
+            "error": "No data found in PDF files",
+            "message": "Processing completed but no output generated"
+        }
+    result = {
+        "success": True,
+        "output_file": result_path,
+        "output_filename": os.path.basename(result_path),
+        "message": "Processing completed successfully"
+    }
+    result.update(details)
+    if discrepancies_path:
+        result["discrepancies_file"] = discrepancies_path
+    return result
+
+def process_streams(invoice, report, workbook_out, result_out=None, workflow_id=None, custom_filename=None,
+                    invoice_name=None, discrepancies_path=None, progress=None):
+    """
+    In-memory variant of process_files for callers that already hold the files.
+    invoice/report: bytes, or binary file-like objects (BytesIO, mmap, ...).
+    The workbook is written to workbook_out and, if result_out is given, the
+    result JSON to it (both binary file-like). Returns the result dict; raises
+    like process_files.
+    """
+    details = {}
+    result_path = process_files(invoice, report, workflow_id, custom_filename, details=details,
+                                discrepancies_path=discrepancies_path, output_stream=workbook_out,
+                                invoice_name=invoice_name, progress=progress)
+    result = build_result(result_path, details, discrepancies_path)
+    if result_out is not None:
+        result_out.write(dumps(result))
+    return result
+
+def split_cli_options(args):
+    """
+    Separates the --profile[=mode] options (allowed anywhere) from the positional CLI arguments.
+    Returns (positional args, profile mode or None). Anything that indexes the
+    arguments goes through this, so an option never shifts the positions.
+    """
+    options = [arg for arg in args if arg == '--profile' or arg.startswith('--profile=')]
+    if not options:
+        return list(args), None
+    return [arg for arg in args if arg not in options], options[-1].partition('=')[2] or 'all'
+
+def cli_result_path(args):
+    """Result JSON path named by CLI arguments (without the script name); None if invalid or stdout."""
+    args, _ = split_cli_options(args)
+    if 3 <= len(args) <= 5 and args[2] != '-':
+        return args[2]
+    return None
+
+def run_cli(args):
+    """
+    Runs one job from CLI arguments (without the script name) and writes the result JSON.
+    '-' as the invoice or report path reads it from stdin; '-' as the output JSON
+    path or custom filename writes the result JSON or the workbook to stdout
+    (progress output then goes to stderr).
+    --profile[=all|cpu|memory] (or N8N_PROFILE) writes profiling reports next
+    to the workbook (see profiling.py).
+    """
+    args, profile_mode = split_cli_options(args)
+    profile_mode = profile_mode or os.environ.get('N8N_PROFILE') or None
+
+    if len(args) < 3 or len(args) > 5:
         print("Usage: python process_invoice.py <invoice_pdf_path> <report_excel_path> <output_json_path> [workflow_id] [custom_filename]")
+        print("       python process_invoice.py batch <directory|manifest> [--workers N] [--output results.jsonl] ...")
         print("  workflow_id: Optional N8N workflow ID for dynamic filename")
         print("  custom_filename: Optional custom output filename (overrides workflow_id)")
+        print("  '-' reads the invoice or report from stdin, or writes the result JSON or workbook (custom_filename) to stdout")
+        print("  --profile[=all|cpu|memory]: write <workbook>.profile.collapsed and <workbook>.alloc.json")
         sys.exit(1)
     
-    invoice_path = sys.argv[1]
-    report_path = sys.argv[2]
-    output_json_path = sys.argv[3]
+    invoice_path = args[0]
+    report_path = args[1]
+    output_json_path = args[2]
     
     # Get optional parameters for N8N integration
-    workflow_id = sys.argv[4] if len(sys.argv) >= 5 else None
-    custom_filename = sys.argv[5] if len(sys.argv) >= 6 else None
+    workflow_id = args[3] if len(args) >= 4 else None
+    custom_filename = args[4] if len(args) >= 5 else None
     
     # In N8N, these can be passed as environment variables or workflow variables
     if not workflow_id:
         workflow_id = os.environ.get('N8N_WORKFLOW_ID')
     if not custom_filename:
         custom_filename = os.environ.get('N8N_OUTPUT_FILENAME')
-    
-    print(f"Processing with:")
-    print(f"  Invoice: {invoice_path}")
-    print(f"  Report: {report_path}")
-    print(f"  Workflow ID: {workflow_id}")
-    print(f"  Custom filename: {custom_filename}")
-    
-    try:
-        result_path = process_files(invoice_path, report_path, workflow_id, custom_filename)
-        
-        if result_path:
-            # Return result as JSON for n8n
-            result = {
-                "success": True,
-                "output_file": result_path,
-                "output_filename": os.path.basename(result_path),
-                "message": "Processing completed successfully"
-            }
+    monthly_workbook = os.environ.get('N8N_MONTHLY_WORKBOOK')
+    discrepancies_path = os.environ.get('N8N_DISCREPANCIES_JSONL')
+    progress_spec = os.environ.get('N8N_PROGRESS')
+    metrics_path = os.environ.get('N8N_METRICS_FILE')
+    configure_logging(job_id=workflow_id)
+
+    # --- stdin/stdout streams ---
+    if invoice_path == '-' and report_path == '-':
+        print("Error: only one of the invoice and the report can be read from stdin")
+        sys.exit(1)
+    if output_json_path == '-' and custom_filename == '-':
+        print("Error: only one of the result JSON and the workbook can be written to stdout")
+        sys.exit(1)
+    if '-' in (output_json_path, custom_filename):
+        # stdout carries data: progress output goes to stderr
+        from contextlib import redirect_stdout
+        data_out = sys.stdout.buffer
+        if progress_spec == 'stdout':
+            progress_spec = 'stderr'
+        with redirect_stdout(sys.stderr):
+            _run_cli_job(invoice_path, report_path, output_json_path, workflow_id, custom_filename,
+                         monthly_workbook, discrepancies_path, progress_spec, data_out, profile_mode, metrics_path)
+    else:
+        _run_cli_job(invoice_path, report_path, output_json_path, workflow_id, custom_filename,
+                     monthly_workbook, discrepancies_path, progress_spec, profile_mode=profile_mode,
+                     metrics_path=metrics_path)
+
+def _run_cli_job(invoice_path, report_path, output_json_path, workflow_id, custom_filename, monthly_workbook,
+                 discrepancies_path, progress_spec=None, data_out=None, profile_mode=None, metrics_path=None):
+    log.info("Processing with: invoice=%s report=%s workflow_id=%s custom_filename=%s monthly_workbook=%s "
+             "discrepancies=%s progress=%s", invoice_path, report_path, workflow_id, custom_filename,
+             monthly_workbook, discrepancies_path, progress_spec)
+    started = time.perf_counter()
+
+    progress = None
+    if progress_spec:
+        from progress import new_progress, sink_from_spec
+        try:
+            progress = new_progress(sink_from_spec(progress_spec),
+                                    float(os.environ.get('N8N_PROGRESS_INTERVAL', '1.0')), job_id=workflow_id)
+        except ValueError as e:
+            log.warning("Progress reporting disabled: %s", e)
+
+    profile = timer = None
+    if profile_mode:
+        from profiling import start_profile, profile_hook
+        try:
+            profile = start_profile(profile_mode)
+            timer = new_timer(hooks=[profile_hook(profile)])
+        except ValueError as e:
+            log.warning("Profiling disabled: %s", e)
+
+    memory_budget_mb = None
+    if os.environ.get('N8N_MEMORY_BUDGET_MB'):
+        try:
+            memory_budget_mb = float(os.environ['N8N_MEMORY_BUDGET_MB'])
+        except ValueError:
+            log.warning("Memory budget disabled: N8N_MEMORY_BUDGET_MB=%r is not a number",
+                        os.environ['N8N_MEMORY_BUDGET_MB'])
+
+    def finish_profile(result, output_path):
+        # Reports go next to the workbook (next to the result JSON if there is none)
+        if profile is None:
+            return
+        from profiling import stop_profile, write_profile, profile_base_path
+        stop_profile(profile)
+        try:
+            result["profile_files"] = write_profile(profile, profile_base_path(output_path))
+            log.info("Profile written: %s", ", ".join(result["profile_files"]))
+        except OSError as e:
+            log.warning("Could not write the profile: %s", e)
+
+    def emit(result):
+        from progress import finish_progress
+        finish_progress(progress, success=result["success"])
+        if output_json_path == '-':
+            data_out.write(dumps(result) + b'\n')
+            data_out.flush()
         else:
-            result = {
-                "success": False,
-                "error": "No data found in PDF files",
-                "message": "Processing completed but no output generated"
-            }
-        
-        with open(output_json_path, 'w') as f:
-            json.dump(result, f)
+            write_result(output_json_path, result)
+        if metrics_path:
+            record_metrics(result)
+
+    def record_metrics(result):
+        from metrics import new_registry, record_job, set_rss, update_textfile
+        from worker_limits import rss_mb
+        registry = new_registry()
+        record_job(registry, "cli", result["success"], time.perf_counter() - started, result)
+        set_rss(registry, "cli", rss_mb())
+        try:
+            update_textfile(metrics_path, registry)
+        except OSError as e:
+            log.warning("Could not write the metrics file %s: %s", metrics_path, e)
+
+    try:
+        # Inputs from stdin are read into memory (pdfplumber needs a seekable file)
+        invoice = sys.stdin.buffer.read() if invoice_path == '-' else invoice_path
+        report = sys.stdin.buffer.read() if report_path == '-' else report_path
+        workbook_out = None
+        if custom_filename == '-':
+            import io
+            workbook_out = io.BytesIO()  # sent only when complete: no partial workbook on stdout
+            custom_filename = None
+
+        details = {}
+        result_path = process_files(invoice, report, workflow_id, custom_filename, monthly_workbook,
+                                    details=details, discrepancies_path=discrepancies_path,
+                                    output_stream=workbook_out, progress=progress, timer=timer,
+                                    memory_budget_mb=memory_budget_mb,
+                                    memory_trace=os.environ.get('N8N_MEMORY_TRACE') == '1')
+        if result_path and workbook_out is not None:
+            data_out.write(workbook_out.getbuffer())
+            data_out.flush()
+
+        # Return result as JSON for n8n
+        result = build_result(result_path, details, discrepancies_path)
+        if result_path and workbook_out is not None:
+            result["output_file"] = "-"
+        finish_profile(result, result_path or output_json_path)
+        emit(result)
             
     except Exception as e:
         result = {
             "success": False,
-            "error": str(e),
+            "error": str(e) or type(e).__name__,  # MemoryError has no message
             "message": "Processing failed"
         }
+        finish_profile(result, output_json_path)
+        emit(result)
         
-        with open(output_json_path, 'w') as f:
-            json.dump(result, f)
-        
-        print(f"Error: {e}")
+        log.error("Processing failed: %s", e)
         sys.exit(1)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main() 
@@ -0,0 +1,243 @@
+"""
+Profiling mode for one reconciliation job (process_invoice.py --profile,
+APP_PROFILE for the Flask app's upload jobs).
+
+Rerunning a slow invoice with profiling on writes, next to its workbook:
+
+   <workbook>.profile.collapsed   sampled call stacks in collapsed format
+                                  ("stage:join;process_files;merge 42"), opens in
+                                  https://www.speedscope.app or flamegraph.pl
+   <workbook>.alloc.json          per stage: traced memory peak, net growth and
+                                  the top-N allocation sites by growth
+                                  (tracemalloc)
+
+MODES: "cpu" (stack sampling only), "memory" (tracemalloc only) or "all".
+Stack sampling costs next to nothing. tracemalloc slows allocation-heavy code
+(pdfminer's layout) down several times, and the memory modes took ~9x as long
+on the 10-page sample invoice; use --profile=cpu for timing questions.
+
+HOW:
+- A daemon thread samples the job thread's stack every SAMPLE_INTERVAL
+  seconds (sys._current_frames); the current top-level stage is prepended as
+  a "stage:<name>" frame, so the flame graph splits by stage.
+- Stages are the telemetry.py spans: the profile is a timer hook, so any
+  code timed with span() is profiled per stage without further changes.
+  Consecutive spans of one stage (one per page) are measured together.
+- Peak and net growth come from tracemalloc.get_traced_memory (cheap). The
+  allocation sites need a snapshot, which costs a few hundred ms once the
+  PDF layout is in memory, so one is only taken after a stage whose peak or live
+  memory moved by SITES_MIN_GROWTH_KB; its sites are diffed against the last
+  snapshot. Small stages list no sites.
+
+Only the standard library is used.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from itertools import groupby
+from operator import itemgetter
+
+SAMPLE_INTERVAL = 0.005  # seconds between stack samples
+TOP_ALLOCATIONS = 15     # allocation sites kept per stage
+TRACEMALLOC_FRAMES = 1
+SITES_MIN_GROWTH_KB = 1024  # smaller stages get peak/net only
+MODES = ("all", "cpu", "memory")
+
+_SIZE = itemgetter(1)
+_FRAMES = itemgetter(2)
+
+
+def start_profile(mode="all", interval=SAMPLE_INTERVAL, top_n=TOP_ALLOCATIONS):
+    """Starts profiling the calling thread. Pass profile_hook(profile) to new_timer(hooks=...)."""
+    if mode not in MODES:
+        raise ValueError(f"Unknown profile mode: {mode!r} (use {', '.join(MODES)})")
+    profile = {
+        "mode": mode, "interval": interval, "top_n": top_n, "thread_id": threading.get_ident(),
+        "stacks": {}, "samples": 0, "stage": None, "stages": {}, "pending": None, "baseline": ({}, 0), "busy": False,
+        "stop": threading.Event(), "sampler": None, "started_tracemalloc": False, "start": time.perf_counter(),
+    }
+    if mode in ("all", "memory") and not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        profile["started_tracemalloc"] = True
+    if mode in ("all", "cpu"):
+        profile["sampler"] = threading.Thread(target=_sample_loop, args=(profile,), daemon=True,
+                                              name="profile-sampler")
+        profile["sampler"].start()
+    return profile
+
+
+def stop_profile(profile):
+    """Stops sampling and tracemalloc (if this profile started it)."""
+    if profile is None:
+        return
+    profile["stop"].set()
+    if profile["sampler"] is not None:
+        profile["sampler"].join()
+    if profile["pending"] is not None:
+        _close_stage(profile)
+    if profile["started_tracemalloc"]:
+        tracemalloc.stop()
+    profile["seconds"] = round(time.perf_counter() - profile["start"], 3)
+
+
+# --- Stack Sampling ---
+
+def _frame_name(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _sample_loop(profile):
+    stacks = profile["stacks"]
+    while not profile["stop"].wait(profile["interval"]):
+        if profile["busy"]:
+            continue  # the profiler's own snapshot work
+        frame = sys._current_frames().get(profile["thread_id"])
+        names = []
+        while frame is not None:
+            names.append(_frame_name(frame.f_code))
+            frame = frame.f_back
+        if profile["stage"]:
+            names.append(f"stage:{profile['stage']}")
+        key = ";".join(reversed(names))
+        stacks[key] = stacks.get(key, 0) + 1
+        profile["samples"] += 1
+
+
+# --- Per-Stage Allocations ---
+
+def _allocation_sites():
+    # {(filename, lineno): (size, count)} of the live traced allocations
+    snapshot = tracemalloc.take_snapshot()
+    raw = getattr(snapshot.traces, "_traces", None)
+    if raw is None:  # Snapshot internals changed: the public (much slower) grouping
+        return {(stat.traceback[0].filename, stat.traceback[0].lineno): (stat.size, stat.count)
+                for stat in snapshot.statistics('lineno')}
+    # Raw traces are (domain, size, frames, ...) tuples. Sorting and grouping them
+    # in C is ~40x faster than a Python loop over every allocation (each traced too)
+    sites = {}
+    for frames, traces in groupby(sorted(raw, key=_FRAMES), key=_FRAMES):
+        traces = list(traces)
+        sites[frames[0]] = (sum(map(_SIZE, traces)), len(traces))
+    return sites
+
+
+def _grew(profile, current):
+    return abs(current - profile["baseline"][1]) >= SITES_MIN_GROWTH_KB * 1024
+
+
+def _open_stage(profile, path):
+    current = tracemalloc.get_traced_memory()[0]
+    if _grew(profile, current):  # allocated outside any stage: not attributed
+        profile["baseline"] = (_allocation_sites(), current)
+    profile["pending"] = (path, current, 0)
+
+
+def _close_stage(profile):
+    # Ends the current stage group; snapshots and diffs by source line only if
+    # the group's peak or the live memory moved by SITES_MIN_GROWTH_KB
+    path, group_start, group_peak = profile["pending"]
+    profile["pending"] = None
+    stage = profile["stages"][path]
+    current = tracemalloc.get_traced_memory()[0]
+    stage["net"] += current - group_start
+    if group_peak < SITES_MIN_GROWTH_KB * 1024 and not _grew(profile, current):
+        return
+    baseline = profile["baseline"][0]
+    sites = _allocation_sites()
+    for site, (size, count) in sites.items():
+        old_size, old_count = baseline.get(site, (0, 0))
+        if size > old_size and site[0] not in (tracemalloc.__file__, __file__):
+            where = f"{site[0]}:{site[1]}"
+            total, number = stage["sites"].get(where, (0, 0))
+            stage["sites"][where] = (total + size - old_size, number + count - old_count)
+    profile["baseline"] = (sites, current)
+
+
+def profile_hook(profile):
+    """
+    telemetry.py timer hook: tracks the current stage (top-level spans) and its
+    allocations. Consecutive spans of one stage (pages) are measured as one;
+    samples taken while the hook works are dropped.
+    """
+    tracing = profile["mode"] in ("all", "memory")
+
+    def hook(event, path, depth):
+        if depth != 1:
+            return
+        profile["busy"] = True
+        if event == "begin":
+            if tracing:
+                if profile["pending"] is not None and profile["pending"][0] != path:
+                    _close_stage(profile)
+                if profile["pending"] is None:
+                    _open_stage(profile, path)
+                profile["stages"].setdefault(path, {"spans": 0, "peak": 0, "net": 0, "sites": {}})
+                tracemalloc.reset_peak()
+                profile["span_start"] = tracemalloc.get_traced_memory()[0]
+            profile["stage"] = path
+        else:
+            profile["stage"] = None
+            if tracing and path in profile["stages"]:
+                stage = profile["stages"][path]
+                stage["spans"] += 1
+                peak = tracemalloc.get_traced_memory()[1] - profile["span_start"]
+                stage["peak"] = max(stage["peak"], peak)
+                if profile["pending"] is not None:
+                    pending_path, group_start, group_peak = profile["pending"]
+                    profile["pending"] = (pending_path, group_start, max(group_peak, peak))
+        profile["busy"] = False
+
+    return hook
+
+
+# --- Reports ---
+
+def collapsed_stacks(profile):
+    """Collapsed-stack text (one "frame;frame;frame count" line per stack)."""
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(profile["stacks"].items()))
+
+
+def allocation_report(profile):
+    """Per-stage allocation summary with the top-N sites by net size."""
+    stages = {}
+    for path, stage in profile["stages"].items():
+        top = sorted(stage["sites"].items(), key=lambda item: -item[1][0])[:profile["top_n"]]
+        stages[path] = {
+            "spans": stage["spans"],
+            "peak_kb": round(stage["peak"] / 1024, 1),
+            "net_kb": round(stage["net"] / 1024, 1),
+            "top": [{"where": where, "size_kb": round(size / 1024, 1), "count": count}
+                    for where, (size, count) in top],
+        }
+    return {"mode": profile["mode"], "seconds": profile.get("seconds"), "samples": profile["samples"],
+            "sample_interval": profile["interval"], "stages": stages}
+
+
+def write_profile(profile, base_path):
+    """
+    Writes the reports as <base_path>.profile.collapsed and <base_path>.alloc.json
+    (for the modes that collected them). Returns the written paths.
+    """
+    from result_json import atomic_path
+
+    paths = []
+    if profile["mode"] in ("all", "cpu"):
+        paths.append(f"{base_path}.profile.collapsed")
+        with atomic_path(paths[-1]) as tmp_path, open(tmp_path, 'w') as f:
+            f.write(collapsed_stacks(profile))
+    if profile["mode"] in ("all", "memory"):
+        paths.append(f"{base_path}.alloc.json")
+        with atomic_path(paths[-1]) as tmp_path, open(tmp_path, 'w') as f:
+            json.dump(allocation_report(profile), f, indent=2)
+    return paths
+
+
+def profile_base_path(output_path, fallback_name="profile"):
+    """Report base path next to a workbook: the workbook path without .xlsx."""
+    if not output_path or output_path == '-':
+        return fallback_name
+    return os.path.splitext(output_path)[0]
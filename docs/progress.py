@@ -0,0 +1,118 @@
+"""
+Progress events for long-running jobs (process_files in process_invoice.py).
+
+process_files reported nothing until it finished, so a 90-second job looked
+like a hung one. It now emits events through an optional progress dict:
+
+   {"event": "progress", "stage": "pages", "done": 3, "total": 6, "elapsed": 1.42, ...}
+
+STAGES (in order): pdf_scan, pages, cca, report, join, sheets, done
+
+RATE LIMITING AND BATCHING:
+- progress_event() only records the event (latest per stage) and returns;
+  the sink is called at most once per interval with the batch collected
+  since the last call, so the extraction loop never waits on I/O.
+- Stage transitions are never lost: a batch holds the latest event of every
+  stage reached since the previous batch.
+- finish_progress() flushes whatever is left.
+
+SINKS (callables taking a list of event dicts), chosen with sink_from_spec():
+   "stdout" / "stderr"     JSON lines
+   "file:/path/x.jsonl"    appended JSON lines
+   "http://..."            POST {"events": [...]} (pooled keep-alive connection)
+"""
+
+import json
+import sys
+import time
+
+from structured_log import get_logger
+
+log = get_logger("progress")
+
+DEFAULT_INTERVAL = 1.0  # seconds between sink calls
+
+
+def new_progress(sink, interval=DEFAULT_INTERVAL, **fields):
+    """Progress state for one job. fields (e.g. job_id) are added to every event."""
+    now = time.monotonic()
+    return {"sink": sink, "interval": interval, "fields": fields, "start": now,
+            "next_flush": now, "pending": {}, "failed": False}
+
+
+def progress_event(progress, stage, **fields):
+    """Records an event; calls the sink if the interval has passed. No-op when progress is None."""
+    if progress is None:
+        return
+    now = time.monotonic()
+    event = {"event": "progress", "stage": stage}
+    event.update(fields)
+    event["elapsed"] = round(now - progress["start"], 3)
+    event.update(progress["fields"])
+    progress["pending"][stage] = event  # dicts keep first-insertion order: stages stay in order
+    if now >= progress["next_flush"]:
+        flush_progress(progress)
+
+
+def flush_progress(progress):
+    if progress is None or not progress["pending"]:
+        return
+    events = list(progress["pending"].values())
+    progress["pending"] = {}
+    progress["next_flush"] = time.monotonic() + progress["interval"]
+    if progress["failed"]:
+        return
+    try:
+        progress["sink"](events)
+    except Exception as e:
+        # Reporting must never fail the job; stop reporting after the first error
+        progress["failed"] = True
+        log.warning("Progress sink failed, progress reporting disabled: %s", e)
+
+
+def finish_progress(progress, **fields):
+    """Emits the final 'done' event and flushes everything pending."""
+    if progress is None:
+        return
+    progress_event(progress, "done", **fields)
+    flush_progress(progress)
+
+
+# --- Sinks ---
+
+def stream_sink(stream):
+    def sink(events):
+        stream.write("".join(json.dumps(event) + "\n" for event in events))
+        stream.flush()
+    return sink
+
+
+def file_sink(path):
+    def sink(events):
+        with open(path, 'a') as f:
+            f.write("".join(json.dumps(event) + "\n" for event in events))
+    return sink
+
+
+def http_sink(url, headers=None, **body_fields):
+    """POSTs {"events": [...], **body_fields} as JSON to url."""
+    from webhook_runner import http_request
+
+    def sink(events):
+        body = dict(body_fields, events=events)
+        http_request('POST', url, body=json.dumps(body).encode('utf-8'),
+                     headers=headers or {"Content-Type": "application/json"})
+    return sink
+
+
+def sink_from_spec(spec):
+    """Sink for "stdout", "stderr", "file:<path>" or an http(s) URL. Raises ValueError otherwise."""
+    if spec == "stdout":
+        return stream_sink(sys.stdout)
+    if spec == "stderr":
+        return stream_sink(sys.stderr)
+    if spec.startswith("file:"):
+        return file_sink(spec[len("file:"):])
+    if spec.startswith(("http://", "https://")):
+        return http_sink(spec)
+    raise ValueError(f"Unknown progress sink: {spec!r} (use stdout, stderr, file:<path> or an http(s) URL)")
@@ -0,0 +1,319 @@
+#!/opt/venv/bin/python3
+"""
+Warm worker daemon for the n8n Execute Command path.
+
+Every n8n job used to start a fresh interpreter and import pandas,
+pdfplumber/pdfminer and openpyxl before touching the invoice, which often
+took longer than processing a small invoice. The daemon imports all of that
+(and process_invoice.py's compiled regexes) once, then pre-forks workers that
+share those pages copy-on-write and serve jobs over a local Unix socket.
+
+SERVER:
+   python reconciler_daemon.py serve --socket /tmp/reconciler.sock --workers 4
+
+   - Workers accept() on the shared listening socket; one job per connection.
+   - A worker exits after --max-jobs jobs, or once its RSS is above
+     --max-rss-mb, and the parent forks a fresh one.
+   - Each job runs under --job-timeout and --job-max-memory-mb
+     (worker_limits.py); a job stopped by a limit gets a failure result JSON
+     and its worker is replaced.
+   - SIGTERM/SIGINT stops the workers and removes the socket file.
+
+CLIENT (unchanged n8n node):
+   Set RECONCILER_DAEMON_SOCKET=/tmp/reconciler.sock in the n8n environment.
+   process_invoice.py then forwards its CLI arguments, the N8N_* variables and
+   the working directory to the daemon, prints the job output and exits with
+   the job's exit code. The result JSON is written by the worker to the same
+   path, so the contract is exactly the one of an in-process run.
+   If the daemon is not reachable, process_invoice.py processes the job itself.
+   If the worker dies during the job, process_invoice.py writes the failure
+   result JSON.
+
+PROTOCOL (one JSON line each way):
+   request:  {"argv": [...], "env": {"N8N_...": ...}, "cwd": "..."}
+   response: {"exit_code": 0, "stdout": "...", "stderr": "..."}
+             plus "limit": "..." when the job was stopped by a limit
+"""
+
+import argparse
+import io
+import json
+import os
+import signal
+import socket
+import sys
+from contextlib import redirect_stdout, redirect_stderr
+
+from worker_limits import DEFAULT_LIMITS, JobTimeout
+
+# Environment variables forwarded from the client to the job
+FORWARDED_ENV_PREFIX = 'N8N_'
+CONNECT_TIMEOUT = 2.0
+STOP_SIGNALS = {signal.SIGTERM, signal.SIGINT}
+
+
+# --- Client ---
+
+def _recv_line(conn):
+    chunks = []
+    while True:
+        chunk = conn.recv(65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        if chunk.endswith(b'\n'):
+            break
+    return b''.join(chunks)
+
+
+def submit_job(socket_path, argv, env=None, cwd=None, result_path=None):
+    """
+    Runs one process_invoice.py job on the daemon.
+    Returns the response dict, or None if the daemon is not reachable
+    (the caller then processes the job itself). response["lost"] is set when
+    the worker died before answering; the failure result JSON is then written
+    to result_path (process_invoice.cli_result_path(argv)), if given.
+    """
+    if env is None:
+        env = {key: value for key, value in os.environ.items() if key.startswith(FORWARDED_ENV_PREFIX)}
+    request = {"argv": list(argv), "env": env, "cwd": cwd or os.getcwd()}
+
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.settimeout(CONNECT_TIMEOUT)
+        conn.connect(socket_path)
+    except OSError:
+        conn.close()
+        return None
+
+    # Connected: from here on the job belongs to the daemon (no local fallback,
+    # an append to the monthly workbook must not run twice)
+    try:
+        conn.settimeout(None)
+        conn.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        response = _recv_line(conn)
+    except OSError:
+        response = b''  # worker killed mid-job (connection reset)
+    finally:
+        conn.close()
+    if not response:
+        if result_path:
+            from result_json import write_result
+            from worker_limits import failure_result
+            write_result(os.path.join(request["cwd"], result_path),
+                         failure_result("Reconciler worker was killed while processing the job"))
+        return {"exit_code": 1, "stdout": "", "stderr": "Error: reconciler daemon closed the connection without a result\n",
+                "lost": True}
+    return json.loads(response)
+
+
+# --- Worker ---
+
+def run_job(request, limits=None):
+    """
+    Runs one job in this process with the client's argv, N8N_* env and cwd,
+    under the per-job timeout and memory ceiling of limits (see worker_limits.py).
+    A job stopped by a limit gets a failure result JSON and response["limit"].
+    """
+    import process_invoice
+    from worker_limits import job_limits, limit_error, failure_result
+
+    limits = limits or {}
+    result_path = process_invoice.cli_result_path(request["argv"])
+    saved_cwd = os.getcwd()
+    saved_env = {key: value for key, value in os.environ.items() if key.startswith(FORWARDED_ENV_PREFIX)}
+    stdout, stderr = io.StringIO(), io.StringIO()
+    exit_code = 0
+    stopped = None
+    try:
+        for key in saved_env:
+            del os.environ[key]
+        os.environ.update({key: value for key, value in request.get("env", {}).items()
+                           if key.startswith(FORWARDED_ENV_PREFIX)})
+        os.chdir(request.get("cwd") or saved_cwd)
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            try:
+                with job_limits(limits):
+                    process_invoice.run_cli(request["argv"])
+            except SystemExit as e:
+                exit_code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+            except (JobTimeout, MemoryError) as e:
+                stopped = limit_error(e, limits)
+                exit_code = 1
+                print(f"Error: {stopped}")
+                if result_path:
+                    process_invoice.write_result(result_path, failure_result(stopped))
+            except Exception as e:
+                import traceback
+                traceback.print_exc()
+                exit_code = 1
+    finally:
+        os.chdir(saved_cwd)
+        for key in [key for key in os.environ if key.startswith(FORWARDED_ENV_PREFIX)]:
+            del os.environ[key]
+        os.environ.update(saved_env)
+    response = {"exit_code": exit_code, "stdout": stdout.getvalue(), "stderr": stderr.getvalue()}
+    if stopped:
+        response["limit"] = stopped
+    return response
+
+
+def worker_loop(listener, limits):
+    """
+    Serves jobs from the shared listening socket until the worker is due for
+    replacement: after limits["max_jobs"] jobs, when its RSS passes
+    limits["max_rss_mb"], or after a job was stopped by a limit.
+    """
+    from worker_limits import recycle_reason
+
+    served = 0
+    reason = None
+    while reason is None:
+        conn, _ = listener.accept()
+        response = None
+        try:
+            line = _recv_line(conn)
+            if not line:
+                continue
+            try:
+                response = run_job(json.loads(line), limits)
+            except Exception as e:
+                response = {"exit_code": 1, "stdout": "", "stderr": f"Error: invalid job request: {e}\n"}
+            conn.sendall(json.dumps(response).encode('utf-8') + b'\n')
+        except OSError as e:
+            print(f"Worker {os.getpid()}: connection error: {e}", file=sys.stderr)
+        finally:
+            conn.close()
+        served += 1
+        if response and response.get("limit"):
+            reason = response["limit"]
+        else:
+            reason = recycle_reason(served, limits)
+    print(f"Worker {os.getpid()} retiring: {reason}")
+    sys.stdout.flush()
+    os._exit(0)
+
+
+# --- Server ---
+
+def preload():
+    """Imports everything a job needs so forked workers share it copy-on-write."""
+    import gc
+    import pandas  # noqa: F401
+    import pdfplumber  # noqa: F401
+    import openpyxl  # noqa: F401
+    import xlrd  # noqa: F401
+    import process_invoice  # noqa: F401 (compiles the extraction regexes)
+    # process_invoice imports these lazily, per stage
+    import column_buffers  # noqa: F401
+    import sheet_spec  # noqa: F401
+    import pandas.io.excel  # noqa: F401
+    # Keep the preloaded objects out of GC passes so workers don't dirty the shared pages
+    gc.collect()
+    gc.freeze()
+
+
+def _bind(socket_path):
+    if os.path.exists(socket_path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socket_path)
+            raise RuntimeError(f"A reconciler daemon is already serving {socket_path}")
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.unlink(socket_path)  # stale socket from a previous run
+        finally:
+            probe.close()
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path)
+    os.chmod(socket_path, 0o660)
+    listener.listen(128)
+    return listener
+
+
+def _spawn(listener, limits, children):
+    # Stop signals stay blocked across fork: the child must not run the parent's
+    # handler, and the parent must record the pid before a stop can kill children
+    signal.pthread_sigmask(signal.SIG_BLOCK, STOP_SIGNALS)
+    pid = os.fork()
+    if pid == 0:
+        for signum in STOP_SIGNALS:
+            signal.signal(signum, signal.SIG_DFL)
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, STOP_SIGNALS)
+        worker_loop(listener, limits)
+    children.add(pid)
+    signal.pthread_sigmask(signal.SIG_UNBLOCK, STOP_SIGNALS)
+
+
+def serve(socket_path, workers, limits):
+    preload()
+    listener = _bind(socket_path)
+    children = set()
+    stopping = []
+
+    def stop(signum, frame):
+        stopping.append(signum)
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(workers):
+        _spawn(listener, limits, children)
+    print(f"Reconciler daemon listening on {socket_path} with {workers} workers (pid {os.getpid()})")
+    sys.stdout.flush()
+
+    try:
+        while children:
+            try:
+                pid, wait_status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            children.discard(pid)
+            if os.WIFSIGNALED(wait_status) and not stopping:
+                # e.g. the kernel OOM killer; the client reports the lost job
+                print(f"Worker {pid} was killed by signal {os.WTERMSIG(wait_status)}, replacing it")
+                sys.stdout.flush()
+            if not stopping:
+                _spawn(listener, limits, children)
+    finally:
+        listener.close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+    print("Reconciler daemon stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm worker daemon for process_invoice.py jobs")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subparsers.add_parser("serve", help="Run the daemon")
+    serve_parser.add_argument("--socket", default=os.environ.get('RECONCILER_DAEMON_SOCKET', '/tmp/reconciler.sock'))
+    serve_parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    serve_parser.add_argument("--max-jobs", type=int, default=DEFAULT_LIMITS["max_jobs"],
+                              help="Jobs per worker before it is replaced (0 = unlimited)")
+    serve_parser.add_argument("--max-rss-mb", type=int, default=DEFAULT_LIMITS["max_rss_mb"],
+                              help="Replace a worker whose RSS is above this after a job (0 = unlimited)")
+    serve_parser.add_argument("--job-timeout", type=int, default=DEFAULT_LIMITS["timeout"],
+                              help="Wall-clock seconds per job (0 = unlimited)")
+    serve_parser.add_argument("--job-max-memory-mb", type=int, default=DEFAULT_LIMITS["max_memory_mb"],
+                              help="Memory a single job may allocate (0 = unlimited)")
+    args = parser.parse_args()
+    limits = {
+        "max_jobs": args.max_jobs,
+        "max_rss_mb": args.max_rss_mb,
+        "timeout": args.job_timeout,
+        "max_memory_mb": args.job_max_memory_mb,
+    }
+
+    # The daemon's own environment must not forward jobs to itself
+    os.environ.pop('RECONCILER_DAEMON_SOCKET', None)
+    serve(args.socket, args.workers, limits)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Result JSON helpers for the n8n Execute Command node.
+
+The result JSON written by process_invoice.py used to hold only success/output
+file/message, so n8n and the dashboard had to open the xlsx to get counts and
+totals. The result now also carries:
+- summary:       the Summary sheet metrics
+- discrepancies: per-category discrepancy counts from the reconciliation
+- rows:          Invoices/CCA row counts (totals rows excluded)
+- timings:       stage and per-page durations in ms (telemetry.py)
+
+Discrepant AWB rows can additionally be streamed to a JSONL file (one
+reconciliation row per line), so downstream nodes can update
+reconciliation_jobs without parsing Excel.
+
+Outputs are written under a temporary name and renamed into place
+(atomic_path), so n8n or a resumed batch never picks up a partial file.
+
+orjson is used when installed (serializes NaN as null and numpy scalars
+natively); otherwise the standard json module is used with NaN -> null.
+"""
+
+import json
+import math
+import os
+from contextlib import contextmanager
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Category name -> mask name set by reconciliation (see discrepancy_masks)
+DISCREPANCY_CATEGORIES = ['charge_weight', 'net_yield_rate', 'net_due', 'missing_in_report']
+
+
+def _plain(value):
+    """Python scalar for JSON (numpy -> python, NaN -> None)."""
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if type(value).__name__ in ('NAType', 'NaTType'):
+        return None
+    return value
+
+
+def dumps(obj):
+    """Serializes obj to JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(_clean(obj)).encode('utf-8')
+
+
+def _clean(obj):
+    if isinstance(obj, dict):
+        return {key: _clean(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_clean(value) for value in obj]
+    return _plain(obj)
+
+
+@contextmanager
+def atomic_path(path):
+    """
+    Yields a temporary path next to path. It is renamed onto path when the
+    block succeeds and removed when it fails, so readers never see a partial file.
+    """
+    directory, name = os.path.split(path)
+    tmp_path = os.path.join(directory, f".{name}.{os.getpid()}.tmp")
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def write_result(path, result):
+    """Writes the result dict as JSON to path (atomically)."""
+    with atomic_path(path) as tmp_path, open(tmp_path, 'wb') as f:
+        f.write(dumps(result))
+
+
+def discrepancy_counts(masks):
+    """
+    Per-category discrepancy counts from boolean masks over the reconciliation data rows.
+    masks: {category: boolean Series}, plus 'any' for rows with at least one discrepancy.
+    """
+    counts = {category: int(masks[category].sum()) if category in masks else 0
+              for category in DISCREPANCY_CATEGORIES}
+    counts['total'] = int(masks['any'].sum()) if 'any' in masks else 0
+    return counts
+
+
+def write_discrepancy_rows(path, df_reconciliation, masks):
+    """
+    Streams discrepant reconciliation rows to path as JSONL, one row per line.
+    Each line also lists the categories the row was flagged for.
+    Returns the number of rows written.
+    """
+    written = 0
+    with atomic_path(path) as tmp_path, open(tmp_path, 'wb') as f:
+        if df_reconciliation is None or df_reconciliation.empty or 'any' not in masks:
+            return written
+        columns = [str(col) for col in df_reconciliation.columns]
+        flagged = masks['any'].to_numpy()
+        category_flags = [(category, masks[category].to_numpy())
+                          for category in DISCREPANCY_CATEGORIES if category in masks]
+        for idx, row in enumerate(df_reconciliation.itertuples(index=False, name=None)):
+            if idx >= len(flagged) or not flagged[idx]:
+                continue
+            record = {name: _plain(value) for name, value in zip(columns, row)}
+            record['categories'] = [category for category, values in category_flags if values[idx]]
+            f.write(dumps(record))
+            f.write(b'\n')
+            written += 1
+    return written
@@ -0,0 +1,296 @@
+"""
+Declarative sheet specs and the shared Excel rendering engine.
+
+The Summary / Reconciliation / Invoices / CCA sheets used to be written by four
+hand-written blocks in process_invoice.py (and a drifting copy with conditional
+formats in app.py). Each block repeated the same steps: to_excel, compute the
+table range, autofit, build the Table, check row counts.
+
+Now each sheet is described once as a spec:
+- columns:        preferred column order (columns missing from the frame are skipped)
+- dtypes:         'str' columns are written as text (AWB Prefix/Serial must not become numbers)
+- number_formats: Excel number format per column
+- table:          Excel table displayName and style (None = no table)
+- total_row:      (column, label) identifying the trailing totals row
+- highlights:     conditional formatting rules (see HIGHLIGHT RULES below)
+- headers:        optional {column: header text} for frame columns whose
+                  header differs from the column name ('' = blank header cell)
+
+render_workbook() carries out the specs for both process_invoice.py and app.py,
+so every optimization to writing lands here and can be benchmarked here.
+
+HIGHLIGHT RULES:
+- {"formula": ..., "apply_to": [...], "fill": ...}: conditional format over the
+  data rows. '{Column Name}' placeholders in the formula become $X2 references.
+  apply_to is a list of columns, or "row" for the whole data row.
+- {"mask": name, "fill": ...}: static fill of whole data rows where the boolean
+  mask passed in masks[name] (aligned with the frame rows) is True.
+
+RENDERING:
+- openpyxl write-only workbook: rows are streamed to the sheet XML instead of
+  building a cell object per value and then walking every cell again to autofit.
+- Column widths are computed from the frame columns: (longest value + 2) * 1.1.
+"""
+
+import warnings
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.formatting.rule import FormulaRule
+from openpyxl.styles import PatternFill, Border, Side
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.table import Table, TableStyleInfo
+
+from structured_log import get_logger
+from telemetry import span
+
+log = get_logger("sheet_spec")
+
+
+# --- Fills / Borders used by highlight rules ---
+FILLS = {
+    'yellow': PatternFill(start_color='FFFFFF00', end_color='FFFFFF00', fill_type='solid'),       # row highlight
+    'orange': PatternFill(start_color='FFFFC7CE', end_color='FFFFC7CE', fill_type='solid'),       # cell mismatches
+    'bright_red': PatternFill(start_color='FFFF0000', end_color='FFFF0000', fill_type='solid'),   # Diff Net Due / invoice rows
+}
+BORDERS = {
+    'thick_black': Border(left=Side(style='thick', color='000000'),
+                          right=Side(style='thick', color='000000'),
+                          top=Side(style='thick', color='000000'),
+                          bottom=Side(style='thick', color='000000')),
+}
+
+
+# --- Sheet Specs ---
+
+SUMMARY_SHEET = {
+    "name": "Summary",
+    "columns": ['Metric', 'Value'],
+    "dtypes": {'Metric': 'str'},
+    "number_formats": {},
+    "table": None,
+    "total_row": None,
+    "highlights": [],
+}
+
+RECONCILIATION_SHEET = {
+    "name": "Reconciliation",
+    "columns": [
+        'AWB Prefix', 'AWB Serial',
+        'Charge Weight (Invoice)', 'Charge Weight (Report)',
+        'Net Yield Rate (Invoice)', 'Net Yield Rate (Report)',
+        'Net Due (Invoice)', 'Net Due (Report)', 'Diff Net Due',
+        'Discrepancy Found',
+    ],
+    "dtypes": {'AWB Prefix': 'str', 'AWB Serial': 'str'},
+    "number_formats": {},
+    "table": {"name": "ReconciliationTable", "style": "TableStyleMedium2"},
+    "total_row": ('AWB Prefix', 'Total'),
+    "highlights": [
+        # Cell mismatches first, row highlight last (stops further rules)
+        {"formula": "AND(ISNUMBER({Charge Weight (Invoice)}), ISNUMBER({Charge Weight (Report)}), "
+                    "ROUND({Charge Weight (Invoice)},2)<>ROUND({Charge Weight (Report)},2))",
+         "apply_to": ['Charge Weight (Invoice)', 'Charge Weight (Report)'], "fill": 'orange'},
+        {"formula": "AND(ISNUMBER({Net Yield Rate (Invoice)}), ISNUMBER({Net Yield Rate (Report)}), "
+                    "ROUND({Net Yield Rate (Invoice)},5)<>ROUND({Net Yield Rate (Report)},5))",
+         "apply_to": ['Net Yield Rate (Invoice)', 'Net Yield Rate (Report)'], "fill": 'orange'},
+        {"formula": "AND(ISNUMBER({Net Due (Invoice)}), ISNUMBER({Net Due (Report)}), ROUND({Diff Net Due},2)<>0)",
+         "apply_to": ['Net Due (Invoice)', 'Net Due (Report)'], "fill": 'orange'},
+        {"formula": "ROUND({Diff Net Due},2)<>0",
+         "apply_to": ['Diff Net Due'], "fill": 'bright_red', "border": 'thick_black'},
+        {"formula": "{Discrepancy Found}=TRUE", "apply_to": "row", "fill": 'yellow', "stop": True},
+    ],
+}
+
+INVOICES_SHEET = {
+    "name": "Invoices",
+    "columns": ['AWB Prefix', 'AWB Serial'],  # remaining columns keep extraction order
+    "dtypes": {'AWB Prefix': 'str', 'AWB Serial': 'str'},
+    "number_formats": {},
+    "table": {"name": "AWBTable", "style": "TableStyleMedium9"},
+    "total_row": ('AWB Prefix', 'Total'),
+    "highlights": [
+        {"mask": "net_due_discrepancy", "fill": 'bright_red'},
+    ],
+}
+
+CCA_SHEET = {
+    "name": "CCA",
+    "columns": ['AWB Prefix', 'AWB Serial'],  # remaining columns keep extraction order
+    "dtypes": {'AWB Prefix': 'str', 'AWB Serial': 'str'},
+    "number_formats": {},
+    "table": {"name": "CCATable", "style": "TableStyleMedium10"},
+    "total_row": ('CCA Ref. No', 'Total'),
+    "highlights": [],
+}
+
+# Workbook order used by both entry points
+WORKBOOK_SHEETS = [SUMMARY_SHEET, RECONCILIATION_SHEET, INVOICES_SHEET, CCA_SHEET]
+
+
+# --- Frame Helpers ---
+
+def order_columns(spec, df):
+    """Spec columns first (those present), then any remaining frame columns."""
+    preferred = [col for col in spec["columns"] if col in df.columns]
+    return df[preferred + [col for col in df.columns if col not in preferred]]
+
+
+def count_data_rows(spec, df):
+    """Rows excluding the trailing totals row, if the spec declares one."""
+    if df is None or df.empty:
+        return 0
+    rows = len(df)
+    if spec["total_row"]:
+        column, label = spec["total_row"]
+        if column in df.columns and (df[column] == label).any():
+            rows -= 1
+    return rows
+
+
+def awb_key_mask(df, awb_keys):
+    """Boolean mask of rows whose (AWB Prefix, AWB Serial) is in awb_keys."""
+    keys = list(zip(df['AWB Prefix'].astype(str), df['AWB Serial'].astype(str)))
+    return [key in awb_keys for key in keys]
+
+
+def _column_values(series, dtype):
+    """Column as a list of Excel-ready values (NaN/NA -> None)."""
+    if dtype == 'str':
+        # notna() also covers pd.NA from Arrow-backed/nullable string columns
+        return [str(value) if present else None for value, present in zip(series.tolist(), series.notna().tolist())]
+    values = series.astype(object).where(series.notna(), None).tolist()
+    return values
+
+
+def _column_width(header, values):
+    longest = len(str(header))
+    for value in values:
+        if value is not None:
+            length = len(str(value))
+            if length > longest:
+                longest = length
+    return (longest + 2) * 1.1
+
+
+def _resolve_formula(formula, col_letters):
+    for name, letter in col_letters.items():
+        formula = formula.replace('{' + name + '}', f'${letter}2')
+    return formula
+
+
+# --- Rendering Engine ---
+
+def render_sheet(wb, spec, df, masks=None, highlights=True):
+    """
+    Writes one sheet from its spec. Returns a stats dict:
+    {"rows": rows written, "data_rows": rows excluding totals, "range": table range}
+    """
+    ws = wb.create_sheet(spec["name"])
+    if df is None or df.empty:
+        log.debug("'%s' DataFrame is empty. Written empty sheet.", spec['name'])
+        return {"rows": 0, "data_rows": 0, "range": None}
+
+    df = order_columns(spec, df)
+    headers = spec.get("headers") or {}
+    header = [str(headers.get(col, col)) for col in df.columns]
+    n_rows, n_cols = len(df), len(header)
+    letters = [get_column_letter(i + 1) for i in range(n_cols)]
+    col_letters = dict(zip(header, letters))
+    table_range = f"A1:{letters[-1]}{n_rows + 1}"
+
+    columns = [_column_values(df[col], spec["dtypes"].get(col)) for col in df.columns]
+
+    # Widths must be set before the first row is streamed
+    for letter, name, values in zip(letters, header, columns):
+        ws.column_dimensions[letter].width = _column_width(name, values)
+
+    number_formats = [spec["number_formats"].get(name) for name in header]
+    has_formats = any(number_formats)
+
+    # Static row fills from data masks
+    row_fill = [None] * n_rows
+    has_total = count_data_rows(spec, df) < n_rows
+    data_end = n_rows - 1 if has_total else n_rows
+    for rule in spec["highlights"] if highlights else []:
+        if "mask" in rule and masks and rule["mask"] in masks:
+            fill = FILLS[rule["fill"]]
+            for idx, flagged in enumerate(masks[rule["mask"]][:data_end]):
+                if flagged:
+                    row_fill[idx] = fill
+
+    ws.append([name or None for name in header])
+
+    for idx, row in enumerate(zip(*columns)):
+        fill = row_fill[idx]
+        if fill is None and not has_formats:
+            ws.append(row)
+            continue
+        cells = []
+        for value, number_format in zip(row, number_formats):
+            cell = WriteOnlyCell(ws, value=value)
+            if fill is not None:
+                cell.fill = fill
+            if number_format:
+                cell.number_format = number_format
+            cells.append(cell)
+        ws.append(cells)
+    log.debug("Written %s rows to '%s' sheet.", n_rows, spec['name'])
+
+    if spec["table"]:
+        table = Table(displayName=spec["table"]["name"], ref=table_range)
+        table._initialise_columns()
+        for table_column, name in zip(table.tableColumns, header):
+            table_column.name = name
+        table.tableStyleInfo = TableStyleInfo(name=spec["table"]["style"], showFirstColumn=False,
+                                              showLastColumn=False, showRowStripes=True, showColumnStripes=False)
+        with warnings.catch_warnings():
+            # Columns were initialised above; openpyxl warns in write-only mode regardless
+            warnings.simplefilter("ignore", UserWarning)
+            ws.add_table(table)
+        log.debug("Added Excel table formatting to '%s' (%s).", spec['name'], table_range)
+
+    # Conditional formats over data rows only (header and totals row excluded)
+    if highlights and data_end >= 1:
+        added = 0
+        for rule in spec["highlights"]:
+            if "formula" not in rule:
+                continue
+            targets = header if rule["apply_to"] == "row" else rule["apply_to"]
+            formula = _resolve_formula(rule["formula"], col_letters)
+            if '{' in formula or not all(name in col_letters for name in targets):
+                continue  # rule refers to a column this frame does not have
+            cf_rule = FormulaRule(formula=[formula], stopIfTrue=rule.get("stop", False),
+                                  fill=FILLS[rule["fill"]], border=BORDERS.get(rule.get("border")))
+            if rule["apply_to"] == "row":
+                ws.conditional_formatting.add(f"A2:{letters[-1]}{data_end + 1}", cf_rule)
+            else:
+                for name in targets:
+                    letter = col_letters[name]
+                    ws.conditional_formatting.add(f"{letter}2:{letter}{data_end + 1}", cf_rule)
+            added += 1
+        if added:
+            log.debug("Added conditional formatting to '%s'.", spec['name'])
+
+    return {"rows": n_rows, "data_rows": count_data_rows(spec, df), "range": table_range}
+
+
+def render_workbook(target, frames, masks=None, highlights=True, specs=None, timer=None):
+    """
+    Renders a workbook from sheet specs.
+
+    target:     output path or binary file-like object
+    frames:     {sheet name: DataFrame}; missing/empty frames give empty sheets
+    masks:      {mask name: list of bools} for mask highlight rules
+    highlights: False skips all highlight rules (plain tables only)
+    timer:      telemetry.py timer; each sheet and the final save are timed as spans
+    Returns {sheet name: stats} as returned by render_sheet.
+    """
+    wb = Workbook(write_only=True)
+    stats = {}
+    for spec in specs or WORKBOOK_SHEETS:
+        with span(timer, spec["name"]):
+            stats[spec["name"]] = render_sheet(wb, spec, frames.get(spec["name"]), masks, highlights)
+    with span(timer, "save"):
+        wb.save(target)
+    return stats
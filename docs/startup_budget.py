@@ -0,0 +1,112 @@
+#!/opt/venv/bin/python3
+"""
+Cold-start budget check for process_invoice.py
+
+Every n8n job starts a fresh interpreter, so import time is paid per job.
+process_invoice.py imports its heavy dependencies (pandas, pdfplumber,
+openpyxl, xlrd) only in the stage that needs them; this script keeps it that way.
+
+Checks, each in a fresh interpreter:
+1. `python -X importtime -c "import process_invoice"`: total import time must
+   stay within --import-budget-ms and none of HEAVY_MODULES may be imported.
+2. Wall time of the usage-error path (`python process_invoice.py`, no args),
+   best of --runs, must stay within --usage-budget-ms.
+
+USAGE:
+   python startup_budget.py
+   python startup_budget.py --import-budget-ms 100 --usage-budget-ms 250 --top 15
+Exits with 1 when a budget is exceeded.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+DOCS_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPT = os.path.join(DOCS_DIR, "process_invoice.py")
+
+# Modules that must not load just by importing process_invoice
+HEAVY_MODULES = ['pandas', 'numpy', 'openpyxl', 'pdfplumber', 'pdfminer', 'xlrd']
+
+
+def measure_imports(module="process_invoice"):
+    """
+    Imports module in a fresh interpreter with -X importtime.
+    Returns {"total_ms": ..., "modules": {name: cumulative ms}} (top-level package names).
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=DOCS_DIR, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{proc.stderr}")
+
+    modules = {}
+    total_ms = 0.0
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        cumulative_ms = int(cumulative) / 1000.0
+        if not name.startswith("  "):  # top-level import (no nesting indent)
+            total_ms += cumulative_ms
+        modules[name.strip()] = cumulative_ms
+    return {"total_ms": total_ms, "modules": modules}
+
+
+def measure_usage_path(runs=5):
+    """Best wall time (ms) of `python process_invoice.py` without arguments (usage error)."""
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, SCRIPT], cwd=DOCS_DIR, capture_output=True)
+        elapsed = (time.perf_counter() - start) * 1000.0
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def heavy_modules_loaded(modules):
+    return [name for name in modules if name.split('.')[0] in HEAVY_MODULES]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start budget check for process_invoice.py")
+    parser.add_argument("--import-budget-ms", type=float, default=150.0)
+    parser.add_argument("--usage-budget-ms", type=float, default=300.0)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to list")
+    args = parser.parse_args()
+
+    failures = []
+
+    print("--- Import time (python -X importtime -c 'import process_invoice') ---")
+    imports = measure_imports()
+    slowest = sorted(imports["modules"].items(), key=lambda item: -item[1])[:args.top]
+    for name, ms in slowest:
+        print(f"  {ms:8.1f} ms  {name}")
+    print(f"  -> Total: {imports['total_ms']:.1f} ms (budget {args.import_budget_ms:.0f} ms)")
+    if imports["total_ms"] > args.import_budget_ms:
+        failures.append(f"import time {imports['total_ms']:.1f} ms > {args.import_budget_ms:.0f} ms")
+
+    heavy = heavy_modules_loaded(imports["modules"])
+    if heavy:
+        print(f"  -> Heavy modules imported at module level: {', '.join(sorted(heavy)[:10])}")
+        failures.append("heavy modules imported at module level")
+
+    print("--- Usage-error path (python process_invoice.py) ---")
+    usage_ms = measure_usage_path(args.runs)
+    print(f"  -> Best of {args.runs}: {usage_ms:.1f} ms (budget {args.usage_budget_ms:.0f} ms)")
+    if usage_ms > args.usage_budget_ms:
+        failures.append(f"usage path {usage_ms:.1f} ms > {args.usage_budget_ms:.0f} ms")
+
+    if failures:
+        print(f"Cold-start budget exceeded: {'; '.join(failures)}")
+        sys.exit(1)
+    print("Cold-start budget OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/opt/venv/bin/python3
+"""
+Local stand-in for Supabase Storage and the app's n8n callbacks, for
+running webhook_runner.py without a Supabase project.
+
+Serves (HTTP/1.1, keep-alive):
+   GET  /storage/v1/object/<bucket>/<path>   file under <root>/<bucket>/<path>
+   POST /storage/v1/object/<bucket>/<path>   stores the request body there
+   POST /callbacks/<name>                    appends the JSON body to <root>/callbacks.jsonl
+Requests without "Authorization: Bearer <key>" are refused (401) when --key is set.
+
+USAGE:
+   python storage_standin.py --root /tmp/storage --port 54321 [--key test-key]
+   SUPABASE_URL=http://127.0.0.1:54321 SUPABASE_SERVICE_ROLE_KEY=test-key \\
+       python webhook_runner.py payload.json
+   with callback_urls pointing at http://127.0.0.1:54321/callbacks/status etc.
+"""
+
+import argparse
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+OBJECT_PREFIX = "/storage/v1/object/"
+CALLBACK_PREFIX = "/callbacks/"
+
+
+def make_handler(root, key=None, stats=None):
+    """Request handler class serving root. stats (dict) counts connections and requests."""
+    stats = stats if stats is not None else {}
+    lock = threading.Lock()
+
+    def count(name):
+        with lock:
+            stats[name] = stats.get(name, 0) + 1
+
+    class StandinHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real storage API
+
+        def setup(self):
+            super().setup()
+            count("connections")
+
+        def log_message(self, format, *args):
+            pass
+
+        def _reply(self, status, body=b'', content_type="application/json"):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _object_path(self):
+            relative = unquote(self.path[len(OBJECT_PREFIX):].split('?')[0])
+            path = os.path.normpath(os.path.join(root, relative))
+            if not path.startswith(os.path.abspath(root) + os.sep):
+                return None
+            return path
+
+        def _authorized(self):
+            return not key or self.headers.get("Authorization") == f"Bearer {key}"
+
+        def do_GET(self):
+            count("requests")
+            if not self.path.startswith(OBJECT_PREFIX):
+                return self._reply(404, b'{"error": "not found"}')
+            if not self._authorized():
+                return self._reply(401, b'{"error": "unauthorized"}')
+            path = self._object_path()
+            if path is None or not os.path.isfile(path):
+                return self._reply(404, b'{"error": "Object not found"}')
+            with open(path, 'rb') as f:
+                self._reply(200, f.read(), "application/octet-stream")
+
+        def do_POST(self):
+            count("requests")
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if self.path.startswith(CALLBACK_PREFIX):
+                entry = {"callback": self.path[len(CALLBACK_PREFIX):], "body": json.loads(body or b'null')}
+                with lock, open(os.path.join(root, "callbacks.jsonl"), 'a') as f:
+                    f.write(json.dumps(entry) + "\n")
+                return self._reply(200, b'{"ok": true}')
+            if not self.path.startswith(OBJECT_PREFIX):
+                return self._reply(404, b'{"error": "not found"}')
+            if not self._authorized():
+                return self._reply(401, b'{"error": "unauthorized"}')
+            path = self._object_path()
+            if path is None:
+                return self._reply(400, b'{"error": "invalid path"}')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(body)
+            self._reply(200, json.dumps({"Key": self.path[len(OBJECT_PREFIX):]}).encode('utf-8'))
+
+    return StandinHandler
+
+
+def read_callbacks(root):
+    """Callbacks received so far, in order."""
+    path = os.path.join(root, "callbacks.jsonl")
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def start_standin(root, port=0, key=None, stats=None):
+    """Starts the stand-in in a background thread. Returns the server (server.server_port)."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(root, key, stats))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Supabase Storage / callback stand-in")
+    parser.add_argument("--root", required=True, help="Directory holding <bucket>/<path> objects")
+    parser.add_argument("--port", type=int, default=54321)
+    parser.add_argument("--key", help="Required bearer token")
+    args = parser.parse_args()
+
+    os.makedirs(args.root, exist_ok=True)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(args.root, args.key))
+    print(f"Storage stand-in serving {args.root} on http://127.0.0.1:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
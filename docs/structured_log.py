@@ -0,0 +1,108 @@
+"""
+Leveled, structured logging for the reconciliation engine (process_invoice.py
+and the modules it uses).
+
+process_files used to print() every page, record and stage to stdout, and n8n
+stored all of it with each execution. Messages now go through the
+"reconciler" logger to stderr, one JSON object per line:
+
+   {"ts": "2026-10-19T08:15:02.113Z", "level": "warning", "logger": "reconciler.process_invoice",
+    "msg": "Could not read Excel file: ...", "job_id": "wf123"}
+
+LEVELS (N8N_LOG_LEVEL, default WARNING: a normal job logs nothing):
+   DEBUG    per-page and per-record detail, DataFrame memory report, AWB matching analysis
+   INFO     one line per stage (report read, merge, workbook written, ...)
+   WARNING  skipped pages, unreadable or incomplete reports
+   ERROR    failed jobs
+
+FORMATS (N8N_LOG_FORMAT): json (default) or text (the plain message, as the
+old print output looked).
+
+Messages use %-style arguments (log.debug("page %s", n)), so a disabled level
+costs one isEnabledFor check and no string formatting. Expensive debug-only
+work is guarded with log.isEnabledFor(logging.DEBUG).
+
+The handler writes to whatever sys.stderr is when a record is emitted, so
+redirect_stderr() in batch.py and reconciler_daemon.py still captures it.
+"""
+
+import datetime
+import json
+import logging
+import os
+import sys
+
+ROOT_LOGGER = "reconciler"
+DEFAULT_LEVEL = "WARNING"
+DEFAULT_FORMAT = "json"
+
+# Attributes every LogRecord has; anything else came in through extra={...}
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def get_logger(name):
+    """Logger of an engine module, e.g. get_logger("process_invoice")."""
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: ts, level, logger, msg, extra fields and job fields."""
+
+    def __init__(self, fields=None):
+        super().__init__()
+        self.fields = fields or {}
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc)
+                  .isoformat(timespec="milliseconds").replace("+00:00", "Z"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        entry.update(self.fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class StderrHandler(logging.StreamHandler):
+    """Writes to the current sys.stderr (not the one at setup time)."""
+
+    def __init__(self):
+        super().__init__(sys.stderr)
+
+    @property
+    def stream(self):
+        return sys.stderr
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+def configure_logging(level=None, fmt=None, **fields):
+    """
+    Sets up the "reconciler" logger (replacing an earlier setup).
+    level/fmt default to N8N_LOG_LEVEL / N8N_LOG_FORMAT; fields (e.g. job_id)
+    are added to every JSON line. Returns the logger.
+    """
+    level = (level or os.environ.get('N8N_LOG_LEVEL') or DEFAULT_LEVEL).upper()
+    fmt = (fmt or os.environ.get('N8N_LOG_FORMAT') or DEFAULT_FORMAT).lower()
+    logger = logging.getLogger(ROOT_LOGGER)
+    for handler in list(logger.handlers):
+        if isinstance(handler, StderrHandler):
+            logger.removeHandler(handler)
+    handler = StderrHandler()
+    if fmt == "text":
+        handler.setFormatter(logging.Formatter("%(message)s"))
+    else:
+        handler.setFormatter(JsonFormatter({key: value for key, value in fields.items() if value is not None}))
+    logger.addHandler(handler)
+    numeric_level = logging.getLevelName(level)  # int for a known level name
+    logger.setLevel(numeric_level if isinstance(numeric_level, int) else logging.WARNING)
+    logger.propagate = False
+    return logger
@@ -0,0 +1,406 @@
+"""
+Synthetic FlyDubai invoices and AllDataReport files for scale testing.
+
+The only realistic inputs are the customer fixtures in nextjs/tests/fixtures
+(one 10-page invoice, ~650 report rows). This generator writes inputs of any
+size with the same layout, so every stage can be benchmarked from 100 to
+100,000 AWBs without customer data:
+
+   python synthetic_inputs.py --awbs 10000 --cca 20 --mismatch-rate 0.05 --out /tmp/synth
+
+writes into --out:
+
+   synthetic-10000.pdf                     invoice: cover page, Section A AWB pages,
+                                           Section B CCA page, Section D summary page
+   AllDataReport_synthetic-10000.xlsx      report: header on row 8, the 33 report columns
+   synthetic-10000.manifest.json           what process_invoice.py should find
+
+OPTIONS:
+   --awbs N             AWB lines on the invoice (default 100)
+   --pages M            Section A pages (default: AWBS_PER_PAGE lines per page)
+   --cca N              CCA entries (default 3, at most CCA_PER_PAGE: the engine reads one CCA page)
+   --mismatch-rate R    share of invoice AWBs the report disagrees with (default 0.05)
+   --duplicate-rate R   share of report rows repeated (identical copies; the engine drops them)
+   --extra-rate R       report-only AWBs, as a share of --awbs (the real report covers more flights)
+   --report-format F    xlsx (default) or xls (needs xlwt; at most 65,535 rows)
+   --seed N             same seed and options -> same files
+
+LAYOUT (what process_invoice.py parses):
+- AWB lines match AWB_LINE_REGEX after whitespace runs are collapsed:
+  "141 5295292 2 TLV VKO 841.00K 6585.03 5.00 0.00 0.00 0.00 4062.03 0.00 0.00 0.00 2528.00 1.00000000 2528.00"
+  followed by "01JAN25 3.00 I" (flight date, net yield rate).
+- CCA entries match CCA_BLOCK_REGEX: "71657 141 5289585 0 TLV PP PP (1268.46) ..." then "09JAN VKO".
+- Amounts follow the fixture: net due = charge weight x rate + 5.00 doc fee,
+  and the report's total_cost equals the invoice net due for a matching AWB.
+
+MANIFEST: awbs, cca, pages, report_rows, duplicates, extra_rows, the
+mismatches as generated (one of charge_weight, net_yield_rate, net_due,
+missing_in_report per mismatched AWB), the mismatched AWB keys
+("141-52952922"), total_net_due, and "expected": the "rows" and
+"discrepancies" objects the result JSON (result_json.py) should hold.
+
+Only the standard library and openpyxl are used; the PDF is written directly
+(Courier text, Flate-compressed page streams).
+"""
+
+import argparse
+import datetime
+import json
+import math
+import os
+import random
+import zlib
+
+AWB_PREFIX = "141"
+ORIGIN = "TLV"
+DESTINATIONS = ["VKO", "DXB", "MSQ", "BEG", "KBP", "TBS", "SVX", "BUD", "OTP", "SOF"]
+RATES = [1.30, 1.90, 2.40, 2.80, 3.00, 3.20]
+DOC_FEE = 5.00
+AWBS_PER_PAGE = 30
+CCA_PER_PAGE = 25
+AGENT = "SYNTHETIC CARGO AGENCIES LTD-TLV(CGO)"
+MISMATCH_CATEGORIES = ["charge_weight", "net_yield_rate", "net_due", "missing_in_report"]
+
+# AllDataReport layout: 7 blank rows, the header on row 8 (names carry the report's stray spaces)
+REPORT_HEADER_ROW = 8
+REPORT_HEADER = [
+    " airline", " awbno", " awbprefix", " awbsuffix", " bookingdate", " flightdate", " destination",
+    " companyname", " product", " pieces", " grosswt", " chargewt", " freightcharges", " othercharges",
+    " frt_cost_rate", " frt_cost_amt", " fuel", " interline/msc", " doc fee", " ins/avi (buy)", " dip mail",
+    " dgr/dgr interline (buy)", " total_cost", " frt_sold_rate", " frt_sold_amt", " consol/other/awb fee?",
+    " ins/avi (sell) & other", " dgr (sell)", " total_sold", " profit_margin", " profit_percent", " status",
+    " flightno ",
+]
+XLS_MAX_ROWS = 65536
+
+# --- Page geometry (landscape A4-ish, like the fixture) ---
+PAGE_WIDTH = 792
+PAGE_HEIGHT = 576
+FONT_SIZE = 6
+LEADING = 7.5
+MARGIN_LEFT = 20
+MARGIN_TOP = 30
+
+
+def check_digit(serial):
+    """IATA AWB check digit: the 7-digit serial modulo 7."""
+    return int(serial) % 7
+
+
+def new_dataset(awbs=100, pages=None, cca=3, mismatch_rate=0.05, duplicate_rate=0.01, extra_rate=0.1,
+                seed=0, period_start=datetime.date(2025, 1, 1), period_days=15):
+    """
+    The invoice and report content as plain rows (no files written):
+    {"awbs": [...], "cca": [...], "report_rows": [...], "pages": [[awb rows of page 2], ...],
+     "period": (first, last), "manifest": {...}}.
+    """
+    if awbs < 1:
+        raise ValueError("awbs must be at least 1")
+    if not 0 <= cca <= CCA_PER_PAGE:
+        raise ValueError(f"cca must be between 0 and {CCA_PER_PAGE} (the engine reads a single CCA page)")
+    pages = pages or math.ceil(awbs / AWBS_PER_PAGE)
+    if not 1 <= pages <= awbs:
+        raise ValueError("pages must be between 1 and the number of AWBs")
+    rng = random.Random(seed)
+    period_end = period_start + datetime.timedelta(days=period_days - 1)
+
+    # --- Invoice AWB lines (serials ascending, dates non-decreasing, like the real invoice) ---
+    serial = rng.randint(5000000, 5500000)
+    offsets = sorted(rng.randrange(period_days) for _ in range(awbs))
+    rows = []
+    for offset in offsets:
+        serial += rng.randint(1, 3)
+        weight = round(rng.choice([rng.uniform(10, 200), rng.uniform(200, 1500)]) * 2) / 2
+        rate = rng.choice(RATES)
+        net_due = round(weight * rate + DOC_FEE, 2)
+        freight = round(weight * (rate + rng.uniform(2.0, 5.0)), 2)
+        rows.append({
+            "serial": f"{serial:07d}", "check": check_digit(serial),
+            "destination": rng.choice(DESTINATIONS),
+            "flight_date": period_start + datetime.timedelta(days=offset),
+            "weight": weight, "rate": rate, "freight": freight,
+            "discount": round(freight + DOC_FEE - net_due, 2), "net_due": net_due,
+        })
+
+    # --- Report rows: one per invoice AWB, some disagreeing, plus report-only and duplicate rows ---
+    mismatched = rng.sample(range(awbs), round(awbs * mismatch_rate))
+    categories = {index: MISMATCH_CATEGORIES[n % len(MISMATCH_CATEGORIES)] for n, index in enumerate(mismatched)}
+    report_rows = []
+    for index, row in enumerate(rows):
+        category = categories.get(index)
+        if category == "missing_in_report":
+            continue
+        report = _report_row(rng, row)
+        if category == "charge_weight":
+            report["chargewt"] = row["weight"] + rng.choice([0.5, 1.0, 10.0])
+        elif category == "net_yield_rate":
+            report["frt_cost_rate"] = round(row["rate"] + 0.1, 2)
+        elif category == "net_due":
+            report["total_cost"] = round(row["net_due"] + rng.choice([-25.0, 12.5, 100.0]), 2)
+        report_rows.append(report)
+    for _ in range(round(awbs * extra_rate)):
+        serial += rng.randint(1, 3)
+        report_rows.append(_report_row(rng, {
+            "serial": f"{serial:07d}", "check": check_digit(serial), "destination": rng.choice(DESTINATIONS),
+            "flight_date": period_start + datetime.timedelta(days=rng.randrange(period_days)),
+            "weight": round(rng.uniform(10, 800) * 2) / 2, "rate": rng.choice(RATES),
+        }))
+    duplicates = [dict(report) for report in rng.sample(report_rows, round(len(report_rows) * duplicate_rate))]
+    report_rows.extend(duplicates)
+    rng.shuffle(report_rows)
+
+    # --- CCA entries (corrections of invoice AWBs) ---
+    cca_rows = []
+    ref = rng.randint(70000, 79000)
+    for row in sorted(rng.sample(rows, min(cca, awbs)), key=lambda row: row["serial"]):
+        ref += rng.randint(1, 40)
+        amount = rng.choice([0.0, round(rng.uniform(20, 1500), 2)])
+        cca_rows.append({
+            "ref": str(ref), "serial": row["serial"], "check": row["check"], "destination": row["destination"],
+            "issue_date": row["flight_date"] + datetime.timedelta(days=rng.randint(1, 5)),
+            "freight": -amount, "due_airline": -DOC_FEE if amount else 0.0,
+            "discount": -round(amount * 0.54, 2), "net_due": -round(amount - amount * 0.54, 2) if amount else 0.0,
+        })
+
+    per_page = math.ceil(awbs / pages)
+    counts = {category: 0 for category in MISMATCH_CATEGORIES}
+    for category in categories.values():
+        counts[category] += 1
+    manifest = {
+        "seed": seed, "awbs": awbs, "cca": len(cca_rows), "pages": pages + 2 + (1 if cca_rows else 0),
+        "awb_pages": pages, "report_rows": len(report_rows), "duplicates": len(duplicates),
+        "extra_rows": round(awbs * extra_rate), "mismatches": counts,
+        "mismatched_awbs": sorted(f"{AWB_PREFIX}-{rows[index]['serial']}{rows[index]['check']}" for index in categories),
+        "total_net_due": round(sum(row["net_due"] for row in rows), 2),
+    }
+    # As in the result JSON: an AWB missing from the report also differs in weight and rate
+    missing = counts["missing_in_report"]
+    manifest["expected"] = {
+        "rows": {"invoices": awbs, "cca": len(cca_rows)},
+        "discrepancies": {"charge_weight": counts["charge_weight"] + missing,
+                          "net_yield_rate": counts["net_yield_rate"] + missing,
+                          "net_due": counts["net_due"], "missing_in_report": missing, "total": len(categories)},
+    }
+    return {
+        "awbs": rows, "cca": cca_rows, "report_rows": report_rows, "period": (period_start, period_end),
+        "pages": [rows[start:start + per_page] for start in range(0, awbs, per_page)], "manifest": manifest,
+    }
+
+
+def _report_row(rng, row):
+    weight, rate = row["weight"], row["rate"]
+    cost = round(weight * rate, 2)
+    sold_rate = round(rate + rng.uniform(0.2, 1.5), 2)
+    sold = round(weight * sold_rate + 12.5, 2)
+    total_cost = round(cost + DOC_FEE, 2)
+    return {
+        "airline": "FZ", "awbno": int(f"{AWB_PREFIX}{row['serial']}{row['check']}"), "awbprefix": int(AWB_PREFIX),
+        "awbsuffix": int(f"{row['serial']}{row['check']}"),
+        "bookingdate": (row["flight_date"] - datetime.timedelta(days=rng.randint(0, 10))).strftime("%d/%m/%Y"),
+        "flightdate": row["flight_date"].strftime("%d/%m/%Y"), "destination": row["destination"],
+        "companyname": rng.choice(["CARGO LOGISTICS SOLUTIONS LTD", "GLOBAL FREIGHT FORWARDING LTD", "EXPRESS AIR CARGO LTD"]),
+        "product": "General Cargo", "pieces": rng.randint(1, 60), "grosswt": math.floor(weight),
+        "chargewt": weight, "freightcharges": "P", "othercharges": "P", "frt_cost_rate": rate,
+        "frt_cost_amt": cost, "fuel": 0.0, "interline/msc": 0, "doc fee": DOC_FEE, "ins/avi (buy)": 0.0,
+        "dip mail": 0.0, "dgr/dgr interline (buy)": 0.0, "total_cost": total_cost, "frt_sold_rate": sold_rate,
+        "frt_sold_amt": round(weight * sold_rate, 2), "consol/other/awb fee?": 12.5, "ins/avi (sell) & other": 0,
+        "dgr (sell)": 0, "total_sold": sold, "profit_margin": round(sold - total_cost, 2),
+        "profit_percent": round((sold - total_cost) / total_cost, 6) if total_cost else 0.0,
+        "status": "Invoice Printed", "flightno": rng.choice([1212, 1550, 1214, 1782]),
+    }
+
+
+# --- Invoice text (one list of lines per page) ---
+
+def _amount(value):
+    """Invoice amount: 2 decimals, no thousands separator (the parser reads ',' as '.')."""
+    return f"{value:.2f}"
+
+
+def _cca_amount(value):
+    """CCA amount: negatives in parentheses, like "(1268.46)"."""
+    return f"({-value:.2f})" if value < 0 else f"{value:.2f}"
+
+
+def _date(day):
+    return day.strftime("%d-%b-%Y")
+
+
+def invoice_pages(dataset):
+    """The invoice as text lines per page (cover, Section A pages, Section B, Section D)."""
+    first, last = dataset["period"]
+    manifest = dataset["manifest"]
+    section_b = sum(row["net_due"] for row in dataset["cca"])
+    total = manifest["total_net_due"] + section_b
+    doc_ref = f"{manifest['seed'] % 1000000:06d} /25-25"
+    period = [f"{'Period From ' + _date(first):>120}", f"{'Period To ' + _date(last):>120}",
+              f"{'Doc. Ref.: ' + doc_ref:>120}"]
+
+    pages = [[
+        f"{'INVOICE':>100}", "", f"{'TEL AVIV YAFO':>60}", f"{'ISRAEL':>56}",
+        f"  {AGENT:<84}Page : 1", f"  {'':<84}Doc. Ref. : {doc_ref}", f"  {'':<84}Date : {_date(last)}",
+        "", f"  Please note that we have DEBITED your account with USD {total:.2f}", "  as detailed below :",
+        f"  {'P A R T I C U L A R S':<100}Amount",
+        f"  {'Export Sales Billing for the Period ' + _date(first) + '/ ' + _date(last):<100}{total:.2f}",
+    ]]
+
+    header = [
+        "Section A:AWB Details", *period, f"Invoice To: {AGENT}",
+        "                 Pre-Paid          Charges Collect",
+        "AWB No. Org Charge Weight Freight Due Airline Freight Due Agent Due Airline Disc. Agency Taxes Others "
+        "Net Due for Exchange Net Due for",
+        "AWB Date Des Net Rate Yield Comm. AWB ( in Sale Rate AWB ( in Invoice",
+        " Agent Reference :0000000TLV SYNTHETIC",
+    ]
+    for number, rows in enumerate(dataset["pages"], start=2):
+        lines = [f"{'Page ' + str(number):>100}"] + header
+        for row in rows:
+            lines.append(
+                f"{AWB_PREFIX} {row['serial']} {row['check']} {ORIGIN} {row['destination']} {row['weight']:.2f}K "
+                f"{_amount(row['freight'])} {_amount(DOC_FEE)} 0.00   0.00   0.00 {_amount(row['discount'])}  "
+                f"0.00   0.00  0.00   {_amount(row['net_due'])} 1.00000000 {_amount(row['net_due'])}")
+            lines.append(f"{row['flight_date'].strftime('%d%b%y').upper()}           {row['rate']:.2f}"
+                         f"{'I':>80}")
+        pages.append(lines)
+    pages[-1].append(f"Total Net in Billing Currency {manifest['total_net_due']:.2f}")
+
+    if dataset["cca"]:
+        lines = [f"{'Page : ' + str(len(pages) + 1):>100}", "Section B: CCA Details", *period,
+                 f"Invoice To: {AGENT}",
+                 "CCA Ref. No AWB Org Reason for MOP MOP Freight Due Airline Due Agent Disc. Agency Taxes Others "
+                 "Net Due for Exchange Net Due for",
+                 "Des Change Freight Other Charge Comm. AWB ( in Sale Rate AWB ( in", "CCA Issue Date",
+                 " Agent Reference : 0000000TLV SYNTHETIC"]
+        for row in dataset["cca"]:
+            net = _cca_amount(row["net_due"])
+            lines.append(
+                f"{row['ref']} {AWB_PREFIX} {row['serial']} {row['check']} {ORIGIN} PP PP {_cca_amount(row['freight'])} "
+                f"{_cca_amount(row['due_airline'])} 0.00 {_cca_amount(row['discount'])} 0.00 0.00 0.00 {net} 1.00 {net}")
+            lines.append(f"{row['issue_date'].strftime('%d%b').upper()} {row['destination']}")
+        lines.append(f"Total Net in Billing Currency {_cca_amount(section_b)}")
+        pages.append(lines)
+
+    pages.append([
+        f"Section D: Summary{'Page : ' + str(len(pages) + 1):>80}", *period,
+        f"Net Amount for Section A : {manifest['total_net_due']:.2f}",
+        f"Net Amount for Section B : {_cca_amount(section_b)}",
+        "Net Amount for Section C : 0.00", f"Total Net Amount USD {total:.2f}",
+    ])
+    return pages
+
+
+# --- Files ---
+
+def _pdf_string(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path, pages):
+    """Minimal PDF: one Courier text page per list of lines (top to bottom)."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier /Encoding /WinAnsiEncoding >>"]
+    kids = []
+    for lines in pages:
+        content = [f"BT /F1 {FONT_SIZE} Tf {LEADING} TL {MARGIN_LEFT} {PAGE_HEIGHT - MARGIN_TOP} Td"]
+        content += [f"({_pdf_string(line)}) Tj T*" for line in lines]
+        content.append("ET")
+        stream = zlib.compress("\n".join(content).encode("latin-1"))
+        objects.append(b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R "
+                       b"/Resources << /Font << /F1 3 0 R >> >> >>" % (PAGE_WIDTH, PAGE_HEIGHT, len(objects)))
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>".encode("ascii")
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        f.write(b"".join(b"%010d 00000 n \n" % offset for offset in offsets))
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+
+
+def write_report(path, report_rows, report_format="xlsx"):
+    """AllDataReport as "xlsx" (openpyxl) or "xls" (xlwt)."""
+    columns = [name.strip() for name in REPORT_HEADER]
+    if report_format == "xls":
+        if len(report_rows) + REPORT_HEADER_ROW > XLS_MAX_ROWS:
+            raise ValueError(f"{len(report_rows)} rows do not fit an .xls sheet; write .xlsx instead")
+        try:
+            import xlwt
+        except ImportError:
+            raise ValueError("Writing .xls needs the xlwt package; write .xlsx instead") from None
+        book = xlwt.Workbook()
+        sheet = book.add_sheet("AllDataReport")
+        for col, name in enumerate(REPORT_HEADER):
+            sheet.write(REPORT_HEADER_ROW - 1, col, name)
+        for number, report in enumerate(report_rows, start=REPORT_HEADER_ROW):
+            for col, name in enumerate(columns):
+                sheet.write(number, col, report[name])
+        book.save(path)
+        return
+
+    from openpyxl import Workbook
+    book = Workbook(write_only=True)
+    sheet = book.create_sheet("AllDataReport")
+    for _ in range(REPORT_HEADER_ROW - 1):
+        sheet.append([])
+    sheet.append(REPORT_HEADER)
+    for report in report_rows:
+        sheet.append([report[name] for name in columns])
+    book.save(path)
+
+
+def generate(out_dir, name=None, report_format="xlsx", **options):
+    """
+    Writes the invoice PDF, the report and the manifest into out_dir.
+    options go to new_dataset. Returns {"invoice", "report", "manifest"} paths.
+    """
+    from result_json import atomic_path
+
+    dataset = new_dataset(**options)
+    name = name or f"synthetic-{dataset['manifest']['awbs']}"
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {
+        "invoice": os.path.join(out_dir, f"{name}.pdf"),
+        "report": os.path.join(out_dir, f"AllDataReport_{name}.{report_format}"),
+        "manifest": os.path.join(out_dir, f"{name}.manifest.json"),
+    }
+    with atomic_path(paths["invoice"]) as tmp_path:
+        write_pdf(tmp_path, invoice_pages(dataset))
+    with atomic_path(paths["report"]) as tmp_path:
+        write_report(tmp_path, dataset["report_rows"], report_format)
+    with atomic_path(paths["manifest"]) as tmp_path, open(tmp_path, "w") as f:
+        json.dump(dict(dataset["manifest"], invoice=os.path.basename(paths["invoice"]),
+                       report=os.path.basename(paths["report"])), f, indent=2)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic FlyDubai invoice + AllDataReport generator")
+    parser.add_argument("--awbs", type=int, default=100)
+    parser.add_argument("--pages", type=int, default=None, help=f"Section A pages (default: {AWBS_PER_PAGE} AWBs per page)")
+    parser.add_argument("--cca", type=int, default=3)
+    parser.add_argument("--mismatch-rate", type=float, default=0.05)
+    parser.add_argument("--duplicate-rate", type=float, default=0.01)
+    parser.add_argument("--extra-rate", type=float, default=0.1)
+    parser.add_argument("--report-format", choices=["xlsx", "xls"], default="xlsx")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--name", default=None, help="File name stem (default: synthetic-<awbs>)")
+    parser.add_argument("--out", default=".")
+    args = parser.parse_args()
+    try:
+        paths = generate(args.out, name=args.name, report_format=args.report_format, awbs=args.awbs,
+                         pages=args.pages, cca=args.cca, mismatch_rate=args.mismatch_rate,
+                         duplicate_rate=args.duplicate_rate, extra_rate=args.extra_rate, seed=args.seed)
+    except ValueError as e:
+        parser.error(str(e))
+    for kind, path in paths.items():
+        print(f"{kind}: {path}")
+
+
+if __name__ == "__main__":
+    main()
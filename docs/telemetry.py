@@ -0,0 +1,88 @@
+"""
+Stage timing spans for process_files (process_invoice.py).
+
+The job's print() lines say what happened but not how long it took. Stages
+are now wrapped in nestable spans and the durations go into the result JSON:
+
+   "timings": {
+     "total_ms": 1510.2,
+     "stages": {"pdf_open": 3.1, "cca_locate": 220.4, "layout": 160.3, "parse": 5.2,
+                "report_read": 310.0, "normalize": 12.9, "join": 8.1, "summary": 1.2,
+                "sheets": 90.4, "sheets.Summary": 2.0, "sheets.save": 40.7, ...},
+     "items":  [{"span": "layout", "page": 2, "ms": 25.1}, ...]
+   }
+
+SPANS:
+- with span(timer, "join"): ... adds the time spent to stages["join"]; a span
+  opened inside another is recorded as "<outer>.<inner>". Repeated spans add up.
+- begin_span()/end_span() do the same for a stage spread over a long block.
+- Keyword fields (span(timer, "layout", page=2)) also record the single span
+  in items, for per-page charts.
+- timer None makes span() a no-op, like progress=None in progress.py.
+
+time.perf_counter_ns is used throughout; a span costs about a microsecond.
+Hooks (new_timer(hooks=[...])) are called outside the timed interval.
+"""
+
+import time
+from contextlib import contextmanager
+
+
+def new_timer(hooks=None):
+    """
+    hooks: callables hook(event, path, depth) run when a span begins ("begin")
+    and ends ("end"), e.g. profiling.py's per-stage allocation snapshots.
+    """
+    return {"start": time.perf_counter_ns(), "stack": [], "stages": {}, "items": [], "hooks": hooks or []}
+
+
+def begin_span(timer, name, **fields):
+    """Opens a span; close it with end_span(). For stages too long to indent under a with-block."""
+    if timer is None:
+        return
+    path = ".".join([name for name, _, _ in timer["stack"]] + [name])
+    for hook in timer["hooks"]:
+        hook("begin", path, len(timer["stack"]) + 1)
+    timer["stack"].append((name, fields, time.perf_counter_ns()))
+    timer["stages"].setdefault(path, 0)  # stages keep the order they started in
+
+
+def end_span(timer):
+    """Closes the innermost open span and records its duration."""
+    if timer is None:
+        return
+    path = _path(timer)
+    _, fields, start = timer["stack"].pop()
+    elapsed = time.perf_counter_ns() - start
+    timer["stages"][path] += elapsed
+    if fields:
+        timer["items"].append(dict(fields, span=path, ms=_ms(elapsed)))
+    for hook in timer["hooks"]:
+        hook("end", path, len(timer["stack"]) + 1)
+
+
+@contextmanager
+def span(timer, name, **fields):
+    """Times the with-block as stage name (nested under any open span)."""
+    begin_span(timer, name, **fields)
+    try:
+        yield
+    finally:
+        end_span(timer)
+
+
+def _path(timer):
+    return ".".join(name for name, _, _ in timer["stack"])
+
+
+def _ms(ns):
+    return round(ns / 1e6, 3)
+
+
+def timings(timer):
+    """The timings object for the result JSON (durations in milliseconds)."""
+    return {
+        "total_ms": _ms(time.perf_counter_ns() - timer["start"]),
+        "stages": {path: _ms(ns) for path, ns in timer["stages"].items()},
+        "items": list(timer["items"]),
+    }
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Tests for the batch subcommand (batch.py) and its checkpoint journal (journal.py)
+Run with: python -m pytest -q test_batch.py
+"""
+
+import io
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from batch import jobs_from_directory, jobs_from_manifest, run_jobs
+from journal import job_key, load_journal, is_complete, append_entry
+
+
+def touch(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"not a pdf")
+    return str(path)
+
+
+def test_jobs_from_directory_pairs_reports(tmp_path):
+    touch(tmp_path / "jan" / "a.pdf")
+    touch(tmp_path / "jan" / "b.pdf")
+    report = touch(tmp_path / "jan" / "report.xls")
+    touch(tmp_path / "feb" / "c.pdf")
+
+    with pytest.raises(ValueError, match="feb"):
+        jobs_from_directory(str(tmp_path))
+
+    touch(tmp_path / "feb" / "report.xlsx")
+    jobs = jobs_from_directory(str(tmp_path))
+    assert [os.path.basename(job["invoice"]) for job in jobs] == ["c.pdf", "a.pdf", "b.pdf"]
+    assert jobs[1]["report"] == report
+    assert all(job["report"] == "shared.xls" for job in jobs_from_directory(str(tmp_path), "shared.xls"))
+
+
+def test_jobs_from_manifest(tmp_path):
+    (tmp_path / "jobs.csv").write_text("invoice,report,workflow_id\na.pdf,r.xls,wf1\n/abs/b.pdf,r.xls,\n")
+    jobs = jobs_from_manifest(str(tmp_path / "jobs.csv"))
+    assert jobs == [
+        {"invoice": str(tmp_path / "a.pdf"), "report": str(tmp_path / "r.xls"), "workflow_id": "wf1"},
+        {"invoice": "/abs/b.pdf", "report": str(tmp_path / "r.xls")},
+    ]
+
+    (tmp_path / "jobs.jsonl").write_text('{"invoice": "a.pdf"}\n')
+    with pytest.raises(ValueError, match="entry 1"):
+        jobs_from_manifest(str(tmp_path / "jobs.jsonl"))
+
+
+def test_run_jobs_streams_jsonl_and_stats(tmp_path):
+    jobs = [{"invoice": touch(tmp_path / f"{name}.pdf"), "report": str(tmp_path / "r.xls")} for name in "ab"]
+    out = io.StringIO()
+    stats = run_jobs(jobs, 2, out, output_dir=str(tmp_path), log_dir=str(tmp_path))
+
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert sorted(record["invoice"] for record in records) == sorted(job["invoice"] for job in jobs)
+    assert all(not record["success"] and "PDF" in record["error"] for record in records)
+    assert stats["jobs"] == 2 and stats["failed"] == 2 and stats["pages"] == 0
+    assert stats["jobs_per_min"] > 0
+    assert (tmp_path / "a.log").exists()
+
+
+def test_journal_skips_done_work_and_retries_failures(tmp_path):
+    journal_path = str(tmp_path / "journal.jsonl")
+    job = {"invoice": touch(tmp_path / "a.pdf"), "report": touch(tmp_path / "r.xls")}
+    key = job_key(job, {"output_dir": None, "workflow_id": "batch"})
+    append_entry(journal_path, key, "done", 1, {"invoice": job["invoice"], "success": True, "pages": 3})
+    with open(journal_path, 'a') as f:
+        f.write('{"key": "torn')  # interrupted write
+
+    bad = {"invoice": touch(tmp_path / "b.pdf"), "report": job["report"]}
+    out = io.StringIO()
+    stats = run_jobs([job, bad], 1, out, journal_path=journal_path, retries=1, backoff=0.01)
+
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert records[0] == {"invoice": job["invoice"], "success": True, "pages": 3, "skipped": True}
+    assert records[1]["invoice"] == bad["invoice"] and records[1]["attempts"] == 2
+    assert stats["skipped"] == 1 and stats["retried"] == 1 and stats["failed"] == 1
+    entries = load_journal(journal_path)
+    assert entries[key]["status"] == "done"
+    assert len(entries) == 2 and is_complete(entries[key])
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Tests for the engine benchmarks (benchmarks.py)
+Run with: python -m pytest -q test_benchmarks.py
+"""
+
+import os
+import statistics
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from benchmarks import (STAGE_GROUPS, BASELINE_PATH, DEFAULT_MAX_ESTIMATE_ERROR, compare, group_stages,
+                        inaccurate_estimates, load, run_benchmarks)
+
+
+def results(**median_ms):
+    return {"sizes": {"100": {"median_ms": median_ms}}}
+
+
+def test_group_stages():
+    stages = {"pdf_open": 1.0, "cca_locate": 10.0, "layout": 20.0, "parse": 2.0, "cca": 3.0,
+              "normalize": 4.0, "report_read": 50.0, "join": 6.0, "sheets": 30.0, "sheets.Summary": 1.0}
+    assert group_stages(stages, 130.0) == {"extract_awb": 32.0, "extract_cca": 3.0, "report_read": 50.0,
+                                           "merge": 10.0, "excel_write": 30.0, "total": 130.0}
+
+
+def test_compare_flags_only_real_regressions():
+    baseline = results(extract_awb=1000.0, merge=2.0, excel_write=100.0)
+    current = results(extract_awb=1300.0, merge=4.0, excel_write=104.0)
+    rows = {row["stage"]: row for row in compare(baseline, current, threshold=0.15, min_ms=5.0)}
+    assert rows["extract_awb"]["regression"] and rows["extract_awb"]["change"] == 0.3
+    assert not rows["merge"]["regression"]        # +100%, but only 2 ms
+    assert not rows["excel_write"]["regression"]  # within the threshold
+    assert compare(baseline, {"sizes": {"5000": {"median_ms": {"merge": 9.0}}}}) == []
+
+
+def test_run_and_baseline_shape(tmp_path):
+    # 20 and 300 AWBs: 4 and 13 pages, so a page-count-only estimate misses one of them
+    current = run_benchmarks(sizes=[20, 300], repeat=1, data_dir=str(tmp_path))
+    entry = current["sizes"]["20"]
+    assert set(entry["median_ms"]) == set(STAGE_GROUPS) | {"total"}
+    assert entry["median_ms"]["extract_awb"] > 0 and entry["awbs_per_sec"]["total"] > 0
+    assert entry["estimate"]["ms"] > 0 and entry["estimate"]["cost_ms"] < entry["median_ms"]["total"]
+    errors = [abs(entry["estimate"]["error"]) for entry in current["sizes"].values()]
+    assert current["estimate_accuracy"]["mean_abs_error"] == round(statistics.fmean(errors), 4)
+    assert current["estimate_accuracy"]["max_abs_error"] <= DEFAULT_MAX_ESTIMATE_ERROR
+    assert inaccurate_estimates(current) == [] and inaccurate_estimates(current, 0.0001) == ["20", "300"]
+    assert compare(current, current) and not any(row["regression"] for row in compare(current, current))
+
+    baseline = load(BASELINE_PATH)
+    assert set(baseline["sizes"]["100"]["median_ms"]) == set(entry["median_ms"])
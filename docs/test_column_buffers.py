@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Tests for the typed column buffers used by the PDF extractors
+(column_buffers.py, parse_awb_lines / parse_cca_text in process_invoice.py)
+Run with: python -m pytest -q test_column_buffers.py
+"""
+
+import math
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from column_buffers import (new_buffers, append_float, append_category, append_text, buffers_to_frame,
+                            apply_dtypes, memory_report)
+from process_invoice import parse_awb_lines, parse_cca_text
+
+
+AWB_LINES = [
+    '141 5295292 2 TLV VKO 841.00K 6585.03 5.00 0.00  0.00   0.00 4062.03  0.00   0.00  0.00   2528.00 1.00000000 2528.00',
+    '01JAN25           3.00                                                                                     I ',
+    'not an AWB line',
+    '141 5295293 3 TLV DXB 12.50 K 80.00 5.00 0.00  0.00   0.00 0.00  0.00   0.00  0.00   85.00 1.00000000 85.00',
+    '02JAN25           6.80',
+]
+
+CCA_TEXT = (
+    "Section B: CCA Details\n"
+    "71657 141 5289585 0 TLV PP PP (1268.46) (5.00) 0.00 (685.26 ) 0.00 0.00 0.00 (588.20) 1.00 (588.20)\n"
+    "09JAN VKO\n"
+)
+
+
+def test_buffers_to_frame_types():
+    buffers = new_buffers([("Name", 'str'), ("City", 'category'), ("Amount", 'float')])
+    for name, city, amount in [("a", "TLV", 1.5), ("b", "DXB", 2.0), ("c", "TLV", "n/a")]:
+        append_text(buffers["Name"], name)
+        append_category(buffers["City"], city)
+        append_float(buffers["Amount"], amount)
+
+    df = buffers_to_frame(buffers)
+    assert list(df.columns) == ["Name", "City", "Amount"]
+    assert df["City"].dtype == 'category'
+    assert list(df["City"]) == ["TLV", "DXB", "TLV"]
+    # An unparsable value is kept as-is and the column falls back to object
+    assert df["Amount"].dtype == object
+    assert list(df["Amount"]) == [1.5, 2.0, "n/a"]
+
+
+def test_empty_buffers_give_empty_frame():
+    assert buffers_to_frame(new_buffers([("Amount", 'float')])).empty
+
+
+def test_parse_awb_lines():
+    df = parse_awb_lines(AWB_LINES)
+    assert len(df) == 2
+    assert df["Charge Weight"].tolist() == [841.0, 12.5]
+    assert df["Net Yield Rate"].tolist() == [3.0, 6.8]
+    assert df["Net Due for AWB"].dtype == 'float64'
+    assert df["Exchange Rate"].dtype == 'category'
+    assert list(df["Destination"]) == ["VKO", "DXB"]
+    assert df["AWB Number"].tolist() == ["141 5295292 2", "141 5295293 3"]
+
+
+def test_parse_cca_text():
+    df = parse_cca_text(CCA_TEXT)
+    assert df["CCA Ref. No"].tolist() == ["71657", "Total"]
+    assert df["AWB Serial"][0] == "52895850"
+    assert df["Freight Charge"][0] == -1268.46
+    assert math.isclose(df["Net Due for AWB (Sale Currency)"][1], -588.20)
+
+
+def test_apply_dtypes_and_memory_report():
+    df = pd.DataFrame({
+        'AWB Prefix': ['141'] * 100,
+        'AWB Serial': [str(52900000 + i) for i in range(100)],
+        'Net Due (Report)': ['85.00'] * 99 + ['-'],
+    })
+    before = memory_report({"Report": df})["Report"]
+    apply_dtypes(df, {'AWB Prefix': 'category', 'AWB Serial': 'string', 'Net Due (Report)': 'float'})
+
+    assert df['AWB Prefix'].dtype == 'category'
+    assert df['Net Due (Report)'].dtype == 'float64'
+    assert df['Net Due (Report)'].isna().sum() == 1
+    after = memory_report({"Report": df, "Empty": pd.DataFrame()})
+    assert after["Empty"] == 0
+    assert after["Report"] < before
+
+
+def merge_key_dtypes(tmp_path, monkeypatch):
+    """AWB key dtypes (left, right) at the reconciliation merge of a synthetic job."""
+    from process_invoice import process_files, AWB_KEY_DTYPES
+    from synthetic_inputs import generate
+
+    merges = []
+    real_merge = pd.merge
+
+    def recording_merge(left, right, *args, **kwargs):
+        merges.append({key: (left[key].dtype, right[key].dtype) for key in AWB_KEY_DTYPES})
+        return real_merge(left, right, *args, **kwargs)
+
+    monkeypatch.setattr(pd, "merge", recording_merge)
+    paths = generate(str(tmp_path), awbs=30, cca=1, seed=5)
+    details = {}
+    process_files(paths["invoice"], paths["report"], details=details, output_dir=str(tmp_path))
+    assert details["rows"]["invoices"] == 30
+    [dtypes] = merges
+    return dtypes
+
+
+def test_merge_keys_keep_their_dtypes(tmp_path, monkeypatch):
+    dtypes = merge_key_dtypes(tmp_path, monkeypatch)
+    left_prefix, right_prefix = dtypes['AWB Prefix']
+    assert left_prefix == right_prefix and isinstance(left_prefix, pd.CategoricalDtype)
+    left_serial, right_serial = dtypes['AWB Serial']
+    assert left_serial == right_serial and left_serial != object
+
+
+def test_awb_serial_is_arrow_backed(tmp_path, monkeypatch):
+    pytest.importorskip("pyarrow")  # optional: without it serials keep pandas' default string dtype
+    assert merge_key_dtypes(tmp_path, monkeypatch)['AWB Serial'] == (pd.StringDtype("pyarrow"),) * 2
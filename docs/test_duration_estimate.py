@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Tests for the processing-time estimate (duration_estimate.py)
+Run with: python -m pytest -q test_duration_estimate.py
+"""
+
+import glob
+import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import duration_estimate
+from duration_estimate import DEFAULT_MODEL, STAGES, estimate, fit, input_features, load_samples, predict
+from synthetic_inputs import generate
+from process_invoice import build_result, process_files
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "nextjs", "tests", "fixtures")
+
+
+def sample(pages, awbs, report_rows, report_format="xlsx"):
+    # Stage times from a known linear model (report_read: 0.5 ms/row for xls, 0.05 for xlsx)
+    stages = {"extract_awb": 20.0 + 50.0 * pages + 10.0 * awbs, "extract_cca": 5.0,
+              "report_read": (0.5 if report_format == "xls" else 0.05) * report_rows,
+              "merge": 10.0 + 0.01 * (awbs + report_rows), "excel_write": 40.0 + 0.2 * awbs, "other": 30.0}
+    return {"pages": pages, "awbs": awbs, "report_rows": report_rows, "report_format": report_format,
+            "stages": stages, "total_ms": sum(stages.values())}
+
+
+def test_input_features_match_the_engine(tmp_path):
+    synthetic = generate(str(tmp_path), awbs=40, cca=2, seed=3)
+    fixture = {"invoice": glob.glob(os.path.join(FIXTURES, "*.pdf"))[0],
+               "report": glob.glob(os.path.join(FIXTURES, "*.xls"))[0]}
+    for paths, report_format in ((synthetic, "xlsx"), (fixture, "xls")):
+        details = {}
+        process_files(paths["invoice"], paths["report"], details=details, output_dir=str(tmp_path))
+        features = input_features(paths["invoice"], paths["report"])
+        assert features == {"pages": details["pages"], "awbs": details["rows"]["invoices"],
+                            "report_rows": details["report_rows"], "report_format": report_format}
+        assert details["report_format"] == report_format
+    assert input_features(synthetic["invoice"], str(tmp_path / "missing.xls"))["report_rows"] == 0
+    assert estimate(fixture["invoice"], fixture["report"]) > 0
+
+
+def test_fit_recovers_the_cost_model():
+    # Sparse and dense invoices: AWBs per page from 2 to 30
+    samples = [sample(pages, awbs, rows, report_format)
+               for pages, awbs, rows, report_format in ((2, 4, 100, "xlsx"), (10, 300, 400, "xlsx"),
+                                                        (40, 200, 900, "xlsx"), (8, 240, 600, "xls"),
+                                                        (20, 100, 1200, "xls"))]
+    model = fit(samples)
+    assert model["awbs_per_page"] == 10.55 and model["records"] == 5
+    assert model["stages"]["extract_awb"] == {"intercept_ms": 20.0, "ms_per": {"awbs": 10.0, "pages": 50.0}}
+    assert model["stages"]["report_read.xls"]["ms_per"] == {"report_rows": 0.5}
+    assert model["stages"]["report_read.xlsx"]["ms_per"] == {"report_rows": 0.05}
+    assert model["stages"]["other"] == {"intercept_ms": 30.0, "ms_per": {}}  # no slope: the mean
+    assert model["accuracy"]["max_abs_error"] < 0.001
+
+    new = sample(100, 2500, 2000, "xls")
+    prediction = predict(model, new)
+    assert set(prediction["stages"]) == set(STAGES)
+    assert abs(prediction["estimate_ms"] - new["total_ms"]) < 0.01
+    assert predict(model, dict(new, report_rows=0))["stages"]["report_read"] == 0.0  # no report
+    # AWBs not countable: predicted from the page count
+    assert predict(model, dict(new, awbs=None))["awbs"] == 1055.0
+
+    # All jobs at one density: pages and AWBs are collinear, the preferred driver is kept
+    same_density = fit([sample(pages, pages * 5, 100) for pages in (2, 10, 40)])
+    assert same_density["stages"]["extract_awb"]["ms_per"].keys() == {"awbs"}
+    assert same_density["accuracy"]["max_abs_error"] < 0.001
+
+
+def test_load_samples_from_recorded_jobs(tmp_path):
+    details = {"pages": 10, "rows": {"invoices": 54, "cca": 3}, "report_rows": 648, "report_format": "xls",
+               "timings": {"total_ms": 1000.0, "stages": {"cca_locate": 400.0, "layout": 100.0, "parse": 5.0,
+                                                          "report_read": 300.0, "sheets": 50.0,
+                                                          "sheets.Summary": 3.0}}}
+    result_path = tmp_path / "result.json"
+    result_path.write_text(json.dumps(build_result("/files/out.xlsx", details)))
+    batch_path = tmp_path / "batch.jsonl"
+    with open(batch_path, "w") as f:
+        for record in (dict(details, success=True), dict(details, success=True, skipped=True),
+                       {"success": False, "error": "No data found in PDF files"}):
+            f.write(json.dumps(record) + "\n")
+        f.write(json.dumps({"key": "k", "status": "done", "attempt": 1, "record": dict(details, success=True)}) + "\n")
+
+    samples = load_samples([str(result_path), str(batch_path)])
+    assert len(samples) == 3
+    assert samples[0]["stages"]["extract_awb"] == 505.0 and samples[0]["stages"]["other"] == 145.0
+    assert samples[0]["awbs"] == 54 and samples[0]["report_format"] == "xls"
+    assert fit(samples)["accuracy"]["samples"] == 3
+    assert DEFAULT_MODEL["stages"].keys() >= set(STAGES)
+
+
+def test_fit_command_without_durations(tmp_path, monkeypatch, capsys):
+    details = {"pages": 10, "rows": {"invoices": 54}, "report_rows": 648, "report_format": "xls",
+               "timings": {"total_ms": 0.0, "stages": {"layout": 0.0}}}
+    records = tmp_path / "batch.jsonl"
+    records.write_text(json.dumps(dict(details, success=True)) + "\n")
+    monkeypatch.setattr(sys, "argv", ["duration_estimate.py", "fit", str(records)])
+    duration_estimate.main()
+    output = capsys.readouterr()
+    assert "none with a recorded duration" in output.err
+    assert json.loads(output.out)["accuracy"]["mean_abs_error"] is None
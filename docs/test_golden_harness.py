@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Tests for the golden-output equivalence harness (golden_harness.py)
+Run with: python -m pytest -q test_golden_harness.py
+"""
+
+import glob
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from golden_harness import compare_frames, run_cli_engine, run_harness, values_equal
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "nextjs", "tests", "fixtures")
+
+
+def test_values_equal_is_typed():
+    assert values_equal(100.0, 100.004) and not values_equal(100.0, 100.01)
+    assert values_equal(np.float64(2.5), 2.5) and values_equal(np.nan, "")
+    assert not values_equal(0.0, np.nan)
+    assert values_equal("141 ", "141") and not values_equal("141", 141)
+
+
+def test_compare_frames_by_position_and_key():
+    reference = pd.DataFrame({"AWB Serial": ["1", "2", "3"], "Net Due": [1.0, 2.0, 3.0]})
+    candidate = pd.DataFrame({"AWB Serial": ["1", "2"], "Net Due": [1.0, 2.5], "Extra": [0, 0]})
+    result = compare_frames("Invoices", reference, candidate)
+    assert not result["equal"]
+    assert result["rows_missing"] == [2] and result["columns_extra"] == ["Extra"]
+    assert result["cells"] == [{"row": 1, "column": "Net Due", "reference": 2.0, "candidate": 2.5}]
+
+    summary = pd.DataFrame({"Metric": ["Count", "Total"], "Value": [3, 6.0]})
+    reordered = pd.DataFrame({"Metric": ["Total", "Count"], "Value": [6.0, 3]})
+    assert compare_frames("Summary", summary, reordered)["equal"]
+
+
+def test_app_and_cli_on_the_fixture(tmp_path):
+    invoice = glob.glob(os.path.join(FIXTURES, "*.pdf"))[0]
+    report = glob.glob(os.path.join(FIXTURES, "*.xls"))[0]
+    result = run_harness(invoice, report, engines=("cli", "app"), extra_engines={"cli_copy": run_cli_engine},
+                         output_dir=str(tmp_path))
+    assert [run["engine"] for run in result["engines"]] == ["cli", "app", "cli_copy"]
+    assert all(run["seconds"] > 0 and "report_read" in run["stages"] for run in result["engines"])
+    assert result["comparisons"]["cli_copy"]["equal"]
+
+    # Known divergence: the Flask Summary adds the CCA totals (and nets them into the difference)
+    app = {sheet["sheet"]: sheet for sheet in result["comparisons"]["app"]["sheets"]}
+    assert all(app[sheet]["equal"] for sheet in ("Reconciliation", "Invoices", "CCA"))
+    assert app["Summary"]["rows_extra"] == ["Total AWB Amount (Net Due)", "Total CCA Amount (Net Due)",
+                                            "Total Invoice Amount (AWB + CCA)"]
+    assert not result["equal"]
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Tests for the job progress SSE stream (job_events.py, /jobs/<job_id>/events in app.py)
+Run with: python -m pytest -q test_job_events.py
+"""
+
+import asyncio
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from job_events import EVENTS_FILE, read_new_events, event_stream, start_event_server
+from job_queue import new_job, write_status
+from progress import new_progress, progress_event, finish_progress, file_sink
+
+
+def parse_sse(data):
+    """[(event, id, data)] of an SSE byte stream; comments and retry lines are skipped."""
+    messages = []
+    for block in data.decode('utf-8').split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line and not line.startswith(":"))
+        if "data" in fields:
+            messages.append((fields.get("event"), fields.get("id"), json.loads(fields["data"])))
+    return messages
+
+
+def run_fake_job(job_id, job_dir, delay=0.0):
+    # Same order as app.run_upload_job: events are flushed before the final status
+    progress = new_progress(file_sink(os.path.join(job_dir, EVENTS_FILE)), interval=0, job_id=job_id)
+    write_status(job_dir, status="running")
+    for page in (1, 2, 3):
+        time.sleep(delay)
+        progress_event(progress, "pages", done=page, total=3)
+    finish_progress(progress, status="done")
+    write_status(job_dir, status="done", results={"excel_file": "out.xlsx", "invoices_rows": 7})
+
+
+def test_read_new_events_skips_partial_line(tmp_path):
+    path = tmp_path / EVENTS_FILE
+    path.write_bytes(b'{"stage": "pages", "done": 1}\n{"stage": "pa')
+    events = read_new_events(str(path), 0)
+    assert [event for event, _ in events] == [{"stage": "pages", "done": 1}]
+    offset = events[-1][1]
+    assert read_new_events(str(path), offset) == []
+
+    with open(path, 'ab') as f:
+        f.write(b'ges", "done": 2}\n')
+    assert [event["done"] for event, _ in read_new_events(str(path), offset)] == [2]
+
+
+def test_event_stream_and_resume(tmp_path):
+    job_id, job_dir = new_job(str(tmp_path))
+    write_status(job_dir, job_id=job_id, status="queued")
+    worker = threading.Thread(target=run_fake_job, args=(job_id, job_dir, 0.05))
+    worker.start()
+    messages = parse_sse(b"".join(event_stream(job_dir, poll_interval=0.01)))
+    worker.join()
+
+    progress = [data for event, _, data in messages if event == "progress"]
+    assert [(data["stage"], data.get("done")) for data in progress] == [("pages", 1), ("pages", 2), ("pages", 3), ("done", None)]
+    assert messages[-1][0] == "summary"
+    assert messages[-1][2]["results"]["invoices_rows"] == 7
+    assert messages[-1][2]["download_url"] == f"/jobs/{job_id}/download"
+    statuses = [data["status"] for event, _, data in messages if event == "status"]
+    assert statuses[-1] == "done"
+
+    # Last-Event-ID: a reconnecting client only gets what it missed
+    second_id = [event_id for event, event_id, _ in messages if event == "progress"][1]
+    resumed = parse_sse(b"".join(event_stream(job_dir, offset=int(second_id), poll_interval=0.01)))
+    assert [data.get("done") for event, _, data in resumed if event == "progress"] == [3, None]
+
+
+def test_async_server_streams_many_clients(tmp_path):
+    job_id, job_dir = new_job(str(tmp_path))
+    write_status(job_dir, job_id=job_id, status="running")
+    stats = {}
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(start_event_server(str(tmp_path), poll_interval=0.01, stats=stats))
+    port = server.sockets[0].getsockname()[1]
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    try:
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+        conn.request("GET", f"/jobs/{'0' * 32}/events")
+        assert conn.getresponse().status == 404
+
+        responses = []
+        for _ in range(20):
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+            conn.request("GET", f"/jobs/{job_id}/events")
+            response = conn.getresponse()
+            assert response.status == 200
+            assert response.getheader("Content-Type") == "text/event-stream"
+            responses.append(response)
+        run_fake_job(job_id, job_dir)
+
+        for response in responses:
+            messages = parse_sse(response.read())
+            assert messages[-1][0] == "summary"
+            assert len([event for event, _, _ in messages if event == "progress"]) == 4
+        assert stats["streams"] == 20
+    finally:
+        loop.call_soon_threadsafe(server.close)
+        loop.call_soon_threadsafe(loop.stop)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Tests for the background job queue behind /upload (job_queue.py)
+Run with: python -m pytest -q test_job_queue.py
+"""
+
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import job_queue
+from job_queue import QueueFullError, new_job, write_status, read_status, job_path, has_capacity, submit
+
+
+def record_job(job_id, job_dir, value):
+    # Runs in a spawned pool process
+    return write_status(job_dir, status="done", results={"value": value})
+
+
+def failing_job(job_id, job_dir):
+    raise RuntimeError("boom")
+
+
+def slow_job(job_id, job_dir):
+    time.sleep(30)
+
+
+def over_limit_upload_job(job_id, job_dir, method, invoice_path, report_path):
+    # Runs app.run_upload_job with pdfplumber allocating past the job's address-space ceiling
+    import pdfplumber
+    import app
+
+    def allocate(*args, **kwargs):
+        return bytearray(8 * 1024 ** 3)
+    setattr(pdfplumber if method == "open" else pdfplumber.page.Page, method, allocate)
+    return app.run_upload_job(job_id, job_dir, invoice_path, report_path)
+
+
+def wait_for(condition, timeout=10):
+    # Done callbacks run just after the future's waiters are woken
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.05)
+
+
+def test_status_file_round_trip(tmp_path):
+    job_id, job_dir = new_job(str(tmp_path))
+    assert job_path(str(tmp_path), job_id) == job_dir
+    assert read_status(str(tmp_path), job_id) is None
+
+    write_status(job_dir, job_id=job_id, status="queued")
+    write_status(job_dir, status="running")
+    status = read_status(str(tmp_path), job_id)
+    assert status["job_id"] == job_id and status["status"] == "running"
+    assert os.listdir(job_dir) == ["status.json"]
+
+    # Ids are validated before touching the filesystem
+    assert job_path(str(tmp_path), "../etc") is None
+    assert read_status(str(tmp_path), "0" * 32) is None
+
+
+def test_submit_runs_jobs_and_applies_backpressure(tmp_path):
+    jobs = [new_job(str(tmp_path)) for _ in range(3)]
+    try:
+        first = submit(*jobs[0], record_job, (42,), max_workers=1, max_pending=0)
+        assert not has_capacity(1, 0)
+        with pytest.raises(QueueFullError):
+            submit(*jobs[1], record_job, (43,), max_workers=1, max_pending=0)
+        assert first.result(timeout=120)["results"] == {"value": 42}
+        wait_for(lambda: has_capacity(1, 0))
+
+        # A job raising outside its own error handling is recorded as failed
+        submit(*jobs[2], failing_job, (), max_workers=1, max_pending=0).exception(timeout=120)
+    finally:
+        job_queue._pool["executor"].shutdown(wait=True)
+        job_queue._pool["executor"] = None
+
+    wait_for(lambda: has_capacity(1, 0))
+    assert read_status(str(tmp_path), jobs[0][0])["status"] == "done"
+    wait_for(lambda: read_status(str(tmp_path), jobs[2][0])["status"] == "failed")
+    failed = read_status(str(tmp_path), jobs[2][0])
+    assert failed["status"] == "failed" and "boom" in failed["error"]
+
+
+def test_job_over_time_limit_is_marked_failed(tmp_path):
+    job_id, job_dir = new_job(str(tmp_path))
+    try:
+        submit(job_id, job_dir, slow_job, (), max_workers=1, max_pending=0,
+               limits={"timeout": 1, "max_jobs": 1}).result(timeout=120)
+    finally:
+        job_queue._pool["executor"].shutdown(wait=True)
+        job_queue._pool["executor"] = None
+    status = read_status(str(tmp_path), job_id)
+    assert status["status"] == "failed"
+    assert status["error"] == "Job exceeded its time limit of 1 s"
+
+
+@pytest.mark.parametrize("method", ["open", "extract_text"])
+def test_upload_job_over_memory_limit_is_marked_failed(tmp_path, method):
+    from synthetic_inputs import generate
+    from worker_limits import limit_error
+
+    paths = generate(str(tmp_path / "inputs"), awbs=10, cca=1, seed=5)
+    limits = {"max_memory_mb": 512, "max_jobs": 1}
+    job_id, job_dir = new_job(str(tmp_path))
+    try:
+        submit(job_id, job_dir, over_limit_upload_job, (method, paths["invoice"], paths["report"]),
+               max_workers=1, max_pending=0, limits=limits).result(timeout=120)
+    finally:
+        job_queue._pool["executor"].shutdown(wait=True)
+        job_queue._pool["executor"] = None
+    # Neither a truncated workbook marked done nor an "encountered issues" failure
+    status = read_status(str(tmp_path), job_id)
+    assert status["status"] == "failed"
+    assert status["error"] == limit_error(MemoryError(), limits)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Tests for the /upload load generator (load_test.py)
+Run with: python -m pytest -q test_load_test.py
+"""
+
+import os
+import sys
+import threading
+
+from werkzeug.serving import make_server
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from load_test import compare_reports, percentiles, run_load_test, tree_rss_mb
+
+
+def test_percentiles_nearest_rank():
+    assert percentiles([]) is None
+    stats = percentiles(list(range(1, 101)))
+    assert (stats["p50"], stats["p95"], stats["p99"], stats["max"]) == (50, 95, 99, 100)
+    assert percentiles([7.0])["p99"] == 7.0
+
+
+def test_compare_flags_slower_or_failing_levels():
+    def level(concurrency, p95, rate, error_rate=0.0):
+        return {"concurrency": concurrency, "upload_ms": {"p95": 10.0}, "job_ms": {"p95": p95},
+                "jobs_per_sec": rate, "error_rate": error_rate}
+
+    old = {"levels": [level(1, 1000.0, 1.0), level(4, 2000.0, 2.0)]}
+    new = {"levels": [level(1, 1100.0, 0.95), level(4, 3000.0, 1.5, error_rate=0.1), level(8, 9000.0, 1.0)]}
+    rows = compare_reports(old, new, threshold=0.2)
+    assert [row["concurrency"] for row in rows] == [1, 4]
+    assert rows[0]["flags"] == []
+    assert len(rows[1]["flags"]) == 3 and rows[1]["changes"]["job_ms.p95"] == 0.5
+
+
+def test_tree_rss_of_this_process():
+    assert tree_rss_mb(os.getpid()) > 0
+    assert tree_rss_mb(2 ** 22 + 1) is None
+
+
+def test_load_level_against_the_app(tmp_path):
+    import app as flask_app
+    flask_app.app.config["JOBS_FOLDER"] = str(tmp_path / "jobs")
+    os.makedirs(flask_app.app.config["JOBS_FOLDER"])
+    server = make_server("127.0.0.1", 0, flask_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        report = run_load_test(f"http://127.0.0.1:{server.server_port}", concurrency=[2], requests=3, sizes=[20],
+                               data_dir=str(tmp_path / "data"), server_pid=os.getpid())
+    finally:
+        server.shutdown()
+        flask_app.app.config["JOBS_FOLDER"] = flask_app.JOBS_FOLDER
+    level = report["levels"][0]
+    assert level["errors"] == 0, level["error_samples"]
+    assert level["accepted"] + level["rejected"] == 3 and level["accepted"] >= 1
+    assert level["job_ms"]["p50"] >= level["upload_ms"]["p50"]
+    assert level["rss_mb"]["peak"] > 0 and report["inputs"] == ["load-20"]
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Tests for per-stage memory accounting and the memory budget (memory_budget.py)
+Run with: python -m pytest -q test_memory_budget.py
+"""
+
+import io
+import os
+import sys
+import threading
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import memory_budget
+from memory_budget import new_memory_stats, memory_hook, memory_summary, stop_memory_stats, plan_memory, input_size
+from telemetry import new_timer, span
+from synthetic_inputs import generate
+from process_invoice import process_files
+
+
+def test_stage_peaks():
+    stats = new_memory_stats(trace=True)
+    timer = new_timer(hooks=[memory_hook(stats)])
+    try:
+        with span(timer, "grow"):
+            block = bytearray(64 * 1024 * 1024)
+            with span(timer, "inner"):  # nested spans belong to their stage
+                pass
+            del block
+        with span(timer, "small"):
+            pass
+    finally:
+        stop_memory_stats(stats)
+    summary = memory_summary(stats)
+
+    assert set(summary["stages"]) == {"grow", "small"}
+    grow = summary["stages"]["grow"]
+    assert grow["spans"] == 1 and grow["py_peak_mb"] >= 64
+    assert grow["peak_rss_mb"] - summary["stages"]["small"]["peak_rss_mb"] > 32  # peak is reset per span
+    assert summary["peak_rss_mb"] == grow["peak_rss_mb"]
+
+
+def test_concurrent_jobs_keep_the_peak(monkeypatch):
+    resets = []
+    monkeypatch.setattr(memory_budget, "_reset_peak", resets.append)
+    started, finished = threading.Event(), threading.Event()
+
+    def other_job():
+        other = new_memory_stats()
+        started.set()
+        finished.wait(30)
+        stop_memory_stats(other)
+
+    thread = threading.Thread(target=other_job)
+    thread.start()
+    started.wait(30)
+    stats = new_memory_stats()
+    timer = new_timer(hooks=[memory_hook(stats)])
+    try:
+        with span(timer, "grow"):
+            block = bytearray(64 * 1024 * 1024)
+            del block
+    finally:
+        finished.set()
+        thread.join()
+    # The other job is gone: this thread is alone again and resets the peak per span
+    with span(timer, "alone"):
+        pass
+    stop_memory_stats(stats)
+
+    grow = memory_summary(stats)["stages"]["grow"]
+    assert resets == [stats]  # only the "alone" span reset the process high-water mark
+    assert grow["peak_rss_mb"] < grow["rss_mb"] - grow["growth_mb"] + 32  # start/end RSS, not VmHWM
+
+
+def test_plan_and_input_size(tmp_path):
+    path = tmp_path / "invoice.pdf"
+    path.write_bytes(b"x" * 2048)
+    assert input_size(str(path)) == 2048 and input_size(b"abc") == 3
+    stream = io.BytesIO(b"12345")
+    stream.seek(2)
+    assert input_size(stream) == 5 and stream.tell() == 2
+
+    assert plan_memory(None, 10, 0, 0) is None
+    small = plan_memory(1000, 10, 50_000, 900_000, rss_mb=100.0)
+    large = plan_memory(1000, 2000, 25 * 1024 * 1024, 900_000, rss_mb=100.0)
+    assert not small["low_memory"] and small["estimate_mb"] < 1000
+    assert large["low_memory"] and large["low_memory_estimate_mb"] < 1000 < large["estimate_mb"]
+
+
+def test_low_memory_paths_give_the_same_result(tmp_path):
+    paths = generate(str(tmp_path), awbs=60, pages=4, cca=3, mismatch_rate=0.2, seed=11)
+    results = {}
+    for budget in (None, 1):
+        details = {}
+        out_dir = tmp_path / f"out-{budget}"
+        out_dir.mkdir()
+        process_files(paths["invoice"], paths["report"], workflow_id="mem", details=details,
+                      output_dir=str(out_dir), memory_budget_mb=budget)
+        results[budget] = details
+
+    memory = results[1]["timings"]["memory"]
+    assert memory["plan"]["low_memory"] and "plan" not in results[None]["timings"]["memory"]
+    assert {"cca_locate", "layout", "report_read", "sheets"} <= set(memory["stages"])
+    for key in ("rows", "discrepancies", "summary", "pages"):
+        assert results[1][key] == results[None][key]
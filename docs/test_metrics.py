@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Tests for the Prometheus metrics (metrics.py) and their app/CLI wiring
+Run with: python -m pytest -q test_metrics.py
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from metrics import new_registry, record_job, record_cache, set_rss, render, parse_families, update_textfile
+
+DETAILS = {
+    "pages": 6,
+    "rows": {"invoices": 70, "cca": 4},
+    "discrepancies": {"net_due": 3, "total": 5},
+    "timings": {"total_ms": 900.0, "stages": {"layout": 600.0, "sheets": 40.0, "sheets.Summary": 2.0}},
+}
+
+
+def samples(text):
+    return {key: value for family in parse_families(text).values() for key, value in family["samples"].items()}
+
+
+def test_render_exposition_format():
+    registry = new_registry()
+    record_job(registry, "cli", True, 0.9, DETAILS)
+    record_job(registry, "cli", False, 700.0, {})
+    record_cache(registry, "batch_journal", True, 2)
+    text = render(registry)
+
+    assert "# TYPE reconciler_job_duration_seconds histogram" in text
+    assert 'reconciler_job_duration_seconds_bucket{engine="cli",le="0.5"} 0\n' in text
+    assert 'reconciler_job_duration_seconds_bucket{engine="cli",le="1"} 1\n' in text
+    assert 'reconciler_job_duration_seconds_bucket{engine="cli",le="+Inf"} 2\n' in text
+    assert 'reconciler_job_duration_seconds_count{engine="cli"} 2\n' in text
+    assert 'reconciler_jobs_total{engine="cli",status="failed"} 1\n' in text
+    assert 'reconciler_stage_duration_seconds_sum{engine="cli",stage="layout"} 0.6\n' in text
+    assert 'stage="sheets.Summary"' not in text
+    assert 'reconciler_discrepancies_total{engine="cli",category="net_due"} 3\n' in text
+    assert 'reconciler_cache_requests_total{cache="batch_journal",result="hit"} 2\n' in text
+    assert "reconciler_queue_jobs" not in text  # no samples, no family
+
+
+def test_textfile_merges_runs(tmp_path):
+    path = str(tmp_path / "reconciler.prom")
+    for rss_mb in (100, 50):
+        registry = new_registry()
+        record_job(registry, "cli", True, 2.0, DETAILS)
+        set_rss(registry, "cli", rss_mb)
+        update_textfile(path, registry)
+    merged = samples(open(path).read())
+
+    assert merged[("reconciler_pages_total", '{engine="cli"}')] == 12
+    assert merged[("reconciler_awbs_total", '{engine="cli"}')] == 140
+    assert merged[("reconciler_job_duration_seconds_bucket", '{engine="cli",le="2.5"}')] == 2
+    assert merged[("reconciler_job_duration_seconds_sum", '{engine="cli"}')] == 4.0
+    assert merged[("reconciler_worker_rss_bytes", '{process="cli"}')] == 50 * 1024 * 1024  # gauges replace
+    assert sorted(os.listdir(tmp_path)) == ["reconciler.prom", "reconciler.prom.lock"]
+
+
+def test_app_metrics_endpoint(tmp_path):
+    import app
+
+    app.record_job_metrics({
+        "status": "done", "started_at": 100.0, "finished_at": 103.5, "timings": DETAILS["timings"],
+        "results": {"invoices_rows": 70, "cca_rows": 4, "pages": 6, "discrepancies": {"total": 5}},
+    })
+    response = app.app.test_client().get("/metrics")
+    assert response.status_code == 200 and response.mimetype == "text/plain"
+    found = samples(response.get_data(as_text=True))
+
+    assert found[("reconciler_jobs_total", '{engine="app",status="done"}')] >= 1
+    assert found[("reconciler_ccas_total", '{engine="app"}')] >= 4
+    assert found[("reconciler_queue_jobs", '{state="capacity"}')] == (app.app.config["JOB_WORKERS"]
+                                                                     + app.app.config["JOB_QUEUE_SIZE"])
+    assert found[("reconciler_worker_rss_bytes", '{process="server"}')] > 0
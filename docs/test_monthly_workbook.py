@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Tests for append-mode monthly workbook accumulation (monthly_workbook.py)
+Run with: python -m pytest -q test_monthly_workbook.py
+"""
+
+import io
+import os
+import sys
+import zipfile
+
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from monthly_workbook import append_invoice, load_index, MonthlyWorkbookError, _central_directory, _zip_members
+
+
+def make_frames(n_awbs, serial_offset=0):
+    """Small Reconciliation/Invoices/CCA frames shaped like process_files output."""
+    serials = [str(52900000 + serial_offset + i) for i in range(n_awbs)]
+    df_rec = pd.DataFrame({
+        'AWB Prefix': ['141'] * n_awbs + ['Total'],
+        'AWB Serial': serials + [''],
+        'Net Due (Invoice)': [100.0] * n_awbs + [100.0 * n_awbs],
+        'Discrepancy Found': [False] * n_awbs + [''],
+    })
+    df_inv = df_rec[['AWB Prefix', 'AWB Serial', 'Net Due (Invoice)']]
+    summary = {
+        'Invoice AWB Count': n_awbs,
+        'Total Invoice Amount (Net Due)': 100.0 * n_awbs,
+        'Total Invoice Charge Weight': 10.0 * n_awbs,
+        'Average Net Yield Rate': 10.0,
+        'Total Report Amount (for Matched AWBs)': 90.0 * n_awbs,
+    }
+    return summary, {"Reconciliation": df_rec, "Invoices": df_inv, "CCA": pd.DataFrame()}
+
+
+def test_append_creates_and_accumulates(tmp_path):
+    path = str(tmp_path / "month.xlsx")
+    append_invoice(path, "inv-a", *make_frames(3))
+    index = append_invoice(path, "inv-b", *make_frames(2, serial_offset=100))
+
+    assert len(index["invoices"]) == 2
+    assert index["totals"]['Invoice AWB Count'] == 5
+
+    sheets = pd.read_excel(path, sheet_name=None)
+    assert list(sheets) == ['Summary', 'Reconciliation 001', 'Invoices 001', 'Reconciliation 002', 'Invoices 002']
+    assert len(sheets['Reconciliation 002']) == 3  # 2 AWBs + totals row
+
+    summary = dict(zip(sheets['Summary']['Metric'][:7], sheets['Summary']['Value'][:7]))
+    assert summary['Invoices Appended'] == 2
+    assert summary['Total Invoice Amount (Net Due)'] == pytest.approx(500.0)
+    assert summary['Difference (Report - Invoice)'] == pytest.approx(-50.0)
+
+
+def test_existing_parts_are_not_rewritten(tmp_path):
+    path = str(tmp_path / "month.xlsx")
+    append_invoice(path, "inv-a", *make_frames(3))
+    with zipfile.ZipFile(path) as zf:
+        before = {i.filename: (i.header_offset, i.CRC) for i in zf.infolist()
+                  if i.filename.startswith(('xl/worksheets/sheet2', 'xl/tables/'))}
+
+    append_invoice(path, "inv-b", *make_frames(4, serial_offset=100))
+    with zipfile.ZipFile(path) as zf:
+        assert zf.testzip() is None
+        after = {i.filename: (i.header_offset, i.CRC) for i in zf.infolist()}
+
+    for name, location in before.items():
+        assert after[name] == location
+
+
+def test_central_directory_matches_zipfile():
+    # The central directory written by an append is byte-for-byte what zipfile writes for the same members
+    parts = [("xl/worksheets/sheet2.xml", b"<sheet/>" * 50), ("xl/workbook.xml", b"<workbook/>")]
+    tail = [("[Content_Types].xml", b"<Types/>")]
+    members, infos, tail_start = _zip_members(parts, lambda index: tail, None)
+    expected = io.BytesIO()
+    with zipfile.ZipFile(expected, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for info, (_, data) in zip(infos, parts + tail):
+            zf.writestr(zipfile.ZipInfo(info.filename, info.date_time), data, compress_type=zipfile.ZIP_DEFLATED)
+    assert members + _central_directory(infos, len(members)) == expected.getvalue()
+    assert tail_start == infos[2].header_offset > infos[1].header_offset
+
+
+def test_workbook_changed_outside_append_mode_is_rejected(tmp_path):
+    path = str(tmp_path / "month.xlsx")
+    append_invoice(path, "inv-a", *make_frames(1))
+    with open(path, 'ab') as f:
+        f.write(b'\0')
+
+    with pytest.raises(MonthlyWorkbookError):
+        load_index(path)
+
+
+def test_interrupted_append_is_rolled_back(tmp_path, monkeypatch):
+    import monthly_workbook
+
+    path = str(tmp_path / "month.xlsx")
+    append_invoice(path, "inv-a", *make_frames(3))
+    size = os.path.getsize(path)
+
+    def crash(index):
+        raise KeyboardInterrupt
+    monkeypatch.setattr(monthly_workbook, "render_tail_parts", crash)
+    with pytest.raises(KeyboardInterrupt):  # failed append: rolled back right away
+        append_invoice(path, "inv-b", *make_frames(2, serial_offset=100))
+    assert os.path.getsize(path) == size and len(load_index(path)["invoices"]) == 1
+
+    monkeypatch.setattr(monthly_workbook, "recover_append", lambda path: False)  # killed: no rollback
+    with pytest.raises(KeyboardInterrupt):
+        append_invoice(path, "inv-b", *make_frames(2, serial_offset=100))
+    monkeypatch.undo()
+    assert os.path.exists(path + ".index.json.journal") and os.path.getsize(path) != size
+
+    assert len(load_index(path)["invoices"]) == 1  # recovered on load
+    assert not os.path.exists(path + ".index.json.journal")
+    append_invoice(path, "inv-b", *make_frames(2, serial_offset=100))
+    assert list(pd.read_excel(path, sheet_name=None))[-1] == 'Invoices 002'
+
+
+def test_sheets_match_the_per_invoice_workbook(tmp_path):
+    from monthly_workbook import render_sheet_parts
+    from sheet_spec import RECONCILIATION_SHEET
+
+    path = str(tmp_path / "month.xlsx")
+    summary, frames = make_frames(3)
+    append_invoice(path, "inv-a", summary, frames)
+    spec = dict(RECONCILIATION_SHEET, table=dict(RECONCILIATION_SHEET["table"], name="ReconciliationTable001"))
+    [(sheet_xml, table_xml)] = render_sheet_parts([spec], {"Reconciliation": frames["Reconciliation"]})
+    with zipfile.ZipFile(path) as zf:
+        assert zf.read("xl/worksheets/sheet2.xml") == sheet_xml
+        assert zf.read("xl/tables/table1.xml") == table_xml
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Tests for the profiling mode (profiling.py, process_invoice.py --profile)
+Run with: python -m pytest -q test_profiling.py
+"""
+
+import json
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from profiling import start_profile, stop_profile, profile_hook, write_profile, profile_base_path
+from telemetry import new_timer, span
+import profiling
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_profile_reports_per_stage(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "SITES_MIN_GROWTH_KB", 256)
+    profile = start_profile("all", interval=0.001)
+    timer = new_timer(hooks=[profile_hook(profile)])
+    with span(timer, "report_read"):
+        kept = [bytearray(1024) for _ in range(1000)]  # ~1 MB, stays alive
+        busy(0.05)
+    with span(timer, "join"):
+        busy(0.05)
+    stop_profile(profile)
+
+    paths = write_profile(profile, str(tmp_path / "out"))
+    assert [os.path.basename(path) for path in paths] == ["out.profile.collapsed", "out.alloc.json"]
+
+    lines = (tmp_path / "out.profile.collapsed").read_text().splitlines()
+    assert any(line.startswith("stage:join;") and "busy (" in line for line in lines)
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+    report = json.loads((tmp_path / "out.alloc.json").read_text())
+    stage = report["stages"]["report_read"]
+    assert stage["spans"] == 1 and stage["net_kb"] >= 1000
+    assert "test_profiling.py:" in stage["top"][0]["where"]
+    assert report["stages"]["join"]["top"] == []  # no growth, no snapshot
+    assert len(kept) == 1000
+
+
+def test_cpu_mode_writes_only_stacks(tmp_path):
+    profile = start_profile("cpu")
+    with span(new_timer(hooks=[profile_hook(profile)]), "sheets"):
+        busy(0.02)
+    stop_profile(profile)
+    assert write_profile(profile, str(tmp_path / "out")) == [str(tmp_path / "out.profile.collapsed")]
+
+
+def test_profile_options():
+    with pytest.raises(ValueError):
+        start_profile("wall")
+    assert profile_base_path("/out/Invoice-wf1.xlsx") == "/out/Invoice-wf1"
+    assert profile_base_path("-", fallback_name="r") == "r"
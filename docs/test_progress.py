@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Tests for progress events (progress.py)
+Run with: python -m pytest -q test_progress.py
+"""
+
+import io
+import json
+import os
+import sys
+from contextlib import redirect_stderr
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from progress import new_progress, progress_event, finish_progress, sink_from_spec, stream_sink
+from structured_log import configure_logging
+
+
+def test_events_are_batched_and_coalesced():
+    batches = []
+    progress = new_progress(batches.append, interval=60, job_id="wf1")
+    for done in range(1, 101):
+        progress_event(progress, "pages", done=done, total=100)
+    progress_event(progress, "report", rows=648)
+    finish_progress(progress, success=True)
+
+    # First event goes out at once; the rest is one batch with the latest event per stage
+    assert len(batches) == 2
+    assert batches[0][0]["done"] == 1
+    assert [(event["stage"], event.get("done")) for event in batches[1]] == [
+        ("pages", 100), ("report", None), ("done", None)]
+    assert all(event["job_id"] == "wf1" and event["event"] == "progress" for event in batches[1])
+
+
+def test_failing_sink_disables_reporting():
+    calls = []
+
+    def sink(events):
+        calls.append(events)
+        raise OSError("callback down")
+
+    configure_logging("WARNING", "json")
+    progress = new_progress(sink, interval=0)
+    stream = io.StringIO()
+    with redirect_stderr(stream):
+        progress_event(progress, "pages", done=1, total=2)
+        progress_event(progress, "pages", done=2, total=2)
+        finish_progress(progress)
+    assert len(calls) == 1
+    entries = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [(entry["level"], entry["logger"]) for entry in entries] == [("warning", "reconciler.progress")]
+    assert entries[0]["msg"] == "Progress sink failed, progress reporting disabled: callback down"
+
+    progress_event(None, "pages", done=1)  # no progress: no-op
+
+
+def test_sinks(tmp_path):
+    stream = io.StringIO()
+    stream_sink(stream)([{"stage": "a"}, {"stage": "b"}])
+    assert [json.loads(line)["stage"] for line in stream.getvalue().splitlines()] == ["a", "b"]
+
+    path = tmp_path / "progress.jsonl"
+    sink_from_spec(f"file:{path}")([{"stage": "a"}])
+    assert json.loads(path.read_text()) == {"stage": "a"}
+    with pytest.raises(ValueError):
+        sink_from_spec("carrier-pigeon")
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Tests for the warm worker daemon (reconciler_daemon.py)
+Run with: python -m pytest -q test_reconciler_daemon.py
+"""
+
+import json
+import os
+import stat
+import subprocess
+import sys
+import time
+
+import pytest
+
+DOCS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(DOCS_DIR)
+import process_invoice
+from reconciler_daemon import submit_job, run_job
+from synthetic_inputs import generate
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    socket_path = str(tmp_path / "reconciler.sock")
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(DOCS_DIR, "reconciler_daemon.py"), "serve",
+         "--socket", socket_path, "--workers", "2", "--max-jobs", "1"],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+    )
+    deadline = time.time() + 60
+    while not os.path.exists(socket_path):
+        assert proc.poll() is None, proc.stdout.read().decode()
+        assert time.time() < deadline, "daemon did not start"
+        time.sleep(0.1)
+    yield socket_path
+    proc.terminate()
+    proc.wait(timeout=30)
+    assert not os.path.exists(socket_path)
+
+
+def test_unreachable_daemon_returns_none(tmp_path):
+    assert submit_job(str(tmp_path / "missing.sock"), ["a", "b", "c"]) is None
+
+
+def test_jobs_keep_cli_contract(daemon, tmp_path):
+    response = submit_job(daemon, ["only-two", "args"])
+    assert response["exit_code"] == 1
+    assert response["stdout"].startswith("Usage: python process_invoice.py")
+
+    # Relative result path resolves against the client's cwd; workers are
+    # replaced after each job (--max-jobs 1), so this also covers respawning
+    for _ in range(3):
+        response = submit_job(daemon, ["missing.pdf", "missing.xls", "result.json"],
+                              env={"N8N_WORKFLOW_ID": "wf1"}, cwd=str(tmp_path))
+        assert response["exit_code"] == 1
+        # The job's error log line (JSON on stderr) carries the workflow id from the client's env
+        assert '"job_id": "wf1"' in response["stderr"]
+        with open(tmp_path / "result.json") as f:
+            result = json.load(f)
+        assert result == {"success": False, "error": "Invoice file not found at missing.pdf",
+                          "message": "Processing failed"}
+
+
+def test_job_stopped_by_timeout_writes_failure_json(tmp_path, monkeypatch):
+    monkeypatch.setattr(process_invoice, "run_cli", lambda argv: time.sleep(5))
+    response = run_job({"argv": ["a.pdf", "b.xls", "result.json"], "cwd": str(tmp_path)}, {"timeout": 0.2})
+    assert response["exit_code"] == 1
+    assert response["limit"] == "Job exceeded its time limit of 0.2 s"
+    with open(tmp_path / "result.json") as f:
+        assert json.load(f) == {"success": False, "error": response["limit"], "message": "Processing failed"}
+
+
+def _processes_holding(path):
+    pids = []
+    for pid in filter(str.isdigit, os.listdir("/proc")):
+        try:
+            fds = os.listdir(f"/proc/{pid}/fd")
+            if any(os.readlink(f"/proc/{pid}/fd/{fd}") == path for fd in fds):
+                pids.append(int(pid))
+        except OSError:
+            pass
+    return pids
+
+
+def test_killed_worker_writes_failure_json_to_the_result_path(daemon, tmp_path):
+    # --profile before the positional arguments must not shift the result path onto an input file
+    invoice = generate(str(tmp_path), awbs=5, seed=2)["invoice"]
+    report = str(tmp_path / "report.xls")
+    os.mkfifo(report)  # the worker blocks reading it until it is killed
+    with open(invoice, "rb") as f:
+        invoice_bytes = f.read()
+    client = subprocess.Popen(
+        [sys.executable, os.path.join(DOCS_DIR, "process_invoice.py"), "--profile=cpu", invoice, report,
+         "result.json"], cwd=str(tmp_path), env=dict(os.environ, RECONCILER_DAEMON_SOCKET=daemon),
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+    )
+    deadline = time.time() + 60
+    writer = None
+    while writer is None:
+        assert client.poll() is None, client.stdout.read().decode()
+        assert time.time() < deadline, "job did not reach the worker"
+        try:
+            writer = os.open(report, os.O_WRONLY | os.O_NONBLOCK)  # succeeds once the worker opens it
+        except OSError:
+            time.sleep(0.1)
+    try:
+        time.sleep(0.5)  # the worker now waits for the invoice bytes
+        for pid in _processes_holding(report):
+            if pid != os.getpid():
+                os.kill(pid, 9)
+        assert client.wait(timeout=60) == 1
+    finally:
+        os.close(writer)
+    assert stat.S_ISFIFO(os.stat(report).st_mode)
+    with open(invoice, "rb") as f:
+        assert f.read() == invoice_bytes
+    with open(tmp_path / "result.json") as f:
+        assert json.load(f)["error"] == "Reconciler worker was killed while processing the job"
+
+
+def test_job_stopped_by_a_limit_resolves_the_result_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(process_invoice, "run_cli", lambda argv: time.sleep(5))
+    (tmp_path / "b.xls").write_bytes(b"report")
+    response = run_job({"argv": ["--profile", "a.pdf", "b.xls", "result.json"], "cwd": str(tmp_path)},
+                       {"timeout": 0.2})
+    assert response["limit"] and (tmp_path / "b.xls").read_bytes() == b"report"
+    assert json.loads((tmp_path / "result.json").read_text())["error"] == response["limit"]
+    assert process_invoice.cli_result_path(["a", "b", "-", "--profile"]) is None
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Tests for the result JSON helpers (result_json.py)
+Run with: python -m pytest -q test_result_json.py
+"""
+
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import result_json
+from result_json import atomic_path, discrepancy_counts, write_discrepancy_rows, write_result
+
+
+def make_reconciliation():
+    df = pd.DataFrame({
+        'AWB Prefix': ['141', '141', '141'],
+        'AWB Serial': ['1', '2', '3'],
+        'Net Due (Invoice)': [100.0, 50.0, 20.0],
+        'Net Due (Report)': [90.0, 50.0, np.nan],
+    })
+    masks = {
+        'net_due': pd.Series([True, False, False]),
+        'missing_in_report': df['Net Due (Report)'].isna(),
+    }
+    masks['any'] = masks['net_due'] | masks['missing_in_report']
+    # Totals row is appended after the masks are computed
+    df = pd.concat([df, pd.DataFrame([{'AWB Prefix': 'Total', 'Net Due (Invoice)': 170.0}])], ignore_index=True)
+    return df, masks
+
+
+def test_discrepancy_counts():
+    _, masks = make_reconciliation()
+    assert discrepancy_counts(masks) == {
+        'charge_weight': 0, 'net_yield_rate': 0, 'net_due': 1, 'missing_in_report': 1, 'total': 2,
+    }
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_discrepancy_rows_and_result(tmp_path, monkeypatch, use_orjson):
+    if not use_orjson:
+        monkeypatch.setattr(result_json, 'orjson', None)
+    elif result_json.orjson is None:
+        pytest.skip("orjson not installed")
+
+    df, masks = make_reconciliation()
+    path = tmp_path / "d.jsonl"
+    assert write_discrepancy_rows(str(path), df, masks) == 2
+
+    rows = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [row['AWB Serial'] for row in rows] == ['1', '3']
+    assert rows[1]['Net Due (Report)'] is None
+    assert rows[1]['categories'] == ['missing_in_report']
+
+    result_path = tmp_path / "result.json"
+    write_result(str(result_path), {"summary": {"Total": np.float64(1.5), "Count": np.int64(2)}})
+    assert json.loads(result_path.read_text()) == {"summary": {"Total": 1.5, "Count": 2}}
+
+
+def test_atomic_path_leaves_no_partial_file(tmp_path):
+    target = tmp_path / "out.xlsx"
+    with pytest.raises(RuntimeError):
+        with atomic_path(str(target)) as partial_path:
+            open(partial_path, 'w').write("partial")
+            raise RuntimeError("crash")
+    assert os.listdir(tmp_path) == []
+
+    with atomic_path(str(target)) as partial_path:
+        open(partial_path, 'w').write("complete")
+    assert os.listdir(tmp_path) == ["out.xlsx"]
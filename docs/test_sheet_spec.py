@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Tests for the declarative sheet spec engine (sheet_spec.py)
+Run with: python -m pytest -q test_sheet_spec.py
+"""
+
+import os
+import sys
+
+import openpyxl
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from sheet_spec import render_workbook, awb_key_mask
+
+
+def make_frames():
+    df_rec = pd.DataFrame({
+        'Discrepancy Found': [True, False, ''],
+        'AWB Prefix': ['141', '141', 'Total'],
+        'AWB Serial': ['00012345', '00012346', ''],
+        'Net Due (Invoice)': [100.0, 50.0, 150.0],
+        'Net Due (Report)': [90.0, 50.0, 140.0],
+        'Diff Net Due': [-10.0, 0.0, -10.0],
+    })
+    df_inv = df_rec[['AWB Prefix', 'AWB Serial', 'Net Due (Invoice)']]
+    df_summary = pd.DataFrame({'Metric': ['Invoice AWB Count'], 'Value': [2]})
+    return {"Summary": df_summary, "Reconciliation": df_rec, "Invoices": df_inv, "CCA": pd.DataFrame()}
+
+
+def test_render_workbook_layout_and_stats(tmp_path):
+    path = str(tmp_path / "out.xlsx")
+    stats = render_workbook(path, make_frames(), highlights=False)
+
+    assert stats["Reconciliation"] == {"rows": 3, "data_rows": 2, "range": "A1:F4"}
+    assert stats["CCA"]["rows"] == 0
+
+    wb = openpyxl.load_workbook(path)
+    assert wb.sheetnames == ['Summary', 'Reconciliation', 'Invoices', 'CCA']
+    ws = wb['Reconciliation']
+    # Spec column order wins over frame order; AWB keys stay text
+    assert [c.value for c in ws[1]][:3] == ['AWB Prefix', 'AWB Serial', 'Net Due (Invoice)']
+    assert ws['B2'].value == '00012345'
+    assert list(ws.tables) == ['ReconciliationTable']
+    assert len(ws.conditional_formatting) == 0
+
+
+def test_highlights_cover_data_rows_only(tmp_path):
+    path = str(tmp_path / "out.xlsx")
+    frames = make_frames()
+    masks = {"net_due_discrepancy": awb_key_mask(frames["Invoices"], {('141', '00012345')})}
+    render_workbook(path, frames, masks=masks)
+
+    wb = openpyxl.load_workbook(path)
+    ranges = {str(cf.sqref) for cf in wb['Reconciliation'].conditional_formatting}
+    assert 'A2:F3' in ranges  # row rule stops before the totals row
+    assert 'E2:E3' in ranges  # Diff Net Due
+
+    fills = [row[0].fill.fgColor.rgb for row in wb['Invoices'].iter_rows(min_row=2)]
+    assert fills[0] == 'FFFF0000'
+    assert fills[1] != 'FFFF0000'
@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+"""
+Tests for the cold-start budget of process_invoice.py (startup_budget.py)
+Run with: python -m pytest -q test_startup_budget.py
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from startup_budget import measure_imports, heavy_modules_loaded
+
+
+def test_import_does_not_load_heavy_dependencies():
+    imports = measure_imports("process_invoice")
+    assert "process_invoice" in imports["modules"]
+    assert heavy_modules_loaded(imports["modules"]) == []
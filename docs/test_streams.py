@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Tests for in-memory I/O (open_input, process_streams and '-' arguments in process_invoice.py)
+Run with: python -m pytest -q test_streams.py
+"""
+
+import io
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+DOCS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(DOCS_DIR)
+from process_invoice import open_input, process_streams
+
+
+def test_open_input():
+    assert open_input("invoice.pdf") == "invoice.pdf"
+    assert open_input(b"%PDF").read() == b"%PDF"
+    assert open_input(memoryview(b"%PDF")).read() == b"%PDF"
+    buffer = io.BytesIO(b"data")
+    assert open_input(buffer) is buffer
+
+
+def test_process_streams_rejects_invalid_pdf():
+    workbook = io.BytesIO()
+    with pytest.raises(RuntimeError, match="Error reading PDF structure"):
+        process_streams(b"not a pdf", b"", workbook)
+    assert workbook.getvalue() == b""
+
+
+def run_cli(args, stdin=b"", **env):
+    return subprocess.run([sys.executable, os.path.join(DOCS_DIR, "process_invoice.py")] + args,
+                          input=stdin, capture_output=True, env=dict(os.environ, RECONCILER_DAEMON_SOCKET="", **env))
+
+
+def test_cli_result_json_on_stdout(tmp_path):
+    proc = run_cli(["-", str(tmp_path / "report.xls"), "-"], stdin=b"not a pdf", N8N_LOG_LEVEL="INFO")
+    assert proc.returncode == 1
+    # stdout holds only the result JSON; log lines went to stderr
+    result = json.loads(proc.stdout)
+    assert result["success"] is False and "PDF" in result["error"]
+    assert b"Processing with:" in proc.stderr
+
+
+def test_cli_rejects_two_stdin_inputs():
+    proc = run_cli(["-", "-", "result.json"])
+    assert proc.returncode == 1
+    assert b"only one of the invoice and the report" in proc.stdout
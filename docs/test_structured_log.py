@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Tests for leveled JSON logging (structured_log.py)
+Run with: python -m pytest -q test_structured_log.py
+"""
+
+import io
+import json
+import logging
+import os
+import sys
+from contextlib import redirect_stderr
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from structured_log import configure_logging, get_logger
+
+
+class Expensive:
+    formatted = 0
+
+    def __str__(self):
+        Expensive.formatted += 1
+        return "expensive"
+
+
+def test_json_lines_with_job_fields():
+    configure_logging("INFO", "json", job_id="wf-1")
+    log = get_logger("test")
+    stream = io.StringIO()
+    with redirect_stderr(stream):  # the handler follows the current sys.stderr
+        log.info("Merge complete. Shape after merge: %s", (54, 8), extra={"stage": "join"})
+        log.debug("not shown")
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 1
+    entry = json.loads(lines[0])
+    assert entry["level"] == "info" and entry["logger"] == "reconciler.test"
+    assert entry["msg"] == "Merge complete. Shape after merge: (54, 8)"
+    assert entry["stage"] == "join" and entry["job_id"] == "wf-1"
+
+
+def test_default_level_is_quiet_and_lazy(monkeypatch):
+    monkeypatch.delenv("N8N_LOG_LEVEL", raising=False)
+    configure_logging()
+    log = get_logger("test")
+    stream = io.StringIO()
+    with redirect_stderr(stream):
+        log.info("Report file read successfully. Shape: %s", Expensive())
+        log.debug("page %s", Expensive())
+        log.warning("Could not read Excel file: %s", "bad header")
+    assert Expensive.formatted == 0
+    assert [json.loads(line)["level"] for line in stream.getvalue().splitlines()] == ["warning"]
+
+
+def test_text_format_and_reconfigure():
+    configure_logging("DEBUG", "text")
+    configure_logging("DEBUG", "text")  # replaces the handler instead of adding a second one
+    stream = io.StringIO()
+    with redirect_stderr(stream):
+        get_logger("test").debug("Extracted %s lines from page %s.", 80, 2)
+    assert stream.getvalue() == "Extracted 80 lines from page 2.\n"
+    assert logging.getLogger("reconciler").level == logging.DEBUG
+    configure_logging("WARNING")
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Tests for the synthetic invoice/report generator (synthetic_inputs.py)
+Run with: python -m pytest -q test_synthetic_inputs.py
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from synthetic_inputs import generate, new_dataset, check_digit
+from process_invoice import process_files
+
+
+def test_engine_finds_what_the_manifest_expects(tmp_path):
+    paths = generate(str(tmp_path), awbs=70, pages=3, cca=4, mismatch_rate=0.2, duplicate_rate=0.1, seed=7)
+    manifest = json.loads(open(paths["manifest"]).read())
+    assert manifest["awb_pages"] == 3 and manifest["pages"] == 6
+    assert manifest["duplicates"] > 0 and sum(manifest["mismatches"].values()) == 14
+
+    details = {}
+    process_files(paths["invoice"], paths["report"], workflow_id="synth", details=details,
+                  output_dir=str(tmp_path))
+    assert details["rows"] == manifest["expected"]["rows"]
+    assert details["discrepancies"] == manifest["expected"]["discrepancies"]
+    assert details["summary"]["Total Invoice Amount (Net Due)"] == pytest.approx(manifest["total_net_due"])
+
+
+def test_dataset_is_reproducible_and_consistent():
+    first = new_dataset(awbs=50, seed=3)
+    assert first["manifest"] == new_dataset(awbs=50, seed=3)["manifest"]
+    assert first["manifest"] != new_dataset(awbs=50, seed=4)["manifest"]
+    for row in first["awbs"]:
+        assert row["check"] == check_digit(row["serial"]) and len(row["serial"]) == 7
+        assert row["net_due"] == pytest.approx(row["weight"] * row["rate"] + 5.0)
+    assert len({row["serial"] for row in first["awbs"]}) == 50
+
+
+def test_invalid_options():
+    with pytest.raises(ValueError):
+        new_dataset(awbs=10, cca=100)
+    with pytest.raises(ValueError):
+        new_dataset(awbs=10, pages=11)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Tests for stage timing spans (telemetry.py)
+Run with: python -m pytest -q test_telemetry.py
+"""
+
+import io
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from telemetry import new_timer, span, begin_span, end_span, timings
+from sheet_spec import render_workbook
+
+
+def test_nested_and_repeated_spans():
+    timer = new_timer()
+    with span(timer, "sheets"):
+        with span(timer, "Summary"):
+            time.sleep(0.01)
+    for page in (2, 3):
+        begin_span(timer, "layout", page=page)
+        end_span(timer)
+
+    result = timings(timer)
+    assert list(result["stages"]) == ["sheets", "sheets.Summary", "layout"]
+    assert result["stages"]["sheets.Summary"] >= 10
+    assert result["stages"]["sheets"] >= result["stages"]["sheets.Summary"]
+    assert [(item["span"], item["page"]) for item in result["items"]] == [("layout", 2), ("layout", 3)]
+    assert result["total_ms"] >= result["stages"]["sheets"]
+    json.dumps(result)
+
+
+def test_span_without_timer_is_a_no_op():
+    with span(None, "join"):
+        pass
+    begin_span(None, "normalize")
+    end_span(None)
+
+
+def test_span_records_on_error():
+    timer = new_timer()
+    try:
+        with span(timer, "report_read"):
+            raise ValueError("bad report")
+    except ValueError:
+        pass
+    assert "report_read" in timings(timer)["stages"]
+    assert timer["stack"] == []
+
+
+def test_render_workbook_times_each_sheet():
+    timer = new_timer()
+    frames = {"Summary": pd.DataFrame({"Metric": ["Invoice AWB Count"], "Value": [1]})}
+    with span(timer, "sheets"):
+        render_workbook(io.BytesIO(), frames, highlights=False, timer=timer)
+    stages = timings(timer)["stages"]
+    assert {"sheets.Summary", "sheets.Reconciliation", "sheets.Invoices", "sheets.CCA", "sheets.save"} <= set(stages)
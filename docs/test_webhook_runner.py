@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Tests for the webhook payload runner (webhook_runner.py) against the local
+storage stand-in (storage_standin.py)
+Run with: python -m pytest -q test_webhook_runner.py
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import webhook_runner
+from webhook_runner import HttpError, download_object, upload_object, run_payload
+from storage_standin import start_standin, read_callbacks
+
+
+@pytest.fixture
+def standin(tmp_path):
+    stats = {}
+    server = start_standin(str(tmp_path), key="test-key", stats=stats)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    config = {"url": base_url, "key": "test-key", "reports_bucket": "reconciler-reports"}
+    yield {"root": tmp_path, "config": config, "base_url": base_url, "stats": stats}
+    webhook_runner.close_connections()
+    server.shutdown()
+    server.server_close()
+
+
+def payload(base_url, invoice_path="u1/jobs/j1/invoice.pdf"):
+    return {
+        "job_id": "j1",
+        "user_id": "u1",
+        "files": {
+            "invoice": {"bucket": "invoice-reconciler", "path": invoice_path, "filename": "invoice.pdf"},
+            "report": {"bucket": "invoice-reconciler", "path": "u1/jobs/j1/report.xls"},
+        },
+        "callback_urls": {"status_update": f"{base_url}/callbacks/status",
+                          "completion": f"{base_url}/callbacks/complete"},
+    }
+
+
+def test_storage_round_trip_reuses_connection(standin):
+    config = standin["config"]
+    upload_object(config, "reconciler-reports", "u1/a b.txt", b"hello", "text/plain")
+    assert download_object(config, "reconciler-reports", "u1/a b.txt") == b"hello"
+    assert (standin["root"] / "reconciler-reports" / "u1" / "a b.txt").read_bytes() == b"hello"
+    with pytest.raises(HttpError, match="404"):
+        download_object(config, "reconciler-reports", "missing")
+    assert standin["stats"]["connections"] == 1
+
+    with pytest.raises(HttpError, match="401"):
+        download_object(dict(config, key="wrong"), "reconciler-reports", "u1/a b.txt")
+
+
+def test_failed_job_posts_callbacks(standin):
+    inputs = standin["root"] / "invoice-reconciler" / "u1" / "jobs" / "j1"
+    inputs.mkdir(parents=True)
+    (inputs / "invoice.pdf").write_bytes(b"not a pdf")
+    (inputs / "report.xls").write_bytes(b"not a report")
+
+    completion = run_payload(payload(standin["base_url"]), standin["config"])
+    assert completion["status"] == "failed"
+    assert "PDF" in completion["error_message"]
+    assert "download" in completion["timings"]
+    callbacks = read_callbacks(str(standin["root"]))
+    assert [(entry["callback"], entry["body"]["status"]) for entry in callbacks] == [
+        ("status", "processing"), ("complete", "failed")]
+    assert not (standin["root"] / "reconciler-reports").exists()
+
+
+def test_missing_object_and_invalid_payload(standin):
+    completion = run_payload(payload(standin["base_url"], "u1/jobs/j1/missing.pdf"), standin["config"])
+    assert completion["status"] == "failed" and "404" in completion["error_message"]
+
+    completion = run_payload({"job_id": "j2", "user_id": "u1", "files": {}}, standin["config"])
+    assert completion == {"job_id": "j2", "status": "failed", "error_message": "Payload is missing files.invoice.bucket/path"}
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Tests for the per-job limits of long-lived workers (worker_limits.py)
+Run with: python -m pytest -q test_worker_limits.py
+"""
+
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from worker_limits import JobTimeout, job_limits, recycle_reason, limit_error, rss_mb
+
+
+def test_timeout_raises_and_is_reset():
+    limits = {"timeout": 0.2}
+    with pytest.raises(JobTimeout):
+        with job_limits(limits):
+            time.sleep(5)
+    # The timer is cleared when the block ends normally
+    with job_limits({"timeout": 0.2}):
+        pass
+    time.sleep(0.4)
+    assert limit_error(JobTimeout(), limits) == "Job exceeded its time limit of 0.2 s"
+
+
+def test_memory_ceiling_raises_memory_error():
+    with pytest.raises(MemoryError):
+        with job_limits({"max_memory_mb": 64}):
+            bytearray(512 * 1024 * 1024)
+    # The previous limit is restored afterwards
+    assert len(bytearray(128 * 1024 * 1024)) == 128 * 1024 * 1024
+
+
+def test_recycle_reason():
+    assert recycle_reason(3, {"max_jobs": 0, "max_rss_mb": 0}) is None
+    assert recycle_reason(3, {"max_jobs": 3}) == "served 3 jobs"
+    assert recycle_reason(1, {"max_jobs": 3, "max_rss_mb": 1}).startswith("RSS ")
+    assert rss_mb() > 1
+
+
+@pytest.mark.parametrize("method", ["open", "extract_text"])
+def test_pipeline_reports_memory_error_as_a_limit(tmp_path, monkeypatch, method):
+    import pdfplumber
+    from batch import run_batch_job
+    from synthetic_inputs import generate
+
+    def out_of_memory(*args, **kwargs):
+        raise MemoryError()
+    # Failing to open the PDF or to extract a page must not turn into "Error reading PDF structure"
+    target = pdfplumber if method == "open" else pdfplumber.page.Page
+    monkeypatch.setattr(target, method, out_of_memory)
+    paths = generate(str(tmp_path), awbs=10, cca=1, seed=5)
+    limits = {"max_memory_mb": 512}
+    record = run_batch_job(paths, str(tmp_path), "limits", None, limits)
+    assert not record["success"]
+    assert record["error"] == limit_error(MemoryError(), limits)
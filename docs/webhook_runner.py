@@ -0,0 +1,258 @@
+#!/opt/venv/bin/python3
+"""
+Self-contained runner for the reconciliation webhook payload.
+
+The n8n flow in n8n-file-integration-architecture.md moves the files
+through a Supabase download node, an Execute Command node, an upload node
+and a callback node, copying the bytes at every step. This runner does all
+of it in one process, in memory:
+
+1. POST callback_urls.status_update  {"job_id", "status": "processing"}, then
+   progress batches {"job_id", "status": "processing", "events": [...]}
+   (at most one per second, see progress.py) while the job runs
+2. GET  the invoice and report from Supabase Storage (files.*.bucket/path)
+3. process_streams() from process_invoice.py: no temp files
+4. POST the workbook to <REPORTS_BUCKET>/<user_id>/jobs/<job_id>/reconciliation_report.xlsx
+5. POST callback_urls.completion  {"job_id", "status": "completed",
+   "result_file_path", "summary", "discrepancies", "rows"}
+   or {"job_id", "status": "failed", "error_message"}
+
+All requests go through one keep-alive HTTP connection per host
+(http.client, no extra dependency).
+
+USAGE:
+   python webhook_runner.py payload.json      # or '-' to read the payload from stdin
+   Prints the completion body as JSON on stdout; progress goes to stderr.
+   Exits with 1 if the job failed.
+
+ENVIRONMENT:
+   SUPABASE_URL                  e.g. https://<project>.supabase.co (storage at /storage/v1)
+   SUPABASE_SERVICE_ROLE_KEY     service key with access to both buckets
+   RECONCILER_REPORTS_BUCKET     default: reconciler-reports
+   RECONCILER_CALLBACK_TOKEN     optional, sent as "Authorization: Bearer ..." to the callbacks
+
+Run against a local stand-in (storage_standin.py) by pointing SUPABASE_URL
+and the callback URLs at it.
+"""
+
+import http.client
+import io
+import json
+import os
+import sys
+import time
+from contextlib import redirect_stdout
+from urllib.parse import urlsplit, quote
+
+REPORT_FILENAME = "reconciliation_report.xlsx"
+XLSX_MIME_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+HTTP_TIMEOUT = 60
+
+# Keep-alive connections of this process, by (scheme, host, port)
+_connections = {}
+
+
+class HttpError(Exception):
+    """Raised for a non-2xx response."""
+
+
+# --- HTTP ---
+
+def _connection(scheme, host, port):
+    key = (scheme, host, port)
+    if key not in _connections:
+        cls = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        _connections[key] = cls(host, port, timeout=HTTP_TIMEOUT)
+    return _connections[key]
+
+
+def http_request(method, url, body=None, headers=None):
+    """
+    Sends one request over the pooled connection to url's host.
+    Returns (status, response body bytes). Raises HttpError for a non-2xx status.
+    """
+    parts = urlsplit(url)
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+    for attempt in (1, 2):
+        conn = _connection(parts.scheme, parts.hostname, parts.port)
+        try:
+            conn.request(method, path, body=body, headers=headers or {})
+            response = conn.getresponse()
+            data = response.read()
+            break
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            # The server closed an idle keep-alive connection: reconnect once
+            conn.close()
+            _connections.pop((parts.scheme, parts.hostname, parts.port), None)
+            if attempt == 2:
+                raise
+    if response.will_close:
+        conn.close()
+        _connections.pop((parts.scheme, parts.hostname, parts.port), None)
+    if not 200 <= response.status < 300:
+        raise HttpError(f"{method} {url} -> {response.status}: {data[:200].decode('utf-8', 'replace')}")
+    return response.status, data
+
+
+def close_connections():
+    for conn in _connections.values():
+        conn.close()
+    _connections.clear()
+
+
+# --- Storage ---
+
+def storage_config():
+    return {
+        "url": os.environ.get('SUPABASE_URL', '').rstrip('/'),
+        "key": os.environ.get('SUPABASE_SERVICE_ROLE_KEY', ''),
+        "reports_bucket": os.environ.get('RECONCILER_REPORTS_BUCKET', 'reconciler-reports'),
+    }
+
+
+def _object_url(config, bucket, path):
+    return f"{config['url']}/storage/v1/object/{quote(bucket)}/{quote(path)}"
+
+
+def _auth_headers(config):
+    return {"Authorization": f"Bearer {config['key']}", "apikey": config['key']}
+
+
+def download_object(config, bucket, path):
+    """Object bytes from Supabase Storage."""
+    _, data = http_request('GET', _object_url(config, bucket, path), headers=_auth_headers(config))
+    return data
+
+
+def upload_object(config, bucket, path, data, content_type):
+    """Uploads (or replaces) an object in Supabase Storage."""
+    headers = dict(_auth_headers(config), **{"Content-Type": content_type, "x-upsert": "true"})
+    http_request('POST', _object_url(config, bucket, path), body=data, headers=headers)
+
+
+# --- Callbacks ---
+
+def callback_headers():
+    headers = {"Content-Type": "application/json"}
+    token = os.environ.get('RECONCILER_CALLBACK_TOKEN')
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    return headers
+
+
+def post_callback(url, body):
+    """POSTs a JSON status body; failures are reported but don't stop the job."""
+    if not url:
+        return False
+    try:
+        http_request('POST', url, body=json.dumps(body, default=str).encode('utf-8'), headers=callback_headers())
+        return True
+    except (HttpError, OSError) as e:
+        print(f"  -> Callback to {url} failed: {e}", file=sys.stderr)
+        return False
+
+
+# --- Runner ---
+
+def validate_payload(payload):
+    """Error message for a payload missing required fields, or None."""
+    for key in ('job_id', 'user_id'):
+        if not payload.get(key):
+            return f"Payload is missing '{key}'"
+    for name in ('invoice', 'report'):
+        spec = payload.get('files', {}).get(name) or {}
+        if not spec.get('bucket') or not spec.get('path'):
+            return f"Payload is missing files.{name}.bucket/path"
+    return None
+
+
+def run_payload(payload, config=None):
+    """
+    Runs one webhook job end to end. Returns the completion body
+    (status "completed" or "failed"); the callbacks are posted on the way.
+    """
+    from process_invoice import process_streams
+    from progress import new_progress, http_sink, flush_progress
+
+    config = config or storage_config()
+    callbacks = payload.get('callback_urls') or {}
+    job_id = payload.get('job_id')
+    error = validate_payload(payload)
+    if error:
+        completion = {"job_id": job_id, "status": "failed", "error_message": error}
+        post_callback(callbacks.get('completion'), completion)
+        return completion
+
+    files = payload['files']
+    result_path = f"{payload['user_id']}/jobs/{job_id}/{REPORT_FILENAME}"
+    timings = {}
+    post_callback(callbacks.get('status_update'), {"job_id": job_id, "status": "processing"})
+    try:
+        start = time.perf_counter()
+        invoice = download_object(config, files['invoice']['bucket'], files['invoice']['path'])
+        report = download_object(config, files['report']['bucket'], files['report']['path'])
+        timings["download"] = time.perf_counter() - start
+        print(f"  -> Downloaded invoice ({len(invoice)} bytes) and report ({len(report)} bytes)", file=sys.stderr)
+
+        start = time.perf_counter()
+        workbook = io.BytesIO()
+        progress = None
+        if callbacks.get('status_update'):
+            progress = new_progress(http_sink(callbacks['status_update'], callback_headers(),
+                                              job_id=job_id, status="processing"))
+        with redirect_stdout(sys.stderr):
+            result = process_streams(invoice, report, workbook, workflow_id=job_id, custom_filename=REPORT_FILENAME,
+                                     invoice_name=files['invoice'].get('filename') or os.path.basename(files['invoice']['path']),
+                                     progress=progress)
+        flush_progress(progress)
+        timings["process"] = time.perf_counter() - start
+        if not result["success"]:
+            raise RuntimeError(result["error"])
+
+        start = time.perf_counter()
+        upload_object(config, config['reports_bucket'], result_path, workbook.getvalue(), XLSX_MIME_TYPE)
+        timings["upload"] = time.perf_counter() - start
+        print(f"  -> Uploaded {config['reports_bucket']}/{result_path}", file=sys.stderr)
+
+        completion = {
+            "job_id": job_id,
+            "status": "completed",
+            "result_file_path": result_path,
+            "result_bucket": config['reports_bucket'],
+        }
+        for key in ('summary', 'discrepancies', 'rows', 'pages'):
+            if key in result:
+                completion[key] = result[key]
+    except Exception as e:
+        completion = {"job_id": job_id, "status": "failed", "error_message": str(e) or type(e).__name__}
+    completion["timings"] = {stage: round(seconds, 3) for stage, seconds in timings.items()}
+    post_callback(callbacks.get('completion'), completion)
+    return completion
+
+
+def main():
+    if len(sys.argv) != 2:
+        print("Usage: python webhook_runner.py <payload.json | ->")
+        sys.exit(1)
+    try:
+        if sys.argv[1] == '-':
+            payload = json.load(sys.stdin)
+        else:
+            with open(sys.argv[1]) as f:
+                payload = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Error: could not read the payload: {e}")
+        sys.exit(1)
+
+    from structured_log import configure_logging
+    configure_logging(job_id=payload.get('job_id'))
+    completion = run_payload(payload)
+    close_connections()
+    print(json.dumps(completion, default=str))
+    sys.exit(0 if completion["status"] == "completed" else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Per-job resource limits for long-lived workers (reconciler_daemon.py, job_queue.py).
+
+pdfplumber/pdfminer build large per-page object graphs, and a process that
+handles many PDFs keeps growing. A worker therefore:
+- is replaced after max_jobs jobs, or as soon as its RSS passes max_rss_mb;
+- runs each job under job_limits(): a wall-clock timeout (SIGALRM, raises
+  JobTimeout) and an address-space ceiling (RLIMIT_AS, allocations beyond it
+  raise MemoryError), so one pathological invoice fails on its own instead of
+  hanging or bloating the worker;
+- reports a killed job with failure_result(), the same shape as any other
+  failed run of process_invoice.py.
+
+Limits come from a dict: {"timeout": seconds, "max_memory_mb": MB,
+"max_rss_mb": MB, "max_jobs": count}; 0 or a missing key disables that limit.
+"""
+
+import os
+import resource
+import signal
+import sys
+from contextlib import contextmanager
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+DEFAULT_LIMITS = {
+    "timeout": 300,         # seconds per job
+    "max_memory_mb": 2048,  # address space a job may add on top of the warm worker
+    "max_rss_mb": 1024,     # worker is replaced after a job leaves it above this
+    "max_jobs": 200,        # jobs per worker before it is replaced
+}
+
+
+class JobTimeout(BaseException):
+    """
+    Raised in the job's main thread when its wall-clock limit expires.
+    A BaseException so the pipeline's `except Exception` blocks can't swallow it.
+    """
+
+
+# --- Measurements ---
+
+def _statm_mb(field):
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[field]) * PAGE_SIZE / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def rss_mb():
+    """Current resident set size in MB (peak RSS where /proc is not available)."""
+    current = _statm_mb(1)
+    if current is not None:
+        return current
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _children(pid):
+    children = []
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    # ppid is the 2nd field after the ")" closing the command name
+                    if int(f.read().rsplit(")", 1)[1].split()[1]) == pid:
+                        children.append(int(entry))
+            except (OSError, IndexError, ValueError):
+                pass
+    return children
+
+
+def tree_rss_mb(pid):
+    """Resident memory (MB) of pid and its descendants, from /proc (None if pid is gone)."""
+    total_kb = 0
+    pending = [pid]
+    found = False
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+                        break
+            found = True
+        except OSError:
+            continue
+        pending.extend(_children(current))
+    return round(total_kb / 1024, 1) if found else None
+
+
+# --- Limits ---
+
+def _raise_timeout(signum, frame):
+    raise JobTimeout()
+
+
+@contextmanager
+def job_limits(limits):
+    """Applies the timeout and memory ceiling of limits to the code in the with block."""
+    timeout = limits.get("timeout") or 0
+    max_memory_mb = limits.get("max_memory_mb") or 0
+
+    previous_handler = None
+    if timeout:
+        previous_handler = signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+
+    previous_rlimit = None
+    address_space_mb = _statm_mb(0)
+    if max_memory_mb and address_space_mb is not None:
+        previous_rlimit = resource.getrlimit(resource.RLIMIT_AS)
+        soft = int((address_space_mb + max_memory_mb) * 1024 * 1024)
+        hard = previous_rlimit[1]
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+
+    try:
+        yield
+    finally:
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous_handler)
+        if previous_rlimit is not None:
+            resource.setrlimit(resource.RLIMIT_AS, previous_rlimit)
+
+
+def recycle_reason(jobs_done, limits):
+    """Why the worker should be replaced now, or None to keep serving."""
+    max_jobs = limits.get("max_jobs") or 0
+    if max_jobs and jobs_done >= max_jobs:
+        return f"served {jobs_done} jobs"
+    max_rss_mb = limits.get("max_rss_mb") or 0
+    if max_rss_mb:
+        current = rss_mb()
+        if current > max_rss_mb:
+            return f"RSS {current:.0f} MB above {max_rss_mb} MB"
+    return None
+
+
+# --- Failure Reporting ---
+
+def limit_error(error, limits):
+    """Message for a job stopped by a limit (JobTimeout or MemoryError), else None."""
+    if isinstance(error, JobTimeout):
+        return f"Job exceeded its time limit of {limits.get('timeout')} s"
+    if isinstance(error, MemoryError):
+        return f"Job exceeded its memory limit of {limits.get('max_memory_mb')} MB"
+    return None
+
+
+def failure_result(error):
+    """Result JSON of a job that was stopped or killed (same shape as other failures)."""
+    return {
+        "success": False,
+        "error": error,
+        "message": "Processing failed"
+    }